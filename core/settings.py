@@ -1,5 +1,6 @@
 import os
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -13,7 +14,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = 'django-insecure-8eiktsv&8trz00xz9cz!k%vy4iatw^b-)=$#8y34q$pei_m&o6'
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# Desligado no Render (variável RENDER): sem DEBUG os estáticos têm hash no nome e cache de longa duração
+DEBUG = os.environ.get('DJANGO_DEBUG', '0' if 'RENDER' in os.environ else '1') == '1'
 
 ALLOWED_HOSTS = ['*']
 
@@ -47,38 +49,96 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'producao.replicas.ReplicaMiddleware',
+    'producao.instrumentacao.InstrumentacaoMiddleware',
 ]
 
+# Fração dos pedidos medidos (latência e queries por vista, ver /estatisticas/desempenho/); 0 desliga
+INSTRUMENTACAO_AMOSTRAGEM = float(os.environ.get('INSTRUMENTACAO_AMOSTRAGEM', 0))
+
 ROOT_URLCONF = 'core.urls'
 
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Templates compilados uma vez por processo e reutilizados em todos os pedidos
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'core.wsgi.application'
 
+# Atualizações em tempo real no tablet (SSE, ver producao/eventos.py). Desligadas por omissão: o stream
+# só funciona num servidor ASGI com um único processo, porque a difusão dos eventos é feita em memória
+# (ex: gunicorn -k uvicorn.workers.UvicornWorker -w 1 core.asgi:application, com WEB_CONCURRENCY=1)
+SSE_ATIVO = os.environ.get('SSE_ATIVO', '0') == '1'
+if SSE_ATIVO and int(os.environ.get('WEB_CONCURRENCY', '1')) > 1:
+    raise ImproperlyConfigured("SSE_ATIVO exige um único processo (WEB_CONCURRENCY=1): a difusão de eventos é em memória")
+
 
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
+# Ligações persistentes (reutilizadas entre pedidos) com verificação antes de cada pedido,
+# para uma ligação cortada pelo servidor não dar erro ao primeiro pedido que a use
+CONN_MAX_AGE = int(os.environ.get('DATABASE_CONN_MAX_AGE', 600))
+
 DATABASES = {
     'default': dj_database_url.config(
         default='sqlite:///db.sqlite3',
-        conn_max_age=600
+        conn_max_age=CONN_MAX_AGE,
+        conn_health_checks=True,
     )
 }
 
+# Réplica só de leitura para estatísticas, análise, calendário e exportações (ver producao/replicas.py).
+# Localmente serve outra cópia da base de dados, ex: DATABASE_REPLICA_URL=sqlite:///replica.sqlite3
+if os.environ.get('DATABASE_REPLICA_URL'):
+    DATABASES['replica'] = dj_database_url.parse(
+        os.environ['DATABASE_REPLICA_URL'], conn_max_age=CONN_MAX_AGE, conn_health_checks=True,
+    )
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+# DATABASE_REPLICA_ATIVA=0 manda tudo para a primária sem tirar a réplica da configuração (ex: réplica atrasada)
+REPLICA_ATIVA = 'replica' in DATABASES and os.environ.get('DATABASE_REPLICA_ATIVA', '1') == '1'
+
+DATABASE_ROUTERS = ['producao.replicas.RouterReplica']
+
+# Segundos em que um browser lê da primária depois de gravar (a réplica pode estar atrasada)
+REPLICA_FIXAR_SEGUNDOS = int(os.environ.get('REPLICA_FIXAR_SEGUNDOS', 10))
+
+# Cache: em memória por processo; com CACHE_DIR usa ficheiros partilhados pelos workers da mesma máquina.
+# Com mais de um worker use CACHE_DIR: sem ela a cache de fragmentos dura só segundos (ver producao/fragmentos.py)
+if os.environ.get('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['CACHE_DIR'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'tractorgest',
+        }
+    }
+
+# Sessões em cookie assinado: os pedidos dos tablets não consultam a tabela de sessões
+SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -116,7 +176,19 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# Nomes com hash do conteúdo (o WhiteNoise serve-os com cache de um ano) e versões gzip/brotli
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# Ficheiros carregados (ex: CSV à espera do trabalhador). O trabalhador tem de ver a mesma pasta
+# (disco partilhado) ou STORAGES['default'] tem de ser um storage partilhado (ex: S3)
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', os.path.join(BASE_DIR, 'media'))
 
 # Configuração de Login
 LOGIN_REDIRECT_URL = '/'
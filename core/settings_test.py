@@ -0,0 +1,11 @@
+"""Configuração dos testes (o manage.py usa-a em `python manage.py test`)."""
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES, STORAGES
+
+# A "réplica" é outra ligação à base de dados de testes; desligada, só os testes da réplica a ligam
+if 'replica' not in DATABASES:
+    DATABASES['replica'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+REPLICA_ATIVA = False
+
+# Os testes não correm o collectstatic: sem manifesto usam os nomes originais
+STORAGES['staticfiles']['BACKEND'] = 'django.contrib.staticfiles.storage.StaticFilesStorage'
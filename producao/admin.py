@@ -1,27 +1,170 @@
-import calendar
 import datetime
-from django.contrib import admin
-from django.urls import reverse
+from django.contrib import admin, messages
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.shortcuts import redirect, render
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.utils.html import format_html, format_html_join
 from django.utils.safestring import mark_safe
-from .models import Acessorio, OrdemProducao, TarefaProducao, Funcionario, Posto, Peca, Agendamento
+from .models import (
+    Acessorio, ComponenteAcessorio, OrdemProducao, TarefaProducao, Funcionario, Posto, Peca, Agendamento, ProducaoDiaria,
+    OrdemArquivada, TarefaArquivada, Trabalho, EventoTablet, EventoProducao, LinhaProducao, PassoRota, RamoOrdem, AlertaLinha,
+)
+from . import fragmentos, importacao, rastreabilidade, replicas, stock, trabalhos
+from .listagens import EscolhasEmCacheMixin, ListagemRapidaMixin
+from .calendario import (
+    ANO_MAX, ANO_MIN, CalendarioProducao, MAX_MESES, PARAMETROS_CALENDARIO,
+    contagens_por_dia, intervalo_meses, intervalo_semana, somar_meses,
+)
 
-class TarefaInline(admin.TabularInline):
+def _avisar_enfileirado(request, trabalho):
+    url = reverse('admin:producao_trabalho_change', args=[trabalho.pk])
+    messages.info(request, format_html('Trabalho <a href="{}">{}</a> enfileirado; o progresso aparece na sua página.', url, trabalho))
+    return url
+
+@admin.action(description="Planear automaticamente (funcionário e data prevista)")
+def planear_automaticamente(modeladmin, request, queryset):
+    # Corre no trabalhador; as outras ordens pendentes já planeadas contam como carga dos seus designados
+    ids = list(queryset.filter(status_global='PENDENTE').values_list('id', flat=True))
+    trabalho = trabalhos.enfileirar('planear', {'ids': ids}, criado_por=request.user)
+    _avisar_enfileirado(request, trabalho)
+
+def _filtros_rastreabilidade(parametros):
+    def numero(chave):
+        valor = parametros.get(chave) or ''
+        return int(valor) if valor.isdigit() else None
+
+    def data(chave):
+        try:
+            return datetime.date.fromisoformat(parametros.get(chave) or '')
+        except ValueError:
+            return None
+
+    return {
+        'serie_de': parametros.get('serie_de') or None,
+        'serie_ate': parametros.get('serie_ate') or None,
+        'desde': data('de'),
+        'ate': data('ate'),
+        'acessorio_id': numero('produto'),
+        'posto_id': numero('posto'),
+    }
+
+class TarefaInline(EscolhasEmCacheMixin, admin.TabularInline):
     model = TarefaProducao
     extra = 0
     readonly_fields = ('inicio', 'fim', 'funcionario')
+    escolhas_em_cache = ('posto',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('funcionario', 'posto')
+
+class RamoInline(admin.TabularInline):
+    """Postos onde a ordem está à espera numa etapa paralela (geridos pelo tablet)."""
+    model = RamoOrdem
+    extra = 0
+    can_delete = False
+    fields = readonly_fields = ('posto', 'opcional', 'estado')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('posto')
+
+    def has_add_permission(self, request, obj=None):
+        return False
 
 @admin.register(OrdemProducao)
-class OrdemProducaoAdmin(admin.ModelAdmin):
+class OrdemProducaoAdmin(ListagemRapidaMixin, admin.ModelAdmin):
+    change_list_template = 'admin/producao/ordemproducao/change_list.html'
     list_display = ('numero_serie', 'acessorio', 'posto_atual', 'funcionario_designado', 'data_prevista', 'status_global')
     list_editable = ('funcionario_designado', 'data_prevista') # <--- Agenda completa (Quem e Quando) editável na lista
+    list_select_related = ('acessorio', 'posto_atual', 'funcionario_designado')
+    escolhas_em_cache = ('funcionario_designado',)
     list_filter = ('posto_atual', 'status_global', 'acessorio', 'data_prevista')
     search_fields = ('numero_serie',)
-    inlines = [TarefaInline]
+    inlines = [RamoInline, TarefaInline]
+    actions = [planear_automaticamente]
+
+    def save_model(self, request, obj, form, change):
+        # Outro produto precisa de outras peças: a reserva feita para o anterior é libertada
+        if change and 'acessorio' in form.changed_data and obj.estado_stock == 'RESERVADO':
+            stock.liberar(obj, acessorio_id=form.initial['acessorio'])
+        super().save_model(request, obj, form, change)
+
+    def get_urls(self):
+        urls = [
+            path('importar/', self.admin_site.admin_view(self.importar_view), name='producao_ordemproducao_importar'),
+            path('rastreabilidade/', self.admin_site.admin_view(self.rastreabilidade_view), name='producao_ordemproducao_rastreabilidade'),
+        ]
+        return urls + super().get_urls()
+
+    def importar_view(self, request):
+        # O ficheiro fica no storage (ver trabalhos.enfileirar) e a importação (importacao.py) corre no trabalhador
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        if request.method == 'POST' and request.FILES.get('ficheiro'):
+            encoding = request.POST.get('encoding') or 'utf-8-sig'
+            try:
+                importacao.verificar_codificacao(encoding)
+            except ValueError as erro:
+                # Falha já no formulário e não no trabalhador, depois de o ficheiro estar na fila
+                self.message_user(request, str(erro), messages.ERROR)
+            else:
+                trabalho = trabalhos.enfileirar(
+                    'importar_ordens',
+                    {'encoding': encoding, 'dry_run': bool(request.POST.get('dry_run'))},
+                    ficheiro=request.FILES['ficheiro'],
+                    criado_por=request.user,
+                )
+                return redirect(_avisar_enfileirado(request, trabalho))
+        return render(request, 'admin/producao/ordemproducao/importar.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Importar Ordens (CSV)',
+        })
+
+    @method_decorator(replicas.usar_replica)
+    def rastreabilidade_view(self, request):
+        # Sem 'formato' mostra o formulário; com ele devolve o ficheiro em streaming (ver rastreabilidade.py)
+        formato = request.GET.get('formato')
+        if formato not in rastreabilidade.FORMATOS:
+            return render(request, 'admin/producao/ordemproducao/rastreabilidade.html', {
+                **self.admin_site.each_context(request),
+                'opts': self.model._meta,
+                'title': 'Exportar Rastreabilidade',
+                'acessorios': Acessorio.objects.order_by('nome').values_list('id', 'nome'),
+                'postos': Posto.objects.values_list('id', 'nome'),
+            })
+        blocos = rastreabilidade.exportar(formato, using=replicas.alias_leitura(), **_filtros_rastreabilidade(request.GET))
+        if isinstance(request, ASGIRequest):
+            blocos = rastreabilidade.em_async(blocos)
+        tipo = 'text/csv' if formato == 'csv' else 'application/x-ndjson'
+        resposta = StreamingHttpResponse(blocos, content_type=f'{tipo}; charset=utf-8')
+        resposta['Content-Disposition'] = f'attachment; filename="rastreabilidade-{timezone.localdate()}.{formato}"'
+        return resposta
+
+class ComponenteInline(admin.TabularInline):
+    model = ComponenteAcessorio
+    extra = 1
+    autocomplete_fields = ('peca',) # Pesquisa em vez de uma lista com todas as peças
+
+class PassoRotaInline(admin.TabularInline):
+    model = PassoRota
+    extra = 1
+    ordering = ('etapa', 'posto__ordem_sequencia')
 
 @admin.register(Acessorio)
 class AcessorioAdmin(admin.ModelAdmin):
+    list_display = ('nome', 'linha')
+    list_filter = ('linha',)
+    # Lista de materiais com quantidades; rota própria (sem passos segue os postos da linha)
+    inlines = [ComponenteInline, PassoRotaInline]
+
+@admin.register(LinhaProducao)
+class LinhaProducaoAdmin(admin.ModelAdmin):
     list_display = ('nome',)
-    filter_horizontal = ('pecas_necessarias',) # Interface bonita para selecionar muitas peças
 
 @admin.register(Funcionario)
 class FuncionarioAdmin(admin.ModelAdmin):
@@ -30,19 +173,171 @@ class FuncionarioAdmin(admin.ModelAdmin):
 
 @admin.register(Posto)
 class PostoAdmin(admin.ModelAdmin):
-    list_display = ('ordem_sequencia', 'nome')
-    ordering = ('ordem_sequencia',)
+    list_display = ('ordem_sequencia', 'nome', 'linha')
+    list_filter = ('linha',)
+    ordering = ('linha', 'ordem_sequencia')
 
 @admin.register(Peca)
 class PecaAdmin(admin.ModelAdmin):
-    list_display = ('referencia', 'nome', 'stock_atual')
+    list_display = ('referencia', 'nome', 'stock_atual', 'stock_reservado')
     search_fields = ('referencia', 'nome')
 
+@admin.register(ProducaoDiaria)
+class ProducaoDiariaAdmin(admin.ModelAdmin):
+    change_list_template = 'admin/producao/producaodiaria/change_list.html'
+    list_display = ('dia', 'posto', 'funcionario', 'acessorio', 'tarefas', 'ordens_concluidas', 'segundos_total')
+    list_filter = ('posto', 'acessorio', 'dia')
+    list_select_related = ('posto', 'funcionario', 'acessorio')
+    date_hierarchy = 'dia'
+
+    # Os totais são mantidos pela aplicação (ou por reconstruir_estatisticas), não à mão
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        urls = [
+            path('reconstruir/', self.admin_site.admin_view(self.reconstruir_view), name='producao_producaodiaria_reconstruir'),
+        ]
+        return urls + super().get_urls()
+
+    def reconstruir_view(self, request):
+        # Apaga e volta a gerar os totais: exige permissão de apagar
+        if request.method != 'POST' or not self.has_delete_permission(request):
+            raise PermissionDenied
+        trabalho = trabalhos.enfileirar('reconstruir_estatisticas', criado_por=request.user)
+        return redirect(_avisar_enfileirado(request, trabalho))
+
+class TarefaArquivadaInline(admin.TabularInline):
+    model = TarefaArquivada
+    extra = 0
+    can_delete = False
+    fields = readonly_fields = ('posto', 'funcionario', 'inicio', 'fim')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('posto', 'funcionario')
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+@admin.register(OrdemArquivada)
+class OrdemArquivadaAdmin(ListagemRapidaMixin, admin.ModelAdmin):
+    # Histórico só de consulta: as ordens chegam aqui pelo comando arquivar_ordens
+    list_display = ('numero_serie', 'acessorio', 'funcionario_designado', 'data_prevista', 'data_conclusao')
+    list_filter = ('acessorio',)
+    list_select_related = ('acessorio', 'funcionario_designado')
+    search_fields = ('numero_serie',)
+    inlines = [TarefaArquivadaInline]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.action(description="Repetir (voltar a enfileirar)")
+def repetir_trabalhos(modeladmin, request, queryset):
+    n = queryset.exclude(estado='EM_CURSO').update(
+        estado='PENDENTE', tentativas=0, progresso=0, mensagem='', erro='', disponivel_em=timezone.now(), trabalhador='',
+    )
+    modeladmin.message_user(request, f"{n} trabalhos voltaram à fila")
+
+@admin.register(Trabalho)
+class TrabalhoAdmin(admin.ModelAdmin):
+    change_form_template = 'admin/producao/trabalho/change_form.html'
+    list_display = ('id', 'tipo', 'estado', 'barra_progresso', 'mensagem', 'criado_por', 'criado_em', 'terminado_em')
+    list_filter = ('estado', 'tipo')
+    list_select_related = ('criado_por',)
+    ordering = ('-id',)
+    actions = [repetir_trabalhos]
+    fields = (
+        'tipo', 'estado', 'barra_progresso', 'mensagem', 'parametros', 'detalhe_resultado', 'erro',
+        'tentativas', 'max_tentativas', 'trabalhador', 'criado_por', 'criado_em', 'disponivel_em',
+        'iniciado_em', 'atualizado_em', 'terminado_em',
+    )
+    readonly_fields = fields
+
+    @admin.display(description="Progresso")
+    def barra_progresso(self, obj):
+        return format_html('<progress max="100" value="{}"></progress> {}%', obj.progresso, obj.progresso)
+
+    @admin.display(description="Resultado")
+    def detalhe_resultado(self, obj):
+        resultado = obj.resultado or {}
+        erros = resultado.get('erros') or []
+        html = format_html('<p>{}</p>', resultado.get('resumo', '-'))
+        if erros:
+            linhas = format_html_join('', '<tr><td>{}</td><td>{}</td><td>{}</td></tr>', (
+                (linha, numero_serie or '-', mensagem) for linha, numero_serie, mensagem in erros
+            ))
+            html += format_html(
+                '<table><thead><tr><th>Linha</th><th>Nº Série</th><th>Erro</th></tr></thead><tbody>{}</tbody></table>', linhas,
+            )
+            if resultado.get('total_erros', 0) > len(erros):
+                html += format_html('<p>… e mais {} erros.</p>', resultado['total_erros'] - len(erros))
+        return html
+
+    # Os trabalhos são criados pelas ações do admin e executados pelo comando trabalhador
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(EventoTablet)
+class EventoTabletAdmin(admin.ModelAdmin):
+    # Registo da sincronização dos tablets: os conflitos são ações feitas sem rede que não foram aplicadas
+    list_display = ('momento', 'funcionario', 'tipo', 'ordem_id', 'estado', 'mensagem', 'recebido_em')
+    list_filter = ('estado', 'tipo')
+    list_select_related = ('funcionario',)
+    ordering = ('-id',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(EventoProducao)
+class EventoProducaoAdmin(ListagemRapidaMixin, admin.ModelAdmin):
+    # Histórico só de acrescentar (ver historico.py): nem se cria nem se altera à mão
+    list_display = ('momento', 'ordem_id', 'tipo', 'posto', 'status', 'funcionario')
+    list_filter = ('tipo', 'posto')
+    list_select_related = ('posto', 'funcionario')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(AlertaLinha)
+class AlertaLinhaAdmin(admin.ModelAdmin):
+    # Criados e resolvidos pelo monitor da linha (comando monitor_linha)
+    list_display = ('inicio', 'tipo', 'posto', 'mensagem', 'resolvido_em')
+    list_filter = ('tipo', ('resolvido_em', admin.EmptyFieldListFilter), 'posto')
+    list_select_related = ('posto',)
+    ordering = ('-id',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 @admin.register(Agendamento)
-class AgendamentoAdmin(admin.ModelAdmin):
+class AgendamentoAdmin(ListagemRapidaMixin, admin.ModelAdmin):
     change_list_template = 'admin/producao/agendamento/change_list.html'
     list_display = ('numero_serie', 'acessorio', 'funcionario_designado', 'data_prevista', 'status_global')
     list_editable = ('funcionario_designado', 'data_prevista')
+    list_select_related = ('acessorio', 'funcionario_designado')
+    escolhas_em_cache = ('funcionario_designado',)
+    actions = [planear_automaticamente]
     
     def get_changeform_initial_data(self, request):
         # Preenche a data automaticamente quando clicas no dia do calendário
@@ -51,34 +346,62 @@ class AgendamentoAdmin(admin.ModelAdmin):
             initial['data_prevista'] = request.GET.get('data_prevista')
         return initial
 
+    @method_decorator(replicas.usar_replica)
     def changelist_view(self, request, extra_context=None):
         extra_context = extra_context or {}
-        
-        # Lógica do Calendário
+
+        # Os parâmetros do calendário não são filtros do admin: retiram-se do GET
+        params = request.GET.copy()
+        valores = {chave: params.pop(chave, [None])[-1] for chave in PARAMETROS_CALENDARIO}
+        request.GET = params
+
         today = datetime.date.today()
-        year = today.year
-        month = today.month
-        
-        class ProductionCalendar(calendar.HTMLCalendar):
-            def formatday(self, day, weekday):
-                if day == 0:
-                    return '<td class="noday">&nbsp;</td>'
-                
-                date_str = f"{year}-{month:02d}-{day:02d}"
-                # Link para ADICIONAR nova tarefa neste dia
-                add_url = reverse('admin:producao_agendamento_add') + f"?data_prevista={date_str}"
-                # Contar tarefas existentes
-                count = OrdemProducao.objects.filter(data_prevista=date_str).count()
-                
-                html = f'<td class="{self.cssclasses[weekday]}" style="height: 100px; vertical-align: top; border: 1px solid #ddd; padding: 5px; background: white;">'
-                html += f'<div style="display:flex; justify-content:space-between;">'
-                html += f'<strong>{day}</strong>'
-                html += f'<a href="{add_url}" style="text-decoration:none; font-size:1.5em; color:#28a745; font-weight:bold;" title="Agendar Nova Tarefa">➕</a>'
-                html += f'</div>'
-                if count > 0:
-                    html += f'<div style="margin-top:5px; background:#e3f2fd; padding:3px; border-radius:3px; font-size:0.8em;">📋 {count} tarefas</div>'
-                return html + '</td>'
-
-        html_cal = ProductionCalendar().formatmonth(year, month)
+        try:
+            year = min(max(int(valores['ano'] or today.year), ANO_MIN), ANO_MAX)
+            month = int(valores['mes'] or today.month)
+            meses = min(max(int(valores['meses'] or 1), 1), MAX_MESES)
+            datetime.date(year, month, 1)
+        except (ValueError, OverflowError):
+            year, month, meses = today.year, today.month, 1
+
+        semana = None
+        if valores['semana']:
+            try:
+                semana = datetime.date.fromisoformat(valores['semana'])
+            except (ValueError, OverflowError):
+                semana = None
+            if semana and not ANO_MIN <= semana.year <= ANO_MAX:
+                semana = None
+
+        # Uma única query agregada para todo o intervalo visível; o HTML fica em cache até as ordens mudarem
+        versao = fragmentos.versao('ordens')
+        if semana:
+            inicio, fim = intervalo_semana(semana)
+            html_cal = cache.get_or_set(
+                f'calendario:{versao}:semana:{inicio}',
+                lambda: CalendarioProducao(contagens_por_dia(inicio, fim)).formatar_semana(inicio),
+                fragmentos.ttl(),
+            )
+            anterior = f"?semana={inicio - datetime.timedelta(days=7)}"
+            seguinte = f"?semana={inicio + datetime.timedelta(days=7)}"
+        else:
+            inicio, fim = intervalo_meses(year, month, meses)
+            html_cal = cache.get_or_set(
+                f'calendario:{versao}:{year}-{month}:{meses}',
+                lambda: CalendarioProducao(contagens_por_dia(inicio, fim)).formatar_meses(year, month, meses),
+                fragmentos.ttl(),
+            )
+            ano_ant, mes_ant = somar_meses(year, month, -meses)
+            ano_seg, mes_seg = somar_meses(year, month, meses)
+            anterior = f"?ano={ano_ant}&mes={mes_ant}&meses={meses}"
+            seguinte = f"?ano={ano_seg}&mes={mes_seg}&meses={meses}"
+
         extra_context['calendar'] = mark_safe(html_cal)
+        extra_context['calendario_nav'] = {
+            'anterior': anterior,
+            'seguinte': seguinte,
+            'hoje': f"?ano={today.year}&mes={today.month}&meses={meses}",
+            'semana': f"?semana={today}",
+            'tres_meses': f"?ano={year}&mes={month}&meses=3",
+        }
         return super().changelist_view(request, extra_context=extra_context)
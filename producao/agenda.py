@@ -0,0 +1,100 @@
+"""Agenda em JSON (ordens por data prevista) para ecrãs de planeamento e painéis.
+
+Quem consulta a agenda repete o mesmo pedido de poucos em poucos segundos,
+por isso cada resposta leva um ETag e um Last-Modified calculados por uma só
+query agregada: MAX(atualizado_em) e COUNT(*) das ordens do intervalo (a
+contagem apanha as ordens apagadas ou arquivadas, que não deixam
+atualizado_em), mais o último atualizado_em dos postos, produtos e
+operadores, cujos nomes vão na resposta. Só entra estado da base de dados:
+todos os workers dão o mesmo ETag. Se o cliente já tem essa versão recebe 304
+sem as ordens serem lidas nem serializadas.
+
+As ordens vão como listas pela ordem de COLUNAS e os nomes dos postos,
+produtos e operadores uma vez só, em dicionários por id.
+"""
+import datetime
+import hashlib
+
+from django.db.models import Count, Max, Subquery
+from django.utils import timezone
+
+from .models import Acessorio, Funcionario, OrdemProducao, Posto
+
+MAX_DIAS = 366
+COLUNAS = (
+    'id', 'numero_serie', 'acessorio_id', 'posto_atual_id', 'funcionario_designado_id', 'data_prevista', 'status_global',
+)
+
+
+def filtros_do_pedido(parametros, hoje=None):
+    """
+    {'inicio', 'fim', 'posto_id', 'funcionario_id'} a partir de ?desde=&ate=&posto=&funcionario=.
+    Por omissão, as 4 semanas a partir de hoje. Lança ValueError se algum for inválido.
+    """
+    hoje = hoje or timezone.localdate()
+    inicio = datetime.date.fromisoformat(parametros['desde']) if parametros.get('desde') else hoje
+    fim = datetime.date.fromisoformat(parametros['ate']) if parametros.get('ate') else inicio + datetime.timedelta(days=27)
+    if fim < inicio:
+        raise ValueError("'ate' é anterior a 'desde'")
+    if (fim - inicio).days >= MAX_DIAS:
+        raise ValueError(f"No máximo {MAX_DIAS} dias por pedido")
+
+    def numero(chave):
+        valor = parametros.get(chave)
+        if not valor:
+            return None
+        if not valor.isdigit():
+            raise ValueError(f"'{chave}' tem de ser um número")
+        return int(valor)
+
+    return {'inicio': inicio, 'fim': fim, 'posto_id': numero('posto'), 'funcionario_id': numero('funcionario')}
+
+
+def ordens(inicio, fim, posto_id=None, funcionario_id=None):
+    consulta = OrdemProducao.objects.filter(data_prevista__range=(inicio, fim))
+    if posto_id:
+        consulta = consulta.filter(posto_atual_id=posto_id)
+    if funcionario_id:
+        consulta = consulta.filter(funcionario_designado_id=funcionario_id)
+    return consulta
+
+
+def _ultimo_nome(modelo):
+    return Max(Subquery(modelo.objects.order_by('-atualizado_em').values('atualizado_em')[:1]))
+
+
+def versao(consulta):
+    """
+    (última alteração das ordens ou dos nomes, ou None, número de ordens) de `consulta`,
+    numa só query. Sem ordens não há nomes na resposta e a versão é (None, 0).
+    """
+    dados = consulta.order_by().aggregate(
+        ultima=Max('atualizado_em'), total=Count('id'),
+        postos=_ultimo_nome(Posto), produtos=_ultimo_nome(Acessorio), funcionarios=_ultimo_nome(Funcionario),
+    )
+    datas = [dados[chave] for chave in ('ultima', 'postos', 'produtos', 'funcionarios') if dados[chave]]
+    return max(datas, default=None), dados['total']
+
+
+def etag(filtros, ultima, total):
+    chave = '|'.join([
+        *(str(filtros[nome]) for nome in sorted(filtros)),
+        ultima.isoformat() if ultima else '', str(total),
+    ])
+    return f'"{hashlib.sha1(chave.encode()).hexdigest()}"'
+
+
+def serializar(consulta):
+    linhas = list(consulta.order_by('data_prevista', 'id').values_list(*COLUNAS))
+
+    def nomes(modelo, indice):
+        ids = {linha[indice] for linha in linhas if linha[indice] is not None}
+        return {str(id_): nome for id_, nome in modelo.objects.filter(id__in=ids).values_list('id', 'nome')} if ids else {}
+
+    return {
+        'colunas': COLUNAS,
+        'ordens': linhas,
+        'produtos': nomes(Acessorio, 2),
+        'postos': nomes(Posto, 3),
+        'funcionarios': nomes(Funcionario, 4),
+    }
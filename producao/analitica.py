@@ -0,0 +1,191 @@
+"""Análise de tempos de ciclo e capacidade por posto.
+
+Os percentis são calculados na base de dados quando é PostgreSQL
+(percentile_cont ... WITHIN GROUP). Noutras bases de dados os tempos vêm
+já ordenados por grupo numa única query e os percentis são lidos por
+índice, grupo a grupo, sem guardar o histórico todo em memória.
+Se o intervalo chegar às tarefas arquivadas, estas entram também nas contas.
+"""
+import datetime
+import math
+from itertools import groupby
+
+from django.db import connection
+from django.db.models import Aggregate, Avg, Count, FloatField, Q
+from django.db.models.functions import Extract
+from django.utils import timezone
+
+from .estatisticas import DURACAO
+from .models import Acessorio, OrdemProducao, Posto, RamoOrdem, TarefaArquivada, TarefaProducao
+
+PERCENTIS = (50, 90, 99)
+
+
+class PercentilContinuo(Aggregate):
+    """percentile_cont(fração) WITHIN GROUP (ORDER BY expressão) — só PostgreSQL."""
+    function = 'percentile_cont'
+    template = '%(function)s(%(fracao)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+    output_field = FloatField()
+
+    def __init__(self, expressao, fracao, **extra):
+        super().__init__(expressao, fracao=float(fracao), **extra)
+
+
+def _percentil(valores_ordenados, p):
+    """Percentil com interpolação linear (igual a percentile_cont)."""
+    if not valores_ordenados:
+        return None
+    posicao = (len(valores_ordenados) - 1) * p / 100
+    baixo = math.floor(posicao)
+    alto = math.ceil(posicao)
+    if baixo == alto:
+        return valores_ordenados[baixo]
+    return valores_ordenados[baixo] + (valores_ordenados[alto] - valores_ordenados[baixo]) * (posicao - baixo)
+
+
+def _segundos(duracao):
+    # Em PostgreSQL a duração em epoch já vem em segundos; no SQLite vem como timedelta
+    if isinstance(duracao, datetime.timedelta):
+        return duracao.total_seconds()
+    return duracao
+
+
+def tarefas_concluidas(desde=None, ate=None, modelo=TarefaProducao):
+    tarefas = modelo.objects.filter(concluido=True, inicio__isnull=False, fim__isnull=False)
+    if desde:
+        tarefas = tarefas.filter(fim__gte=desde)
+    if ate:
+        tarefas = tarefas.filter(fim__lt=ate)
+    return tarefas
+
+
+def percentis_tempo_ciclo(tarefas, campo, arquivadas=None):
+    """
+    {valor_do_campo: {'n': ..., 'p50': ..., 'p90': ..., 'p99': ..., 'media': ...}} em segundos,
+    agrupado por `campo` (ex: 'posto_id' ou 'ordem__acessorio_id').
+    `arquivadas` (tarefas de TarefaArquivada no mesmo intervalo) juntam-se às vivas.
+    """
+    tarefas = tarefas.annotate(duracao=DURACAO)
+    if arquivadas is not None and not arquivadas.exists():
+        arquivadas = None
+    if connection.vendor == 'postgresql' and arquivadas is None:
+        segundos = Extract('duracao', 'epoch')
+        linhas = tarefas.values(campo).annotate(
+            n=Count('id'),
+            media=Avg(segundos),
+            **{f'p{p}': PercentilContinuo(segundos, p / 100) for p in PERCENTIS},
+        ).order_by()
+        return {linha.pop(campo): linha for linha in linhas}
+
+    resultado = {}
+    linhas = tarefas.values_list(campo, 'duracao')
+    if arquivadas is not None:
+        linhas = linhas.union(arquivadas.annotate(duracao=DURACAO).values_list(campo, 'duracao'), all=True)
+    linhas = linhas.order_by(campo, 'duracao').iterator(chunk_size=5000)
+    for chave, grupo in groupby(linhas, key=lambda linha: linha[0]):
+        valores = [_segundos(duracao) for _, duracao in grupo]
+        resultado[chave] = {
+            'n': len(valores),
+            'media': sum(valores) / len(valores),
+            **{f'p{p}': _percentil(valores, p) for p in PERCENTIS},
+        }
+    return resultado
+
+
+def wip_por_posto():
+    """
+    Ordens em curso por posto: {posto_id: {'pendentes': n, 'em_andamento': n}} em duas queries.
+    As ordens numa etapa paralela (sem posto_atual) contam em cada posto com um ramo por concluir.
+    """
+    linhas = (
+        OrdemProducao.objects.exclude(status_global='CONCLUIDO')
+        .filter(posto_atual__isnull=False)
+        .values('posto_atual_id')
+        .annotate(
+            pendentes=Count('id', filter=Q(status_global='PENDENTE')),
+            em_andamento=Count('id', filter=Q(status_global='EM_ANDAMENTO')),
+        )
+        .order_by()
+    )
+    wip = {linha.pop('posto_atual_id'): linha for linha in linhas}
+    ramos = (
+        RamoOrdem.objects.exclude(estado='CONCLUIDO').exclude(ordem__status_global='CONCLUIDO')
+        .values('posto_id')
+        .annotate(
+            pendentes=Count('id', filter=Q(estado='PENDENTE')),
+            em_andamento=Count('id', filter=Q(estado='EM_ANDAMENTO')),
+        )
+        .order_by()
+    )
+    for linha in ramos:
+        contagem = wip.setdefault(linha['posto_id'], {'pendentes': 0, 'em_andamento': 0})
+        contagem['pendentes'] += linha['pendentes']
+        contagem['em_andamento'] += linha['em_andamento']
+    return wip
+
+
+def throughput_por_posto(desde, ate):
+    """Tarefas concluídas por hora em cada posto no intervalo [desde, ate)."""
+    horas = max((ate - desde).total_seconds() / 3600, 1e-9)
+    contagens = {}
+    for modelo in (TarefaProducao, TarefaArquivada):
+        linhas = tarefas_concluidas(desde, ate, modelo).values('posto_id').annotate(n=Count('id')).order_by()
+        for linha in linhas:
+            contagens[linha['posto_id']] = contagens.get(linha['posto_id'], 0) + linha['n']
+    return {posto_id: n / horas for posto_id, n in contagens.items()}
+
+
+def analise_linha(horas=24 * 7, agora=None):
+    """
+    Resumo por posto e por produto e ranking de estrangulamentos.
+
+    A capacidade de um posto é (operadores autorizados × 3600 / tempo médio de ciclo)
+    peças por hora; o estrangulamento é o posto com menor capacidade. Em empate,
+    ganha o que tem mais ordens à espera.
+    """
+    agora = agora or timezone.now()
+    desde = agora - datetime.timedelta(hours=horas)
+    tarefas = tarefas_concluidas(desde, agora)
+    arquivadas = tarefas_concluidas(desde, agora, TarefaArquivada)
+
+    ciclos_posto = percentis_tempo_ciclo(tarefas, 'posto_id', arquivadas)
+    ciclos_produto = percentis_tempo_ciclo(tarefas, 'ordem__acessorio_id', arquivadas)
+    wip = wip_por_posto()
+    throughput = throughput_por_posto(desde, agora)
+    postos = Posto.objects.annotate(operadores=Count('funcionarios')).order_by('ordem_sequencia')
+    nomes_produto = dict(Acessorio.objects.values_list('id', 'nome'))
+
+    resumo_postos = []
+    for posto in postos:
+        ciclo = ciclos_posto.get(posto.id)
+        media = ciclo['media'] if ciclo else None
+        capacidade = posto.operadores * 3600 / media if media else None
+        resumo_postos.append({
+            'posto_id': posto.id,
+            'posto': posto.nome,
+            'ordem_sequencia': posto.ordem_sequencia,
+            'operadores': posto.operadores,
+            'tempo_ciclo': ciclo,
+            'wip': wip.get(posto.id, {'pendentes': 0, 'em_andamento': 0}),
+            'throughput_hora': throughput.get(posto.id, 0),
+            'capacidade_hora': capacidade,
+        })
+
+    com_capacidade = [linha for linha in resumo_postos if linha['capacidade_hora'] is not None]
+    estrangulamentos = sorted(
+        com_capacidade,
+        key=lambda linha: (linha['capacidade_hora'], -linha['wip']['pendentes']),
+    )
+
+    resumo_produtos = [
+        {'acessorio_id': acessorio_id, 'acessorio': nomes_produto.get(acessorio_id), 'tempo_ciclo': ciclo}
+        for acessorio_id, ciclo in sorted(ciclos_produto.items(), key=lambda item: nomes_produto.get(item[0]) or '')
+    ]
+
+    return {
+        'desde': desde,
+        'ate': agora,
+        'postos': resumo_postos,
+        'produtos': resumo_produtos,
+        'estrangulamentos': [linha['posto_id'] for linha in estrangulamentos],
+    }
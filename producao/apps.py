@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class ProducaoConfig(AppConfig):
     name = 'producao'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,70 @@
+"""Arquivo de ordens concluídas.
+
+As ordens CONCLUIDO há mais de N dias passam, com as suas tarefas, para
+OrdemArquivada/TarefaArquivada (mesmos ids). Cada lote é copiado e apagado
+numa só transação; se o comando for interrompido, volta a correr e continua
+de onde estava, porque as ordens já arquivadas deixaram de existir nas
+tabelas vivas. Assim as tabelas de OrdemProducao e TarefaProducao (e os
+seus índices) ficam só com o trabalho em curso e o histórico recente.
+
+Quem lê histórico (calendário, análise, reconstrução dos totais) junta as
+duas tabelas; os totais diários (ProducaoDiaria) não são afetados.
+"""
+import datetime
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import fragmentos
+from .models import OrdemArquivada, OrdemProducao, TarefaArquivada, TarefaProducao
+
+DIAS_PADRAO = 90
+TAMANHO_LOTE = 500
+
+CAMPOS_ORDEM = [campo.attname for campo in OrdemArquivada._meta.concrete_fields if campo.name != 'arquivada_em']
+CAMPOS_TAREFA = [campo.attname for campo in TarefaArquivada._meta.concrete_fields]
+
+
+def arquivaveis(dias=DIAS_PADRAO, agora=None):
+    """Ordens concluídas há mais de `dias` dias (sem data de conclusão conta a data de criação)."""
+    limite = (agora or timezone.now()) - datetime.timedelta(days=dias)
+    return OrdemProducao.objects.filter(status_global='CONCLUIDO').filter(
+        Q(data_conclusao__lt=limite) | Q(data_conclusao__isnull=True, data_criacao__lt=limite)
+    )
+
+
+def arquivar_lote(ordens, tamanho_lote=TAMANHO_LOTE):
+    """Move um lote de `ordens` (queryset) para o arquivo. Devolve (ordens, tarefas) movidas."""
+    with transaction.atomic():
+        ids = list(ordens.select_for_update().order_by('id').values_list('id', flat=True)[:tamanho_lote])
+        if not ids:
+            return 0, 0
+        OrdemArquivada.objects.bulk_create(
+            [OrdemArquivada(**linha) for linha in OrdemProducao.objects.filter(id__in=ids).values(*CAMPOS_ORDEM)]
+        )
+        tarefas = TarefaProducao.objects.filter(ordem_id__in=ids)
+        n_tarefas = len(TarefaArquivada.objects.bulk_create(
+            [TarefaArquivada(**linha) for linha in tarefas.values(*CAMPOS_TAREFA)], batch_size=1000
+        ))
+        # DELETE direto, sem carregar as linhas nem disparar sinais: são ordens e tarefas já fechadas
+        tarefas._raw_delete(tarefas.db)
+        apagar = OrdemProducao.objects.filter(id__in=ids)
+        apagar._raw_delete(apagar.db)
+        fragmentos.ordens_alteradas()
+    return len(ids), n_tarefas
+
+
+def arquivar(dias=DIAS_PADRAO, tamanho_lote=TAMANHO_LOTE, max_lotes=None, progresso=None, agora=None):
+    """Arquiva lote a lote até não haver mais ordens (ou até `max_lotes`). Devolve (ordens, tarefas)."""
+    total_ordens = total_tarefas = lotes = 0
+    while max_lotes is None or lotes < max_lotes:
+        n_ordens, n_tarefas = arquivar_lote(arquivaveis(dias, agora), tamanho_lote)
+        if not n_ordens:
+            break
+        lotes += 1
+        total_ordens += n_ordens
+        total_tarefas += n_tarefas
+        if progresso:
+            progresso(total_ordens, total_tarefas)
+    return total_ordens, total_tarefas
@@ -0,0 +1,138 @@
+"""Benchmark dos caminhos mais usados, com o cliente de testes do Django (comando benchmark).
+
+Cada cenário é pedido `repeticoes` vezes (depois de um pedido de aquecimento)
+e conta-se o tempo de parede e o número de queries. Corre tudo dentro de uma
+transação que é desfeita no fim: as tarefas abertas e fechadas, o utilizador
+de staff temporário e os totais diários não ficam na base de dados. Por isso
+o custo dos COMMIT (fsync) não entra nos tempos.
+
+Os resultados são dicionários simples para guardar em JSON e comparar com
+uma base anterior (`comparar`).
+"""
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import dados_sinteticos, operador
+from .models import Funcionario, OrdemProducao, TarefaProducao
+
+REPETICOES = 5
+TOLERANCIA = 0.25  # aumento relativo do tempo mediano tolerado antes de contar como regressão
+
+CENARIOS = ('dashboard_funcionario', 'iniciar_tarefa', 'finalizar_tarefa', 'dashboard_estatisticas', 'calendario_admin')
+
+
+class ErroBenchmark(Exception):
+    pass
+
+
+def _sem_savepoints(queries):
+    return [query for query in queries if 'SAVEPOINT' not in query['sql']]
+
+
+def _medir(pedido):
+    """(milissegundos, queries, resposta) de um pedido."""
+    with CaptureQueriesContext(connection) as queries:
+        inicio = time.perf_counter()
+        resposta = pedido()
+        ms = (time.perf_counter() - inicio) * 1000
+    if resposta.status_code >= 400:
+        raise ErroBenchmark(f"Pedido devolveu {resposta.status_code}")
+    return ms, len(_sem_savepoints(queries)), resposta
+
+
+def _escolher_operador():
+    """Uma ordem pendente e um operador livre autorizado no seu posto."""
+    livres = Funcionario.objects.exclude(
+        id__in=TarefaProducao.objects.filter(concluido=False).values('funcionario_id'),
+    ).order_by('id')
+    ordens = OrdemProducao.objects.filter(status_global='PENDENTE', posto_atual__isnull=False).order_by('id')
+    for ordem_id, posto_id in ordens.values_list('id', 'posto_atual_id')[:200]:
+        funcionario = livres.filter(postos=posto_id).first()
+        if funcionario:
+            return funcionario, ordem_id
+    raise ErroBenchmark("Não há nenhuma ordem pendente com um operador livre no seu posto (gere dados com gerar_dados)")
+
+
+def _resumo(medicoes):
+    tempos = [ms for ms, _ in medicoes]
+    return {
+        'ms_mediana': round(statistics.median(tempos), 2),
+        'ms_min': round(min(tempos), 2),
+        'ms_max': round(max(tempos), 2),
+        'queries': max(queries for _, queries in medicoes),
+    }
+
+
+def executar(repeticoes=REPETICOES, cenarios=CENARIOS):
+    """Mede os cenários sobre os dados atuais. Devolve um dicionário pronto para JSON."""
+    medicoes = {nome: [] for nome in cenarios}
+    with transaction.atomic():
+        funcionario, ordem_id = _escolher_operador()
+        tablet = Client()
+        if tablet.post(reverse('login_funcionario'), {'codigo': funcionario.codigo}).status_code != 302:
+            raise ErroBenchmark(f"Não foi possível entrar como {funcionario}")
+        gestor = Client()
+        gestor.force_login(User.objects.create_superuser(f'benchmark-{time.time_ns()}', '', None))
+
+        pedidos = {
+            'dashboard_funcionario': lambda: tablet.get(reverse('dashboard_funcionario')),
+            'dashboard_estatisticas': lambda: gestor.get(reverse('dashboard_estatisticas')),
+            'calendario_admin': lambda: gestor.get(reverse('admin:producao_agendamento_changelist'), {'meses': 3}),
+        }
+        for repeticao in range(repeticoes + 1):
+            aquecimento = repeticao == 0
+            for nome, pedido in pedidos.items():
+                if nome in medicoes:
+                    ms, queries, _ = _medir(pedido)
+                    if not aquecimento:
+                        medicoes[nome].append((ms, queries))
+            if 'iniciar_tarefa' in medicoes or 'finalizar_tarefa' in medicoes:
+                # Abre e fecha a mesma tarefa; o savepoint desfaz ambas para a repetição seguinte
+                with transaction.atomic():
+                    ms, queries, _ = _medir(lambda: tablet.post(reverse('iniciar_tarefa', args=[ordem_id])))
+                    tarefa = TarefaProducao.objects.filter(funcionario=funcionario, concluido=False).first()
+                    if tarefa is None:
+                        raise ErroBenchmark(f"Não foi possível abrir a ordem {ordem_id}")
+                    if not aquecimento and 'iniciar_tarefa' in medicoes:
+                        medicoes['iniciar_tarefa'].append((ms, queries))
+                    ms, queries, _ = _medir(lambda: tablet.post(reverse('finalizar_tarefa', args=[tarefa.id])))
+                    if not aquecimento and 'finalizar_tarefa' in medicoes:
+                        medicoes['finalizar_tarefa'].append((ms, queries))
+                    transaction.set_rollback(True)
+                operador.invalidar(funcionario.id)
+        resultado = {
+            'momento': timezone.now().isoformat(),
+            'base_de_dados': connection.vendor,
+            'repeticoes': repeticoes,
+            'dados': dados_sinteticos.contagens(),
+            'cenarios': {nome: _resumo(valores) for nome, valores in medicoes.items()},
+        }
+        transaction.set_rollback(True)
+    operador.invalidar(funcionario.id)
+    return resultado
+
+
+def comparar(atual, base, tolerancia=TOLERANCIA):
+    """
+    Diferenças por cenário entre dois resultados de `executar`:
+    [(cenario, campo, antes, depois, regressao)]. Conta como regressão mais
+    queries ou um tempo mediano acima de base * (1 + tolerancia).
+    """
+    diferencas = []
+    for nome, depois in atual['cenarios'].items():
+        antes = base.get('cenarios', {}).get(nome)
+        if antes is None:
+            continue
+        diferencas.append((nome, 'queries', antes['queries'], depois['queries'], depois['queries'] > antes['queries']))
+        diferencas.append((
+            nome, 'ms_mediana', antes['ms_mediana'], depois['ms_mediana'],
+            depois['ms_mediana'] > antes['ms_mediana'] * (1 + tolerancia),
+        ))
+    return diferencas
@@ -0,0 +1,146 @@
+"""Motor do calendário de agendamento.
+
+Todas as contagens por dia de um intervalo (semana, mês ou vários meses)
+são obtidas numa única query agregada, em vez de uma query por célula.
+"""
+import calendar
+import datetime
+from collections import defaultdict
+
+from django.db.models import Count
+from django.urls import reverse
+from django.utils.html import escape
+
+from .models import OrdemArquivada, OrdemProducao
+
+# Parâmetros do URL usados pelo calendário (não são filtros do admin)
+PARAMETROS_CALENDARIO = ('ano', 'mes', 'meses', 'semana')
+MAX_MESES = 12
+# Anos aceites no URL: nos extremos de datetime.date, somar meses ou semanas sai do intervalo
+ANO_MIN, ANO_MAX = 1900, 9998
+
+ROTULOS_STATUS = dict(OrdemProducao.STATUS_CHOICES)
+
+
+class ResumoDia:
+    """Contagens de um dia, separadas por estado e por funcionário."""
+
+    def __init__(self):
+        self.total = 0
+        self.por_status = defaultdict(int)
+        self.por_funcionario = defaultdict(int)
+
+    def adicionar(self, status, funcionario, quantidade):
+        self.total += quantidade
+        self.por_status[status] += quantidade
+        self.por_funcionario[funcionario] += quantidade
+
+
+def somar_meses(ano, mes, n):
+    """Devolve (ano, mes) deslocado n meses (n pode ser negativo)."""
+    indice = ano * 12 + (mes - 1) + n
+    return indice // 12, indice % 12 + 1
+
+
+def intervalo_meses(ano, mes, meses=1):
+    """Primeiro e último dia de `meses` meses consecutivos a começar em ano/mes."""
+    ano_fim, mes_fim = somar_meses(ano, mes, meses - 1)
+    ultimo_dia = calendar.monthrange(ano_fim, mes_fim)[1]
+    return datetime.date(ano, mes, 1), datetime.date(ano_fim, mes_fim, ultimo_dia)
+
+
+def intervalo_semana(dia, primeiro_dia_semana=calendar.MONDAY):
+    """Primeiro e último dia da semana que contém `dia`."""
+    inicio = dia - datetime.timedelta(days=(dia.weekday() - primeiro_dia_semana) % 7)
+    return inicio, inicio + datetime.timedelta(days=6)
+
+
+def contagens_por_dia(inicio, fim, queryset=None):
+    """
+    Agrega as ordens com data_prevista entre `inicio` e `fim` (inclusive).
+    Uma única query GROUP BY devolve {data: ResumoDia}. Sem `queryset`,
+    junta as ordens vivas e as arquivadas (UNION ALL na mesma query).
+    """
+    def agregar(ordens):
+        return (
+            ordens.filter(data_prevista__range=(inicio, fim))
+            .values('data_prevista', 'status_global', 'funcionario_designado__nome')
+            .annotate(total=Count('id'))
+            .order_by()
+        )
+
+    if queryset is None:
+        linhas = agregar(OrdemProducao.objects.all()).union(agregar(OrdemArquivada.objects.all()), all=True)
+    else:
+        linhas = agregar(queryset)
+
+    resumos = defaultdict(ResumoDia)
+    for linha in linhas:
+        resumos[linha['data_prevista']].adicionar(
+            linha['status_global'],
+            linha['funcionario_designado__nome'],
+            linha['total'],
+        )
+    return resumos
+
+
+class CalendarioProducao(calendar.HTMLCalendar):
+    """HTMLCalendar que desenha cada dia a partir de contagens já agregadas."""
+
+    def __init__(self, resumos, firstweekday=calendar.MONDAY):
+        super().__init__(firstweekday)
+        self.resumos = resumos
+        self.url_adicionar = reverse('admin:producao_agendamento_add')
+        self._ano = None
+        self._mes = None
+
+    def formatmonth(self, theyear, themonth, withyear=True):
+        self._ano, self._mes = theyear, themonth
+        return super().formatmonth(theyear, themonth, withyear)
+
+    def formatday(self, day, weekday):
+        if day == 0:
+            return '<td class="noday">&nbsp;</td>'
+        return self.formatar_celula(datetime.date(self._ano, self._mes, day), weekday)
+
+    def formatar_celula(self, data, weekday):
+        date_str = data.isoformat()
+        # Link para ADICIONAR nova tarefa neste dia
+        add_url = self.url_adicionar + f"?data_prevista={date_str}"
+        resumo = self.resumos.get(data)
+
+        html = f'<td class="{self.cssclasses[weekday]}">'
+        html += '<div class="cabecalho-dia">'
+        html += f'<strong>{data.day}</strong>'
+        html += f'<a href="{add_url}" class="agendar" title="Agendar Nova Tarefa">➕</a>'
+        html += '</div>'
+        if resumo and resumo.total > 0:
+            html += f'<div class="total-dia">📋 {resumo.total} tarefas</div>'
+            html += '<div class="detalhe-dia">'
+            for status, rotulo in ROTULOS_STATUS.items():
+                if resumo.por_status.get(status):
+                    html += f'<div>{rotulo}: {resumo.por_status[status]}</div>'
+            for nome, quantidade in sorted(resumo.por_funcionario.items(), key=lambda item: item[0] or ''):
+                html += f'<div>👤 {escape(nome or "Sem atribuição")}: {quantidade}</div>'
+            html += '</div>'
+        return html + '</td>'
+
+    def formatar_meses(self, ano, mes, meses=1):
+        """Desenha `meses` meses consecutivos, um a seguir ao outro."""
+        tabelas = []
+        for n in range(meses):
+            ano_n, mes_n = somar_meses(ano, mes, n)
+            tabelas.append(self.formatmonth(ano_n, mes_n))
+        return '\n'.join(tabelas)
+
+    def formatar_semana(self, inicio):
+        """Desenha uma única semana (7 dias a partir de `inicio`)."""
+        fim = inicio + datetime.timedelta(days=6)
+        titulo = f'{inicio:%d/%m/%Y} – {fim:%d/%m/%Y}'
+        html = f'<table border="0" cellpadding="0" cellspacing="0" class="{self.cssclass_month}">\n'
+        html += f'<tr><th colspan="7" class="{self.cssclass_month_head}">Semana {titulo}</th></tr>\n'
+        html += self.formatweekheader() + '\n<tr>'
+        for n in range(7):
+            data = inicio + datetime.timedelta(days=n)
+            html += self.formatar_celula(data, data.weekday())
+        return html + '</tr>\n</table>\n'
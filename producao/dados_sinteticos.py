@@ -0,0 +1,210 @@
+"""Dados sintéticos de fábrica para testes de carga e benchmarks (comando gerar_dados).
+
+Gera postos, funcionários (com postos autorizados), tipos de produto e um
+histórico de ordens com as suas tarefas, tudo com bulk_create por lotes.
+As ordens antigas ficam concluídas (uma tarefa por posto da rota, com tempos
+de ciclo próprios de cada posto/produto); as recentes ficam pendentes ao longo
+da linha ou em curso. No fim os totais diários são reconstruídos.
+
+Tudo o que é gerado leva o prefixo PREFIXO (nomes, códigos e números de
+série), para `remover` apagar só estes dados. Com a mesma semente e a mesma
+escala o resultado é sempre igual.
+"""
+import datetime
+import random
+
+from django.db import transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+from . import estatisticas, fragmentos, historico, roteamento
+from .models import (
+    Acessorio, EventoProducao, Funcionario, OrdemArquivada, OrdemProducao, Posto, ProducaoDiaria, TarefaArquivada,
+    TarefaProducao,
+)
+
+PREFIXO = 'SINT'
+TAMANHO_LOTE = 2000
+
+ESCALAS = {
+    'minima': {'postos': 3, 'funcionarios': 6, 'produtos': 2, 'ordens': 60, 'dias': 20},
+    'pequena': {'postos': 6, 'funcionarios': 20, 'produtos': 8, 'ordens': 5000, 'dias': 90},
+    'media': {'postos': 8, 'funcionarios': 40, 'produtos': 12, 'ordens': 50000, 'dias': 365},
+    'grande': {'postos': 10, 'funcionarios': 80, 'produtos': 20, 'ordens': 300000, 'dias': 730},
+}
+
+DIAS_ABERTOS = 3  # ordens previstas a partir de hoje - DIAS_ABERTOS ainda não estão concluídas
+FRACAO_EM_CURSO = 0.1
+
+
+class _Fabrica:
+    """Postos, operadores e tempos de ciclo criados; gera as ordens e tarefas em memória."""
+
+    def __init__(self, aleatorio, postos, funcionarios, produtos, hoje):
+        self.aleatorio = aleatorio
+        self.rota = [posto.id for posto in postos]
+        self.produtos = [produto.id for produto in produtos]
+        self.hoje = hoje
+        self.operadores = {posto_id: [] for posto_id in self.rota}
+        for funcionario_id, posto_id in Funcionario.postos.through.objects.filter(
+            funcionario__in=funcionarios,
+        ).values_list('funcionario_id', 'posto_id'):
+            self.operadores[posto_id].append(funcionario_id)
+        # Tempo de ciclo típico (segundos) de cada posto para cada produto
+        self.ciclo = {
+            (posto_id, produto_id): aleatorio.uniform(10 * 60, 60 * 60)
+            for posto_id in self.rota for produto_id in self.produtos
+        }
+        self.ocupados = set()  # operadores com tarefa aberta (no máximo uma cada)
+        self.max_em_curso = len(funcionarios) // 2  # os restantes ficam livres para pegar em ordens
+
+    def _tarefas_concluidas(self, ordem, postos_ids, inicio):
+        tarefas = []
+        for posto_id in postos_ids:
+            duracao = self.ciclo[posto_id, ordem.acessorio_id] * self.aleatorio.uniform(0.7, 1.5)
+            fim = inicio + datetime.timedelta(seconds=duracao)
+            tarefas.append(TarefaProducao(
+                ordem=ordem, posto_id=posto_id, funcionario_id=self.aleatorio.choice(self.operadores[posto_id]),
+                inicio=inicio, fim=fim, concluido=True,
+            ))
+            inicio = fim + datetime.timedelta(seconds=self.aleatorio.uniform(0, 3600))
+        return tarefas, inicio
+
+    def ordem(self, numero, dia):
+        """(OrdemProducao, tarefas) por gravar, para uma ordem prevista para `dia`."""
+        ordem = OrdemProducao(
+            numero_serie=f'{PREFIXO}-{numero:07d}', acessorio_id=self.aleatorio.choice(self.produtos), data_prevista=dia,
+        )
+        inicio = timezone.make_aware(datetime.datetime.combine(dia, datetime.time(7))) + datetime.timedelta(
+            seconds=self.aleatorio.uniform(0, 4 * 3600),
+        )
+
+        if dia < self.hoje - datetime.timedelta(days=DIAS_ABERTOS):
+            ordem.status_global = 'CONCLUIDO'
+            ordem.posto_atual_id = self.rota[-1]
+            ordem.funcionario_designado_id = self.aleatorio.choice(self.operadores[self.rota[0]])
+            tarefas, _ = self._tarefas_concluidas(ordem, self.rota, inicio)
+            ordem.data_conclusao = tarefas[-1].fim
+            return ordem, tarefas
+
+        # Ordem em aberto: parada num posto da linha, com os postos anteriores já feitos
+        indice = self.aleatorio.randrange(len(self.rota))
+        posto_id = self.rota[indice]
+        ordem.posto_atual_id = posto_id
+        tarefas, inicio = self._tarefas_concluidas(ordem, self.rota[:indice], inicio)
+        livres = [funcionario_id for funcionario_id in self.operadores[posto_id] if funcionario_id not in self.ocupados]
+        if livres and len(self.ocupados) < self.max_em_curso and self.aleatorio.random() < FRACAO_EM_CURSO:
+            funcionario_id = self.aleatorio.choice(livres)
+            self.ocupados.add(funcionario_id)
+            ordem.status_global = 'EM_ANDAMENTO'
+            tarefas.append(TarefaProducao(ordem=ordem, posto_id=posto_id, funcionario_id=funcionario_id, inicio=inicio))
+        else:
+            ordem.status_global = 'PENDENTE'
+            if self.aleatorio.random() < 0.5:
+                ordem.funcionario_designado_id = self.aleatorio.choice(self.operadores[posto_id])
+        return ordem, tarefas
+
+
+def _criar_base(aleatorio, postos, funcionarios, produtos):
+    base = Posto.objects.aggregate(maximo=Max('ordem_sequencia'))['maximo'] or 0
+    postos = Posto.objects.bulk_create([
+        Posto(nome=f'{PREFIXO} Posto {i + 1}', ordem_sequencia=base + i + 1) for i in range(postos)
+    ])
+    produtos = Acessorio.objects.bulk_create([Acessorio(nome=f'{PREFIXO} Produto {i + 1}') for i in range(produtos)])
+    funcionarios = Funcionario.objects.bulk_create([
+        Funcionario(nome=f'{PREFIXO} Operador {i + 1}', codigo=f'{PREFIXO}{i + 1:05d}') for i in range(funcionarios)
+    ])
+    # Cada posto tem pelo menos um operador; cada operador pode trabalhar em 1 a 3 postos
+    autorizacoes = set()
+    for i, funcionario in enumerate(funcionarios):
+        autorizacoes.add((funcionario.id, postos[i % len(postos)].id))
+        for posto in aleatorio.sample(postos, min(aleatorio.randint(0, 2), len(postos))):
+            autorizacoes.add((funcionario.id, posto.id))
+    Funcionario.postos.through.objects.bulk_create([
+        Funcionario.postos.through(funcionario_id=funcionario_id, posto_id=posto_id)
+        for funcionario_id, posto_id in sorted(autorizacoes)
+    ])
+    return postos, funcionarios, produtos
+
+
+def gerar(postos=6, funcionarios=20, produtos=8, ordens=5000, dias=90, semente=42,
+          tamanho_lote=TAMANHO_LOTE, reconstruir_totais=True, progresso=None, hoje=None):
+    """
+    Cria um conjunto de dados sintético. Devolve {'ordens': n, 'tarefas': n}.
+    As ordens ficam espalhadas entre hoje - `dias` e hoje + 14 dias.
+    `progresso(ordens, tarefas)` é chamado depois de cada lote.
+    """
+    if postos < 1 or funcionarios < postos or produtos < 1:
+        raise ValueError("São precisos pelo menos 1 posto, 1 produto e um funcionário por posto")
+    aleatorio = random.Random(semente)
+    hoje = hoje or timezone.localdate()
+
+    with transaction.atomic():
+        fabrica = _Fabrica(aleatorio, *_criar_base(aleatorio, postos, funcionarios, produtos), hoje)
+    roteamento.invalidar()
+
+    primeiro_dia = hoje - datetime.timedelta(days=dias)
+    intervalo = dias + 14
+    total_ordens = total_tarefas = 0
+    while total_ordens < ordens:
+        n = min(tamanho_lote, ordens - total_ordens)
+        geradas = [
+            fabrica.ordem(total_ordens + i + 1, primeiro_dia + datetime.timedelta(days=(total_ordens + i) * intervalo // ordens))
+            for i in range(n)
+        ]
+        with transaction.atomic():
+            OrdemProducao.objects.bulk_create([ordem for ordem, _ in geradas], batch_size=tamanho_lote)
+            # As tarefas apontam para as instâncias das ordens, que agora já têm id
+            tarefas = [tarefa for _, tarefas_ordem in geradas for tarefa in tarefas_ordem]
+            TarefaProducao.objects.bulk_create(tarefas, batch_size=tamanho_lote)
+            historico.registar_muitos([
+                evento for ordem, tarefas_ordem in geradas for evento in historico.eventos_da_ordem(ordem, tarefas_ordem)
+            ])
+        total_ordens += n
+        total_tarefas += len(tarefas)
+        if progresso:
+            progresso(total_ordens, total_tarefas)
+
+    fragmentos.ordens_alteradas()
+    if reconstruir_totais:
+        estatisticas.reconstruir(primeiro_dia, hoje)
+    return {'ordens': total_ordens, 'tarefas': total_tarefas}
+
+
+def remover():
+    """Apaga só os dados com o prefixo sintético (e os totais diários dos seus postos)."""
+    ordens = OrdemProducao.objects.filter(numero_serie__startswith=f'{PREFIXO}-')
+    arquivadas = OrdemArquivada.objects.filter(numero_serie__startswith=f'{PREFIXO}-')
+    postos = Posto.objects.filter(nome__startswith=f'{PREFIXO} ')
+    with transaction.atomic():
+        # Apagar em massa sem carregar as tarefas (podem ser centenas de milhares)
+        eventos = EventoProducao.objects.filter(Q(ordem_id__in=ordens.values('id')) | Q(ordem_id__in=arquivadas.values('id')))
+        primeiro = eventos.aggregate(primeiro=Min('momento'))['primeiro']
+        eventos._raw_delete(eventos.db)
+        if primeiro:
+            historico.invalidar_snapshots(primeiro)
+        TarefaProducao.objects.filter(ordem__in=ordens)._raw_delete(TarefaProducao.objects.db)
+        n = ordens._raw_delete(ordens.db)
+        TarefaArquivada.objects.filter(ordem__in=arquivadas)._raw_delete(TarefaArquivada.objects.db)
+        arquivadas._raw_delete(arquivadas.db)
+        ProducaoDiaria.objects.filter(posto__in=postos).delete()
+        Funcionario.objects.filter(codigo__startswith=PREFIXO).delete()
+        postos.delete()
+        Acessorio.objects.filter(nome__startswith=f'{PREFIXO} ').delete()
+    roteamento.invalidar()
+    fragmentos.ordens_alteradas()
+    fragmentos.incrementar('producao')
+    return n
+
+
+def contagens():
+    """Tamanho atual dos dados (para acompanhar os resultados dos benchmarks)."""
+    return {
+        'postos': Posto.objects.count(),
+        'funcionarios': Funcionario.objects.count(),
+        'produtos': Acessorio.objects.count(),
+        'ordens': OrdemProducao.objects.count(),
+        'tarefas': TarefaProducao.objects.count(),
+        'ordens_arquivadas': OrdemArquivada.objects.count(),
+        'producao_diaria': ProducaoDiaria.objects.count(),
+    }
@@ -0,0 +1,106 @@
+"""Totais de produção pré-calculados (tabela ProducaoDiaria).
+
+Cada tarefa concluída soma-se à linha do seu dia/funcionário/posto/produto
+com um único INSERT ... ON CONFLICT DO UPDATE, dentro da transação que
+fecha a tarefa. A página de estatísticas lê apenas estes totais.
+`reconstruir` volta a gerá-los a partir do histórico (tarefas vivas e
+arquivadas), por lotes de dias.
+"""
+import datetime
+
+from django.db import connection, transaction
+from django.db.models import Count, DurationField, Exists, ExpressionWrapper, F, Max, Min, OuterRef, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import fragmentos
+from .models import ProducaoDiaria, TarefaArquivada, TarefaProducao
+
+DURACAO = ExpressionWrapper(F('fim') - F('inicio'), output_field=DurationField())
+
+
+def registar_tarefa(fim, inicio, funcionario_id, posto_id, acessorio_id, concluiu_ordem):
+    """Soma uma tarefa concluída aos totais do dia (uma só query)."""
+    segundos = (fim - inicio).total_seconds() if inicio else 0
+    tabela = connection.ops.quote_name(ProducaoDiaria._meta.db_table)
+    # SQLite (>= 3.24) e PostgreSQL suportam o mesmo ON CONFLICT.
+    # Nota: com funcionario NULL o conflito não dispara e fica uma linha por tarefa (os totais somam na mesma).
+    sql = (
+        f'INSERT INTO {tabela} '
+        '(dia, funcionario_id, posto_id, acessorio_id, tarefas, ordens_concluidas, segundos_total) '
+        'VALUES (%s, %s, %s, %s, 1, %s, %s) '
+        'ON CONFLICT (dia, funcionario_id, posto_id, acessorio_id) DO UPDATE SET '
+        f'tarefas = {tabela}.tarefas + 1, '
+        f'ordens_concluidas = {tabela}.ordens_concluidas + EXCLUDED.ordens_concluidas, '
+        f'segundos_total = {tabela}.segundos_total + EXCLUDED.segundos_total'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [
+            timezone.localdate(fim), funcionario_id, posto_id, acessorio_id,
+            1 if concluiu_ordem else 0, segundos,
+        ])
+
+
+def totais_do_historico(tarefas):
+    """
+    Agrega tarefas concluídas por dia/funcionário/posto/produto numa query.
+    Conta como 'ordem concluída' a última tarefa de cada ordem CONCLUIDO.
+    Serve para TarefaProducao e para TarefaArquivada.
+    """
+    tarefa_posterior = tarefas.model.objects.filter(ordem=OuterRef('ordem'), fim__gt=OuterRef('fim'))
+    return (
+        tarefas.filter(concluido=True, fim__isnull=False)
+        .annotate(dia=TruncDate('fim'), ultima=~Exists(tarefa_posterior))
+        .values('dia', 'funcionario_id', 'posto_id', 'ordem__acessorio_id')
+        .annotate(
+            n_tarefas=Count('id'),
+            n_ordens=Count('id', filter=Q(ultima=True, ordem__status_global='CONCLUIDO')),
+            duracao=Sum(DURACAO),
+        )
+        .order_by()
+    )
+
+
+def reconstruir(inicio=None, fim=None, dias_por_lote=31, progresso=None):
+    """
+    Apaga e volta a gerar os totais entre `inicio` e `fim` (datas, inclusive),
+    um lote de dias de cada vez, cada lote na sua transação.
+    Devolve o número de linhas de totais criadas.
+    """
+    fontes = [
+        modelo.objects.filter(concluido=True, fim__isnull=False) for modelo in (TarefaProducao, TarefaArquivada)
+    ]
+    if inicio is None or fim is None:
+        limites = [fonte.aggregate(primeiro=Min('fim'), ultimo=Max('fim')) for fonte in fontes]
+        primeiros = [limite['primeiro'] for limite in limites if limite['primeiro']]
+        if not primeiros:
+            return 0
+        inicio = inicio or timezone.localdate(min(primeiros))
+        fim = fim or timezone.localdate(max(limite['ultimo'] for limite in limites if limite['ultimo']))
+
+    criadas = 0
+    lote_inicio = inicio
+    while lote_inicio <= fim:
+        lote_fim = min(lote_inicio + datetime.timedelta(days=dias_por_lote - 1), fim)
+        # A mesma chave pode aparecer nas duas tabelas (ordens diferentes no mesmo dia): soma-se
+        totais = {}
+        for fonte in fontes:
+            for linha in totais_do_historico(fonte.filter(fim__date__range=(lote_inicio, lote_fim))):
+                chave = (linha['dia'], linha['funcionario_id'], linha['posto_id'], linha['ordem__acessorio_id'])
+                total = totais.setdefault(chave, ProducaoDiaria(
+                    dia=chave[0], funcionario_id=chave[1], posto_id=chave[2], acessorio_id=chave[3],
+                    tarefas=0, ordens_concluidas=0, segundos_total=0,
+                ))
+                total.tarefas += linha['n_tarefas']
+                total.ordens_concluidas += linha['n_ordens']
+                total.segundos_total += linha['duracao'].total_seconds() if linha['duracao'] else 0
+        linhas = list(totais.values())
+        with transaction.atomic():
+            ProducaoDiaria.objects.filter(dia__range=(lote_inicio, lote_fim)).delete()
+            ProducaoDiaria.objects.bulk_create(linhas, batch_size=1000)
+            fragmentos.incrementar('producao')
+        criadas += len(linhas)
+        if progresso:
+            progresso(lote_inicio, lote_fim, len(linhas))
+        lote_inicio = lote_fim + datetime.timedelta(days=1)
+    return criadas
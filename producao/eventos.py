@@ -0,0 +1,114 @@
+"""Difusão de alterações de ordens para os tablets (Server-Sent Events).
+
+Quando uma ordem muda de posto ou de estado publica-se um evento depois do
+commit. Cada ligação SSE aberta (ver views.stream_funcionario) subscreve os
+postos do seu operador e só recebe os eventos desses postos.
+
+A difusão é feita em memória, dentro do processo: o stream tem de correr num
+servidor ASGI (ex: uvicorn) com um único processo, o mesmo que recebe as
+escritas. Por isso só está ligada com SSE_ATIVO (que recusa WEB_CONCURRENCY
+acima de 1); caso contrário o stream responde 204 e o tablet não o abre. Se não
+houver nenhuma ligação aberta, publicar não custa nenhuma query.
+"""
+import asyncio
+import threading
+
+from django.db import transaction
+
+# Eventos por entregar guardados por ligação; se o tablet não os consumir, os mais antigos perdem-se
+MAX_EVENTOS_EM_FILA = 100
+
+
+class Subscricao:
+    def __init__(self, postos_ids, funcionario_id):
+        self.postos_ids = set(postos_ids)
+        self.funcionario_id = funcionario_id
+        self.loop = asyncio.get_running_loop()
+        self.fila = asyncio.Queue(maxsize=MAX_EVENTOS_EM_FILA)
+
+    def interessa(self, evento):
+        if evento['posto_anterior_id'] is None and evento['origem'] == 'admin':
+            return True
+        return bool(self.postos_ids & {evento['posto_id'], evento['posto_anterior_id']})
+
+    def entregar(self, evento):
+        # Pode ser chamado a partir de qualquer thread (as views síncronas correm fora do loop)
+        try:
+            self.loop.call_soon_threadsafe(self._por_na_fila, evento)
+        except RuntimeError:
+            pass  # loop já fechado: a ligação terminou
+
+    def _por_na_fila(self, evento):
+        if self.fila.full():
+            self.fila.get_nowait()
+        self.fila.put_nowait(evento)
+
+
+class Difusor:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscricoes = set()
+
+    def subscrever(self, postos_ids, funcionario_id):
+        subscricao = Subscricao(postos_ids, funcionario_id)
+        with self._lock:
+            self._subscricoes.add(subscricao)
+        return subscricao
+
+    def cancelar(self, subscricao):
+        with self._lock:
+            self._subscricoes.discard(subscricao)
+
+    def tem_subscritores(self):
+        return bool(self._subscricoes)
+
+    def publicar(self, evento):
+        with self._lock:
+            subscricoes = list(self._subscricoes)
+        for subscricao in subscricoes:
+            if subscricao.interessa(evento):
+                subscricao.entregar(evento)
+
+
+difusor = Difusor()
+
+
+def construir_evento(ordem_id, posto_anterior_id=None, origem='posto'):
+    from .models import OrdemProducao
+
+    ordem = (
+        OrdemProducao.objects.filter(pk=ordem_id)
+        .values(
+            'id', 'numero_serie', 'status_global', 'data_prevista',
+            'posto_atual_id', 'posto_atual__nome', 'acessorio__nome', 'funcionario_designado_id',
+        )
+        .first()
+    )
+    if ordem is None:
+        # Ordem apagada: os tablets só precisam de retirar o cartão
+        return {
+            'ordem_id': ordem_id, 'numero_serie': None, 'status': None, 'data_prevista': None,
+            'posto_id': None, 'posto': None, 'acessorio': None, 'funcionario_designado_id': None,
+            'posto_anterior_id': posto_anterior_id, 'origem': origem,
+        }
+    return {
+        'ordem_id': ordem['id'],
+        'numero_serie': ordem['numero_serie'],
+        'status': ordem['status_global'],
+        'data_prevista': ordem['data_prevista'].isoformat() if ordem['data_prevista'] else None,
+        'posto_id': ordem['posto_atual_id'],
+        'posto': ordem['posto_atual__nome'],
+        'acessorio': ordem['acessorio__nome'],
+        'funcionario_designado_id': ordem['funcionario_designado_id'],
+        'posto_anterior_id': posto_anterior_id,
+        'origem': origem,
+    }
+
+
+def ordem_alterada(ordem_id, posto_anterior_id=None, origem='posto'):
+    """Agenda a publicação do estado da ordem para depois do commit da transação atual."""
+    if not difusor.tem_subscritores():
+        return
+    transaction.on_commit(
+        lambda: difusor.publicar(construir_evento(ordem_id, posto_anterior_id, origem))
+    )
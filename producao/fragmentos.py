@@ -0,0 +1,88 @@
+"""Versões para a cache de fragmentos de template (dashboard, estatísticas, calendário).
+
+Cada fragmento em cache tem na chave a versão dos dados de que depende; em
+vez de apagar fragmentos, quem altera os dados incrementa a versão e os
+fragmentos antigos deixam de ser lidos (expiram sozinhos ao fim de TTL).
+
+Versões:
+- 'posto:<id>': fila de ordens pendentes de um posto (tablet);
+- 'filas': todas as filas, quando não se sabe que postos mudaram (admin,
+  importação, planeamento);
+- 'ordens': qualquer alteração de ordens (estatísticas e calendário);
+- 'producao' e 'stock': totais diários e peças (estatísticas).
+
+As versões vivem na cache: só valem para todos os workers se a cache for
+partilhada (CACHE_DIR, ver settings). Com a cache em memória de cada processo
+um worker não vê os incrementos dos outros, por isso os fragmentos duram
+apenas TTL_LOCAL segundos.
+
+As versões são incrementadas já e outra vez depois do commit (como em
+operador.invalidar): um pedido que leia entre os dois momentos pode guardar
+dados antigos com a versão nova, e o segundo incremento descarta-os.
+"""
+import time
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+from . import replicas
+
+TTL = 60 * 60
+TTL_REPLICA = 60
+TTL_LOCAL = 10
+PREFIXO = 'fragmento:versao:'
+
+
+def _incrementar(chaves):
+    for chave in chaves:
+        try:
+            cache.incr(PREFIXO + chave)
+        except ValueError:
+            # Versão ainda não existe (ou saiu da cache): começa num valor que nunca foi usado
+            cache.add(PREFIXO + chave, time.time_ns(), None)
+
+
+def incrementar(*chaves):
+    _incrementar(chaves)
+    transaction.on_commit(lambda: _incrementar(chaves))
+
+
+def cache_partilhada():
+    """A cache (e as versões) é vista por todos os processos, e não só por este."""
+    return not isinstance(caches['default'], LocMemCache)
+
+
+def ttl():
+    """
+    Validade de um fragmento desenhado agora. Sem cache partilhada dura segundos: as
+    versões incrementadas noutros workers não chegam a este. Lido da réplica também dura
+    pouco: a réplica pode ainda não ter a escrita que mudou a versão.
+    """
+    validade = TTL if cache_partilhada() else TTL_LOCAL
+    if replicas.na_replica():
+        validade = min(validade, TTL_REPLICA)
+    return validade
+
+
+def versao(*chaves):
+    """Texto com as versões atuais de `chaves`, para usar na chave de um fragmento."""
+    nomes = [PREFIXO + chave for chave in chaves]
+    valores = cache.get_many(nomes)
+    em_falta = {nome: time.time_ns() for nome in nomes if nome not in valores}
+    if em_falta:
+        for nome, valor in em_falta.items():
+            cache.add(nome, valor, None)
+        valores.update(cache.get_many(list(em_falta)))
+    return '.'.join(str(valores.get(nome, 0)) for nome in nomes)
+
+
+def ordens_alteradas(*postos_ids):
+    """Ordens mudaram nas filas destes postos (ou em postos desconhecidos, sem argumentos)."""
+    filas = [f'posto:{posto_id}' for posto_id in postos_ids if posto_id] or ['filas']
+    incrementar('ordens', *filas)
+
+
+def filas(postos_ids):
+    """Versão das filas de ordens pendentes de um operador com estes postos."""
+    return versao('filas', *(f'posto:{posto_id}' for posto_id in sorted(postos_ids)))
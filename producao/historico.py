@@ -0,0 +1,288 @@
+"""Histórico das ordens em eventos e WIP (trabalho em curso) em qualquer momento do passado.
+
+`OrdemProducao.posto_atual`/`status_global` só guardam o estado atual. Cada
+mudança fica também em EventoProducao, na mesma transação (abrir e fechar
+tarefas, criar/editar/apagar ordens), com o estado da ordem depois dela:
+(posto, status). Os eventos nunca são alterados.
+
+Numa etapa paralela a ordem está em vários postos ao mesmo tempo: há um
+evento por ramo. O primeiro substitui o estado anterior da ordem; os outros,
+marcados com `ramo`, só mudam o estado da ordem no seu posto (e um ramo
+CONCLUIDO sai do WIP sem tirar a ordem dos outros postos).
+
+O estado num momento t é o do último evento de cada ordem (e de cada ramo) até t. Para não
+repetir o histórico todo, SnapshotWIP guarda de INTERVALO_SNAPSHOT em
+INTERVALO_SNAPSHOT as ordens por concluir; `estado_em(t)` parte do último
+snapshot antes de t e repete só os eventos entre os dois. Os snapshots são
+criados pelo comando `snapshot_wip` (ou pelo trabalho com o mesmo nome) e
+nunca para os últimos MARGEM minutos, onde ainda podem chegar eventos de
+transações em curso. Um evento mais antigo (ex: tablet sem rede) apaga os
+snapshots a partir do seu momento, que são recriados na vez seguinte.
+
+`reconstruir` gera os eventos a partir das ordens e tarefas (vivas e
+arquivadas), para bases de dados com histórico anterior a esta tabela. Cada
+lote é gravado na sua transação (como no arquivo), para o trabalho poder dar
+sinal de vida pelo caminho; se for interrompido, volta a correr do início.
+"""
+import datetime
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    EventoProducao, OrdemArquivada, OrdemProducao, RamoOrdem, SnapshotWIP, TarefaArquivada, TarefaProducao,
+)
+
+INTERVALO_SNAPSHOT = datetime.timedelta(hours=1)
+MARGEM = datetime.timedelta(minutes=5)
+TAMANHO_LOTE = 2000
+TAMANHO_CHUNK = 5000
+MAX_PONTOS = 1000
+
+
+def invalidar_snapshots(momento):
+    """Apaga os snapshots que já não contam com um evento em `momento`."""
+    SnapshotWIP.objects.filter(momento__gte=momento).delete()
+
+
+def registar(ordem_id, tipo, posto_id, status, momento=None, funcionario_id=None, ramo=False):
+    agora = timezone.now()
+    momento = momento or agora
+    evento = EventoProducao.objects.create(
+        momento=momento, tipo=tipo, ordem_id=ordem_id, posto_id=posto_id, status=status, funcionario_id=funcionario_id,
+        ramo=ramo,
+    )
+    if momento < agora - MARGEM:
+        invalidar_snapshots(momento)
+    return evento
+
+
+def eventos_etapa(ordem_id, tipo, postos_ids, status, momento, funcionario_id=None):
+    """EventoProducao por gravar da ordem a entrar nos `postos_ids` de uma etapa (vários se for paralela)."""
+    return [
+        EventoProducao(
+            momento=momento, tipo=tipo, ordem_id=ordem_id, posto_id=posto_id, status=status,
+            funcionario_id=funcionario_id, ramo=i > 0,
+        )
+        for i, posto_id in enumerate(postos_ids)
+    ]
+
+
+def registar_etapa(ordem_id, tipo, postos_ids, status, momento=None, funcionario_id=None):
+    registar_muitos(eventos_etapa(ordem_id, tipo, postos_ids, status, momento or timezone.now(), funcionario_id))
+
+
+def registar_muitos(eventos):
+    """Grava uma lista de EventoProducao (ex: importação, dados sintéticos)."""
+    if not eventos:
+        return
+    EventoProducao.objects.bulk_create(eventos, batch_size=TAMANHO_LOTE)
+    primeiro = min(evento.momento for evento in eventos)
+    if primeiro < timezone.now() - MARGEM:
+        invalidar_snapshots(primeiro)
+
+
+def ultimo_estado(ordem_id):
+    """(posto_id, status) do último evento da ordem (sem contar ramos), ou None se ainda não tem eventos."""
+    return (
+        EventoProducao.objects.filter(ordem_id=ordem_id, ramo=False)
+        .order_by('-momento', '-id').values_list('posto_id', 'status').first()
+    )
+
+
+def eventos_da_ordem(ordem, tarefas, ramos=()):
+    """
+    EventoProducao por gravar com a história de `ordem` (OrdemProducao ou OrdemArquivada)
+    a partir das suas `tarefas` (com inicio, fim, posto_id e funcionario_id).
+    Depois de cada tarefa a ordem fica pendente no posto da tarefa seguinte; depois da
+    última, fica no estado atual da ordem. `ramos` são os postos onde a ordem está à
+    espera numa etapa paralela (sem posto_atual): um evento por posto.
+    """
+    tarefas = sorted((tarefa for tarefa in tarefas if tarefa.inicio), key=lambda tarefa: tarefa.inicio)
+    criada = min([ordem.data_criacao] + [tarefa.inicio for tarefa in tarefas[:1]])
+    if tarefas:
+        eventos = eventos_etapa(ordem.pk, 'CRIADA', [tarefas[0].posto_id], 'PENDENTE', criada)
+    else:
+        eventos = eventos_etapa(ordem.pk, 'CRIADA', ramos or [ordem.posto_atual_id], 'PENDENTE', criada)
+    for i, tarefa in enumerate(tarefas):
+        eventos.append(EventoProducao(
+            momento=tarefa.inicio, tipo='INICIADA', ordem_id=ordem.pk, posto_id=tarefa.posto_id, status='EM_ANDAMENTO',
+            funcionario_id=tarefa.funcionario_id,
+        ))
+        if not tarefa.fim:
+            continue
+        if i + 1 < len(tarefas):
+            postos_ids, status = [tarefas[i + 1].posto_id], 'PENDENTE'
+        else:
+            postos_ids = ramos or [ordem.posto_atual_id]
+            status = 'CONCLUIDO' if ordem.status_global == 'CONCLUIDO' else 'PENDENTE'
+        eventos += eventos_etapa(ordem.pk, 'FINALIZADA', postos_ids, status, tarefa.fim, tarefa.funcionario_id)
+    return eventos
+
+
+def reconstruir(tamanho_lote=TAMANHO_LOTE, progresso=None):
+    """
+    Apaga os eventos e snapshots e volta a gerá-los a partir das ordens e tarefas.
+    `progresso(ordens, eventos)` é chamado depois de cada lote, já gravado. Devolve o número de eventos.
+    Não corre dentro de uma transação: até acabar, o histórico fica incompleto.
+    """
+    with transaction.atomic():
+        EventoProducao.objects.all().delete()
+        SnapshotWIP.objects.all().delete()
+    total_ordens = total_eventos = 0
+    for modelo_ordem, modelo_tarefa in ((OrdemProducao, TarefaProducao), (OrdemArquivada, TarefaArquivada)):
+        ultimo_id = 0
+        while True:
+            ordens = list(
+                modelo_ordem.objects.filter(id__gt=ultimo_id).order_by('id')
+                .only('id', 'data_criacao', 'posto_atual_id', 'status_global')[:tamanho_lote]
+            )
+            if not ordens:
+                break
+            ultimo_id = ordens[-1].id
+            with transaction.atomic():
+                tarefas = defaultdict(list)
+                for tarefa in modelo_tarefa.objects.filter(ordem_id__in=[ordem.id for ordem in ordens]).only(
+                    'ordem_id', 'posto_id', 'funcionario_id', 'inicio', 'fim',
+                ):
+                    tarefas[tarefa.ordem_id].append(tarefa)
+                ramos = defaultdict(list)
+                if modelo_ordem is OrdemProducao:
+                    for ordem_id, posto_id in RamoOrdem.objects.filter(
+                        ordem_id__in=[ordem.id for ordem in ordens if ordem.posto_atual_id is None],
+                    ).exclude(estado='CONCLUIDO').order_by('ordem_id', 'posto_id').values_list('ordem_id', 'posto_id'):
+                        ramos[ordem_id].append(posto_id)
+                eventos = [
+                    evento for ordem in ordens for evento in eventos_da_ordem(ordem, tarefas[ordem.id], ramos[ordem.id])
+                ]
+                EventoProducao.objects.bulk_create(eventos, batch_size=tamanho_lote)
+            total_ordens += len(ordens)
+            total_eventos += len(eventos)
+            if progresso:
+                progresso(total_ordens, total_eventos)
+    return total_eventos
+
+
+def _aplicar(estado, ordem_id, tipo, posto_id, status, ramo=False):
+    # Só as ordens por concluir (e, nas etapas paralelas, os ramos por concluir) contam para o WIP
+    if tipo == 'REMOVIDA' or (status == 'CONCLUIDO' and not ramo):
+        estado.pop(ordem_id, None)
+    elif not ramo:
+        estado[ordem_id] = {posto_id: status}
+    elif status == 'CONCLUIDO':
+        estado.get(ordem_id, {}).pop(posto_id, None)
+    else:
+        estado.setdefault(ordem_id, {})[posto_id] = status
+
+
+def _postos(valor):
+    # Snapshots anteriores aos ramos guardam um só [posto_id, status]
+    if valor and not isinstance(valor[0], list):
+        return {valor[0]: valor[1]}
+    return {posto_id: status for posto_id, status in valor}
+
+
+def _ponto_de_partida(momento):
+    """(momento, estado) do último snapshot até `momento`, ou (None, {}) se não houver."""
+    snapshot = SnapshotWIP.objects.filter(momento__lte=momento).order_by('-momento').first()
+    if snapshot is None:
+        return None, {}
+    return snapshot.momento, {int(ordem_id): _postos(valor) for ordem_id, valor in snapshot.ordens.items()}
+
+
+def _eventos(desde, ate):
+    """Eventos em (desde, ate] por ordem cronológica, como (momento, ordem_id, tipo, posto_id, status, ramo)."""
+    eventos = EventoProducao.objects.filter(momento__lte=ate)
+    if desde is not None:
+        eventos = eventos.filter(momento__gt=desde)
+    return eventos.order_by('momento', 'id').values_list(
+        'momento', 'ordem_id', 'tipo', 'posto_id', 'status', 'ramo',
+    ).iterator(chunk_size=TAMANHO_CHUNK)
+
+
+def estado_em(momento):
+    """({ordem_id: {posto_id: status}} das ordens por concluir em `momento`, eventos repetidos)."""
+    desde, estado = _ponto_de_partida(momento)
+    repetidos = 0
+    for _, *evento in _eventos(desde, momento):
+        _aplicar(estado, *evento)
+        repetidos += 1
+    return estado, repetidos
+
+
+def _contar(estado):
+    wip = defaultdict(lambda: {'pendentes': 0, 'em_andamento': 0})
+    for postos in estado.values():
+        for posto_id, status in postos.items():
+            wip[posto_id]['em_andamento' if status == 'EM_ANDAMENTO' else 'pendentes'] += 1
+    return dict(wip)
+
+
+def wip_em(momento):
+    """{posto_id: {'pendentes': n, 'em_andamento': n}} em `momento`."""
+    return _contar(estado_em(momento)[0])
+
+
+def serie_wip(desde, ate, passo):
+    """
+    [(momento, wip_em(momento))] de `desde` a `ate`, de `passo` em `passo`, lendo os
+    eventos uma só vez a partir do snapshot anterior a `desde`.
+    """
+    if passo <= datetime.timedelta(0):
+        raise ValueError("O passo tem de ser positivo")
+    if (ate - desde) / passo >= MAX_PONTOS:
+        raise ValueError(f"No máximo {MAX_PONTOS} pontos por série")
+    inicio, estado = _ponto_de_partida(desde)
+    eventos = _eventos(inicio, ate)
+    seguinte = next(eventos, None)
+    pontos = []
+    momento = desde
+    while momento <= ate:
+        while seguinte is not None and seguinte[0] <= momento:
+            _aplicar(estado, *seguinte[1:])
+            seguinte = next(eventos, None)
+        pontos.append((momento, _contar(estado)))
+        momento += passo
+    return pontos
+
+
+def criar_snapshot(momento):
+    estado, repetidos = estado_em(momento)
+    snapshot, _ = SnapshotWIP.objects.update_or_create(momento=momento, defaults={
+        'ordens': {
+            str(ordem_id): [[posto_id, status] for posto_id, status in postos.items()] for ordem_id, postos in estado.items()
+        },
+        'eventos': repetidos,
+    })
+    return snapshot
+
+
+def _alinhar(momento, intervalo):
+    """Primeiro múltiplo de `intervalo` (desde a meia-noite UTC) depois de `momento`."""
+    dia = momento.astimezone(datetime.timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return dia + ((momento - dia) // intervalo + 1) * intervalo
+
+
+def criar_snapshots(ate=None, intervalo=INTERVALO_SNAPSHOT, progresso=None):
+    """
+    Cria os snapshots em falta de `intervalo` em `intervalo`, a seguir ao último (ou ao
+    primeiro evento) até `ate` (por omissão, agora - MARGEM). Cada um parte do anterior.
+    Devolve o número de snapshots criados.
+    """
+    limite = timezone.now() - MARGEM
+    ate = min(ate, limite) if ate else limite
+    ultimo = SnapshotWIP.objects.order_by('-momento').values_list('momento', flat=True).first()
+    if ultimo is None:
+        ultimo = EventoProducao.objects.order_by('momento').values_list('momento', flat=True).first()
+        if ultimo is None:
+            return 0
+    momento = _alinhar(ultimo, intervalo)
+    criados = 0
+    while momento <= ate:
+        criar_snapshot(momento)
+        criados += 1
+        if progresso:
+            progresso(momento, criados)
+        momento += intervalo
+    return criados
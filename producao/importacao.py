@@ -0,0 +1,255 @@
+"""Importação de ordens de produção a partir de CSV (ex: exportado do Excel).
+
+O ficheiro é lido linha a linha e tratado em lotes: cada lote é validado
+contra os números de série já existentes numa só query e inserido com
+bulk_create. Nunca se carrega o ficheiro inteiro em memória.
+
+Colunas reconhecidas (o cabeçalho é obrigatório, maiúsculas e acentos indiferentes):
+    numero_serie   (obrigatória)
+    tipo_produto   nome ou id do Tipo de Produto (obrigatória)
+    data_prevista  AAAA-MM-DD ou DD/MM/AAAA (opcional)
+    funcionario    id ou nome do funcionário designado (opcional). Nunca o código: é o
+                   PIN de entrada no tablet e os ficheiros do planeamento circulam por email
+"""
+import codecs
+import csv
+import datetime
+import itertools
+from collections import defaultdict
+import unicodedata
+
+from django.db import IntegrityError, transaction
+
+from . import fragmentos, historico, roteamento
+from .models import Acessorio, Funcionario, OrdemProducao, RamoOrdem
+
+TAMANHO_LOTE = 1000
+
+ALIASES_COLUNAS = {
+    'numero_serie': 'numero_serie',
+    'numero de serie': 'numero_serie',
+    'n serie': 'numero_serie',
+    'sn': 'numero_serie',
+    'tipo_produto': 'tipo_produto',
+    'tipo de produto': 'tipo_produto',
+    'produto': 'tipo_produto',
+    'acessorio': 'tipo_produto',
+    'data_prevista': 'data_prevista',
+    'data prevista': 'data_prevista',
+    'data': 'data_prevista',
+    'funcionario': 'funcionario',
+    'funcionario_designado': 'funcionario',
+}
+
+
+class ErroLinha(Exception):
+    pass
+
+
+def verificar_codificacao(encoding):
+    """Lança ValueError (com mensagem para o utilizador) se `encoding` não for uma codificação conhecida."""
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        raise ValueError(f"Codificação desconhecida: {encoding}") from None
+
+
+class RelatorioImportacao:
+    def __init__(self):
+        self.lidas = 0
+        self.criadas = 0
+        self.erros = []  # [(número da linha no ficheiro, numero_serie, mensagem)]
+
+    def erro(self, linha, numero_serie, mensagem):
+        self.erros.append((linha, numero_serie, mensagem))
+
+    def __str__(self):
+        return f"{self.lidas} linhas lidas, {self.criadas} ordens criadas, {len(self.erros)} erros"
+
+
+def _normalizar(texto):
+    texto = (texto or '').replace('º', '').replace('ª', '').replace('.', ' ')
+    texto = unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode()
+    return ' '.join(texto.lower().split())
+
+
+def _ler_data(valor):
+    valor = (valor or '').strip()
+    if not valor:
+        return None
+    for formato in ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y'):
+        try:
+            return datetime.datetime.strptime(valor, formato).date()
+        except ValueError:
+            pass
+    raise ErroLinha(f"Data inválida: {valor}")
+
+
+def _ramos_iniciais(ordens):
+    """RamoOrdem por gravar das ordens (já com id) cuja rota começa numa etapa paralela."""
+    return [
+        RamoOrdem(ordem_id=ordem.id, posto_id=passo.posto_id, opcional=passo.opcional)
+        for ordem in ordens if ordem.posto_atual_id is None
+        for passo in roteamento.rota(ordem.acessorio_id).primeira_etapa or ()
+    ]
+
+
+def _linhas_csv(ficheiro, delimitador=None):
+    """Devolve (colunas, iterador de (número da linha, dict)) sem ler o ficheiro todo."""
+    cabecalho = ficheiro.readline()
+    if not cabecalho:
+        raise ErroLinha("Ficheiro vazio")
+    if delimitador is None:
+        # O Excel em português exporta com ';'
+        delimitador = ';' if cabecalho.count(';') > cabecalho.count(',') else ','
+    leitor = csv.reader(itertools.chain([cabecalho], ficheiro), delimiter=delimitador)
+    colunas = [ALIASES_COLUNAS.get(_normalizar(coluna), _normalizar(coluna)) for coluna in next(leitor)]
+    for obrigatoria in ('numero_serie', 'tipo_produto'):
+        if obrigatoria not in colunas:
+            raise ErroLinha(f"Falta a coluna obrigatória '{obrigatoria}'")
+
+    def linhas():
+        for numero, valores in enumerate(leitor, start=2):
+            if any(valor.strip() for valor in valores):
+                yield numero, dict(zip(colunas, valores))
+
+    return colunas, linhas()
+
+
+class Importador:
+    def __init__(self, tamanho_lote=TAMANHO_LOTE, gravar=True):
+        self.tamanho_lote = tamanho_lote
+        self.gravar = gravar
+        self.relatorio = RelatorioImportacao()
+        # Tabelas pequenas: carregadas uma vez para validar sem queries por linha
+        self.acessorios_por_nome = {}
+        self.acessorios_por_id = set()
+        for acessorio_id, nome in Acessorio.objects.values_list('id', 'nome'):
+            self.acessorios_por_nome.setdefault(_normalizar(nome), acessorio_id)
+            self.acessorios_por_id.add(acessorio_id)
+        self.funcionarios_por_nome = {}
+        self.funcionarios_por_id = set()
+        for funcionario_id, nome in Funcionario.objects.values_list('id', 'nome'):
+            # Nomes repetidos ficam a None: só se pode designar pelo id
+            chave = _normalizar(nome)
+            self.funcionarios_por_nome[chave] = None if chave in self.funcionarios_por_nome else funcionario_id
+            self.funcionarios_por_id.add(funcionario_id)
+
+    def _construir(self, dados):
+        numero_serie = (dados.get('numero_serie') or '').strip()
+        if not numero_serie:
+            raise ErroLinha("Número de série vazio")
+        if len(numero_serie) > OrdemProducao._meta.get_field('numero_serie').max_length:
+            raise ErroLinha("Número de série demasiado longo")
+
+        produto = (dados.get('tipo_produto') or '').strip()
+        if produto.isdigit() and int(produto) in self.acessorios_por_id:
+            acessorio_id = int(produto)
+        else:
+            acessorio_id = self.acessorios_por_nome.get(_normalizar(produto))
+        if acessorio_id is None:
+            raise ErroLinha(f"Tipo de produto desconhecido: {produto}")
+
+        funcionario_id = None
+        funcionario = (dados.get('funcionario') or '').strip()
+        if funcionario.isdigit():
+            if int(funcionario) not in self.funcionarios_por_id:
+                raise ErroLinha(f"Funcionário desconhecido: {funcionario}")
+            funcionario_id = int(funcionario)
+        elif funcionario:
+            chave = _normalizar(funcionario)
+            if chave not in self.funcionarios_por_nome:
+                raise ErroLinha(f"Funcionário desconhecido: {funcionario}")
+            funcionario_id = self.funcionarios_por_nome[chave]
+            if funcionario_id is None:
+                raise ErroLinha(f"Há mais de um funcionário com o nome {funcionario}: use o id")
+
+        return OrdemProducao(
+            numero_serie=numero_serie,
+            acessorio_id=acessorio_id,
+            posto_atual_id=roteamento.posto_inicial(acessorio_id),
+            funcionario_designado_id=funcionario_id,
+            data_prevista=_ler_data(dados.get('data_prevista')),
+            status_global='PENDENTE',
+        )
+
+    def _processar_lote(self, lote):
+        ordens = []
+        vistos = set()
+        for numero, dados in lote:
+            try:
+                ordem = self._construir(dados)
+            except ErroLinha as erro:
+                self.relatorio.erro(numero, dados.get('numero_serie'), str(erro))
+                continue
+            if ordem.numero_serie in vistos:
+                self.relatorio.erro(numero, ordem.numero_serie, "Número de série repetido no ficheiro")
+                continue
+            vistos.add(ordem.numero_serie)
+            ordens.append((numero, ordem))
+
+        # Uma query por lote para os números de série que já existem (inclui lotes anteriores já gravados e o arquivo)
+        existentes = set(
+            OrdemProducao.objects.filter(numero_serie__in=vistos).values_list('numero_serie', flat=True).union(
+                OrdemProducao.series_arquivadas(vistos)
+            )
+        )
+        novas = []
+        for numero, ordem in ordens:
+            if ordem.numero_serie in existentes:
+                self.relatorio.erro(numero, ordem.numero_serie, "Número de série já existe")
+            else:
+                novas.append((numero, ordem))
+
+        if not self.gravar:
+            self.relatorio.criadas += len(novas)
+            return
+        try:
+            with transaction.atomic():
+                OrdemProducao.objects.bulk_create([ordem for _, ordem in novas])
+                ramos = RamoOrdem.objects.bulk_create(_ramos_iniciais([ordem for _, ordem in novas]))
+                postos_ramos = defaultdict(list)
+                for ramo in ramos:
+                    postos_ramos[ramo.ordem_id].append(ramo.posto_id)
+                historico.registar_muitos([
+                    evento for _, ordem in novas for evento in historico.eventos_da_ordem(ordem, [], postos_ramos[ordem.id])
+                ])
+            self.relatorio.criadas += len(novas)
+            fragmentos.ordens_alteradas()
+        except IntegrityError:
+            # Alguém criou um destes números entretanto: grava linha a linha para identificar qual
+            for numero, ordem in novas:
+                ordem.pk = None
+                try:
+                    with transaction.atomic():
+                        ordem.save(force_insert=True)  # o sinal post_save atualiza as versões
+                        ramos = RamoOrdem.objects.bulk_create(_ramos_iniciais([ordem]))
+                        if ramos:
+                            historico.registar_etapa(
+                                ordem.id, 'CRIADA', [ramo.posto_id for ramo in ramos], 'PENDENTE', momento=ordem.data_criacao,
+                            )
+                    self.relatorio.criadas += 1
+                except IntegrityError:
+                    self.relatorio.erro(numero, ordem.numero_serie, "Número de série já existe")
+
+    def importar(self, ficheiro, delimitador=None, progresso=None):
+        try:
+            _, linhas = _linhas_csv(ficheiro, delimitador)
+        except ErroLinha as erro:
+            self.relatorio.erro(1, None, str(erro))
+            return self.relatorio
+
+        while True:
+            lote = list(itertools.islice(linhas, self.tamanho_lote))
+            if not lote:
+                break
+            self.relatorio.lidas += len(lote)
+            self._processar_lote(lote)
+            if progresso:
+                progresso(self.relatorio)
+        return self.relatorio
+
+
+def importar_csv(ficheiro, tamanho_lote=TAMANHO_LOTE, gravar=True, delimitador=None, progresso=None):
+    """Importa ordens de um ficheiro de texto aberto. Devolve um RelatorioImportacao."""
+    return Importador(tamanho_lote, gravar).importar(ficheiro, delimitador, progresso)
@@ -0,0 +1,89 @@
+"""Verificação (EXPLAIN) de que as queries mais frequentes usam os índices certos.
+
+Usado pelo comando `verificar_indices` e pelos testes. Em PostgreSQL as
+sequential scans são desligadas durante a verificação: com tabelas pequenas
+o planeador prefere sempre ler a tabela toda, e o que se quer saber aqui é se
+o índice pode ser usado, não se compensa com os dados atuais.
+"""
+import datetime
+
+from django.db import connections, transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .models import OrdemProducao, TarefaProducao
+
+
+def consultas_quentes():
+    """Lista de (descrição, queryset, nomes de índice aceitáveis)."""
+    hoje = timezone.localdate()
+    agora = timezone.now()
+    fila = OrdemProducao.objects.filter(posto_atual__in=[1, 2], status_global='PENDENTE')
+    return [
+        (
+            'fila do posto: ordens atribuídas',
+            fila.filter(funcionario_designado=1).order_by('data_prevista', 'id'),
+            ['ordem_fila_posto_idx'],
+        ),
+        (
+            'fila do posto: ordens gerais',
+            fila.filter(funcionario_designado__isnull=True).order_by('data_prevista', 'id'),
+            ['ordem_fila_posto_idx'],
+        ),
+        (
+            'ordens atrasadas',
+            OrdemProducao.objects.filter(data_prevista__lt=hoje).exclude(status_global='CONCLUIDO'),
+            ['ordem_aberta_prevista_idx'],
+        ),
+        (
+            'WIP por posto',
+            OrdemProducao.objects.exclude(status_global='CONCLUIDO').filter(posto_atual__isnull=False)
+            .values('posto_atual_id').annotate(n=Count('id')).order_by(),
+            ['ordem_aberta_posto_idx'],
+        ),
+        (
+            'calendário',
+            OrdemProducao.objects.filter(data_prevista__range=(hoje, hoje + datetime.timedelta(days=31)))
+            .values('data_prevista', 'status_global').annotate(n=Count('id')).order_by(),
+            ['ordem_prevista_idx', 'ordem_aberta_prevista_idx'],
+        ),
+        (
+            'agenda: versão do intervalo',
+            OrdemProducao.objects.filter(data_prevista__range=(hoje, hoje + datetime.timedelta(days=27)))
+            .values('data_prevista').annotate(ultima=Max('atualizado_em')).order_by(),
+            ['ordem_prevista_atualizada_idx'],
+        ),
+        (
+            'monitor da linha: ordens alteradas',
+            OrdemProducao.objects.filter(atualizado_em__gte=agora - datetime.timedelta(minutes=5)),
+            ['ordem_atualizada_idx'],
+        ),
+        (
+            'tarefa aberta do funcionário',
+            TarefaProducao.objects.filter(funcionario=1, concluido=False),
+            ['tarefa_aberta_unica_por_funcionario'],
+        ),
+        (
+            'tarefas concluídas por período',
+            TarefaProducao.objects.filter(concluido=True, fim__gte=agora - datetime.timedelta(days=7), fim__lt=agora),
+            ['tarefa_concluida_fim_idx'],
+        ),
+    ]
+
+
+def explicar(queryset, using='default'):
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.using(using).explain()
+
+
+def verificar(using='default'):
+    """Devolve [(descrição, ok, plano)] para cada query quente."""
+    resultados = []
+    for descricao, queryset, indices in consultas_quentes():
+        plano = explicar(queryset, using)
+        resultados.append((descricao, any(indice in plano for indice in indices), plano))
+    return resultados
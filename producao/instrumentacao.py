@@ -0,0 +1,175 @@
+"""Amostragem de latência e queries por vista (InstrumentacaoMiddleware).
+
+Com settings.INSTRUMENTACAO_AMOSTRAGEM = 0 (omissão) o middleware só lê a
+setting e passa o pedido à frente. Com um valor entre 0 e 1, essa fração dos
+pedidos é medida: tempo total, número e tempo das queries (via
+connection.execute_wrapper) e queries repetidas com o mesmo SQL (sinal de
+N+1). As amostras ficam num buffer circular em memória, por processo (cada
+worker do gunicorn tem o seu), e são agregadas por vista em `resumo()`.
+"""
+import random
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+MAX_AMOSTRAS = 5000
+LIMIAR_REPETIDAS = 5  # a mesma query N vezes no mesmo pedido conta como suspeita de N+1
+LIMITES_HISTOGRAMA = (10, 25, 50, 100, 250, 500, 1000, 2500)  # milissegundos
+
+_amostras = deque(maxlen=MAX_AMOSTRAS)
+_trinco = threading.Lock()
+
+
+class _Registador:
+    """execute_wrapper que conta as queries do pedido e o tempo passado na base de dados."""
+
+    def __init__(self):
+        self.queries = 0
+        self.segundos = 0.0
+        self.sql = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.segundos += time.perf_counter() - inicio
+            self.queries += 1
+            self.sql[sql] += 1
+
+
+def taxa_de_amostragem():
+    return getattr(settings, 'INSTRUMENTACAO_AMOSTRAGEM', 0)
+
+
+def registar(amostra):
+    with _trinco:
+        _amostras.append(amostra)
+
+
+def amostras():
+    with _trinco:
+        return list(_amostras)
+
+
+def limpar():
+    with _trinco:
+        _amostras.clear()
+
+
+def _nome_da_vista(request):
+    rota = getattr(request, 'resolver_match', None)
+    if rota is None:
+        return '(sem rota)'
+    return rota.view_name or rota.route
+
+
+def _sortear():
+    taxa = taxa_de_amostragem()
+    return taxa > 0 and (taxa >= 1 or random.random() < taxa)
+
+
+def _instalar(registador):
+    """Liga o registador a todas as bases de dados, na thread atual; fecha-se com .close()."""
+    pilha = ExitStack()
+    for alias in connections:
+        pilha.enter_context(connections[alias].execute_wrapper(registador))
+    return pilha
+
+
+def _guardar(request, resposta, registador, duracao):
+    repetidas = [(sql[:300], n) for sql, n in registador.sql.most_common(3) if n >= LIMIAR_REPETIDAS]
+    registar({
+        'vista': _nome_da_vista(request),
+        'metodo': request.method,
+        'estado': resposta.status_code,
+        'momento': timezone.now().isoformat(),
+        'ms': round(duracao * 1000, 2),
+        'queries': registador.queries,
+        'bd_ms': round(registador.segundos * 1000, 2),
+        'repetidas': repetidas,
+    })
+    resposta['Server-Timing'] = f'db;dur={registador.segundos * 1000:.1f}, total;dur={duracao * 1000:.1f}'
+    return resposta
+
+
+class InstrumentacaoMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.assincrono = iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self._medir_async(request)
+        if not _sortear():
+            return self.get_response(request)
+        registador = _Registador()
+        inicio = time.perf_counter()
+        with _instalar(registador):
+            resposta = self.get_response(request)
+        return _guardar(request, resposta, registador, time.perf_counter() - inicio)
+
+    async def _medir_async(self, request):
+        if not _sortear():
+            return await self.get_response(request)
+        registador = _Registador()
+        inicio = time.perf_counter()
+        # Sob ASGI as vistas síncronas e o ORM correm na thread do pedido (sync_to_async): o registador liga-se lá
+        pilha = await sync_to_async(_instalar)(registador)
+        try:
+            resposta = await self.get_response(request)
+        finally:
+            await sync_to_async(pilha.close)()
+        return _guardar(request, resposta, registador, time.perf_counter() - inicio)
+
+
+def _percentil(ordenados, fracao):
+    return ordenados[min(int(fracao * len(ordenados)), len(ordenados) - 1)]
+
+
+def resumo(lista=None):
+    """Agregado por vista, da mais lenta (p90) para a mais rápida."""
+    por_vista = {}
+    for amostra in amostras() if lista is None else lista:
+        por_vista.setdefault(amostra['vista'], []).append(amostra)
+
+    vistas = []
+    for vista, grupo in por_vista.items():
+        tempos = sorted(amostra['ms'] for amostra in grupo)
+        histograma = [0] * (len(LIMITES_HISTOGRAMA) + 1)
+        for ms in tempos:
+            histograma[sum(ms > limite for limite in LIMITES_HISTOGRAMA)] += 1
+        suspeitas = Counter()
+        for amostra in grupo:
+            for sql, n in amostra['repetidas']:
+                suspeitas[sql] = max(suspeitas[sql], n)
+        vistas.append({
+            'vista': vista,
+            'pedidos': len(grupo),
+            'p50_ms': _percentil(tempos, 0.5),
+            'p90_ms': _percentil(tempos, 0.9),
+            'p99_ms': _percentil(tempos, 0.99),
+            'max_ms': tempos[-1],
+            'queries_media': sum(amostra['queries'] for amostra in grupo) / len(grupo),
+            'queries_max': max(amostra['queries'] for amostra in grupo),
+            'bd_ms_media': sum(amostra['bd_ms'] for amostra in grupo) / len(grupo),
+            'histograma': histograma,
+            'n_mais_1': [{'sql': sql, 'repeticoes': n} for sql, n in suspeitas.most_common()],
+        })
+    vistas.sort(key=lambda linha: linha['p90_ms'], reverse=True)
+    return {
+        'amostragem': taxa_de_amostragem(),
+        'limites_histograma_ms': list(LIMITES_HISTOGRAMA),
+        'vistas': vistas,
+    }
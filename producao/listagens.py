@@ -0,0 +1,119 @@
+"""Listas do admin para tabelas grandes (ordens de produção com histórico longo).
+
+- PaginadorEstimado: em PostgreSQL usa a estimativa do planeador em vez de
+  COUNT(*) quando a tabela/filtro passa LIMIAR_CONTAGEM_EXATA linhas.
+- ListagemRapidaMixin: sem a contagem total extra e com paginação por cursor
+  (keyset) sobre o id, que não faz OFFSET.
+- EscolhasEmCacheMixin: as listas de escolha das chaves estrangeiras editáveis
+  são lidas uma vez por pedido, não uma vez por linha do formset.
+"""
+import json
+
+from django.contrib.admin.views.main import ORDER_VAR, PAGE_VAR
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+# Abaixo disto a contagem exata é barata e é a que se mostra
+LIMIAR_CONTAGEM_EXATA = 10000
+
+PARAMETRO_CURSOR = 'cursor'
+
+
+def estimar_linhas(queryset):
+    """Número de linhas estimado pelo PostgreSQL (None noutras bases de dados)."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            # Sem filtros: estatística da tabela, não precisa de planear nada
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table],
+            )
+            linha = cursor.fetchone()
+        else:
+            sql, params = queryset.order_by().query.sql_with_params()
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plano = cursor.fetchone()[0]
+            if isinstance(plano, str):
+                plano = json.loads(plano)
+            linha = (plano[0]['Plan']['Plan Rows'],)
+    if not linha or linha[0] is None or linha[0] < 0:
+        return None  # tabela nunca analisada
+    return int(linha[0])
+
+
+class PaginadorEstimado(Paginator):
+    @cached_property
+    def count(self):
+        estimativa = estimar_linhas(self.object_list)
+        if estimativa is not None and estimativa >= LIMIAR_CONTAGEM_EXATA:
+            return estimativa
+        return super().count
+
+
+class EscolhasEmCacheMixin:
+    """Guarda por pedido as escolhas dos campos em `escolhas_em_cache` (evita uma query por linha)."""
+    escolhas_em_cache = ()
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        campo = super().formfield_for_foreignkey(db_field, request, **kwargs)
+        if campo is None or request is None or db_field.name not in self.escolhas_em_cache:
+            return campo
+        memoria = request.__dict__.setdefault('_escolhas_admin', {})
+        chave = (db_field.model._meta.label, db_field.name)
+        if chave not in memoria:
+            memoria[chave] = list(campo.choices)
+        campo.choices = memoria[chave]
+        return campo
+
+
+class ListagemRapidaMixin(EscolhasEmCacheMixin):
+    """
+    Changelist para muitas linhas. Com a ordenação por omissão (-id) e sem página
+    pedida, a navegação é feita com ?cursor=<último id>, que usa a chave primária
+    em vez de OFFSET. Ordenar por uma coluna ou pedir ?p= volta à paginação normal.
+    """
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+    paginacao_keyset = True
+
+    def _cursor_do_pedido(self, request):
+        params = request.GET.copy()
+        valor = params.pop(PARAMETRO_CURSOR, [None])[-1]
+        request.GET = params  # o admin rejeita parâmetros que não conhece
+        if not self.paginacao_keyset or ORDER_VAR in params or PAGE_VAR in params:
+            return None, False
+        try:
+            return (int(valor) if valor else None), True
+        except ValueError:
+            return None, True
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        cursor = getattr(request, '_cursor_listagem', None)
+        if cursor is not None:
+            queryset = queryset.filter(pk__lt=cursor)
+        return queryset
+
+    def changelist_view(self, request, extra_context=None):
+        cursor, keyset = self._cursor_do_pedido(request)
+        request._cursor_listagem = cursor
+        resposta = super().changelist_view(request, extra_context=extra_context)
+        # Redirecionamentos (ex: depois de gravar a lista editável) não têm contexto
+        cl = getattr(resposta, 'context_data', None) and resposta.context_data.get('cl')
+        if keyset and cl:
+            resultados = list(cl.result_list)
+            base = request.GET.copy()
+            seguinte = None
+            if len(resultados) >= cl.list_per_page:
+                base[PARAMETRO_CURSOR] = resultados[-1].pk
+                seguinte = f'?{base.urlencode()}'
+                base.pop(PARAMETRO_CURSOR)
+            resposta.context_data['keyset'] = {
+                'inicio': f'?{base.urlencode()}' if cursor is not None else None,
+                'seguinte': seguinte,
+            }
+        return resposta
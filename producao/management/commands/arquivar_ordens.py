@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from producao import arquivo
+
+
+class Command(BaseCommand):
+    help = (
+        "Move as ordens concluídas há mais de N dias (e as suas tarefas) para o arquivo, por lotes. "
+        "Pode ser interrompido e corrido outra vez: continua onde parou."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=arquivo.DIAS_PADRAO, help="Idade mínima da conclusão, em dias.")
+        parser.add_argument('--lote', type=int, default=arquivo.TAMANHO_LOTE, help="Ordens movidas em cada transação.")
+        parser.add_argument('--max-lotes', type=int, help="Pára ao fim deste número de lotes (ex: para correr fora de horas).")
+        parser.add_argument('--dry-run', action='store_true', help="Só conta as ordens que seriam arquivadas.")
+
+    def handle(self, *args, **options):
+        if options['dias'] < 0:
+            raise CommandError("--dias não pode ser negativo")
+        if options['lote'] < 1:
+            raise CommandError("--lote tem de ser pelo menos 1")
+
+        if options['dry_run']:
+            n = arquivo.arquivaveis(options['dias']).count()
+            self.stdout.write(f"{n} ordens seriam arquivadas")
+            return
+
+        def progresso(ordens, tarefas):
+            self.stdout.write(f"{ordens} ordens e {tarefas} tarefas arquivadas")
+
+        ordens, tarefas = arquivo.arquivar(
+            options['dias'], options['lote'], max_lotes=options['max_lotes'], progresso=progresso,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Arquivo concluído: {ordens} ordens, {tarefas} tarefas"))
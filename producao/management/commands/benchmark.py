@@ -0,0 +1,83 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from producao import benchmark, dados_sinteticos
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede tempo e queries dos caminhos mais usados (tablet, estatísticas, calendário do admin). "
+        "Com --escala gera primeiro dados sintéticos dessa escala (apagando os anteriores). "
+        "Os resultados podem ser guardados em JSON e comparados com uma base anterior."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--escala', action='append', choices=sorted(dados_sinteticos.ESCALAS),
+            help="Gera os dados desta escala e mede (pode repetir-se). Sem --escala mede os dados atuais.",
+        )
+        parser.add_argument('--repeticoes', type=int, default=benchmark.REPETICOES)
+        parser.add_argument('--semente', type=int, default=42)
+        parser.add_argument('--guardar', help="Ficheiro JSON onde guardar os resultados.")
+        parser.add_argument('--comparar', help="Ficheiro JSON de uma execução anterior (base).")
+        parser.add_argument('--tolerancia', type=float, default=benchmark.TOLERANCIA,
+                            help="Aumento relativo do tempo mediano aceite (0.25 = 25%%).")
+
+    def handle(self, *args, **options):
+        if options['repeticoes'] < 1:
+            raise CommandError("--repeticoes tem de ser pelo menos 1")
+        base = None
+        if options['comparar']:
+            with open(options['comparar'], encoding='utf-8') as ficheiro:
+                base = json.load(ficheiro)
+
+        resultados = {}
+        for escala in options['escala'] or [None]:
+            if escala:
+                dados_sinteticos.remover()
+                self.stdout.write(f"A gerar dados ({escala})...")
+                dados_sinteticos.gerar(**dados_sinteticos.ESCALAS[escala], semente=options['semente'])
+            try:
+                resultado = benchmark.executar(options['repeticoes'])
+            except benchmark.ErroBenchmark as erro:
+                raise CommandError(erro)
+            resultados[escala or 'atual'] = resultado
+            self.escrever(escala or 'atual', resultado)
+
+        if options['guardar']:
+            with open(options['guardar'], 'w', encoding='utf-8') as ficheiro:
+                json.dump(resultados, ficheiro, indent=2, ensure_ascii=False)
+            self.stdout.write(f"Resultados guardados em {options['guardar']}")
+
+        if base is not None:
+            regressoes = self.comparar(resultados, base, options['tolerancia'])
+            if regressoes:
+                raise CommandError(f"{regressoes} regressões em relação a {options['comparar']}")
+            self.stdout.write(self.style.SUCCESS("Sem regressões"))
+
+    def escrever(self, nome, resultado):
+        dados = resultado['dados']
+        self.stdout.write(f"\n== {nome}: {dados['ordens']} ordens, {dados['tarefas']} tarefas ({resultado['base_de_dados']})")
+        self.stdout.write(f"{'cenário':<26}{'mediana ms':>12}{'mín ms':>10}{'máx ms':>10}{'queries':>9}")
+        for cenario, medida in resultado['cenarios'].items():
+            self.stdout.write(
+                f"{cenario:<26}{medida['ms_mediana']:>12.1f}{medida['ms_min']:>10.1f}"
+                f"{medida['ms_max']:>10.1f}{medida['queries']:>9}"
+            )
+
+    def comparar(self, resultados, base, tolerancia):
+        regressoes = 0
+        for nome, resultado in resultados.items():
+            if nome not in base:
+                self.stdout.write(self.style.WARNING(f"{nome}: sem base para comparar"))
+                continue
+            self.stdout.write(f"\n== {nome} em relação à base")
+            for cenario, campo, antes, depois, regressao in benchmark.comparar(resultado, base[nome], tolerancia):
+                linha = f"{cenario:<26}{campo:<12}{antes:>10} -> {depois}"
+                if regressao:
+                    regressoes += 1
+                    self.stdout.write(self.style.ERROR(f"{linha}  REGRESSÃO"))
+                else:
+                    self.stdout.write(linha)
+        return regressoes
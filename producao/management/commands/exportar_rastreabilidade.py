@@ -0,0 +1,51 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from producao import rastreabilidade, replicas
+
+
+def _data(valor):
+    try:
+        return datetime.date.fromisoformat(valor)
+    except ValueError:
+        raise CommandError(f"Data inválida (use AAAA-MM-DD): {valor}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta as tarefas de cada número de série (ordens vivas e arquivadas) em CSV ou JSON Lines, "
+        "em streaming (memória constante)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--saida', help="Ficheiro de saída (por omissão, o stdout).")
+        parser.add_argument('--formato', choices=rastreabilidade.FORMATOS, default='csv')
+        parser.add_argument('--serie-de', help="Primeiro número de série (inclusive).")
+        parser.add_argument('--serie-ate', help="Último número de série (inclusive).")
+        parser.add_argument('--de', type=_data, help="Tarefas iniciadas a partir deste dia (AAAA-MM-DD).")
+        parser.add_argument('--ate', type=_data, help="Tarefas iniciadas até este dia, inclusive.")
+        parser.add_argument('--produto', type=int, help="Id do tipo de produto.")
+        parser.add_argument('--posto', type=int, help="Id do posto.")
+        parser.add_argument('--chunk', type=int, default=rastreabilidade.TAMANHO_CHUNK, help="Linhas lidas da base de dados de cada vez.")
+
+    def handle(self, *args, **options):
+        # Lê da réplica, se houver: a exportação pode ser longa e não deve competir com a produção
+        blocos = rastreabilidade.exportar(
+            options['formato'],
+            using=replicas.REPLICA if replicas.disponivel() else None,
+            tamanho_chunk=options['chunk'],
+            serie_de=options['serie_de'],
+            serie_ate=options['serie_ate'],
+            desde=options['de'],
+            ate=options['ate'],
+            acessorio_id=options['produto'],
+            posto_id=options['posto'],
+        )
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8', newline='') as ficheiro:
+                ficheiro.writelines(blocos)
+            self.stderr.write(f"Exportado para {options['saida']}")
+        else:
+            for bloco in blocos:
+                self.stdout.write(bloco, ending='')
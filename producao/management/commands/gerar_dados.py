@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from producao import dados_sinteticos
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera dados sintéticos de fábrica (postos, operadores, produtos, ordens e tarefas) para testes de carga. "
+        "Não usar na base de dados de produção."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escala', choices=sorted(dados_sinteticos.ESCALAS), default='pequena')
+        for campo in ('postos', 'funcionarios', 'produtos', 'ordens', 'dias'):
+            parser.add_argument(f'--{campo}', type=int, help=f"Substitui o número de {campo} da escala.")
+        parser.add_argument('--semente', type=int, default=42, help="Semente aleatória (mesma semente, mesmos dados).")
+        parser.add_argument('--lote', type=int, default=dados_sinteticos.TAMANHO_LOTE, help="Ordens gravadas em cada transação.")
+        parser.add_argument('--limpar', action='store_true', help="Apaga os dados sintéticos anteriores antes de gerar.")
+        parser.add_argument('--remover', action='store_true', help="Só apaga os dados sintéticos e termina.")
+
+    def handle(self, *args, **options):
+        if options['limpar'] or options['remover']:
+            n = dados_sinteticos.remover()
+            self.stdout.write(f"{n} ordens sintéticas apagadas")
+            if options['remover']:
+                return
+
+        parametros = dict(dados_sinteticos.ESCALAS[options['escala']])
+        parametros.update({campo: options[campo] for campo in parametros if options[campo] is not None})
+
+        def progresso(ordens, tarefas):
+            self.stdout.write(f"{ordens}/{parametros['ordens']} ordens, {tarefas} tarefas")
+
+        try:
+            gerados = dados_sinteticos.gerar(
+                **parametros, semente=options['semente'], tamanho_lote=options['lote'], progresso=progresso,
+            )
+        except ValueError as erro:
+            raise CommandError(erro)
+        self.stdout.write(self.style.SUCCESS(
+            f"Dados gerados ({options['escala']}): {gerados['ordens']} ordens, {gerados['tarefas']} tarefas"
+        ))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from producao import importacao
+
+
+class Command(BaseCommand):
+    help = "Importa ordens de produção de um ficheiro CSV (numero_serie, tipo_produto, data_prevista, funcionario)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('ficheiro', help="Caminho do ficheiro CSV.")
+        parser.add_argument('--lote', type=int, default=importacao.TAMANHO_LOTE, help="Linhas validadas e inseridas de cada vez.")
+        parser.add_argument('--encoding', default='utf-8-sig', help="Codificação do ficheiro (o Excel usa muitas vezes cp1252).")
+        parser.add_argument('--delimitador', help="Separador de colunas. Por omissão é detetado pelo cabeçalho (';' ou ',').")
+        parser.add_argument('--dry-run', action='store_true', help="Só valida, não grava nada.")
+
+    def handle(self, *args, **options):
+        if options['lote'] < 1:
+            raise CommandError("--lote tem de ser pelo menos 1")
+        try:
+            importacao.verificar_codificacao(options['encoding'])
+        except ValueError as erro:
+            raise CommandError(erro)
+
+        def progresso(relatorio):
+            self.stdout.write(f"... {relatorio}")
+
+        try:
+            with open(options['ficheiro'], encoding=options['encoding'], newline='') as ficheiro:
+                relatorio = importacao.importar_csv(
+                    ficheiro,
+                    tamanho_lote=options['lote'],
+                    gravar=not options['dry_run'],
+                    delimitador=options['delimitador'],
+                    progresso=progresso,
+                )
+        except (OSError, UnicodeDecodeError) as erro:
+            raise CommandError(f"Não foi possível ler o ficheiro: {erro}")
+
+        for linha, numero_serie, mensagem in relatorio.erros:
+            self.stderr.write(f"Linha {linha} ({numero_serie or '-'}): {mensagem}")
+        estilo = self.style.WARNING if relatorio.erros else self.style.SUCCESS
+        prefixo = "[dry-run] " if options['dry_run'] else ""
+        self.stdout.write(estilo(f"{prefixo}{relatorio}"))
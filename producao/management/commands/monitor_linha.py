@@ -0,0 +1,48 @@
+import datetime
+import signal
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from producao import monitor
+
+
+class Command(BaseCommand):
+    help = (
+        "Vigia a linha (filas, postos lentos, ordens em risco de atraso) e grava os alertas mostrados nas "
+        "estatísticas. Corre num processo próprio; só deve haver um."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--intervalo', type=float, default=monitor.INTERVALO, help="Segundos entre verificações.")
+        parser.add_argument('--uma-vez', action='store_true', help="Faz uma verificação e termina (ex: cron).")
+        parser.add_argument('--janela', type=int, default=int(monitor.JANELA.total_seconds() // 60), help="Minutos de tarefas fechadas a considerar.")
+        parser.add_argument('--limite-fila', type=float, default=monitor.LIMITE_FILA_HORAS, help="Horas de fila a partir das quais há alerta.")
+        parser.add_argument('--fator-lento', type=float, default=monitor.FATOR_LENTO, help="Razão face ao ciclo habitual a partir da qual um posto é lento.")
+
+    def handle(self, *args, **options):
+        if options['intervalo'] <= 0 or options['janela'] <= 0:
+            raise CommandError("--intervalo e --janela têm de ser positivos")
+
+        # SIGTERM (deploy/paragem no Render) deixa acabar a verificação atual
+        parar = []
+        def pedir_paragem(sinal, frame):
+            parar.append(sinal)
+        signal.signal(signal.SIGTERM, pedir_paragem)
+        signal.signal(signal.SIGINT, pedir_paragem)
+
+        vigia = monitor.Monitor(
+            janela=datetime.timedelta(minutes=options['janela']),
+            limite_fila_horas=options['limite_fila'],
+            fator_lento=options['fator_lento'],
+        )
+        vigia.arrancar()
+        self.stdout.write(f"Monitor a vigiar {len(vigia.ordens)} ordens abertas")
+        while not parar:
+            novos, resolvidos = vigia.executar()
+            if novos or resolvidos:
+                self.stdout.write(f"Alertas: {novos} novos, {resolvidos} resolvidos, {len(vigia.alertas)} ativos")
+            if options['uma_vez']:
+                break
+            time.sleep(options['intervalo'])
+        self.stdout.write(f"Monitor terminou ({len(vigia.alertas)} alertas ativos)")
@@ -0,0 +1,41 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from producao import planeamento
+
+
+class Command(BaseCommand):
+    help = "Atribui funcionário designado e data prevista às ordens pendentes, segundo a capacidade de cada posto."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inicio', help="Primeiro dia do plano (AAAA-MM-DD). Por omissão, hoje.")
+        parser.add_argument('--horas-por-dia', type=float, default=planeamento.HORAS_POR_DIA, help="Capacidade de cada operador por dia útil.")
+        parser.add_argument('--dias-historico', type=int, default=planeamento.DIAS_HISTORICO, help="Dias de histórico usados para os tempos de ciclo.")
+        parser.add_argument('--replanear', action='store_true', help="Planeia também as ordens que já têm funcionário e data.")
+        parser.add_argument('--dry-run', action='store_true', help="Mostra as alterações sem gravar.")
+
+    def handle(self, *args, **options):
+        try:
+            inicio = datetime.date.fromisoformat(options['inicio']) if options['inicio'] else None
+        except ValueError as erro:
+            raise CommandError(f"Data inválida: {erro}")
+        if options['horas_por_dia'] <= 0:
+            raise CommandError("--horas-por-dia tem de ser positivo")
+
+        plano = planeamento.planear(
+            replanear=options['replanear'],
+            inicio=inicio,
+            horas_por_dia=options['horas_por_dia'],
+            dias_historico=options['dias_historico'],
+        )
+        if options['dry_run']:
+            for alteracao in plano.alteracoes:
+                self.stdout.write(str(alteracao))
+            for numero_serie in plano.sem_operador:
+                self.stdout.write(f"{numero_serie}: sem operadores autorizados no posto atual")
+            self.stdout.write(f"(dry-run) {plano}")
+            return
+
+        planeamento.aplicar(plano)
+        self.stdout.write(self.style.SUCCESS(f"Plano gravado: {plano}"))
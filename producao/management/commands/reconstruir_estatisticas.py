@@ -0,0 +1,29 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from producao import estatisticas
+
+
+class Command(BaseCommand):
+    help = "Volta a gerar os totais diários de produção (ProducaoDiaria) a partir do histórico de tarefas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help="Primeiro dia a reconstruir (AAAA-MM-DD). Por omissão, o início do histórico.")
+        parser.add_argument('--ate', help="Último dia a reconstruir (AAAA-MM-DD). Por omissão, o fim do histórico.")
+        parser.add_argument('--dias-por-lote', type=int, default=31, help="Dias processados em cada transação.")
+
+    def handle(self, *args, **options):
+        try:
+            desde = datetime.date.fromisoformat(options['desde']) if options['desde'] else None
+            ate = datetime.date.fromisoformat(options['ate']) if options['ate'] else None
+        except ValueError as erro:
+            raise CommandError(f"Data inválida: {erro}")
+        if options['dias_por_lote'] < 1:
+            raise CommandError("--dias-por-lote tem de ser pelo menos 1")
+
+        def progresso(inicio, fim, linhas):
+            self.stdout.write(f"{inicio} a {fim}: {linhas} linhas")
+
+        total = estatisticas.reconstruir(desde, ate, options['dias_por_lote'], progresso=progresso)
+        self.stdout.write(self.style.SUCCESS(f"Totais reconstruídos: {total} linhas"))
@@ -0,0 +1,32 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from producao import historico
+
+
+class Command(BaseCommand):
+    help = "Cria os snapshots de WIP em falta (para correr periodicamente, ex: de hora a hora)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reconstruir', action='store_true',
+            help="Antes, volta a gerar todos os eventos a partir das ordens e tarefas (histórico anterior aos eventos).",
+        )
+        parser.add_argument('--intervalo', type=int, default=60, help="Minutos entre snapshots.")
+
+    def handle(self, *args, **options):
+        if options['reconstruir']:
+            def progresso_eventos(ordens, eventos):
+                self.stdout.write(f"{ordens} ordens: {eventos} eventos")
+
+            eventos = historico.reconstruir(progresso=progresso_eventos)
+            self.stdout.write(self.style.SUCCESS(f"Eventos reconstruídos: {eventos}"))
+
+        def progresso(momento, criados):
+            if criados % 100 == 0:
+                self.stdout.write(f"{criados} snapshots (até {momento:%Y-%m-%d %H:%M})")
+
+        intervalo = datetime.timedelta(minutes=max(options['intervalo'], 1))
+        criados = historico.criar_snapshots(intervalo=intervalo, progresso=progresso)
+        self.stdout.write(self.style.SUCCESS(f"Snapshots criados: {criados}"))
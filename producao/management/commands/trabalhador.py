@@ -0,0 +1,54 @@
+import os
+import signal
+import socket
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from producao import trabalhos
+
+
+class Command(BaseCommand):
+    help = (
+        "Executa os trabalhos em segundo plano enfileirados pelo admin (importações, reconstrução de totais, ...). "
+        "Corre num processo próprio; vários trabalhadores podem partilhar a mesma fila."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--intervalo', type=float, default=2, help="Segundos de espera quando a fila está vazia.")
+        parser.add_argument('--uma-vez', action='store_true', help="Esvazia a fila e termina (ex: cron).")
+        parser.add_argument('--nome', default=f"{socket.gethostname()}:{os.getpid()}", help="Identificação deste trabalhador.")
+        parser.add_argument('--max-trabalhos', type=int, help="Termina ao fim deste número de trabalhos.")
+
+    def handle(self, *args, **options):
+        if options['intervalo'] <= 0:
+            raise CommandError("--intervalo tem de ser positivo")
+
+        # SIGTERM (deploy/paragem no Render) deixa acabar o trabalho atual
+        parar = []
+        def pedir_paragem(sinal, frame):
+            parar.append(sinal)
+        signal.signal(signal.SIGTERM, pedir_paragem)
+        signal.signal(signal.SIGINT, pedir_paragem)
+
+        nome, limite = options['nome'], options['max_trabalhos']
+        executados = 0
+        self.stdout.write(f"Trabalhador {nome} à espera de trabalhos")
+        while not parar and (limite is None or executados < limite):
+            recuperados = trabalhos.recuperar_abandonados()
+            if recuperados:
+                self.stdout.write(self.style.WARNING(f"{recuperados} trabalhos abandonados devolvidos à fila"))
+            trabalho = trabalhos.reclamar(nome)
+            if trabalho is None:
+                if options['uma_vez']:
+                    break
+                time.sleep(options['intervalo'])
+                continue
+            descricao = f"#{trabalho.pk} {trabalho.tipo}"
+            self.stdout.write(f"A executar {descricao} (tentativa {trabalho.tentativas})")
+            if trabalhos.executar(trabalho):
+                self.stdout.write(self.style.SUCCESS(f"{descricao} concluído"))
+            else:
+                self.stdout.write(self.style.ERROR(f"{descricao} falhou"))
+            executados += 1
+        self.stdout.write(f"Trabalhador {nome} terminou ({executados} trabalhos)")
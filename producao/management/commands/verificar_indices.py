@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from producao import indices
+
+
+class Command(BaseCommand):
+    help = "Corre EXPLAIN nas queries mais frequentes e confirma que usam os índices esperados."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help="Alias da base de dados a verificar.")
+        parser.add_argument('--planos', action='store_true', help="Mostra o plano de todas as queries, não só das que falham.")
+
+    def handle(self, *args, **options):
+        falhas = 0
+        for descricao, ok, plano in indices.verificar(options['database']):
+            if ok:
+                self.stdout.write(self.style.SUCCESS(f"OK    {descricao}"))
+            else:
+                falhas += 1
+                self.stdout.write(self.style.ERROR(f"FALHA {descricao}"))
+            if options['planos'] or not ok:
+                self.stdout.write(f"      {plano}")
+        if falhas:
+            raise CommandError(f"{falhas} queries não usam os índices esperados")
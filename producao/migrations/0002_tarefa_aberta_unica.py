@@ -0,0 +1,39 @@
+# Generated by Django 6.0.1 on 2026-10-18 10:12
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fechar_tarefas_duplicadas(apps, schema_editor):
+    # Por ordem e por funcionário fica aberta a tarefa mais antiga; as outras fecham sem duração (fim=inicio)
+    TarefaProducao = apps.get_model('producao', 'TarefaProducao')
+    abertas = TarefaProducao.objects.filter(concluido=False).order_by(F('inicio').asc(nulls_last=True), 'id')
+    ordens, funcionarios, fechar = set(), set(), []
+    for tarefa_id, ordem_id, funcionario_id in abertas.values_list('id', 'ordem_id', 'funcionario_id').iterator():
+        if ordem_id in ordens or funcionario_id in funcionarios:
+            fechar.append(tarefa_id)
+            continue
+        ordens.add(ordem_id)
+        if funcionario_id is not None:
+            funcionarios.add(funcionario_id)
+    for i in range(0, len(fechar), 1000):
+        TarefaProducao.objects.filter(pk__in=fechar[i:i + 1000]).update(concluido=True, fim=F('inicio'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('producao', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(fechar_tarefas_duplicadas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='tarefaproducao',
+            constraint=models.UniqueConstraint(condition=models.Q(('concluido', False)), fields=('ordem',), name='tarefa_aberta_unica_por_ordem'),
+        ),
+        migrations.AddConstraint(
+            model_name='tarefaproducao',
+            constraint=models.UniqueConstraint(condition=models.Q(('concluido', False)), fields=('funcionario',), name='tarefa_aberta_unica_por_funcionario'),
+        ),
+    ]
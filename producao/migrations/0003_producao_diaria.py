@@ -0,0 +1,32 @@
+# Generated by Django 6.0.1 on 2026-10-18 11:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('producao', '0002_tarefa_aberta_unica'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProducaoDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('tarefas', models.PositiveIntegerField(default=0)),
+                ('ordens_concluidas', models.PositiveIntegerField(default=0)),
+                ('segundos_total', models.FloatField(default=0, help_text='Soma dos tempos de ciclo (fim - início) em segundos')),
+                ('acessorio', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='producao.acessorio', verbose_name='Tipo de Produto')),
+                ('funcionario', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='producao.funcionario')),
+                ('posto', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='producao.posto')),
+            ],
+            options={
+                'verbose_name': 'Produção Diária',
+                'verbose_name_plural': 'Produção Diária',
+                'constraints': [models.UniqueConstraint(fields=('dia', 'funcionario', 'posto', 'acessorio'), name='producao_diaria_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('producao', '0003_producao_diaria'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ordemproducao',
+            index=models.Index(condition=models.Q(('status_global', 'PENDENTE')), fields=['posto_atual', 'funcionario_designado', 'data_prevista'], name='ordem_fila_posto_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordemproducao',
+            index=models.Index(condition=models.Q(('status_global', 'CONCLUIDO'), _negated=True), fields=['data_prevista'], name='ordem_aberta_prevista_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordemproducao',
+            index=models.Index(condition=models.Q(('status_global', 'CONCLUIDO'), _negated=True), fields=['posto_atual', 'status_global'], name='ordem_aberta_posto_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ordemproducao',
+            index=models.Index(fields=['data_prevista', 'status_global'], name='ordem_prevista_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tarefaproducao',
+            index=models.Index(condition=models.Q(('concluido', True)), fields=['fim', 'posto'], name='tarefa_concluida_fim_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 6.0.1 on 2026-10-18 13:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copiar_pecas_necessarias(apps, schema_editor):
+    # Cada peça da antiga lista passa a componente com quantidade 1
+    Acessorio = apps.get_model('producao', 'Acessorio')
+    ComponenteAcessorio = apps.get_model('producao', 'ComponenteAcessorio')
+    ligacoes = Acessorio.pecas_necessarias.through.objects.values_list('acessorio_id', 'peca_id')
+    ComponenteAcessorio.objects.bulk_create(
+        [ComponenteAcessorio(acessorio_id=acessorio_id, peca_id=peca_id, quantidade=1) for acessorio_id, peca_id in ligacoes],
+        batch_size=1000,
+    )
+
+
+def marcar_ordens_iniciadas(apps, schema_editor):
+    # Ordens que já começaram antes da lista de materiais não devem voltar a descontar stock
+    OrdemProducao = apps.get_model('producao', 'OrdemProducao')
+    OrdemProducao.objects.filter(tarefas__isnull=False).update(estado_stock='CONSUMIDO')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('producao', '0004_indices_filas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComponenteAcessorio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantidade', models.PositiveIntegerField(default=1)),
+                ('acessorio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='componentes', to='producao.acessorio')),
+                ('peca', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='componentes', to='producao.peca')),
+            ],
+            options={
+                'verbose_name': 'Componente',
+                'verbose_name_plural': 'Lista de Materiais',
+                'constraints': [models.UniqueConstraint(fields=('acessorio', 'peca'), name='componente_unico_por_acessorio')],
+            },
+        ),
+        migrations.RunPython(copiar_pecas_necessarias, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='acessorio',
+            name='pecas_necessarias',
+        ),
+        migrations.AddField(
+            model_name='ordemproducao',
+            name='estado_stock',
+            field=models.CharField(choices=[('NAO_RESERVADO', 'Não Reservado'), ('RESERVADO', 'Reservado'), ('CONSUMIDO', 'Consumido')], default='NAO_RESERVADO', max_length=20),
+        ),
+        migrations.RunPython(marcar_ordens_iniciadas, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='peca',
+            name='stock_reservado',
+            field=models.IntegerField(default=0, help_text='Unidades reservadas para ordens ainda não iniciadas'),
+        ),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def preencher_data_conclusao(apps, schema_editor):
+    # Ordens já concluídas: a data de conclusão é o fim da sua última tarefa
+    OrdemProducao = apps.get_model('producao', 'OrdemProducao')
+    TarefaProducao = apps.get_model('producao', 'TarefaProducao')
+    ultima = (
+        TarefaProducao.objects.filter(ordem=models.OuterRef('pk'), fim__isnull=False)
+        .order_by('-fim').values('fim')[:1]
+    )
+    OrdemProducao.objects.filter(status_global='CONCLUIDO', data_conclusao__isnull=True).update(
+        data_conclusao=models.Subquery(ultima)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('producao', '0005_lista_materiais'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrdemArquivada',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('numero_serie', models.CharField(db_index=True, max_length=50)),
+                ('data_criacao', models.DateTimeField()),
+                ('data_prevista', models.DateField(blank=True, null=True)),
+                ('status_global', models.CharField(choices=[('PENDENTE', 'Pendente'), ('EM_ANDAMENTO', 'Em Andamento'), ('CONCLUIDO', 'Concluído')], default='CONCLUIDO', max_length=20)),
+                ('estado_stock', models.CharField(choices=[('NAO_RESERVADO', 'Não Reservado'), ('RESERVADO', 'Reservado'), ('CONSUMIDO', 'Consumido')], default='CONSUMIDO', max_length=20)),
+                ('data_conclusao', models.DateTimeField(blank=True, null=True)),
+                ('arquivada_em', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Ordem Arquivada',
+                'verbose_name_plural': 'Ordens Arquivadas',
+            },
+        ),
+        migrations.CreateModel(
+            name='TarefaArquivada',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('inicio', models.DateTimeField(blank=True, null=True)),
+                ('fim', models.DateTimeField(blank=True, null=True)),
+                ('concluido', models.BooleanField(default=True)),
+            ],
+            options={
+                'verbose_name': 'Tarefa Arquivada',
+                'verbose_name_plural': 'Tarefas Arquivadas',
+            },
+        ),
+        migrations.AddField(
+            model_name='ordemproducao',
+            name='data_conclusao',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(preencher_data_conclusao, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ordemproducao',
+            index=models.Index(condition=models.Q(('status_global', 'CONCLUIDO')), fields=['data_conclusao', 'id'], name='ordem_concluida_data_idx'),
+        ),
+        migrations.AddField(
+            model_name='ordemarquivada',
+            name='acessorio',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='producao.acessorio', verbose_name='Tipo de Produto'),
+        ),
+        migrations.AddField(
+            model_name='ordemarquivada',
+            name='funcionario_designado',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='producao.funcionario'),
+        ),
+        migrations.AddField(
+            model_name='ordemarquivada',
+            name='posto_atual',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='producao.posto'),
+        ),
+        migrations.AddField(
+            model_name='tarefaarquivada',
+            name='funcionario',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='producao.funcionario'),
+        ),
+        migrations.AddField(
+            model_name='tarefaarquivada',
+            name='ordem',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tarefas', to='producao.ordemarquivada'),
+        ),
+        migrations.AddField(
+            model_name='tarefaarquivada',
+            name='posto',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='producao.posto'),
+        ),
+        migrations.AddIndex(
+            model_name='ordemarquivada',
+            index=models.Index(fields=['data_prevista', 'status_global'], name='arquivo_prevista_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tarefaarquivada',
+            index=models.Index(fields=['fim', 'posto'], name='arquivo_tarefa_fim_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('producao', '0006_arquivo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Trabalho',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(help_text='Nome registado em trabalhos.py (ex: importar_ordens)', max_length=50)),
+                ('parametros', models.JSONField(blank=True, default=dict)),
+                ('ficheiro', models.BinaryField(blank=True, help_text='Dados carregados pelo utilizador (ex: CSV), apagados no fim', null=True)),
+                ('estado', models.CharField(choices=[('PENDENTE', 'Pendente'), ('EM_CURSO', 'Em Curso'), ('CONCLUIDO', 'Concluído'), ('FALHOU', 'Falhou')], default='PENDENTE', max_length=20)),
+                ('tentativas', models.PositiveIntegerField(default=0)),
+                ('max_tentativas', models.PositiveIntegerField(default=3)),
+                ('progresso', models.PositiveSmallIntegerField(default=0, help_text='Percentagem (0 a 100)')),
+                ('mensagem', models.CharField(blank=True, max_length=255)),
+                ('resultado', models.JSONField(blank=True, null=True)),
+                ('erro', models.TextField(blank=True)),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+                ('disponivel_em', models.DateTimeField(default=django.utils.timezone.now, help_text='Só é executado a partir desta hora (novas tentativas esperam)')),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True)),
+                ('atualizado_em', models.DateTimeField(blank=True, help_text='Último sinal de vida do trabalhador', null=True)),
+                ('terminado_em', models.DateTimeField(blank=True, null=True)),
+                ('trabalhador', models.CharField(blank=True, max_length=100)),
+                ('criado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Trabalho em Segundo Plano',
+                'verbose_name_plural': 'Trabalhos em Segundo Plano',
+                'indexes': [models.Index(condition=models.Q(('estado', 'PENDENTE')), fields=['disponivel_em', 'id'], name='trabalho_fila_idx')],
+            },
+        ),
+    ]
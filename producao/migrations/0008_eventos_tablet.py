@@ -0,0 +1,33 @@
+# Generated by Django 6.0.1 on 2026-10-18 15:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('producao', '0007_trabalhos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoTablet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uuid', models.UUIDField(help_text='Gerado no tablet: reenviar o mesmo evento não o aplica duas vezes', unique=True)),
+                ('tipo', models.CharField(choices=[('INICIAR', 'Iniciar'), ('FINALIZAR', 'Finalizar')], max_length=10)),
+                ('momento', models.DateTimeField(help_text='Hora do tablet em que o operador carregou no botão')),
+                ('recebido_em', models.DateTimeField(auto_now_add=True)),
+                ('estado', models.CharField(choices=[('APLICADO', 'Aplicado'), ('CONFLITO', 'Conflito')], default='APLICADO', max_length=10)),
+                ('mensagem', models.CharField(blank=True, max_length=255)),
+                ('funcionario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='eventos_tablet', to='producao.funcionario')),
+                ('ordem', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='producao.ordemproducao')),
+                ('tarefa', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='producao.tarefaproducao')),
+            ],
+            options={
+                'verbose_name': 'Evento de Tablet',
+                'verbose_name_plural': 'Eventos de Tablet',
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 6.0.1 on 2026-10-18 16:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('producao', '0008_eventos_tablet'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnapshotWIP',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('momento', models.DateTimeField(unique=True)),
+                ('ordens', models.JSONField(help_text='{ordem_id: [posto_id, status]} das ordens por concluir')),
+                ('eventos', models.PositiveIntegerField(default=0, help_text='Eventos repetidos desde o snapshot anterior')),
+                ('criado_em', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Snapshot de WIP',
+                'verbose_name_plural': 'Snapshots de WIP',
+            },
+        ),
+        migrations.CreateModel(
+            name='EventoProducao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('momento', models.DateTimeField()),
+                ('tipo', models.CharField(choices=[('CRIADA', 'Criada'), ('INICIADA', 'Tarefa iniciada'), ('FINALIZADA', 'Tarefa finalizada'), ('MOVIDA', 'Alterada no admin'), ('REMOVIDA', 'Apagada')], max_length=10)),
+                ('status', models.CharField(blank=True, choices=[('PENDENTE', 'Pendente'), ('EM_ANDAMENTO', 'Em Andamento'), ('CONCLUIDO', 'Concluído')], max_length=20)),
+                ('funcionario', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='producao.funcionario')),
+                ('ordem', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='producao.ordemproducao')),
+                ('posto', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='producao.posto')),
+            ],
+            options={
+                'verbose_name': 'Evento de Produção',
+                'verbose_name_plural': 'Eventos de Produção',
+                'indexes': [models.Index(fields=['momento', 'id'], name='evento_momento_idx'), models.Index(fields=['ordem', 'momento'], name='evento_ordem_idx')],
+            },
+        ),
+    ]
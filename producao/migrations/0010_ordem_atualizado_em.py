@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-18 16:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('producao', '0009_historico_wip'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ordemproducao',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='ordemproducao',
+            index=models.Index(fields=['data_prevista', 'atualizado_em'], name='ordem_prevista_atualizada_idx'),
+        ),
+    ]
@@ -0,0 +1,113 @@
+# Generated by Django 6.0.1 on 2026-10-18 17:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('producao', '0010_ordem_atualizado_em'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LinhaProducao',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=100, unique=True)),
+            ],
+            options={
+                'verbose_name': 'Linha de Produção',
+                'verbose_name_plural': 'Linhas de Produção',
+            },
+        ),
+        migrations.CreateModel(
+            name='PassoRota',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('etapa', models.PositiveIntegerField(help_text='Passos com a mesma etapa são feitos em paralelo')),
+                ('opcional', models.BooleanField(default=False, help_text='Numa etapa paralela, não é preciso esperar por este posto')),
+            ],
+            options={
+                'verbose_name': 'Passo da Rota',
+                'verbose_name_plural': 'Rota (passos por etapa)',
+                'ordering': ['acessorio', 'etapa', 'posto__ordem_sequencia'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RamoOrdem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('opcional', models.BooleanField(default=False)),
+                ('estado', models.CharField(choices=[('PENDENTE', 'Pendente'), ('EM_ANDAMENTO', 'Em Andamento'), ('CONCLUIDO', 'Concluído')], default='PENDENTE', max_length=20)),
+            ],
+            options={
+                'verbose_name': 'Ramo Paralelo',
+                'verbose_name_plural': 'Ramos Paralelos',
+            },
+        ),
+        migrations.RemoveConstraint(
+            model_name='tarefaproducao',
+            name='tarefa_aberta_unica_por_ordem',
+        ),
+        migrations.AlterField(
+            model_name='posto',
+            name='ordem_sequencia',
+            field=models.IntegerField(help_text='Ordem do posto no fluxo da sua linha (ex: 1, 2, 3...)'),
+        ),
+        migrations.AddConstraint(
+            model_name='tarefaproducao',
+            constraint=models.UniqueConstraint(condition=models.Q(('concluido', False)), fields=('ordem', 'posto'), name='tarefa_aberta_unica_por_ordem_posto'),
+        ),
+        migrations.AddField(
+            model_name='acessorio',
+            name='linha',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='produtos', to='producao.linhaproducao'),
+        ),
+        migrations.AddField(
+            model_name='posto',
+            name='linha',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='postos', to='producao.linhaproducao'),
+        ),
+        migrations.AddConstraint(
+            model_name='posto',
+            constraint=models.UniqueConstraint(fields=('linha', 'ordem_sequencia'), name='posto_sequencia_unica_por_linha'),
+        ),
+        migrations.AddConstraint(
+            model_name='posto',
+            constraint=models.UniqueConstraint(condition=models.Q(('linha__isnull', True)), fields=('ordem_sequencia',), name='posto_sequencia_unica_sem_linha'),
+        ),
+        migrations.AddField(
+            model_name='passorota',
+            name='acessorio',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='passos_rota', to='producao.acessorio', verbose_name='Tipo de Produto'),
+        ),
+        migrations.AddField(
+            model_name='passorota',
+            name='posto',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='producao.posto'),
+        ),
+        migrations.AddField(
+            model_name='ramoordem',
+            name='ordem',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ramos', to='producao.ordemproducao'),
+        ),
+        migrations.AddField(
+            model_name='ramoordem',
+            name='posto',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='producao.posto'),
+        ),
+        migrations.AddConstraint(
+            model_name='passorota',
+            constraint=models.UniqueConstraint(fields=('acessorio', 'posto'), name='passo_rota_posto_unico'),
+        ),
+        migrations.AddIndex(
+            model_name='ramoordem',
+            index=models.Index(condition=models.Q(('estado', 'PENDENTE')), fields=['posto', 'ordem'], name='ramo_pendente_posto_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='ramoordem',
+            constraint=models.UniqueConstraint(fields=('ordem', 'posto'), name='ramo_unico_por_posto'),
+        ),
+    ]
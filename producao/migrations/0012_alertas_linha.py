@@ -0,0 +1,53 @@
+# Generated by Django 6.0.1 on 2026-10-18 18:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('producao', '0011_rotas_por_produto'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertaLinha',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('FILA', 'Fila a acumular'), ('LENTO', 'Posto mais lento que o habitual'), ('PRAZO', 'Ordem em risco de atraso')], max_length=10)),
+                ('chave', models.CharField(max_length=50)),
+                ('mensagem', models.CharField(max_length=255)),
+                ('valor', models.FloatField(help_text='Medida que disparou o alerta (horas de fila, razão do ciclo, dias de atraso)')),
+                ('inicio', models.DateTimeField()),
+                ('atualizado_em', models.DateTimeField()),
+                ('resolvido_em', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Alerta da Linha',
+                'verbose_name_plural': 'Alertas da Linha',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ordemproducao',
+            index=models.Index(fields=['atualizado_em'], name='ordem_atualizada_idx'),
+        ),
+        migrations.AddField(
+            model_name='alertalinha',
+            name='ordem',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='producao.ordemproducao'),
+        ),
+        migrations.AddField(
+            model_name='alertalinha',
+            name='posto',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='producao.posto'),
+        ),
+        migrations.AddIndex(
+            model_name='alertalinha',
+            index=models.Index(condition=models.Q(('resolvido_em__isnull', True)), fields=['tipo', 'valor'], name='alerta_ativo_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='alertalinha',
+            constraint=models.UniqueConstraint(condition=models.Q(('resolvido_em__isnull', True)), fields=('chave',), name='alerta_ativo_unico'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0.1 on 2026-10-18 19:55
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('producao', '0013_nomes_atualizado_em'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='trabalho',
+            name='ficheiro',
+        ),
+    ]
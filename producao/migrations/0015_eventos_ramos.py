@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-18 20:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('producao', '0014_trabalho_ficheiro_no_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventoproducao',
+            name='ramo',
+            field=models.BooleanField(default=False, help_text='Ramo de uma etapa paralela: só muda o estado da ordem neste posto (status do ramo)'),
+        ),
+        migrations.AlterField(
+            model_name='snapshotwip',
+            name='ordens',
+            field=models.JSONField(help_text='{ordem_id: [[posto_id, status], ...]} das ordens por concluir (um por ramo)'),
+        ),
+    ]
@@ -1,14 +1,34 @@
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+class LinhaProducao(models.Model):
+    """Linha de produção: um conjunto de postos com a sua própria sequência"""
+    nome = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        verbose_name = "Linha de Produção"
+        verbose_name_plural = "Linhas de Produção"
+
+    def __str__(self):
+        return self.nome
+
 class Posto(models.Model):
     nome = models.CharField(max_length=100)
-    ordem_sequencia = models.IntegerField(unique=True, help_text="Ordem do posto no fluxo (ex: 1, 2, 3...)")
+    # Postos sem linha formam a linha geral (a de sempre)
+    linha = models.ForeignKey(LinhaProducao, on_delete=models.PROTECT, null=True, blank=True, related_name='postos')
+    ordem_sequencia = models.IntegerField(help_text="Ordem do posto no fluxo da sua linha (ex: 1, 2, 3...)")
     descricao = models.TextField(blank=True)
+    # Nomes alterados mudam a agenda (ver agenda.versao)
+    atualizado_em = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['ordem_sequencia']
+        constraints = [
+            models.UniqueConstraint(fields=['linha', 'ordem_sequencia'], name='posto_sequencia_unica_por_linha'),
+            models.UniqueConstraint(fields=['ordem_sequencia'], condition=models.Q(linha__isnull=True), name='posto_sequencia_unica_sem_linha'),
+        ]
 
     def __str__(self):
         return f"{self.ordem_sequencia} - {self.nome}"
@@ -18,6 +38,7 @@ class Funcionario(models.Model):
     codigo = models.CharField(max_length=20, unique=True, help_text="Código de acesso (PIN) para login no posto")
     postos = models.ManyToManyField(Posto, related_name='funcionarios', help_text="Postos onde este funcionário pode trabalhar")
     telefone = models.CharField(max_length=20, blank=True)
+    atualizado_em = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.nome
@@ -27,14 +48,21 @@ class Peca(models.Model):
     nome = models.CharField(max_length=200)
     referencia = models.CharField(max_length=50, unique=True)
     stock_atual = models.IntegerField(default=0)
+    stock_reservado = models.IntegerField(default=0, help_text="Unidades reservadas para ordens ainda não iniciadas")
 
     def __str__(self):
         return f"{self.referencia} - {self.nome}"
 
+    @property
+    def stock_disponivel(self):
+        return self.stock_atual - self.stock_reservado
+
 class Acessorio(models.Model):
     nome = models.CharField(max_length=200)
     descricao = models.TextField(blank=True)
-    pecas_necessarias = models.ManyToManyField(Peca, blank=True, help_text="Peças necessárias para fabricar este acessório")
+    # Sem passos de rota próprios, o produto percorre todos os postos desta linha (ou da linha geral)
+    linha = models.ForeignKey(LinhaProducao, on_delete=models.PROTECT, null=True, blank=True, related_name='produtos')
+    atualizado_em = models.DateTimeField(auto_now=True)
     
     class Meta:
         verbose_name = "Tipo de Produto"
@@ -43,6 +71,44 @@ class Acessorio(models.Model):
     def __str__(self):
         return self.nome
 
+class PassoRota(models.Model):
+    """
+    Passo da rota própria de um produto (ver roteamento.py). Os passos com o mesmo
+    número de etapa são feitos em paralelo e a ordem só avança quando terminam todos
+    os obrigatórios; os opcionais que ninguém começou são saltados.
+    """
+    acessorio = models.ForeignKey(Acessorio, on_delete=models.CASCADE, related_name='passos_rota', verbose_name="Tipo de Produto")
+    etapa = models.PositiveIntegerField(help_text="Passos com a mesma etapa são feitos em paralelo")
+    posto = models.ForeignKey(Posto, on_delete=models.PROTECT)
+    opcional = models.BooleanField(default=False, help_text="Numa etapa paralela, não é preciso esperar por este posto")
+
+    class Meta:
+        verbose_name = "Passo da Rota"
+        verbose_name_plural = "Rota (passos por etapa)"
+        ordering = ['acessorio', 'etapa', 'posto__ordem_sequencia']
+        constraints = [
+            models.UniqueConstraint(fields=['acessorio', 'posto'], name='passo_rota_posto_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.etapa}: {self.posto_id}{' (opcional)' if self.opcional else ''}"
+
+class ComponenteAcessorio(models.Model):
+    """Lista de materiais: quantas unidades de cada peça leva um acessório"""
+    acessorio = models.ForeignKey(Acessorio, on_delete=models.CASCADE, related_name='componentes')
+    peca = models.ForeignKey(Peca, on_delete=models.PROTECT, related_name='componentes')
+    quantidade = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        verbose_name = "Componente"
+        verbose_name_plural = "Lista de Materiais"
+        constraints = [
+            models.UniqueConstraint(fields=['acessorio', 'peca'], name='componente_unico_por_acessorio'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantidade} x {self.peca_id}"
+
 class OrdemProducao(models.Model):
     STATUS_CHOICES = [
         ('PENDENTE', 'Pendente'),
@@ -53,7 +119,7 @@ class OrdemProducao(models.Model):
     acessorio = models.ForeignKey(Acessorio, on_delete=models.PROTECT, verbose_name="Tipo de Produto")
     data_criacao = models.DateTimeField(auto_now_add=True)
     
-    # Agora liga à tabela Posto em vez de ser um número fixo
+    # Agora liga à tabela Posto em vez de ser um número fixo. Vazio enquanto a ordem está numa etapa paralela (RamoOrdem)
     posto_atual = models.ForeignKey(Posto, on_delete=models.PROTECT, null=True, blank=True)
     
     # Campo para agendar/atribuir a um funcionário específico (opcional)
@@ -62,9 +128,104 @@ class OrdemProducao(models.Model):
     
     status_global = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDENTE')
 
+    STOCK_CHOICES = [
+        ('NAO_RESERVADO', 'Não Reservado'),
+        ('RESERVADO', 'Reservado'),
+        ('CONSUMIDO', 'Consumido'),
+    ]
+    # Estado das peças desta ordem: reservadas ao criar, consumidas ao iniciar a produção
+    estado_stock = models.CharField(max_length=20, choices=STOCK_CHOICES, default='NAO_RESERVADO')
+
+    # Preenchida quando a última tarefa fecha; decide quando a ordem pode ir para o arquivo
+    data_conclusao = models.DateTimeField(null=True, blank=True)
+
+    # Última alteração (ETag da agenda). Os update() em massa têm de a preencher à mão
+    atualizado_em = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Fila de cada posto no tablet (só ordens à espera): posto + designado, já ordenada por data
+            models.Index(fields=['posto_atual', 'funcionario_designado', 'data_prevista'], condition=models.Q(status_global='PENDENTE'), name='ordem_fila_posto_idx'),
+            # Ordens atrasadas / WIP: só ordens não concluídas
+            models.Index(fields=['data_prevista'], condition=~models.Q(status_global='CONCLUIDO'), name='ordem_aberta_prevista_idx'),
+            models.Index(fields=['posto_atual', 'status_global'], condition=~models.Q(status_global='CONCLUIDO'), name='ordem_aberta_posto_idx'),
+            # Calendário (todas as ordens de um intervalo de datas)
+            models.Index(fields=['data_prevista', 'status_global'], name='ordem_prevista_idx'),
+            # Versão de um intervalo da agenda (MAX(atualizado_em) lido só do índice)
+            models.Index(fields=['data_prevista', 'atualizado_em'], name='ordem_prevista_atualizada_idx'),
+            # Monitor da linha: ordens alteradas desde a última leitura
+            models.Index(fields=['atualizado_em'], name='ordem_atualizada_idx'),
+            # Arquivo: ordens concluídas há mais de N dias
+            models.Index(fields=['data_conclusao', 'id'], condition=models.Q(status_global='CONCLUIDO'), name='ordem_concluida_data_idx'),
+        ]
+
     def __str__(self):
         return f"SN: {self.numero_serie} - {self.acessorio.nome}"
 
+    @staticmethod
+    def series_arquivadas(numeros_serie):
+        """Números de série de `numeros_serie` já usados por ordens arquivadas (fora do índice único das vivas)."""
+        return OrdemArquivada.objects.filter(numero_serie__in=numeros_serie).values_list('numero_serie', flat=True)
+
+    def validar_serie_livre_no_arquivo(self):
+        """Lança ValidationError se o número de série já pertencer a uma ordem arquivada (rastreabilidade)."""
+        if self.series_arquivadas([self.numero_serie]).exists():
+            raise ValidationError({'numero_serie': f"O número de série {self.numero_serie} já foi usado por uma ordem arquivada."})
+
+    def validate_unique(self, exclude=None):
+        # Formulários (admin): o erro aparece no campo, junto do das ordens vivas
+        super().validate_unique(exclude)
+        if not exclude or 'numero_serie' not in exclude:
+            self.validar_serie_livre_no_arquivo()
+
+    def save(self, *args, **kwargs):
+        # Ordens novas criadas por código (ex: tablet). O importador usa bulk_create e verifica o lote com series_arquivadas
+        if self._state.adding:
+            self.validar_serie_livre_no_arquivo()
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def entrar_na_etapa(ordem_id, etapa, momento=None):
+        """
+        Põe a ordem na `etapa` da rota (tuplo de roteamento.Passo; None = fim da rota) e devolve
+        os campos a gravar na ordem. Numa etapa paralela cria um RamoOrdem por posto e a ordem
+        fica sem posto_atual, à espera em todos esses postos.
+        """
+        if not etapa:
+            return {'status_global': 'CONCLUIDO', 'data_conclusao': momento or timezone.now()}
+        if len(etapa) == 1:
+            return {'posto_atual_id': etapa[0].posto_id, 'status_global': 'PENDENTE'}
+        RamoOrdem.objects.bulk_create([
+            RamoOrdem(ordem_id=ordem_id, posto_id=passo.posto_id, opcional=passo.opcional) for passo in etapa
+        ])
+        return {'posto_atual_id': None, 'status_global': 'PENDENTE'}
+
+class RamoOrdem(models.Model):
+    """Posto de uma etapa paralela onde a ordem está (ou esteve) à espera; apagados quando a etapa termina."""
+    ESTADO_CHOICES = [
+        ('PENDENTE', 'Pendente'),
+        ('EM_ANDAMENTO', 'Em Andamento'),
+        ('CONCLUIDO', 'Concluído'),
+    ]
+    ordem = models.ForeignKey(OrdemProducao, on_delete=models.CASCADE, related_name='ramos')
+    posto = models.ForeignKey(Posto, on_delete=models.PROTECT)
+    opcional = models.BooleanField(default=False)
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='PENDENTE')
+
+    class Meta:
+        verbose_name = "Ramo Paralelo"
+        verbose_name_plural = "Ramos Paralelos"
+        constraints = [
+            models.UniqueConstraint(fields=['ordem', 'posto'], name='ramo_unico_por_posto'),
+        ]
+        indexes = [
+            # Fila do tablet: ordens à espera num posto paralelo
+            models.Index(fields=['posto', 'ordem'], condition=models.Q(estado='PENDENTE'), name='ramo_pendente_posto_idx'),
+        ]
+
+    def __str__(self):
+        return f"Ordem {self.ordem_id} no posto {self.posto_id} ({self.get_estado_display()})"
+
 class TarefaProducao(models.Model):
     ordem = models.ForeignKey(OrdemProducao, on_delete=models.CASCADE, related_name='tarefas')
     posto = models.ForeignKey(Posto, on_delete=models.PROTECT)
@@ -73,25 +234,377 @@ class TarefaProducao(models.Model):
     fim = models.DateTimeField(null=True, blank=True)
     concluido = models.BooleanField(default=False)
 
+    class Meta:
+        constraints = [
+            # No máximo uma tarefa aberta por ordem em cada posto (várias em etapas paralelas) e por funcionário
+            # (protege contra corridas entre workers)
+            models.UniqueConstraint(fields=['ordem', 'posto'], condition=models.Q(concluido=False), name='tarefa_aberta_unica_por_ordem_posto'),
+            models.UniqueConstraint(fields=['funcionario'], condition=models.Q(concluido=False), name='tarefa_aberta_unica_por_funcionario'),
+        ]
+        indexes = [
+            # Estatísticas, análise e reconstrução dos totais: tarefas concluídas por data de fim
+            models.Index(fields=['fim', 'posto'], condition=models.Q(concluido=True), name='tarefa_concluida_fim_idx'),
+        ]
+
+    @classmethod
+    def abrir(cls, ordem_id, funcionario, inicio=None):
+        """
+        Reserva a ordem para o funcionário e abre a tarefa no posto atual (numa etapa paralela,
+        no primeiro ramo pendente de um posto do funcionário).
+        Os postos do funcionário são lidos aqui, na transação (nunca da cache do operador).
+        `inicio` é a hora em que o operador começou, se não foi agora (ex: tablet sem rede).
+        É idempotente: se o funcionário já tem esta ordem aberta devolve essa tarefa.
+        Devolve None se a ordem não estiver disponível (já reservada, concluída ou noutro posto).
+        Lança stock.StockInsuficiente se as peças da ordem ainda não foram consumidas e faltam.
+        """
+        from . import eventos, fragmentos, historico, stock
+
+        try:
+            with transaction.atomic():
+                aberta = cls.objects.filter(funcionario=funcionario, concluido=False).first()
+                if aberta:
+                    # Duplo toque no tablet: devolve a tarefa que já está a contar
+                    return aberta if aberta.ordem_id == ordem_id else None
+
+                # Bloqueia a linha da ordem até ao fim da transação
+                ordem = OrdemProducao.objects.select_for_update().filter(pk=ordem_id).first()
+                if ordem is None:
+                    return None
+                if ordem.posto_atual_id is not None:
+                    if ordem.status_global != 'PENDENTE':
+                        return None
+                    candidatos = [ordem.posto_atual_id]
+                else:
+                    # Etapa paralela: qualquer ramo ainda por começar
+                    candidatos = list(
+                        RamoOrdem.objects.filter(ordem=ordem, estado='PENDENTE')
+                        .order_by('posto__ordem_sequencia', 'posto_id').values_list('posto_id', flat=True)
+                    )
+                postos_ids = set(funcionario.postos.filter(id__in=candidatos).values_list('id', flat=True))
+                posto_id = next((posto_id for posto_id in candidatos if posto_id in postos_ids), None)
+                if posto_id is None:
+                    return None
+
+                # Primeira tarefa da ordem: desconta as peças (lança StockInsuficiente se faltarem)
+                stock.consumir(ordem)
+
+                tarefa = cls.objects.create(
+                    ordem=ordem,
+                    posto_id=posto_id,
+                    funcionario=funcionario,
+                    inicio=inicio or timezone.now(),
+                )
+                if ordem.posto_atual_id is None:
+                    RamoOrdem.objects.filter(ordem=ordem, posto_id=posto_id).update(estado='EM_ANDAMENTO')
+                OrdemProducao.objects.filter(pk=ordem.pk).update(
+                    status_global='EM_ANDAMENTO', estado_stock=ordem.estado_stock, atualizado_em=timezone.now(),
+                )
+                ordem.status_global = 'EM_ANDAMENTO'
+                historico.registar(
+                    ordem.pk, 'INICIADA', posto_id, 'EM_ANDAMENTO', momento=tarefa.inicio, funcionario_id=funcionario.pk,
+                    ramo=ordem.posto_atual_id is None,
+                )
+                eventos.ordem_alterada(ordem.pk, posto_id)
+                fragmentos.ordens_alteradas(posto_id)
+                return tarefa
+        except IntegrityError:
+            # Outro pedido ganhou a corrida (índices únicos parciais): só é nossa se for a mesma ordem
+            return cls.objects.filter(funcionario=funcionario, ordem_id=ordem_id, concluido=False).first()
+
     def iniciar_tarefa(self):
         self.inicio = timezone.now()
-        self.save()
+        self.save(update_fields=['inicio'])
+
+    def finalizar_tarefa(self, fim=None):
+        """
+        Fecha a tarefa e avança a ordem. Devolve False se a tarefa já estava fechada.
+        `fim` é a hora em que o operador terminou, se não foi agora (ex: tablet sem rede).
+        """
+        from . import estatisticas, eventos, fragmentos, historico, roteamento
 
-    def finalizar_tarefa(self):
-        self.fim = timezone.now()
+        fim = fim or timezone.now()
+        acessorio_id = self.ordem.acessorio_id
+
+        # Lógica automática: a etapa seguinte vem da tabela de encaminhamento em memória
+        rota = roteamento.rota(acessorio_id)
+        etapa = rota.etapa(self.posto_id) or ()
+        seguinte = rota.depois_de(self.posto_id)
+
+        # Escritas (tarefa + ordem + totais diários) numa só transação, só com os campos alterados.
+        # O UPDATE condicional garante que a ordem só avança uma vez, mesmo com pedidos repetidos.
+        with transaction.atomic():
+            fechada = TarefaProducao.objects.filter(pk=self.pk, concluido=False).update(fim=fim, concluido=True)
+            if not fechada:
+                return False
+            avanca = True
+            if len(etapa) > 1:
+                # Etapa paralela: os ramos da ordem fecham um de cada vez (bloqueio da ordem), e só
+                # o último a fechar a faz avançar
+                list(OrdemProducao.objects.select_for_update().filter(pk=self.ordem_id).values_list('id'))
+                RamoOrdem.objects.filter(ordem_id=self.ordem_id, posto_id=self.posto_id).update(estado='CONCLUIDO')
+                estados = dict(RamoOrdem.objects.filter(ordem_id=self.ordem_id).values_list('posto_id', 'estado'))
+                avanca = roteamento.etapa_concluida(etapa, estados)
+            if avanca:
+                if len(etapa) > 1:
+                    RamoOrdem.objects.filter(ordem_id=self.ordem_id).delete()
+                alteracoes = OrdemProducao.entrar_na_etapa(self.ordem_id, seguinte, fim)
+                seguintes = [passo.posto_id for passo in seguinte or ()]
+            else:
+                alteracoes = {'status_global': 'EM_ANDAMENTO' if 'EM_ANDAMENTO' in estados.values() else 'PENDENTE'}
+                seguintes = []
+            alteracoes['atualizado_em'] = timezone.now()
+            OrdemProducao.objects.filter(pk=self.ordem_id).update(**alteracoes)
+            if avanca:
+                # Numa etapa paralela seguinte a ordem fica à espera em cada um dos postos
+                postos_etapa = seguintes if len(seguintes) > 1 else [alteracoes.get('posto_atual_id', self.posto_id)]
+                historico.registar_etapa(
+                    self.ordem_id, 'FINALIZADA', postos_etapa, alteracoes['status_global'], momento=fim,
+                    funcionario_id=self.funcionario_id,
+                )
+            else:
+                # Só este ramo acabou: a ordem continua nos outros postos da etapa
+                historico.registar(
+                    self.ordem_id, 'FINALIZADA', self.posto_id, 'CONCLUIDO', momento=fim,
+                    funcionario_id=self.funcionario_id, ramo=True,
+                )
+            eventos.ordem_alterada(self.ordem_id, self.posto_id)
+            # Numa etapa paralela a ordem fica sem posto_atual: cada um dos postos tem de ser avisado
+            for posto_id in seguintes if len(seguintes) > 1 else ():
+                eventos.ordem_alterada(self.ordem_id, posto_id)
+            fragmentos.ordens_alteradas(self.posto_id, *seguintes)
+            estatisticas.registar_tarefa(
+                fim=fim,
+                inicio=self.inicio,
+                funcionario_id=self.funcionario_id,
+                posto_id=self.posto_id,
+                acessorio_id=acessorio_id,
+                concluiu_ordem=alteracoes['status_global'] == 'CONCLUIDO',
+            )
+
+        self.fim = fim
         self.concluido = True
-        
-        # Lógica automática: Procura o próximo posto baseado na sequência
-        proximo = Posto.objects.filter(ordem_sequencia__gt=self.posto.ordem_sequencia).order_by('ordem_sequencia').first()
-        
-        if proximo:
-            self.ordem.posto_atual = proximo
-            self.ordem.status_global = 'PENDENTE' # Reseta status para o novo posto
-        else:
-            self.ordem.status_global = 'CONCLUIDO'
-        
-        self.ordem.save()
-        self.save()
+        if TarefaProducao.ordem.is_cached(self):
+            for campo, valor in alteracoes.items():
+                setattr(self.ordem, campo, valor)
+        return True
+
+class ProducaoDiaria(models.Model):
+    """Totais diários por funcionário/posto/produto, atualizados quando uma tarefa termina"""
+    dia = models.DateField()
+    funcionario = models.ForeignKey(Funcionario, on_delete=models.PROTECT, null=True)
+    posto = models.ForeignKey(Posto, on_delete=models.PROTECT)
+    acessorio = models.ForeignKey(Acessorio, on_delete=models.PROTECT, verbose_name="Tipo de Produto")
+    tarefas = models.PositiveIntegerField(default=0)
+    ordens_concluidas = models.PositiveIntegerField(default=0)
+    segundos_total = models.FloatField(default=0, help_text="Soma dos tempos de ciclo (fim - início) em segundos")
+
+    class Meta:
+        verbose_name = "Produção Diária"
+        verbose_name_plural = "Produção Diária"
+        constraints = [
+            models.UniqueConstraint(fields=['dia', 'funcionario', 'posto', 'acessorio'], name='producao_diaria_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.dia} - {self.posto_id}/{self.funcionario_id}/{self.acessorio_id}: {self.tarefas}"
+
+    @property
+    def segundos_medio(self):
+        return self.segundos_total / self.tarefas if self.tarefas else 0
+
+class OrdemArquivada(models.Model):
+    """Ordem concluída retirada de OrdemProducao pelo comando arquivar_ordens (mantém o id original)"""
+    id = models.BigIntegerField(primary_key=True)
+    numero_serie = models.CharField(max_length=50, db_index=True)
+    acessorio = models.ForeignKey(Acessorio, on_delete=models.PROTECT, verbose_name="Tipo de Produto")
+    data_criacao = models.DateTimeField()
+    posto_atual = models.ForeignKey(Posto, on_delete=models.PROTECT, null=True, blank=True)
+    funcionario_designado = models.ForeignKey(Funcionario, on_delete=models.PROTECT, null=True, blank=True)
+    data_prevista = models.DateField(null=True, blank=True)
+    status_global = models.CharField(max_length=20, choices=OrdemProducao.STATUS_CHOICES, default='CONCLUIDO')
+    estado_stock = models.CharField(max_length=20, choices=OrdemProducao.STOCK_CHOICES, default='CONSUMIDO')
+    data_conclusao = models.DateTimeField(null=True, blank=True)
+    arquivada_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Ordem Arquivada"
+        verbose_name_plural = "Ordens Arquivadas"
+        indexes = [
+            models.Index(fields=['data_prevista', 'status_global'], name='arquivo_prevista_idx'),
+        ]
+
+    def __str__(self):
+        return f"SN: {self.numero_serie} (arquivada)"
+
+class TarefaArquivada(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    ordem = models.ForeignKey(OrdemArquivada, on_delete=models.CASCADE, related_name='tarefas')
+    posto = models.ForeignKey(Posto, on_delete=models.PROTECT)
+    funcionario = models.ForeignKey(Funcionario, on_delete=models.PROTECT, null=True)
+    inicio = models.DateTimeField(null=True, blank=True)
+    fim = models.DateTimeField(null=True, blank=True)
+    concluido = models.BooleanField(default=True)
+
+    class Meta:
+        verbose_name = "Tarefa Arquivada"
+        verbose_name_plural = "Tarefas Arquivadas"
+        indexes = [
+            models.Index(fields=['fim', 'posto'], name='arquivo_tarefa_fim_idx'),
+        ]
+
+class Trabalho(models.Model):
+    """Operação pesada (importação, reconstrução de totais, ...) executada pelo comando `trabalhador`"""
+    ESTADO_CHOICES = [
+        ('PENDENTE', 'Pendente'),
+        ('EM_CURSO', 'Em Curso'),
+        ('CONCLUIDO', 'Concluído'),
+        ('FALHOU', 'Falhou'),
+    ]
+    tipo = models.CharField(max_length=50, help_text="Nome registado em trabalhos.py (ex: importar_ordens)")
+    parametros = models.JSONField(default=dict, blank=True)
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='PENDENTE')
+    tentativas = models.PositiveIntegerField(default=0)
+    max_tentativas = models.PositiveIntegerField(default=3)
+    progresso = models.PositiveSmallIntegerField(default=0, help_text="Percentagem (0 a 100)")
+    mensagem = models.CharField(max_length=255, blank=True)
+    resultado = models.JSONField(null=True, blank=True)
+    erro = models.TextField(blank=True)
+    criado_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    criado_em = models.DateTimeField(auto_now_add=True)
+    disponivel_em = models.DateTimeField(default=timezone.now, help_text="Só é executado a partir desta hora (novas tentativas esperam)")
+    iniciado_em = models.DateTimeField(null=True, blank=True)
+    atualizado_em = models.DateTimeField(null=True, blank=True, help_text="Último sinal de vida do trabalhador")
+    terminado_em = models.DateTimeField(null=True, blank=True)
+    trabalhador = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        verbose_name = "Trabalho em Segundo Plano"
+        verbose_name_plural = "Trabalhos em Segundo Plano"
+        indexes = [
+            # Fila: só os pendentes, pela ordem em que ficam disponíveis
+            models.Index(fields=['disponivel_em', 'id'], condition=models.Q(estado='PENDENTE'), name='trabalho_fila_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.tipo} ({self.get_estado_display()})"
+
+class EventoTablet(models.Model):
+    """Início ou fim de tarefa registado num tablet (às vezes sem rede) e sincronizado em lote"""
+    TIPO_CHOICES = [
+        ('INICIAR', 'Iniciar'),
+        ('FINALIZAR', 'Finalizar'),
+    ]
+    ESTADO_CHOICES = [
+        ('APLICADO', 'Aplicado'),
+        ('CONFLITO', 'Conflito'),
+    ]
+    uuid = models.UUIDField(unique=True, help_text="Gerado no tablet: reenviar o mesmo evento não o aplica duas vezes")
+    funcionario = models.ForeignKey(Funcionario, on_delete=models.CASCADE, related_name='eventos_tablet')
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
+    # Sem restrição na base de dados: ordens e tarefas são movidas para o arquivo com DELETE direto
+    ordem = models.ForeignKey(OrdemProducao, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    tarefa = models.ForeignKey(
+        TarefaProducao, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+',
+    )
+    momento = models.DateTimeField(help_text="Hora do tablet em que o operador carregou no botão")
+    recebido_em = models.DateTimeField(auto_now_add=True)
+    estado = models.CharField(max_length=10, choices=ESTADO_CHOICES, default='APLICADO')
+    mensagem = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        verbose_name = "Evento de Tablet"
+        verbose_name_plural = "Eventos de Tablet"
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} ordem {self.ordem_id} ({self.get_estado_display()})"
+
+class EventoProducao(models.Model):
+    """
+    Registo só de acrescentar das mudanças de estado das ordens (ver historico.py).
+    Cada evento guarda o estado da ordem depois da mudança (posto e status).
+    """
+    TIPO_CHOICES = [
+        ('CRIADA', 'Criada'),
+        ('INICIADA', 'Tarefa iniciada'),
+        ('FINALIZADA', 'Tarefa finalizada'),
+        ('MOVIDA', 'Alterada no admin'),
+        ('REMOVIDA', 'Apagada'),
+    ]
+    momento = models.DateTimeField()
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
+    # Sem restrição na base de dados: o histórico fica depois de as ordens irem para o arquivo
+    ordem = models.ForeignKey(OrdemProducao, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    posto = models.ForeignKey(Posto, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+')
+    status = models.CharField(max_length=20, choices=OrdemProducao.STATUS_CHOICES, blank=True)
+    funcionario = models.ForeignKey(
+        Funcionario, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+',
+    )
+    ramo = models.BooleanField(
+        default=False, help_text="Ramo de uma etapa paralela: só muda o estado da ordem neste posto (status do ramo)",
+    )
+
+    class Meta:
+        verbose_name = "Evento de Produção"
+        verbose_name_plural = "Eventos de Produção"
+        indexes = [
+            # Reconstrução do WIP: eventos por ordem cronológica a partir de um snapshot
+            models.Index(fields=['momento', 'id'], name='evento_momento_idx'),
+            models.Index(fields=['ordem', 'momento'], name='evento_ordem_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.momento:%Y-%m-%d %H:%M} ordem {self.ordem_id}: {self.get_tipo_display()}"
+
+class SnapshotWIP(models.Model):
+    """Ordens em curso (posto e status de cada uma) num momento, para não repetir o histórico todo"""
+    momento = models.DateTimeField(unique=True)
+    ordens = models.JSONField(help_text="{ordem_id: [[posto_id, status], ...]} das ordens por concluir (um por ramo)")
+    eventos = models.PositiveIntegerField(default=0, help_text="Eventos repetidos desde o snapshot anterior")
+    criado_em = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Snapshot de WIP"
+        verbose_name_plural = "Snapshots de WIP"
+
+    def __str__(self):
+        return f"WIP em {self.momento:%Y-%m-%d %H:%M} ({len(self.ordens)} ordens)"
+
+class AlertaLinha(models.Model):
+    """
+    Alerta de balanceamento da linha, criado pelo monitor (ver monitor.py). Fica ativo
+    enquanto a condição se mantiver; depois é marcado como resolvido e não volta a mudar.
+    """
+    TIPO_CHOICES = [
+        ('FILA', 'Fila a acumular'),
+        ('LENTO', 'Posto mais lento que o habitual'),
+        ('PRAZO', 'Ordem em risco de atraso'),
+    ]
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
+    # Identifica a condição (ex: 'fila:3', 'prazo:120'): no máximo um alerta ativo por chave
+    chave = models.CharField(max_length=50)
+    posto = models.ForeignKey(Posto, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    # Sem restrição na base de dados: o alerta fica depois de a ordem ir para o arquivo
+    ordem = models.ForeignKey(
+        OrdemProducao, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+',
+    )
+    mensagem = models.CharField(max_length=255)
+    valor = models.FloatField(help_text="Medida que disparou o alerta (horas de fila, razão do ciclo, dias de atraso)")
+    inicio = models.DateTimeField()
+    atualizado_em = models.DateTimeField()
+    resolvido_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Alerta da Linha"
+        verbose_name_plural = "Alertas da Linha"
+        constraints = [
+            models.UniqueConstraint(fields=['chave'], condition=models.Q(resolvido_em__isnull=True), name='alerta_ativo_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['tipo', 'valor'], condition=models.Q(resolvido_em__isnull=True), name='alerta_ativo_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()}: {self.mensagem}"
 
 class Agendamento(OrdemProducao):
     class Meta:
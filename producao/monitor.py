@@ -0,0 +1,333 @@
+"""Monitor da linha: alertas de balanceamento enquanto ainda há tempo para mudar operadores.
+
+Corre num processo próprio (comando `monitor_linha`) e guarda o estado em
+memória, atualizado a cada ciclo só com o que mudou desde o anterior:
+- tarefas fechadas: os EventoProducao novos (INICIADA e FINALIZADA da mesma
+  ordem e funcionário formam uma tarefa) entram numa janela deslizante de
+  JANELA por posto;
+- ordens por concluir (posto ou ramos, produto, data prevista): as ordens com
+  atualizado_em desde a leitura anterior, e os eventos REMOVIDA;
+- tempos de ciclo habituais: dos totais diários, como no planeamento,
+  relidos de RELER_CICLOS em RELER_CICLOS.
+Ao arrancar lê só o estado atual (ordens e tarefas abertas); o histórico de
+tarefas nunca é repetido.
+
+Em cada ciclo são avaliadas três condições, cada uma com um AlertaLinha
+ativo enquanto se mantiver:
+- FILA: esvaziar a fila de um posto (ordens à espera x ciclo / operadores
+  ativos) leva mais de LIMITE_FILA_HORAS;
+- LENTO: as tarefas da janela demoraram em média mais de FATOR_LENTO vezes o
+  ciclo habitual dos mesmos produtos (com pelo menos MIN_AMOSTRAS tarefas);
+- PRAZO: com as filas e ritmos atuais, uma ordem que ainda está dentro do
+  prazo só termina depois da data prevista (HORAS_POR_DIA por dia útil, como
+  no planeamento). As já atrasadas estão na tabela de ordens atrasadas.
+
+Só deve correr um monitor de cada vez: o índice único de alertas ativos
+impede duplicados, mas dois monitores resolveriam os alertas um do outro.
+"""
+import datetime
+import math
+from collections import defaultdict, deque
+from typing import NamedTuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from . import historico, planeamento, roteamento
+from .models import AlertaLinha, EventoProducao, OrdemProducao, RamoOrdem, TarefaProducao
+
+INTERVALO = 30  # segundos entre ciclos do comando
+JANELA = datetime.timedelta(hours=1)
+LIMITE_FILA_HORAS = 4
+FATOR_LENTO = 1.5
+MIN_AMOSTRAS = 3
+RELER_CICLOS = datetime.timedelta(hours=24)
+
+
+class Ordem(NamedTuple):
+    numero_serie: str
+    posto_id: int
+    ramos: tuple  # postos com ramo por começar (etapa paralela)
+    status: str
+    acessorio_id: int
+    data_prevista: datetime.date
+
+
+class Concluida(NamedTuple):
+    fim: datetime.datetime
+    duracao: float
+    razao: float  # duração / ciclo habitual do produto no posto (None sem histórico)
+    funcionario_id: int
+
+
+class Monitor:
+    def __init__(
+        self, janela=JANELA, limite_fila_horas=LIMITE_FILA_HORAS, fator_lento=FATOR_LENTO,
+        min_amostras=MIN_AMOSTRAS, horas_por_dia=planeamento.HORAS_POR_DIA,
+    ):
+        self.janela = janela
+        self.limite_fila = limite_fila_horas * 3600
+        self.fator_lento = fator_lento
+        self.min_amostras = min_amostras
+        self.capacidade = horas_por_dia * 3600
+        self.ordens = {}
+        self.filas = defaultdict(set)  # posto_id: ordens à espera nesse posto
+        self.abertas = {}  # (ordem_id, funcionario_id): (posto_id, inicio, acessorio_id)
+        self.concluidas = defaultdict(deque)  # posto_id: Concluida dentro da janela
+        self.alertas = {}  # chave: (id, mensagem) dos alertas ativos
+        self.cursor = 0
+        self.vistos = {}  # id: momento dos eventos dos últimos MARGEM minutos
+        self.lido_ate = None
+        self.ciclos_lidos_em = None
+
+    # --- Estado -------------------------------------------------------------
+
+    def arrancar(self, agora=None):
+        """Lê o estado atual: ordens abertas, tarefas abertas, ciclos habituais e alertas ativos."""
+        agora = agora or timezone.now()
+        self.cursor = EventoProducao.objects.aggregate(ultimo=Max('id'))['ultimo'] or 0
+        self.vistos = dict(
+            EventoProducao.objects.filter(momento__gte=agora - historico.MARGEM).values_list('id', 'momento')
+        )
+        self.lido_ate = agora
+        self._ler_ordens(OrdemProducao.objects.exclude(status_global='CONCLUIDO'))
+        for ordem_id, funcionario_id, posto_id, inicio, acessorio_id in TarefaProducao.objects.filter(
+            concluido=False, inicio__isnull=False,
+        ).values_list('ordem_id', 'funcionario_id', 'posto_id', 'inicio', 'ordem__acessorio_id'):
+            self.abertas[ordem_id, funcionario_id] = (posto_id, inicio, acessorio_id)
+        self._ler_ciclos(agora)
+        self.alertas = {
+            chave: (alerta_id, mensagem)
+            for alerta_id, chave, mensagem in AlertaLinha.objects.filter(resolvido_em__isnull=True).values_list(
+                'id', 'chave', 'mensagem',
+            )
+        }
+
+    def _ler_ciclos(self, agora):
+        self.ciclo_produto, self.ciclo_posto = planeamento.tempos_de_ciclo(hoje=timezone.localdate(agora))
+        self.ciclos_lidos_em = agora
+
+    def _ler_ordens(self, consulta):
+        linhas = list(consulta.values_list(
+            'id', 'numero_serie', 'posto_atual_id', 'status_global', 'acessorio_id', 'data_prevista',
+        ))
+        em_ramos = [linha[0] for linha in linhas if linha[2] is None and linha[3] != 'CONCLUIDO']
+        ramos = defaultdict(list)
+        if em_ramos:
+            for ordem_id, posto_id in RamoOrdem.objects.filter(ordem_id__in=em_ramos, estado='PENDENTE').order_by(
+                'posto__ordem_sequencia',
+            ).values_list('ordem_id', 'posto_id'):
+                ramos[ordem_id].append(posto_id)
+        for ordem_id, numero_serie, posto_id, status, acessorio_id, data_prevista in linhas:
+            if status == 'CONCLUIDO':
+                self._definir(ordem_id, None)
+            else:
+                self._definir(ordem_id, Ordem(
+                    numero_serie, posto_id, tuple(ramos[ordem_id]), status, acessorio_id, data_prevista,
+                ))
+
+    def _definir(self, ordem_id, ordem):
+        """Substitui o estado de uma ordem (None = já não está aberta), mantendo as filas dos postos."""
+        antiga = self.ordens.pop(ordem_id, None)
+        if antiga:
+            for posto_id in self._postos_em_espera(antiga):
+                self.filas[posto_id].discard(ordem_id)
+        if ordem:
+            self.ordens[ordem_id] = ordem
+            for posto_id in self._postos_em_espera(ordem):
+                self.filas[posto_id].add(ordem_id)
+
+    @staticmethod
+    def _postos_em_espera(ordem):
+        if ordem.posto_id:
+            return (ordem.posto_id,) if ordem.status == 'PENDENTE' else ()
+        return ordem.ramos
+
+    def _ler_eventos(self, agora):
+        limite = agora - historico.MARGEM
+        # Os eventos dos últimos MARGEM minutos são relidos: uma transação mais lenta
+        # pode gravar um id menor que o cursor depois de ele ter avançado
+        eventos = EventoProducao.objects.filter(Q(id__gt=self.cursor) | Q(momento__gte=limite)).order_by('id')
+        for evento_id, momento, tipo, ordem_id, posto_id, funcionario_id in eventos.values_list(
+            'id', 'momento', 'tipo', 'ordem_id', 'posto_id', 'funcionario_id',
+        ):
+            if evento_id in self.vistos or (evento_id <= self.cursor and momento < limite):
+                continue
+            if momento >= limite:
+                self.vistos[evento_id] = momento
+            self.cursor = max(self.cursor, evento_id)
+            if tipo == 'INICIADA':
+                ordem = self.ordens.get(ordem_id)
+                self.abertas[ordem_id, funcionario_id] = (posto_id, momento, ordem.acessorio_id if ordem else None)
+            elif tipo == 'FINALIZADA':
+                aberta = self.abertas.pop((ordem_id, funcionario_id), None)
+                if aberta:
+                    self._concluir(*aberta, momento, funcionario_id, agora)
+            elif tipo == 'REMOVIDA':
+                self._definir(ordem_id, None)
+                for chave in [chave for chave in self.abertas if chave[0] == ordem_id]:
+                    del self.abertas[chave]
+        self.vistos = {evento_id: momento for evento_id, momento in self.vistos.items() if momento >= limite}
+
+    def _concluir(self, posto_id, inicio, acessorio_id, fim, funcionario_id, agora):
+        if fim < agora - self.janela:
+            return
+        duracao = max((fim - inicio).total_seconds(), 0.0)
+        habitual = self.ciclo_produto.get((posto_id, acessorio_id)) or self.ciclo_posto.get(posto_id)
+        self.concluidas[posto_id].append(Concluida(fim, duracao, duracao / habitual if habitual else None, funcionario_id))
+
+    def atualizar(self, agora=None):
+        """Lê as ordens alteradas e os eventos novos e descarta as tarefas que saíram da janela."""
+        agora = agora or timezone.now()
+        if self.lido_ate is None:
+            self.arrancar(agora)
+        if agora - self.ciclos_lidos_em > RELER_CICLOS:
+            self._ler_ciclos(agora)
+        # As ordens primeiro: uma tarefa iniciada neste ciclo precisa do produto da ordem
+        self._ler_ordens(OrdemProducao.objects.filter(atualizado_em__gte=self.lido_ate - historico.MARGEM))
+        self.lido_ate = agora
+        self._ler_eventos(agora)
+        inicio_janela = agora - self.janela
+        for concluidas in self.concluidas.values():
+            while concluidas and concluidas[0].fim < inicio_janela:
+                concluidas.popleft()
+
+    # --- Condições ----------------------------------------------------------
+
+    def fator(self, posto_id):
+        """Ritmo do posto na janela face ao habitual (1.0 com poucas tarefas ou sem histórico)."""
+        razoes = [concluida.razao for concluida in self.concluidas[posto_id] if concluida.razao is not None]
+        return sum(razoes) / len(razoes) if len(razoes) >= self.min_amostras else 1.0
+
+    def ciclo(self, posto_id, acessorio_id=None):
+        """Tempo de ciclo esperado agora: o habitual (do produto, do posto ou o padrão) ao ritmo da janela."""
+        habitual = (
+            self.ciclo_produto.get((posto_id, acessorio_id)) or self.ciclo_posto.get(posto_id)
+            or planeamento.CICLO_PADRAO
+        )
+        return habitual * self.fator(posto_id)
+
+    def operadores(self, posto_id):
+        """Operadores ativos no posto: com tarefa aberta ou fechada na janela (pelo menos 1)."""
+        ativos = {concluida.funcionario_id for concluida in self.concluidas[posto_id]}
+        ativos.update(funcionario_id for (_, funcionario_id), aberta in self.abertas.items() if aberta[0] == posto_id)
+        return max(len(ativos), 1)
+
+    def condicoes(self, agora=None):
+        """{chave: (tipo, posto_id, ordem_id, valor, mensagem)} das condições que se verificam agora."""
+        agora = agora or timezone.now()
+        condicoes = {}
+        espera = {}  # (posto_id, ordem_id): segundos até a ordem começar nesse posto
+        for posto_id, fila in self.filas.items():
+            if not fila:
+                continue
+            por_ordem = self.ciclo(posto_id) / self.operadores(posto_id)
+            # Pela ordem da fila do tablet (data prevista, depois antiguidade)
+            ordenada = sorted(fila, key=lambda ordem_id: (
+                self.ordens[ordem_id].data_prevista or datetime.date.max, ordem_id,
+            ))
+            for posicao, ordem_id in enumerate(ordenada):
+                espera[posto_id, ordem_id] = posicao * por_ordem
+            total = len(fila) * por_ordem
+            if total > self.limite_fila:
+                horas = total / 3600
+                condicoes[f'fila:{posto_id}'] = ('FILA', posto_id, None, round(horas, 1), (
+                    f"{len(fila)} ordens à espera: cerca de {horas:.1f} h para esvaziar "
+                    f"com {self.operadores(posto_id)} operador(es)"
+                ))
+
+        for posto_id, concluidas in self.concluidas.items():
+            fator = self.fator(posto_id)
+            if fator > self.fator_lento:
+                condicoes[f'lento:{posto_id}'] = ('LENTO', posto_id, None, round(fator, 2), (
+                    f"Últimas {len(concluidas)} tarefas a {fator:.1f}x o tempo de ciclo habitual"
+                ))
+
+        hoje = timezone.localdate(agora)
+        calendario = []
+        dias = planeamento.dias_uteis(hoje)
+        for ordem_id, ordem in self.ordens.items():
+            if ordem.data_prevista is None or ordem.data_prevista < hoje:
+                continue
+            restante = self.restante(ordem_id, ordem, espera)
+            indice = max(math.ceil(restante / self.capacidade) - 1, 0)
+            while len(calendario) <= indice:
+                calendario.append(next(dias))
+            fim = calendario[indice]
+            if fim > ordem.data_prevista:
+                condicoes[f'prazo:{ordem_id}'] = ('PRAZO', ordem.posto_id, ordem_id, (fim - ordem.data_prevista).days, (
+                    f"{ordem.numero_serie}: fim estimado a {fim:%d/%m/%Y}, previsto para {ordem.data_prevista:%d/%m/%Y}"
+                ))
+        return condicoes
+
+    def restante(self, ordem_id, ordem, espera):
+        """Segundos de trabalho (e fila) até a ordem sair do fim da rota."""
+        if ordem.posto_id:
+            posto_id = ordem.posto_id
+            segundos = espera.get((posto_id, ordem_id), 0.0) + self.ciclo(posto_id, ordem.acessorio_id)
+        elif ordem.ramos:
+            posto_id = ordem.ramos[0]
+            segundos = max(
+                espera.get((ramo, ordem_id), 0.0) + self.ciclo(ramo, ordem.acessorio_id) for ramo in ordem.ramos
+            )
+        else:
+            return 0.0
+        # Etapas seguintes: numa etapa paralela conta o posto mais demorado
+        rota = roteamento.rota(ordem.acessorio_id)
+        etapa = rota.etapa_seguinte(posto_id)
+        while etapa:
+            segundos += max(self.ciclo(passo.posto_id, ordem.acessorio_id) for passo in etapa)
+            etapa = rota.etapa_seguinte(etapa[0].posto_id)
+        return segundos
+
+    # --- Alertas ------------------------------------------------------------
+
+    def gravar(self, condicoes, agora=None):
+        """Cria, atualiza e resolve os AlertaLinha conforme `condicoes`. Devolve (novos, resolvidos)."""
+        agora = agora or timezone.now()
+        novos = []
+        alterados = 0
+        for chave, (tipo, posto_id, ordem_id, valor, mensagem) in condicoes.items():
+            ativo = self.alertas.get(chave)
+            if ativo is None:
+                novos.append(AlertaLinha(
+                    tipo=tipo, chave=chave, posto_id=posto_id, ordem_id=ordem_id, valor=valor, mensagem=mensagem,
+                    inicio=agora, atualizado_em=agora,
+                ))
+            elif ativo[1] != mensagem:
+                # Só se grava quando o texto muda (ex: mais uma ordem na fila), não a cada ciclo
+                AlertaLinha.objects.filter(pk=ativo[0]).update(mensagem=mensagem, valor=valor, atualizado_em=agora)
+                self.alertas[chave] = (ativo[0], mensagem)
+                alterados += 1
+
+        resolvidos = [chave for chave in self.alertas if chave not in condicoes]
+        if resolvidos:
+            AlertaLinha.objects.filter(pk__in=[self.alertas[chave][0] for chave in resolvidos]).update(
+                resolvido_em=agora, atualizado_em=agora,
+            )
+            for chave in resolvidos:
+                del self.alertas[chave]
+
+        if novos:
+            try:
+                with transaction.atomic():
+                    AlertaLinha.objects.bulk_create(novos)
+            except IntegrityError:
+                # Outro processo criou alguns destes alertas: passa a contar com os que estão na base de dados
+                self.alertas = {
+                    chave: (alerta_id, mensagem)
+                    for alerta_id, chave, mensagem in AlertaLinha.objects.filter(resolvido_em__isnull=True).values_list(
+                        'id', 'chave', 'mensagem',
+                    )
+                }
+                return 0, len(resolvidos)
+            for alerta in novos:
+                self.alertas[alerta.chave] = (alerta.id, alerta.mensagem)
+        return len(novos), len(resolvidos)
+
+    def executar(self, agora=None):
+        """Atualiza o estado, avalia as condições e grava os alertas. Devolve (novos, resolvidos)."""
+        agora = agora or timezone.now()
+        self.atualizar(agora)
+        return self.gravar(self.condicoes(agora), agora)
@@ -0,0 +1,125 @@
+"""Contexto do operador do tablet guardado em cache.
+
+Em cada pedido do chão de fábrica é preciso o nome do funcionário e os postos
+onde pode trabalhar (cabeçalho e fila do tablet). Em vez de os ler da base de
+dados a cada pedido, guarda-se tudo na cache (settings.CACHES) durante
+CONTEXTO_TTL segundos e reconstrói-se numa só query quando falta.
+
+O contexto é apagado quando os postos do funcionário mudam (m2m_changed, ver
+signals.py). Com a cache em memória local cada processo tem a sua cópia e
+outro processo pode ver dados antigos até ao fim do TTL, por isso o contexto
+serve só para mostrar: a tarefa aberta é sempre lida da base de dados (índice
+tarefa_aberta_unica_por_funcionario) e TarefaProducao.abrir confirma os postos
+do funcionário na base de dados antes de gravar.
+
+Também aqui: limite de tentativas de PIN por IP, contado só na cache.
+"""
+import os
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+CONTEXTO_TTL = int(os.environ.get('OPERADOR_CONTEXTO_TTL', 300))
+
+# Tentativas de PIN erradas permitidas por IP dentro da janela (segundos)
+PIN_MAX_TENTATIVAS = getattr(settings, 'PIN_MAX_TENTATIVAS', 5)
+PIN_JANELA = getattr(settings, 'PIN_JANELA', 300)
+
+
+class PostoResumo:
+    def __init__(self, id, nome):
+        self.id = id
+        self.nome = nome
+
+    def __str__(self):
+        return self.nome
+
+
+class ContextoOperador:
+    def __init__(self, funcionario_id, nome, postos):
+        self.funcionario_id = funcionario_id
+        self.nome = nome
+        self.postos = postos  # [PostoResumo] por ordem de sequência
+        # Só para mostrar (fila do tablet): pode estar desatualizado noutro processo
+        self.postos_ids = frozenset(posto.id for posto in postos)
+
+    @property
+    def funcionario(self):
+        # Instância sem query, suficiente para filtros e chaves estrangeiras (funcionario=...)
+        from .models import Funcionario
+
+        funcionario = Funcionario(id=self.funcionario_id, nome=self.nome)
+        funcionario._state.adding = False
+        funcionario._state.db = 'default'
+        return funcionario
+
+
+def _chave(funcionario_id):
+    return f'producao:operador:{funcionario_id}'
+
+
+def _construir(**filtro):
+    """Lê funcionário e postos numa só query. Devolve None se o funcionário não existir."""
+    from .models import Funcionario
+
+    linhas = list(
+        Funcionario.objects.filter(**filtro)
+        .values_list('id', 'nome', 'postos__id', 'postos__nome')
+        .order_by('postos__ordem_sequencia', 'postos__id')
+    )
+    if not linhas:
+        return None
+    funcionario_id, nome = linhas[0][:2]
+    postos = [PostoResumo(posto_id, posto_nome) for *_, posto_id, posto_nome in linhas if posto_id is not None]
+    contexto = ContextoOperador(funcionario_id, nome, postos)
+    cache.set(_chave(funcionario_id), contexto, CONTEXTO_TTL)
+    return contexto
+
+
+def contexto(funcionario_id):
+    """Contexto do operador, da cache ou reconstruído (uma query)."""
+    return cache.get(_chave(funcionario_id)) or _construir(pk=funcionario_id)
+
+
+def autenticar(codigo):
+    """Procura o funcionário pelo PIN e deixa o contexto já em cache. Devolve None se o código não existir."""
+    if not codigo:
+        return None
+    return _construir(codigo=codigo)
+
+
+def invalidar(*funcionarios_ids):
+    chaves = [_chave(funcionario_id) for funcionario_id in funcionarios_ids]
+    if not chaves:
+        return
+    cache.delete_many(chaves)
+    # Outra leitura pode ter reconstruído o contexto antes do commit: apaga outra vez depois
+    transaction.on_commit(lambda: cache.delete_many(chaves))
+
+
+# --- Limite de tentativas de PIN ---
+def _ip(request):
+    # Atrás do proxy do Render o IP real é o último acrescentado a X-Forwarded-For
+    encaminhado = request.META.get('HTTP_X_FORWARDED_FOR')
+    if encaminhado:
+        return encaminhado.split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _chave_tentativas(request):
+    return f'producao:pin:{_ip(request)}'
+
+
+def bloqueado(request):
+    return (cache.get(_chave_tentativas(request)) or 0) >= PIN_MAX_TENTATIVAS
+
+
+def registar_falha(request):
+    chave = _chave_tentativas(request)
+    # add só cria a chave (com o prazo da janela) se ainda não existir; incr mantém o prazo
+    cache.add(chave, 0, PIN_JANELA)
+    try:
+        cache.incr(chave)
+    except ValueError:
+        cache.set(chave, 1, PIN_JANELA)
@@ -0,0 +1,221 @@
+"""Planeamento automático: funcionário designado e data prevista das ordens pendentes.
+
+Heurística gulosa (list scheduling) com uma fila de prioridade por posto:
+as ordens são tratadas por prioridade (data prevista já marcada, depois a
+mais antiga) e cada passo da rota vai para o operador autorizado nesse posto
+que fica livre mais cedo. O designado é o operador do posto atual da ordem; a
+data prevista é o dia útil em que o último posto da rota termina.
+
+Os tempos de ciclo vêm dos totais diários (ProducaoDiaria, gerados a partir
+das tarefas) por posto e tipo de produto, com recurso à média do posto e a
+CICLO_PADRAO quando não há histórico. Cada operador tem HORAS_POR_DIA de
+capacidade por dia útil. Tudo é lido em poucas queries e calculado em memória;
+milhares de ordens planeiam-se em segundos.
+"""
+import datetime
+import heapq
+import math
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import fragmentos, roteamento
+from .models import Funcionario, OrdemProducao, ProducaoDiaria
+
+HORAS_POR_DIA = 8
+DIAS_HISTORICO = 90
+CICLO_PADRAO = 30 * 60  # segundos, para postos sem histórico
+TAMANHO_LOTE = 500
+
+
+class Alteracao:
+    """Novo funcionário/data de uma ordem, com os valores antigos (nomes) para mostrar a diferença."""
+    __slots__ = ('ordem_id', 'numero_serie', 'funcionario_id', 'data_prevista', 'funcionario_antes', 'funcionario_depois', 'data_antes')
+
+    def __init__(self, ordem_id, numero_serie, funcionario_id, data_prevista, funcionario_antes, funcionario_depois, data_antes):
+        self.ordem_id = ordem_id
+        self.numero_serie = numero_serie
+        self.funcionario_id = funcionario_id
+        self.data_prevista = data_prevista
+        self.funcionario_antes = funcionario_antes
+        self.funcionario_depois = funcionario_depois
+        self.data_antes = data_antes
+
+    def __str__(self):
+        return (
+            f"{self.numero_serie}: {self.funcionario_antes or '-'} -> {self.funcionario_depois}, "
+            f"{self.data_antes or '-'} -> {self.data_prevista}"
+        )
+
+
+class Plano:
+    def __init__(self):
+        self.alteracoes = []
+        self.planeadas = 0
+        self.sem_operador = []  # números de série de ordens cujo posto não tem ninguém autorizado
+
+    def __str__(self):
+        return (
+            f"{self.planeadas} ordens planeadas, {len(self.alteracoes)} alteradas, "
+            f"{len(self.sem_operador)} sem operador"
+        )
+
+
+def tempos_de_ciclo(dias=DIAS_HISTORICO, hoje=None):
+    """({(posto_id, acessorio_id): segundos}, {posto_id: segundos}) a partir dos totais diários."""
+    hoje = hoje or timezone.localdate()
+    linhas = (
+        ProducaoDiaria.objects.filter(dia__gt=hoje - datetime.timedelta(days=dias), tarefas__gt=0)
+        .values('posto_id', 'acessorio_id')
+        .annotate(tarefas=Sum('tarefas'), segundos=Sum('segundos_total'))
+        .order_by()
+    )
+    por_produto = {}
+    soma_posto = defaultdict(lambda: [0, 0.0])
+    for linha in linhas:
+        por_produto[linha['posto_id'], linha['acessorio_id']] = linha['segundos'] / linha['tarefas']
+        soma_posto[linha['posto_id']][0] += linha['tarefas']
+        soma_posto[linha['posto_id']][1] += linha['segundos']
+    por_posto = {posto_id: segundos / tarefas for posto_id, (tarefas, segundos) in soma_posto.items()}
+    return por_produto, por_posto
+
+
+def dias_uteis(inicio):
+    dia = inicio
+    while True:
+        if dia.weekday() < 5:
+            yield dia
+        dia += datetime.timedelta(days=1)
+
+
+class Planeador:
+    def __init__(self, inicio=None, horas_por_dia=HORAS_POR_DIA, dias_historico=DIAS_HISTORICO):
+        self.inicio = inicio or timezone.localdate()
+        self.capacidade = horas_por_dia * 3600
+        self.ciclo_produto, self.ciclo_posto = tempos_de_ciclo(dias_historico, self.inicio)
+        self._dias = dias_uteis(self.inicio)
+        self._calendario = []
+
+        # Quem pode trabalhar em cada posto e a hora (em segundos de trabalho desde o início) em que fica livre
+        self.operadores = defaultdict(list)
+        self.postos_de = defaultdict(list)
+        for funcionario_id, posto_id in Funcionario.postos.through.objects.values_list('funcionario_id', 'posto_id'):
+            self.operadores[posto_id].append(funcionario_id)
+            self.postos_de[funcionario_id].append(posto_id)
+        self.livre = {funcionario_id: 0.0 for ids in self.operadores.values() for funcionario_id in ids}
+        # Fila de prioridade por posto com entradas (livre, funcionario_id); entradas antigas são descartadas ao ler
+        self.filas = {posto_id: [(0.0, funcionario_id) for funcionario_id in ids] for posto_id, ids in self.operadores.items()}
+        for fila in self.filas.values():
+            heapq.heapify(fila)
+
+    def ciclo(self, posto_id, acessorio_id):
+        return self.ciclo_produto.get((posto_id, acessorio_id)) or self.ciclo_posto.get(posto_id) or CICLO_PADRAO
+
+    def _alocar(self, posto_id, pronto, duracao, funcionario_id=None):
+        """Dá o trabalho ao operador do posto livre mais cedo (ou a `funcionario_id`). Devolve (operador, fim)."""
+        if funcionario_id is None:
+            fila = self.filas[posto_id]
+            while fila[0][0] != self.livre[fila[0][1]]:
+                heapq.heappop(fila)
+            funcionario_id = fila[0][1]
+        fim = max(pronto, self.livre[funcionario_id]) + duracao
+        self.livre[funcionario_id] = fim
+        for posto in self.postos_de[funcionario_id]:
+            heapq.heappush(self.filas[posto], (fim, funcionario_id))
+        return funcionario_id, fim
+
+    def _data(self, segundos):
+        """Dia útil em que termina o trabalho que acaba `segundos` depois do início."""
+        indice = max(math.ceil(segundos / self.capacidade) - 1, 0)
+        while len(self._calendario) <= indice:
+            self._calendario.append(next(self._dias))
+        return self._calendario[indice]
+
+    def reservar(self, ordem):
+        """Conta a carga de uma ordem já planeada à mão (não é alterada)."""
+        funcionario_id = ordem['funcionario_designado_id']
+        if funcionario_id in self.livre and ordem['posto_atual_id']:
+            self._alocar(
+                ordem['posto_atual_id'], 0.0, self.ciclo(ordem['posto_atual_id'], ordem['acessorio_id']), funcionario_id,
+            )
+
+    def planear(self, ordem):
+        """(funcionario_id, data_prevista) para a ordem, ou None se o posto atual não tem operadores."""
+        rota = roteamento.rota(ordem['acessorio_id'])
+        posto_id = ordem['posto_atual_id'] or rota.primeiro
+        if posto_id not in self.filas:
+            return None
+        designado, pronto = self._alocar(posto_id, 0.0, self.ciclo(posto_id, ordem['acessorio_id']))
+        posto_id = rota.proximo(posto_id)
+        while posto_id:
+            if posto_id in self.filas:
+                _, pronto = self._alocar(posto_id, pronto, self.ciclo(posto_id, ordem['acessorio_id']))
+            posto_id = rota.proximo(posto_id)
+        return designado, self._data(pronto)
+
+
+def _prioridade(ordem):
+    # Primeiro as que já têm data marcada (mais cedo primeiro), depois por antiguidade
+    return (ordem['data_prevista'] is None, ordem['data_prevista'] or datetime.date.min, ordem['id'])
+
+
+def planear(selecao=None, replanear=False, inicio=None, horas_por_dia=HORAS_POR_DIA, dias_historico=DIAS_HISTORICO):
+    """
+    Calcula o plano das ordens pendentes sem gravar nada. Devolve um Plano.
+
+    Por omissão só são planeadas as ordens sem funcionário ou sem data; as
+    restantes ocupam a capacidade do seu designado. Com `replanear` todas são
+    planeadas; com `selecao` (queryset) só essas.
+    """
+    planeador = Planeador(inicio, horas_por_dia, dias_historico)
+    selecionadas = set(selecao.values_list('id', flat=True)) if selecao is not None else None
+    ordens = OrdemProducao.objects.filter(status_global='PENDENTE').values(
+        'id', 'numero_serie', 'acessorio_id', 'posto_atual_id', 'funcionario_designado_id', 'data_prevista',
+    )
+
+    a_planear = []
+    for ordem in ordens.iterator(chunk_size=2000):
+        if selecionadas is not None:
+            planear_esta = ordem['id'] in selecionadas
+        else:
+            planear_esta = replanear or ordem['funcionario_designado_id'] is None or ordem['data_prevista'] is None
+        if planear_esta:
+            a_planear.append(ordem)
+        elif ordem['funcionario_designado_id']:
+            planeador.reservar(ordem)
+
+    plano = Plano()
+    nomes = dict(Funcionario.objects.values_list('id', 'nome'))
+    for ordem in sorted(a_planear, key=_prioridade):
+        resultado = planeador.planear(ordem)
+        if resultado is None:
+            plano.sem_operador.append(ordem['numero_serie'])
+            continue
+        plano.planeadas += 1
+        funcionario_id, data = resultado
+        if (funcionario_id, data) != (ordem['funcionario_designado_id'], ordem['data_prevista']):
+            plano.alteracoes.append(Alteracao(
+                ordem['id'], ordem['numero_serie'], funcionario_id, data,
+                nomes.get(ordem['funcionario_designado_id']), nomes.get(funcionario_id), ordem['data_prevista'],
+            ))
+    return plano
+
+
+def aplicar(plano):
+    """Grava o plano com bulk_update (só funcionario_designado e data_prevista)."""
+    agora = timezone.now()
+    ordens = [
+        OrdemProducao(
+            id=alteracao.ordem_id, funcionario_designado_id=alteracao.funcionario_id, data_prevista=alteracao.data_prevista,
+            atualizado_em=agora,
+        )
+        for alteracao in plano.alteracoes
+    ]
+    with transaction.atomic():
+        OrdemProducao.objects.bulk_update(
+            ordens, ['funcionario_designado', 'data_prevista', 'atualizado_em'], batch_size=TAMANHO_LOTE,
+        )
+        fragmentos.ordens_alteradas()
+    return len(ordens)
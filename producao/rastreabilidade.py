@@ -0,0 +1,124 @@
+"""Exportação da rastreabilidade: todas as tarefas de cada número de série, em streaming.
+
+Para auditorias: cada linha é uma tarefa (posto, operador, início, fim,
+duração), das ordens vivas e das arquivadas, ordenadas por número de série e
+início. Lê com values_list(...).iterator(chunk_size) (cursor do lado do
+servidor no PostgreSQL) e escreve em blocos de texto, por isso a memória
+usada não depende do número de tarefas.
+
+`exportar` devolve um gerador de blocos de texto (CSV ou JSON Lines) para
+uma StreamingHttpResponse, um ficheiro ou o stdout; `em_async` adapta-o a um
+servidor ASGI sem o ler todo de uma vez. Como a exportação é lida depois
+de a vista terminar, a base de dados (ex: a réplica) é fixada com `using`.
+"""
+import csv
+import datetime
+import heapq
+import io
+import json
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+from .models import TarefaArquivada, TarefaProducao
+
+TAMANHO_CHUNK = 2000
+LINHAS_POR_BLOCO = 500
+FORMATOS = ('csv', 'jsonl')
+
+CABECALHO = (
+    'numero_serie', 'produto', 'posto_sequencia', 'posto', 'codigo_funcionario', 'funcionario',
+    'inicio', 'fim', 'duracao_segundos', 'concluido', 'arquivada',
+)
+_CAMPOS = (
+    'ordem__numero_serie', 'ordem__acessorio__nome', 'posto__ordem_sequencia', 'posto__nome',
+    'funcionario__codigo', 'funcionario__nome', 'inicio', 'fim', 'concluido',
+)
+
+
+def _inicio_do_dia(dia):
+    return timezone.make_aware(datetime.datetime.combine(dia, datetime.time.min))
+
+
+def tarefas(modelo=TarefaProducao, serie_de=None, serie_ate=None, desde=None, ate=None, acessorio_id=None, posto_id=None,
+            using=None):
+    """values_list das tarefas de `modelo` com os filtros, por número de série e início."""
+    consulta = modelo.objects.using(using)
+    if serie_de:
+        consulta = consulta.filter(ordem__numero_serie__gte=serie_de)
+    if serie_ate:
+        consulta = consulta.filter(ordem__numero_serie__lte=serie_ate)
+    if desde:
+        consulta = consulta.filter(inicio__gte=_inicio_do_dia(desde))
+    if ate:
+        consulta = consulta.filter(inicio__lt=_inicio_do_dia(ate + datetime.timedelta(days=1)))
+    if acessorio_id:
+        consulta = consulta.filter(ordem__acessorio_id=acessorio_id)
+    if posto_id:
+        consulta = consulta.filter(posto_id=posto_id)
+    return consulta.order_by('ordem__numero_serie', 'inicio', 'id').values_list(*_CAMPOS)
+
+
+def linhas(tamanho_chunk=TAMANHO_CHUNK, **filtros):
+    """Tuplas na ordem de CABECALHO, das tarefas vivas e arquivadas intercaladas por número de série."""
+    def ler(modelo):
+        arquivada = modelo is TarefaArquivada
+        for serie, produto, sequencia, posto, codigo, nome, inicio, fim, concluido in (
+            tarefas(modelo, **filtros).iterator(chunk_size=tamanho_chunk)
+        ):
+            duracao = round((fim - inicio).total_seconds(), 1) if inicio and fim else None
+            yield (serie, produto, sequencia, posto, codigo, nome, inicio, fim, duracao, concluido, arquivada)
+
+    # Cada número de série está só numa das tabelas: basta intercalar as duas sequências já ordenadas
+    return heapq.merge(ler(TarefaProducao), ler(TarefaArquivada), key=lambda linha: linha[0])
+
+
+def _data_hora(valor):
+    return valor.isoformat() if valor else ''
+
+
+def _blocos_csv(linhas_exportar):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(CABECALHO)
+    for n, linha in enumerate(linhas_exportar, 1):
+        escritor.writerow(linha[:6] + (_data_hora(linha[6]), _data_hora(linha[7])) + linha[8:])
+        if n % LINHAS_POR_BLOCO == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _blocos_jsonl(linhas_exportar):
+    bloco = []
+    for linha in linhas_exportar:
+        registo = dict(zip(CABECALHO, linha))
+        registo['inicio'] = _data_hora(registo['inicio']) or None
+        registo['fim'] = _data_hora(registo['fim']) or None
+        bloco.append(json.dumps(registo, ensure_ascii=False))
+        if len(bloco) == LINHAS_POR_BLOCO:
+            yield '\n'.join(bloco) + '\n'
+            bloco = []
+    if bloco:
+        yield '\n'.join(bloco) + '\n'
+
+
+def exportar(formato='csv', tamanho_chunk=TAMANHO_CHUNK, **filtros):
+    """Gerador de blocos de texto no `formato` pedido ('csv' ou 'jsonl')."""
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconhecido: {formato}")
+    gerar = _blocos_csv if formato == 'csv' else _blocos_jsonl
+    return gerar(linhas(tamanho_chunk, **filtros))
+
+
+async def em_async(blocos):
+    """
+    Versão assíncrona de `blocos` para StreamingHttpResponse sob ASGI (que, com um
+    iterador síncrono, leria a exportação toda para memória). Cada bloco é lido na
+    thread do pedido, onde está a ligação (e o cursor) à base de dados.
+    """
+    iterador = iter(blocos)
+    ler = sync_to_async(next)
+    while (bloco := await ler(iterador, None)) is not None:
+        yield bloco
@@ -0,0 +1,107 @@
+"""Leituras pesadas numa réplica da base de dados (estatísticas, análise, calendário, exportações).
+
+Com DATABASE_REPLICA_URL definido, settings.py cria o alias REPLICA e o
+RouterReplica envia para lá as leituras feitas dentro de `ler_da_replica()`
+(ou das vistas com @usar_replica). Tudo o resto (o tablet, as gravações do
+admin, os trabalhos) continua na primária. Sem réplica configurada (ou com
+REPLICA_ATIVA desligado) tudo vai para a primária.
+
+Ler o que se acabou de escrever: um pedido que não seja GET/HEAD deixa o
+cookie COOKIE_PRIMARIA durante REPLICA_FIXAR_SEGUNDOS, e enquanto ele
+existir as vistas @usar_replica leem da primária (a réplica pode ainda não
+ter a gravação).
+"""
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICA = 'replica'
+COOKIE_PRIMARIA = 'primaria'
+
+_na_replica = contextvars.ContextVar('producao_ler_da_replica', default=False)
+
+
+def disponivel():
+    return settings.REPLICA_ATIVA
+
+
+def alias_leitura():
+    """Alias de onde se lê neste momento (para querysets avaliados fora do contexto, ex: streaming)."""
+    return REPLICA if _na_replica.get() and disponivel() else DEFAULT_DB_ALIAS
+
+
+def na_replica():
+    return alias_leitura() == REPLICA
+
+
+@contextmanager
+def ler_da_replica(ativo=True):
+    token = _na_replica.set(ativo)
+    try:
+        yield
+    finally:
+        _na_replica.reset(token)
+
+
+def fixado_na_primaria(request):
+    return COOKIE_PRIMARIA in request.COOKIES
+
+
+def usar_replica(vista):
+    """Decorador: os GET da vista leem da réplica, exceto logo a seguir a uma gravação do mesmo browser."""
+    @wraps(vista)
+    def envolvida(request, *args, **kwargs):
+        with ler_da_replica(request.method in ('GET', 'HEAD') and not fixado_na_primaria(request)):
+            resposta = vista(request, *args, **kwargs)
+            # As TemplateResponse (ex: admin) só são desenhadas depois da vista: desenha-se já, ainda na réplica
+            if not getattr(resposta, 'is_rendered', True):
+                resposta.render()
+            return resposta
+    return envolvida
+
+
+class RouterReplica:
+    def db_for_read(self, model, **hints):
+        return alias_leitura()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Réplica e primária têm os mesmos dados
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # A réplica recebe o esquema por replicação
+        return db != REPLICA
+
+
+class ReplicaMiddleware:
+    """Depois de um pedido que pode ter gravado, o mesmo browser lê da primária durante uns segundos."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.assincrono = iscoroutinefunction(get_response)
+        if self.assincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.assincrono:
+            return self._chamar_async(request)
+        return self._fixar(request, self.get_response(request))
+
+    async def _chamar_async(self, request):
+        return self._fixar(request, await self.get_response(request))
+
+    def _fixar(self, request, resposta):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and disponivel():
+            resposta.set_cookie(
+                COOKIE_PRIMARIA, '1', max_age=settings.REPLICA_FIXAR_SEGUNDOS, httponly=True, samesite='Lax',
+            )
+        return resposta
@@ -0,0 +1,202 @@
+"""Tabela de encaminhamento: a rota de cada produto, compilada em memória.
+
+Uma rota é uma lista de etapas; cada etapa tem um ou mais postos (Passo).
+Os postos da mesma etapa são feitos em paralelo: a ordem fica à espera em
+todos (RamoOrdem) e só passa à etapa seguinte quando terminam os passos
+obrigatórios (ou, numa etapa só de opcionais, o primeiro que terminar).
+
+A rota de um produto é, por esta ordem:
+- os seus PassoRota, agrupados por etapa;
+- os postos da sua linha (Acessorio.linha), um por etapa, por ordem_sequencia;
+- a linha geral: os postos sem linha, um por etapa (chave None).
+
+As rotas mudam raramente, por isso a tabela é guardada em memória no
+processo e reconstruída só quando um Posto, produto, linha ou passo é
+gravado ou apagado (ver signals.py). Como cada worker do gunicorn tem a sua
+própria cópia, a tabela expira também ao fim de ROTEAMENTO_TTL segundos.
+Depois de construída, a etapa seguinte de qualquer posto é lida de um
+dicionário (O(1) por tarefa fechada, sem queries).
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+from itertools import groupby
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Acessorio, Posto
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_tabela = None
+_construida_em = 0.0
+
+
+class Passo(NamedTuple):
+    posto_id: int
+    opcional: bool = False
+
+
+class Rota:
+    """Etapas ordenadas de postos, com acesso O(1) à etapa de cada posto e à seguinte."""
+
+    def __init__(self, etapas, sequencias=None):
+        self.etapas = [tuple(etapa) for etapa in etapas if etapa]
+        # (linha_id, ordem_sequencia) de todos os postos (não só os da rota), para retomar a rota (ver `depois_de`)
+        self.sequencias = sequencias or {}
+        self.postos_ids = [passo.posto_id for etapa in self.etapas for passo in etapa]
+        # Sequência achatada (etapas paralelas posto a posto), para quem estima tempos ao longo da rota
+        self.seguinte = dict(zip(self.postos_ids, self.postos_ids[1:]))
+        self._etapa = {}
+        self._etapa_seguinte = {}
+        for i, etapa in enumerate(self.etapas):
+            proxima = self.etapas[i + 1] if i + 1 < len(self.etapas) else None
+            for passo in etapa:
+                self._etapa[passo.posto_id] = etapa
+                self._etapa_seguinte[passo.posto_id] = proxima
+
+    @classmethod
+    def linear(cls, postos_ids, sequencias=None):
+        return cls([(Passo(posto_id),) for posto_id in postos_ids], sequencias)
+
+    @property
+    def primeiro(self):
+        return self.postos_ids[0] if self.postos_ids else None
+
+    @property
+    def primeira_etapa(self):
+        return self.etapas[0] if self.etapas else None
+
+    def proximo(self, posto_id):
+        return self.seguinte.get(posto_id)
+
+    def etapa(self, posto_id):
+        """Etapa a que o posto pertence (None se não está na rota)."""
+        return self._etapa.get(posto_id)
+
+    def etapa_seguinte(self, posto_id):
+        """Etapa depois da de `posto_id`, ou None se é a última (ou o posto não está na rota)."""
+        return self._etapa_seguinte.get(posto_id)
+
+    def depois_de(self, posto_id):
+        """
+        Etapa para onde vai a ordem quando termina em `posto_id` (None depois da última etapa).
+        Se o posto não está na rota (a rota mudou com a ordem a meio, ou o posto foi escolhido no
+        admin), a ordem retoma a rota na primeira etapa com um posto da mesma linha mais à frente
+        na sequência; se o posto vem depois de todos os da rota, a ordem fica concluída. Só se
+        nenhum posto da rota for da linha do posto (sequências incomparáveis) volta ao início.
+        """
+        if posto_id in self._etapa:
+            return self._etapa_seguinte[posto_id]
+        linha_id, sequencia = self.sequencias.get(posto_id, (None, None))
+        # A ordem_sequencia só tem significado dentro de uma linha
+        da_linha = [
+            (etapa, self.sequencias[passo.posto_id][1]) for etapa in self.etapas for passo in etapa
+            if sequencia is not None and passo.posto_id in self.sequencias and self.sequencias[passo.posto_id][0] == linha_id
+        ]
+        if da_linha:
+            etapa = next((etapa for etapa, seguinte in da_linha if seguinte > sequencia), None)
+        else:
+            etapa = self.primeira_etapa
+        logger.warning(
+            "Posto %s fora da rota: a ordem %s", posto_id,
+            f"retoma a rota em {[passo.posto_id for passo in etapa]}" if etapa else "fica concluída",
+        )
+        return etapa
+
+
+def etapa_concluida(etapa, estados):
+    """
+    Se uma etapa paralela terminou, dados os `estados` dos seus ramos ({posto_id: estado}):
+    nenhum ramo em curso e todos os obrigatórios concluídos (só opcionais: pelo menos um).
+    """
+    if 'EM_ANDAMENTO' in estados.values():
+        return False
+    obrigatorios = [passo.posto_id for passo in etapa if not passo.opcional]
+    if obrigatorios:
+        return all(estados.get(posto_id) == 'CONCLUIDO' for posto_id in obrigatorios)
+    return 'CONCLUIDO' in estados.values()
+
+
+def _construir():
+    por_linha = defaultdict(list)
+    sequencias = {}
+    for posto_id, linha_id, sequencia in Posto.objects.order_by('ordem_sequencia', 'id').values_list(
+        'id', 'linha_id', 'ordem_sequencia',
+    ):
+        por_linha[linha_id].append(posto_id)
+        sequencias[posto_id] = (linha_id, sequencia)
+    linhas = {linha_id: Rota.linear(postos_ids, sequencias) for linha_id, postos_ids in por_linha.items()}
+    vazia = Rota([], sequencias)
+    tabela = {None: linhas.get(None) or vazia}
+
+    # Produtos com linha própria ou com passos, numa só query (uma linha por passo)
+    produtos = (
+        Acessorio.objects.filter(Q(linha__isnull=False) | Q(passos_rota__isnull=False))
+        .order_by('id', 'passos_rota__etapa', 'passos_rota__posto__ordem_sequencia', 'passos_rota__posto_id')
+        .values_list('id', 'linha_id', 'passos_rota__etapa', 'passos_rota__posto_id', 'passos_rota__opcional')
+    )
+    for acessorio_id, do_produto in groupby(produtos, key=lambda linha: linha[0]):
+        do_produto = list(do_produto)
+        if do_produto[0][2] is None:
+            tabela[acessorio_id] = linhas.get(do_produto[0][1]) or vazia
+            continue
+        tabela[acessorio_id] = Rota([
+            [Passo(posto_id, opcional) for _, _, _, posto_id, opcional in da_etapa]
+            for _, da_etapa in groupby(do_produto, key=lambda linha: linha[2])
+        ], sequencias)
+    return tabela
+
+
+def _ttl():
+    return getattr(settings, 'ROTEAMENTO_TTL', 300)
+
+
+def tabela():
+    global _tabela, _construida_em
+    with _lock:
+        if _tabela is None or time.monotonic() - _construida_em > _ttl():
+            _tabela = _construir()
+            _construida_em = time.monotonic()
+        return _tabela
+
+
+def invalidar():
+    global _tabela
+    with _lock:
+        _tabela = None
+
+
+def rota(acessorio_id=None):
+    rotas = tabela()
+    return rotas.get(acessorio_id) or rotas[None]
+
+
+def primeiro_posto_id(acessorio_id=None):
+    return rota(acessorio_id).primeiro
+
+
+def proximo_posto_id(posto_id, acessorio_id=None):
+    """Id do posto seguinte na sequência achatada, ou None se `posto_id` é o último da rota."""
+    return rota(acessorio_id).proximo(posto_id)
+
+
+def posto_inicial(acessorio_id=None):
+    """posto_atual de uma ordem nova: o primeiro posto, ou None se a rota começa numa etapa paralela."""
+    etapa = rota(acessorio_id).primeira_etapa
+    return etapa[0].posto_id if etapa and len(etapa) == 1 else None
+
+
+def postos_iniciais():
+    """Postos onde começa pelo menos uma rota (onde o tablet deixa criar ordens)."""
+    return {passo.posto_id for r in tabela().values() if r.primeira_etapa for passo in r.primeira_etapa}
+
+
+def comeca_em(acessorio_id, postos_ids):
+    """Se a rota do produto começa num destes postos."""
+    etapa = rota(acessorio_id).primeira_etapa or ()
+    return any(passo.posto_id in postos_ids for passo in etapa)
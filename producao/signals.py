@@ -0,0 +1,102 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import eventos, fragmentos, historico, operador, roteamento, stock
+from .models import (
+    Acessorio, ComponenteAcessorio, Funcionario, LinhaProducao, OrdemProducao, PassoRota, Peca, Posto, RamoOrdem,
+    TarefaProducao,
+)
+
+
+@receiver([post_save, post_delete], sender=Posto)
+@receiver([post_save, post_delete], sender=Acessorio)
+@receiver([post_save, post_delete], sender=PassoRota)
+@receiver([post_save, post_delete], sender=LinhaProducao)
+def invalidar_roteamento(sender, **kwargs):
+    # Postos, linhas ou rotas mudaram: a tabela de encaminhamento é reconstruída no próximo uso
+    roteamento.invalidar()
+
+
+@receiver(post_save, sender=OrdemProducao)
+def publicar_ordem_gravada(sender, instance, created, **kwargs):
+    # Ordens criadas já têm posto conhecido; edições no admin podem ter mudado o posto, por isso vão para todos
+    if created:
+        eventos.ordem_alterada(instance.pk, instance.posto_atual_id)
+        fragmentos.ordens_alteradas(instance.posto_atual_id)
+    else:
+        eventos.ordem_alterada(instance.pk, origem='admin')
+        fragmentos.ordens_alteradas()
+
+
+@receiver(pre_delete, sender=OrdemProducao)
+def liberar_stock_reservado(sender, instance, **kwargs):
+    # Ordem apagada antes de começar: as peças reservadas voltam a estar disponíveis
+    if instance.estado_stock == 'RESERVADO':
+        stock.liberar(instance)
+
+
+@receiver(post_delete, sender=OrdemProducao)
+def publicar_ordem_apagada(sender, instance, **kwargs):
+    eventos.ordem_alterada(instance.pk, origem='admin')
+    fragmentos.ordens_alteradas()
+
+
+@receiver(post_save, sender=OrdemProducao)
+def registar_ordem_gravada(sender, instance, created, **kwargs):
+    if created:
+        historico.registar(
+            instance.pk, 'CRIADA', instance.posto_atual_id, instance.status_global, momento=instance.data_criacao,
+        )
+        return
+    # Edição no admin: só fica no histórico se mudou o posto ou o status. Numa etapa paralela os
+    # postos vêm dos eventos de cada ramo (geridos pelo tablet), a não ser que a ordem tenha sido concluída
+    estado = (instance.posto_atual_id, instance.status_global)
+    if estado[0] is None and estado[1] != 'CONCLUIDO' and RamoOrdem.objects.filter(ordem_id=instance.pk).exists():
+        return
+    if historico.ultimo_estado(instance.pk) != estado:
+        historico.registar(instance.pk, 'MOVIDA', *estado)
+
+
+@receiver(post_delete, sender=OrdemProducao)
+def registar_ordem_apagada(sender, instance, **kwargs):
+    historico.registar(instance.pk, 'REMOVIDA', instance.posto_atual_id, instance.status_global)
+
+
+@receiver([post_save, post_delete], sender=Posto)
+@receiver([post_save, post_delete], sender=Acessorio)
+@receiver([post_save, post_delete], sender=Funcionario)
+def invalidar_fragmentos_ordens(sender, **kwargs):
+    # Nomes de postos, produtos e operadores aparecem nas filas, nas estatísticas e no calendário
+    # (a agenda vê-os mudar pelo atualizado_em de cada um)
+    fragmentos.ordens_alteradas()
+
+
+@receiver([post_save, post_delete], sender=Peca)
+@receiver([post_save, post_delete], sender=ComponenteAcessorio)
+def invalidar_fragmentos_stock(sender, **kwargs):
+    fragmentos.incrementar('stock')
+
+
+@receiver(m2m_changed, sender=Funcionario.postos.through)
+def invalidar_operador_postos(sender, instance, action, reverse, pk_set, **kwargs):
+    # Os postos autorizados mudaram: o contexto em cache do operador deixa de servir
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        operador.invalidar(instance.pk)
+    elif action == 'pre_clear':
+        operador.invalidar(*instance.funcionarios.values_list('id', flat=True))
+    else:
+        operador.invalidar(*pk_set)
+
+
+@receiver([post_save, post_delete], sender=Funcionario)
+def invalidar_operador(sender, instance, **kwargs):
+    operador.invalidar(instance.pk)
+
+
+@receiver([post_save, pre_delete], sender=Posto)
+def invalidar_operadores_do_posto(sender, instance, **kwargs):
+    # O contexto guarda os nomes dos postos; apagar um posto também remove as ligações sem m2m_changed
+    operador.invalidar(*instance.funcionarios.values_list('id', flat=True))
+
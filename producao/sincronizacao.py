@@ -0,0 +1,130 @@
+"""Sincronização em lote dos eventos dos tablets (início e fim de tarefas).
+
+Sem rede, o tablet guarda cada toque em INICIAR/CONCLUIR como um evento
+{'id': uuid, 'tipo': 'iniciar'|'finalizar', 'ordem_id': n, 'momento': ISO 8601}
+e envia-os todos num só pedido quando a rede volta (ou logo, se houver rede).
+
+`aplicar_lote` aplica os eventos por ordem de `momento` numa só transação,
+cada um no seu savepoint: um evento em conflito (ordem entretanto pegada por
+outro operador, tarefa já fechada, falta de stock) não desfaz os restantes.
+Cada evento fica registado em EventoTablet pelo uuid, por isso reenviar um
+lote (ex: a resposta perdeu-se) devolve o mesmo resultado sem o aplicar de
+novo.
+"""
+import uuid
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import stock
+from .models import EventoTablet, TarefaProducao
+
+MAX_EVENTOS = 200
+TIPOS = {'iniciar': 'INICIAR', 'finalizar': 'FINALIZAR'}
+
+
+class LoteInvalido(Exception):
+    pass
+
+
+def _ler_evento(dados, agora):
+    """(uuid, tipo, ordem_id, momento) de um evento do tablet. Lança ValueError se for inválido."""
+    if not isinstance(dados, dict):
+        raise ValueError("Evento tem de ser um objeto")
+    identificador = uuid.UUID(str(dados.get('id')))
+    tipo = TIPOS.get(dados.get('tipo'))
+    if tipo is None:
+        raise ValueError(f"Tipo desconhecido: {dados.get('tipo')}")
+    ordem_id = dados.get('ordem_id')
+    if not isinstance(ordem_id, int) or isinstance(ordem_id, bool):
+        raise ValueError("ordem_id tem de ser um número")
+    momento = parse_datetime(str(dados.get('momento') or ''))
+    if momento is None:
+        raise ValueError("momento tem de ser uma data e hora ISO 8601")
+    if timezone.is_naive(momento):
+        momento = timezone.make_aware(momento)
+    # Relógio do tablet adiantado: nada pode ter acontecido depois de agora
+    return identificador, tipo, ordem_id, min(momento, agora)
+
+
+def _resultado(identificador, estado, mensagem='', tarefa_id=None, repetido=False):
+    return {
+        'id': str(identificador), 'estado': estado.lower(), 'mensagem': mensagem,
+        'tarefa_id': tarefa_id, 'repetido': repetido,
+    }
+
+
+def _iniciar(contexto, ordem_id, momento):
+    try:
+        tarefa = TarefaProducao.abrir(ordem_id, contexto.funcionario, inicio=momento)
+    except stock.StockInsuficiente as erro:
+        return 'CONFLITO', f"Stock insuficiente: {erro}", None
+    if tarefa is None or tarefa.ordem_id != ordem_id:
+        return 'CONFLITO', "Ordem já não está disponível (pegada por outro operador, concluída ou noutro posto)", None
+    return 'APLICADO', '', tarefa.id
+
+
+def _finalizar(contexto, ordem_id, momento):
+    tarefa = (
+        TarefaProducao.objects.select_related('ordem')
+        .filter(funcionario_id=contexto.funcionario_id, ordem_id=ordem_id, concluido=False)
+        .first()
+    )
+    if tarefa is None:
+        return 'CONFLITO', "Não há tarefa aberta nesta ordem", None
+    # Um relógio atrasado não pode dar durações negativas
+    if not tarefa.finalizar_tarefa(fim=max(momento, tarefa.inicio)):
+        return 'CONFLITO', "Tarefa já estava concluída", tarefa.id
+    return 'APLICADO', '', tarefa.id
+
+
+def aplicar_lote(contexto, eventos, agora=None):
+    """
+    Aplica os `eventos` (lista de dicionários do tablet) em nome do operador de `contexto`
+    (operador.ContextoOperador). Devolve um resultado por evento, pela ordem em que foram
+    aplicados: {'id', 'estado': 'aplicado'|'conflito'|'invalido', 'mensagem', 'tarefa_id', 'repetido'}.
+    """
+    if not isinstance(eventos, list):
+        raise LoteInvalido("'eventos' tem de ser uma lista")
+    if len(eventos) > MAX_EVENTOS:
+        raise LoteInvalido(f"No máximo {MAX_EVENTOS} eventos por pedido")
+    agora = agora or timezone.now()
+
+    resultados = []
+    validos = []
+    for dados in eventos:
+        try:
+            validos.append(_ler_evento(dados, agora))
+        except ValueError as erro:
+            identificador = dados.get('id') if isinstance(dados, dict) else None
+            resultados.append({
+                'id': identificador, 'estado': 'invalido', 'mensagem': str(erro), 'tarefa_id': None, 'repetido': False,
+            })
+    # Pela ordem em que aconteceram no tablet (sort estável: empates mantêm a ordem do lote)
+    validos.sort(key=lambda evento: evento[3])
+
+    acoes = {'INICIAR': _iniciar, 'FINALIZAR': _finalizar}
+    with transaction.atomic():
+        for identificador, tipo, ordem_id, momento in validos:
+            try:
+                with transaction.atomic():
+                    registo = EventoTablet.objects.create(
+                        uuid=identificador, funcionario_id=contexto.funcionario_id, tipo=tipo,
+                        ordem_id=ordem_id, momento=momento,
+                    )
+            except IntegrityError:
+                # Já recebido (reenvio ou dois envios em paralelo): devolve o resultado guardado
+                anterior = EventoTablet.objects.filter(uuid=identificador).first()
+                if anterior is None or anterior.funcionario_id != contexto.funcionario_id:
+                    resultados.append(_resultado(identificador, 'INVALIDO', "Identificador de evento repetido"))
+                else:
+                    resultados.append(_resultado(
+                        identificador, anterior.estado, anterior.mensagem, anterior.tarefa_id, repetido=True,
+                    ))
+                continue
+
+            estado, mensagem, tarefa_id = acoes[tipo](contexto, ordem_id, momento)
+            EventoTablet.objects.filter(pk=registo.pk).update(estado=estado, mensagem=mensagem, tarefa_id=tarefa_id)
+            resultados.append(_resultado(identificador, estado, mensagem, tarefa_id))
+    return resultados
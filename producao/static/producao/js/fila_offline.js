@@ -0,0 +1,147 @@
+// Fila de eventos do tablet: INICIAR e CONCLUIR respondem logo, mesmo sem rede.
+// Cada toque fica guardado no localStorage como um evento com id único e hora do tablet,
+// e a fila é enviada num só pedido para /sincronizar/ (ver sincronizacao.py).
+// Reenviar a fila é seguro: o servidor reconhece os eventos já aplicados pelo id.
+(function () {
+    var corpo = document.body;
+    if (!window.fetch || !window.localStorage || !corpo.dataset.sincronizar) { return; }  // os formulários fazem POST normal
+
+    var urlSincronizar = corpo.dataset.sincronizar;
+    var chave = 'tractorgest:eventos:' + corpo.dataset.funcionario;
+    var chaveConflitos = chave + ':conflitos';
+    var aviso = document.getElementById('aviso-offline');
+    var INTERVALO_MS = 15000;
+    var aEnviar = false;
+
+    function ler(nome) {
+        try { return JSON.parse(localStorage.getItem(nome)) || []; } catch (erro) { return []; }
+    }
+
+    function fila() { return ler(chave); }
+
+    function guardar(eventos) {
+        localStorage.setItem(chave, JSON.stringify(eventos));
+        mostrarAviso();
+    }
+
+    function novoId() {
+        if (window.crypto && crypto.randomUUID) { return crypto.randomUUID(); }
+        return 'xxxxxxxx-xxxx-4xxx-yxxx-xxxxxxxxxxxx'.replace(/[xy]/g, function (c) {
+            var r = Math.random() * 16 | 0;
+            return (c === 'x' ? r : (r & 3 | 8)).toString(16);
+        });
+    }
+
+    function tokenCsrf() {
+        var campo = document.querySelector('[name=csrfmiddlewaretoken]');
+        return campo ? campo.value : '';
+    }
+
+    function mostrarAviso() {
+        var pendentes = fila().length;
+        var conflitos = ler(chaveConflitos);
+        aviso.textContent = '';
+        if (pendentes) {
+            aviso.appendChild(document.createTextNode(
+                '📡 Sem ligação: ' + pendentes + (pendentes === 1 ? ' ação' : ' ações') + ' por sincronizar.'
+            ));
+        }
+        conflitos.forEach(function (mensagem) {
+            var linha = document.createElement('div');
+            linha.className = 'conflito';
+            linha.textContent = '⚠️ ' + mensagem;
+            aviso.appendChild(linha);
+        });
+        aviso.hidden = !pendentes && !conflitos.length;
+    }
+
+    // Envia a fila; resolve com true se o servidor a aceitou
+    function sincronizar() {
+        var eventos = fila();
+        if (aEnviar || !eventos.length) { return Promise.resolve(false); }
+        aEnviar = true;
+        return fetch(urlSincronizar, {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: {'Content-Type': 'application/json', 'X-CSRFToken': tokenCsrf()},
+            body: JSON.stringify({eventos: eventos})
+        }).then(function (resposta) {
+            if (resposta.status === 403) {
+                // Sessão terminada: a fila fica guardada até o operador voltar a entrar
+                window.location.reload();
+                return false;
+            }
+            if (!resposta.ok) { throw new Error('HTTP ' + resposta.status); }
+            return resposta.json().then(function (dados) {
+                var enviados = {};
+                eventos.forEach(function (evento) { enviados[evento.id] = true; });
+                var conflitos = dados.resultados.filter(function (resultado) {
+                    return resultado.estado !== 'aplicado';
+                }).map(function (resultado) { return resultado.mensagem; });
+                localStorage.setItem(chaveConflitos, JSON.stringify(conflitos));
+                // Eventos criados durante o envio ficam para o próximo
+                guardar(fila().filter(function (evento) { return !enviados[evento.id]; }));
+                return true;
+            });
+        }).catch(function () {
+            return false;
+        }).then(function (aceite) {
+            aEnviar = false;
+            return aceite;
+        });
+    }
+
+    function sincronizarEAtualizar() {
+        sincronizar().then(function (aceite) {
+            // Com a fila aplicada, a página do servidor passa a ser a verdade
+            if (aceite) { window.location.reload(); }
+        });
+    }
+
+    function iniciarLocalmente(formulario) {
+        var cartao = formulario.closest('.card');
+        var listas = document.getElementById('listas');
+        var emCurso = document.getElementById('modelo-em-curso').content.firstElementChild.cloneNode(true);
+        emCurso.querySelector('.numero-serie').textContent = formulario.dataset.serie || '';
+        emCurso.querySelector('.inicio').textContent = new Date().toTimeString().slice(0, 5);
+        emCurso.querySelector('form').dataset.ordemEvento = formulario.dataset.ordemEvento;
+        if (cartao) { cartao.remove(); }
+        if (listas) {
+            listas.hidden = true;
+            listas.parentNode.insertBefore(emCurso, listas);
+        }
+    }
+
+    function finalizarLocalmente() {
+        var emCurso = document.getElementById('tarefa-em-curso');
+        var listas = document.getElementById('listas');
+        if (emCurso) { emCurso.remove(); }
+        if (listas) { listas.hidden = false; }
+    }
+
+    document.addEventListener('submit', function (evento) {
+        var formulario = evento.target;
+        var tipo = formulario.dataset.evento;
+        if (!tipo || !formulario.dataset.ordemEvento) { return; }
+        evento.preventDefault();
+        if (tipo === 'iniciar' && document.getElementById('tarefa-em-curso')) { return; }  // uma tarefa de cada vez
+
+        var eventos = fila();
+        eventos.push({
+            id: novoId(),
+            tipo: tipo,
+            ordem_id: parseInt(formulario.dataset.ordemEvento, 10),
+            momento: new Date().toISOString()
+        });
+        guardar(eventos);
+        if (tipo === 'iniciar') { iniciarLocalmente(formulario); } else { finalizarLocalmente(); }
+        sincronizarEAtualizar();
+    });
+
+    window.addEventListener('online', sincronizarEAtualizar);
+    setInterval(sincronizarEAtualizar, INTERVALO_MS);
+    mostrarAviso();
+    // Conflitos já mostrados uma vez depois de recarregar não voltam a aparecer
+    localStorage.removeItem(chaveConflitos);
+    sincronizarEAtualizar();
+})();
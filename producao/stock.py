@@ -0,0 +1,128 @@
+"""Reserva e consumo de peças segundo a lista de materiais (ComponenteAcessorio).
+
+Ao criar uma ordem reservam-se as peças (stock_reservado); ao iniciar a
+primeira tarefa são consumidas (stock_atual e stock_reservado descem). Se a
+ordem for apagada ou mudar de produto antes disso a reserva é libertada.
+Tudo dentro de transações, com as linhas das peças bloqueadas
+(select_for_update, sempre pela mesma ordem de id para evitar deadlocks) e
+incrementos feitos pela base de dados com F(), nunca ler-alterar-gravar.
+"""
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When
+from django.utils import timezone
+
+from .models import ComponenteAcessorio, OrdemProducao, Peca
+
+
+class StockInsuficiente(Exception):
+    def __init__(self, faltas):
+        # faltas: [(peca, necessario, disponivel)]
+        self.faltas = faltas
+        super().__init__(', '.join(
+            f"{peca.referencia}: precisa {necessario}, disponível {disponivel}" for peca, necessario, disponivel in faltas
+        ))
+
+
+def necessidades(acessorio_id):
+    """{peca_id: quantidade} para fabricar uma unidade do acessório."""
+    return dict(
+        ComponenteAcessorio.objects.filter(acessorio_id=acessorio_id).values_list('peca_id', 'quantidade')
+    )
+
+
+def _bloquear_e_verificar(necessario, descontar_reserva):
+    """Bloqueia as peças e confirma que há stock livre (ignorando a reserva da própria ordem)."""
+    pecas = Peca.objects.select_for_update().filter(id__in=necessario).order_by('id')
+    faltas = []
+    for peca in pecas:
+        disponivel = peca.stock_disponivel + (necessario[peca.id] if descontar_reserva else 0)
+        if disponivel < necessario[peca.id]:
+            faltas.append((peca, necessario[peca.id], disponivel))
+    if faltas:
+        raise StockInsuficiente(faltas)
+
+
+def _por_peca(necessario):
+    # Um único UPDATE para todas as peças: CASE id WHEN ... THEN quantidade
+    return Case(
+        *[When(id=peca_id, then=Value(quantidade)) for peca_id, quantidade in necessario.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def reservar(ordem):
+    """Reserva as peças de uma ordem ainda não reservada. Lança StockInsuficiente se faltar alguma."""
+    with transaction.atomic():
+        estado = (
+            OrdemProducao.objects.select_for_update().filter(pk=ordem.pk)
+            .values_list('estado_stock', flat=True).first()
+        )
+        if estado != 'NAO_RESERVADO':
+            return False
+        necessario = necessidades(ordem.acessorio_id)
+        if necessario:
+            _bloquear_e_verificar(necessario, descontar_reserva=False)
+            Peca.objects.filter(id__in=necessario).update(stock_reservado=F('stock_reservado') + _por_peca(necessario))
+        OrdemProducao.objects.filter(pk=ordem.pk).update(estado_stock='RESERVADO', atualizado_em=timezone.now())
+    ordem.estado_stock = 'RESERVADO'
+    return True
+
+
+def liberar(ordem, acessorio_id=None):
+    """
+    Devolve as peças reservadas por uma ordem que já não as vai consumir (apagada ou com outro
+    produto). `acessorio_id` é o produto para o qual se reservou, se a ordem já mudou de produto.
+    """
+    with transaction.atomic():
+        estado = (
+            OrdemProducao.objects.select_for_update().filter(pk=ordem.pk)
+            .values_list('estado_stock', flat=True).first()
+        )
+        if estado != 'RESERVADO':
+            return False
+        necessario = necessidades(acessorio_id or ordem.acessorio_id)
+        if necessario:
+            # Bloqueia pela mesma ordem de id que reservar e consumir antes do UPDATE
+            list(Peca.objects.select_for_update().filter(id__in=necessario).order_by('id').values_list('id', flat=True))
+            Peca.objects.filter(id__in=necessario).update(stock_reservado=F('stock_reservado') - _por_peca(necessario))
+        OrdemProducao.objects.filter(pk=ordem.pk).update(estado_stock='NAO_RESERVADO', atualizado_em=timezone.now())
+    ordem.estado_stock = 'NAO_RESERVADO'
+    return True
+
+
+def consumir(ordem):
+    """
+    Desconta as peças de uma ordem que vai começar a ser produzida.
+    A ordem tem de estar bloqueada pela transação de quem chama (ver TarefaProducao.abrir).
+    """
+    if ordem.estado_stock == 'CONSUMIDO':
+        return False
+    necessario = necessidades(ordem.acessorio_id)
+    if necessario:
+        reservado = ordem.estado_stock == 'RESERVADO'
+        _bloquear_e_verificar(necessario, descontar_reserva=reservado)
+        alteracoes = {'stock_atual': F('stock_atual') - _por_peca(necessario)}
+        if reservado:
+            alteracoes['stock_reservado'] = F('stock_reservado') - _por_peca(necessario)
+        Peca.objects.filter(id__in=necessario).update(**alteracoes)
+    ordem.estado_stock = 'CONSUMIDO'
+    return True
+
+
+def faltas(ate=None):
+    """
+    Peças em falta para todas as ordens por iniciar (opcionalmente só até à data prevista `ate`),
+    numa única query agregada: [{'id', 'referencia', 'nome', 'stock_atual', 'necessario', 'falta'}].
+    """
+    filtro = Q(componentes__acessorio__ordemproducao__estado_stock__in=['NAO_RESERVADO', 'RESERVADO'])
+    filtro &= ~Q(componentes__acessorio__ordemproducao__status_global='CONCLUIDO')
+    if ate:
+        filtro &= Q(componentes__acessorio__ordemproducao__data_prevista__lte=ate)
+    return list(
+        Peca.objects.annotate(necessario=Sum('componentes__quantidade', filter=filtro))
+        .annotate(falta=F('necessario') - F('stock_atual'))
+        .filter(falta__gt=0)
+        .values('id', 'referencia', 'nome', 'stock_atual', 'necessario', 'falta')
+        .order_by('-falta')
+    )
@@ -1,3 +1,2237 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import io
+import json
+import os
+import re
+import tempfile
+import uuid
+from contextlib import contextmanager
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.middleware.csrf import _unmask_cipher_token
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    analitica, arquivo, benchmark, dados_sinteticos, estatisticas, eventos, fragmentos, historico, importacao, indices,
+    instrumentacao, monitor, operador, planeamento, rastreabilidade, replicas, roteamento, sincronizacao, stock, trabalhos,
+)
+from .calendario import contagens_por_dia, intervalo_meses, intervalo_semana, somar_meses
+from .models import (
+    AlertaLinha, Acessorio, ComponenteAcessorio, EventoProducao, EventoTablet, Funcionario, LinhaProducao, OrdemArquivada, OrdemProducao,
+    PassoRota, Peca, Posto, ProducaoDiaria, RamoOrdem, SnapshotWIP, TarefaProducao, Trabalho,
+)
+from .views import ORDENS_GERAIS_POR_PAGINA
+
+
+class CalendarioTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.posto = Posto.objects.create(nome='Montagem', ordem_sequencia=1)
+        cls.acessorio = Acessorio.objects.create(nome='Pá carregadora')
+        cls.joao = Funcionario.objects.create(nome='João', codigo='1111')
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'senha')
+
+    def criar_ordens(self, n, data, **kwargs):
+        inicio = OrdemProducao.objects.count()
+        OrdemProducao.objects.bulk_create([
+            OrdemProducao(
+                numero_serie=f'SN-{inicio + i}',
+                acessorio=self.acessorio,
+                posto_atual=self.posto,
+                data_prevista=data,
+                **kwargs,
+            )
+            for i in range(n)
+        ])
+
+    def test_intervalos(self):
+        self.assertEqual(somar_meses(2026, 12, 1), (2027, 1))
+        self.assertEqual(somar_meses(2026, 1, -1), (2025, 12))
+        self.assertEqual(
+            intervalo_meses(2026, 11, 3),
+            (datetime.date(2026, 11, 1), datetime.date(2027, 1, 31)),
+        )
+        self.assertEqual(
+            intervalo_semana(datetime.date(2026, 10, 18)),
+            (datetime.date(2026, 10, 12), datetime.date(2026, 10, 18)),
+        )
+
+    def test_contagens_por_dia_numa_query(self):
+        dia = datetime.date(2026, 10, 5)
+        self.criar_ordens(3, dia)
+        self.criar_ordens(2, dia, funcionario_designado=self.joao, status_global='EM_ANDAMENTO')
+        self.criar_ordens(1, datetime.date(2026, 11, 5))
+
+        with self.assertNumQueries(1):
+            resumos = contagens_por_dia(*intervalo_meses(2026, 10))
+
+        self.assertEqual(list(resumos), [dia])
+        self.assertEqual(resumos[dia].total, 5)
+        self.assertEqual(resumos[dia].por_status['PENDENTE'], 3)
+        self.assertEqual(resumos[dia].por_status['EM_ANDAMENTO'], 2)
+        self.assertEqual(resumos[dia].por_funcionario['João'], 2)
+        self.assertEqual(resumos[dia].por_funcionario[None], 3)
+
+    def test_changelist_uma_query_de_calendario(self):
+        self.client.force_login(self.admin)
+        for dia in range(1, 29):
+            self.criar_ordens(2, datetime.date(2026, 11, dia))
+
+        with CaptureQueriesContext(connection) as queries:
+            resposta = self.client.get(
+                reverse('admin:producao_agendamento_changelist'),
+                {'ano': 2026, 'mes': 10, 'meses': 3},
+            )
+        self.assertEqual(resposta.status_code, 200)
+        self.assertContains(resposta, '2 tarefas')
+        consultas_calendario = [q for q in queries if 'BETWEEN' in q['sql']]
+        self.assertEqual(len(consultas_calendario), 1)
+
+    def test_vista_semanal(self):
+        self.client.force_login(self.admin)
+        self.criar_ordens(4, datetime.date(2026, 10, 14))
+        resposta = self.client.get(
+            reverse('admin:producao_agendamento_changelist'), {'semana': '2026-10-15'}
+        )
+        self.assertEqual(resposta.status_code, 200)
+        self.assertContains(resposta, 'Semana 12/10/2026')
+        self.assertContains(resposta, '4 tarefas')
+
+    def test_mes_no_limite_do_calendario(self):
+        self.client.force_login(self.admin)
+        resposta = self.client.get(
+            reverse('admin:producao_agendamento_changelist'), {'ano': 9999, 'mes': 12, 'meses': 2}
+        )
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.context['calendario_nav']['seguinte'], '?ano=9999&mes=2&meses=2')
+
+    def test_semana_no_limite_do_calendario(self):
+        self.client.force_login(self.admin)
+        for semana in ('9999-12-31', '0001-01-01'):
+            resposta = self.client.get(reverse('admin:producao_agendamento_changelist'), {'semana': semana})
+            self.assertEqual(resposta.status_code, 200)
+            # Data fora dos anos aceites: volta à vista do mês atual
+            self.assertNotContains(resposta, 'Semana ')
+
+
+class OrcamentoQueriesMixin:
+    """Asserções de orçamento de queries: o número não pode passar o limite."""
+
+    @contextmanager
+    def assertMaxQueries(self, limite):
+        with CaptureQueriesContext(connection) as queries:
+            yield queries
+        self.assertLessEqual(
+            len(queries), limite,
+            '\n'.join(q['sql'] for q in queries.captured_queries),
+        )
+
+    def queries_efetivas(self, queries):
+        # Os SAVEPOINT das transações aninhadas do TestCase não são round-trips da aplicação
+        return [q for q in queries if not q['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))]
+
+    def entrar_como(self, funcionario):
+        session = self.client.session
+        session['funcionario_id'] = funcionario.id
+        session.save()
+        # Com sessões em cookie assinado o conteúdo vai no próprio cookie
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+
+class OrcamentoQueriesViewsTests(OrcamentoQueriesMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.posto1 = Posto.objects.create(nome='Corte', ordem_sequencia=1)
+        cls.posto2 = Posto.objects.create(nome='Soldadura', ordem_sequencia=2)
+        cls.acessorio = Acessorio.objects.create(nome='Balde')
+        cls.operador = Funcionario.objects.create(nome='Ana', codigo='1234')
+        cls.operador.postos.set([cls.posto1, cls.posto2])
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'senha')
+
+    def setUp(self):
+        roteamento.invalidar()
+        cache.clear()
+
+    def criar_ordens(self, n, **kwargs):
+        inicio = OrdemProducao.objects.count()
+        kwargs.setdefault('posto_atual', self.posto1)
+        OrdemProducao.objects.bulk_create([
+            OrdemProducao(numero_serie=f'SN-{inicio + i}', acessorio=self.acessorio, **kwargs)
+            for i in range(n)
+        ])
+        fragmentos.ordens_alteradas()  # bulk_create não envia sinais
+
+    def queries_dashboard(self):
+        with CaptureQueriesContext(connection) as queries:
+            resposta = self.client.get(reverse('dashboard_funcionario'))
+        self.assertEqual(resposta.status_code, 200)
+        return len(queries)
+
+    def test_login(self):
+        with self.assertMaxQueries(0):
+            self.client.get(reverse('login_funcionario'))
+        # Sessão em cookie assinado: só a query do PIN (que já deixa o contexto do operador em cache)
+        with self.assertMaxQueries(1):
+            resposta = self.client.post(reverse('login_funcionario'), {'codigo': '1234'})
+        self.assertRedirects(resposta, reverse('dashboard_funcionario'), fetch_redirect_response=False)
+
+    def test_logout(self):
+        self.entrar_como(self.operador)
+        with self.assertMaxQueries(0):
+            self.client.get(reverse('logout_funcionario'))
+
+    def test_dashboard_numero_constante_de_queries(self):
+        self.entrar_como(self.operador)
+        self.criar_ordens(2)
+        self.criar_ordens(1, funcionario_designado=self.operador)
+        roteamento.tabela()
+        self.queries_dashboard()  # constrói o contexto do operador em cache
+        poucas = self.queries_dashboard()
+
+        self.criar_ordens(40)
+        self.criar_ordens(15, posto_atual=self.posto2, funcionario_designado=self.operador)
+        self.assertEqual(self.queries_dashboard(), poucas)
+        self.assertLessEqual(poucas, 6)  # inclui a tarefa aberta e os ramos pendentes nos postos
+
+    def test_dashboard_pool_geral_paginada(self):
+        self.entrar_como(self.operador)
+        self.criar_ordens(ORDENS_GERAIS_POR_PAGINA + 5)
+        resposta = self.client.get(reverse('dashboard_funcionario'))
+        self.assertEqual(len(resposta.context['ordens_gerais']), ORDENS_GERAIS_POR_PAGINA)
+        resposta = self.client.get(reverse('dashboard_funcionario'), {'pagina': 2})
+        self.assertEqual(len(resposta.context['ordens_gerais']), 5)
+
+    def test_dashboard_com_tarefa_em_curso(self):
+        self.entrar_como(self.operador)
+        self.criar_ordens(30)
+        ordem = OrdemProducao.objects.first()
+        TarefaProducao.objects.create(ordem=ordem, posto=self.posto1, funcionario=self.operador)
+        with self.assertMaxQueries(5):
+            resposta = self.client.get(reverse('dashboard_funcionario'))
+        self.assertContains(resposta, ordem.numero_serie)
+
+    def test_iniciar_e_finalizar_tarefa(self):
+        self.entrar_como(self.operador)
+        self.criar_ordens(1)
+        ordem = OrdemProducao.objects.get()
+        with self.assertMaxQueries(10):
+            self.client.post(reverse('iniciar_tarefa', args=[ordem.id]))
+        tarefa = TarefaProducao.objects.get(ordem=ordem)
+
+        with self.assertMaxQueries(9):
+            self.client.post(reverse('finalizar_tarefa', args=[tarefa.id]))
+        ordem.refresh_from_db()
+        self.assertEqual(ordem.posto_atual, self.posto2)
+
+    def test_estatisticas_numero_constante_de_queries(self):
+        self.client.force_login(self.admin)
+        ontem = datetime.date.today() - datetime.timedelta(days=1)
+        self.criar_ordens(2, data_prevista=ontem)
+        with CaptureQueriesContext(connection) as poucas:
+            self.client.get(reverse('dashboard_estatisticas'))
+
+        self.criar_ordens(30, data_prevista=ontem, posto_atual=self.posto2)
+        with self.assertMaxQueries(len(poucas)):
+            resposta = self.client.get(reverse('dashboard_estatisticas'))
+        self.assertEqual(resposta.status_code, 200)
+
+
+class OperadorTests(OrcamentoQueriesMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.posto1 = Posto.objects.create(nome='Corte', ordem_sequencia=1)
+        cls.posto2 = Posto.objects.create(nome='Soldadura', ordem_sequencia=2)
+        cls.acessorio = Acessorio.objects.create(nome='Balde')
+        cls.operador = Funcionario.objects.create(nome='Ana', codigo='1234')
+        cls.operador.postos.set([cls.posto2])
+
+    def setUp(self):
+        roteamento.invalidar()
+        cache.clear()
+
+    def test_contexto_em_cache(self):
+        with self.assertNumQueries(1):
+            contexto = operador.contexto(self.operador.id)
+        self.assertEqual(contexto.nome, 'Ana')
+        self.assertEqual(contexto.postos_ids, {self.posto2.id})
+        with self.assertNumQueries(0):
+            self.assertEqual(operador.contexto(self.operador.id).postos_ids, {self.posto2.id})
+        self.assertIsNone(operador.contexto(0))
+
+    def test_invalidado_quando_postos_mudam(self):
+        operador.contexto(self.operador.id)
+        self.operador.postos.add(self.posto1)
+        self.assertEqual(operador.contexto(self.operador.id).postos_ids, {self.posto1.id, self.posto2.id})
+        self.posto1.funcionarios.remove(self.operador)
+        self.assertEqual(operador.contexto(self.operador.id).postos_ids, {self.posto2.id})
+        self.posto2.funcionarios.clear()
+        self.assertEqual(operador.contexto(self.operador.id).postos_ids, frozenset())
+
+    def test_tarefa_aberta_lida_da_base_de_dados(self):
+        self.entrar_como(self.operador)
+        ordem = OrdemProducao.objects.create(numero_serie='SN-1', acessorio=self.acessorio, posto_atual=self.posto2)
+        self.client.get(reverse('dashboard_funcionario'))  # contexto em cache
+        # Aberta noutro processo: a cache deste não foi avisada
+        TarefaProducao.objects.create(ordem=ordem, posto=self.posto2, funcionario=self.operador)
+        resposta = self.client.get(reverse('dashboard_funcionario'))
+        self.assertEqual(resposta.context['tarefa_em_curso'].ordem_id, ordem.id)
+
+    def test_postos_em_cache_nao_autorizam(self):
+        self.entrar_como(self.operador)
+        ordem = OrdemProducao.objects.create(numero_serie='SN-1', acessorio=self.acessorio, posto_atual=self.posto2)
+        operador.contexto(self.operador.id)
+        # Posto retirado noutro processo: o contexto em cache deste ainda o tem
+        Funcionario.postos.through.objects.filter(funcionario=self.operador).delete()
+        self.assertEqual(operador.contexto(self.operador.id).postos_ids, {self.posto2.id})
+        self.client.post(reverse('iniciar_tarefa', args=[ordem.id]))
+        self.assertFalse(TarefaProducao.objects.filter(ordem=ordem).exists())
+
+    def test_dashboard_sem_queries_ao_funcionario(self):
+        self.client.post(reverse('login_funcionario'), {'codigo': '1234'})
+        with CaptureQueriesContext(connection) as queries:
+            resposta = self.client.get(reverse('dashboard_funcionario'))
+        self.assertContains(resposta, 'Soldadura')
+        sql = ' '.join(q['sql'] for q in queries.captured_queries)
+        self.assertNotIn('producao_funcionario_postos', sql)
+        self.assertNotIn('django_session', sql)
+
+    def test_limite_de_tentativas_de_pin(self):
+        for _ in range(operador.PIN_MAX_TENTATIVAS):
+            resposta = self.client.post(reverse('login_funcionario'), {'codigo': '0000'})
+            self.assertContains(resposta, 'Código inválido')
+        # Bloqueado: nem o PIN certo passa, e não se vai à base de dados
+        with self.assertNumQueries(0):
+            resposta = self.client.post(reverse('login_funcionario'), {'codigo': '1234'})
+        self.assertEqual(resposta.status_code, 429)
+        # Outro IP não é afetado
+        resposta = self.client.post(reverse('login_funcionario'), {'codigo': '1234'}, REMOTE_ADDR='10.0.0.2')
+        self.assertRedirects(resposta, reverse('dashboard_funcionario'), fetch_redirect_response=False)
+
+
+class AdminListagemTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.posto1 = Posto.objects.create(nome='Corte', ordem_sequencia=1)
+        cls.posto2 = Posto.objects.create(nome='Soldadura', ordem_sequencia=2)
+        cls.acessorio = Acessorio.objects.create(nome='Balde')
+        cls.funcionarios = Funcionario.objects.bulk_create([
+            Funcionario(nome=f'Operador {i}', codigo=f'90{i}') for i in range(5)
+        ])
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'senha')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def criar_ordens(self, n):
+        inicio = OrdemProducao.objects.count()
+        OrdemProducao.objects.bulk_create([
+            OrdemProducao(
+                numero_serie=f'SN-{inicio + i}', acessorio=self.acessorio, posto_atual=self.posto1,
+                funcionario_designado=self.funcionarios[i % 5], data_prevista=datetime.date(2026, 10, 1),
+            )
+            for i in range(n)
+        ])
+        fragmentos.ordens_alteradas()  # bulk_create não envia sinais
+
+    def queries_lista(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            resposta = self.client.get(url, params)
+        self.assertEqual(resposta.status_code, 200)
+        return len(queries), resposta
+
+    def test_lista_com_numero_constante_de_queries(self):
+        for nome in ('admin:producao_ordemproducao_changelist', 'admin:producao_agendamento_changelist'):
+            with self.subTest(nome):
+                OrdemProducao.objects.all().delete()
+                self.criar_ordens(3)
+                poucas, _ = self.queries_lista(reverse(nome))
+                self.criar_ordens(60)
+                muitas, resposta = self.queries_lista(reverse(nome))
+                self.assertEqual(muitas, poucas)
+                self.assertContains(resposta, 'Operador 4')
+
+    def test_paginacao_por_cursor(self):
+        self.criar_ordens(150)
+        url = reverse('admin:producao_ordemproducao_changelist')
+        _, resposta = self.queries_lista(url, status_global__exact='PENDENTE')
+        pagina1 = [ordem.pk for ordem in resposta.context['cl'].result_list]
+        self.assertEqual(len(pagina1), 100)
+        seguinte = resposta.context['keyset']['seguinte']
+        self.assertIn(f'cursor={pagina1[-1]}', seguinte)
+        self.assertIn('status_global__exact=PENDENTE', seguinte)
+
+        with CaptureQueriesContext(connection) as queries:
+            resposta = self.client.get(url + seguinte)
+        pagina2 = [ordem.pk for ordem in resposta.context['cl'].result_list]
+        self.assertEqual(len(pagina2), 50)
+        self.assertLess(max(pagina2), min(pagina1))
+        self.assertIsNone(resposta.context['keyset']['seguinte'])
+        self.assertNotIn('OFFSET', ' '.join(q['sql'] for q in queries.captured_queries))
+
+        # Ordenar por uma coluna volta à paginação normal
+        resposta = self.client.get(url, {'o': '1'})
+        self.assertNotIn('keyset', resposta.context)
+
+    def test_tarefas_da_ordem_sem_query_por_linha(self):
+        self.criar_ordens(1)
+        ordem = OrdemProducao.objects.get()
+        url = reverse('admin:producao_ordemproducao_change', args=[ordem.pk])
+        TarefaProducao.objects.create(ordem=ordem, posto=self.posto1, funcionario=self.funcionarios[0], concluido=True)
+        self.client.get(url)
+        poucas, _ = self.queries_lista(url)
+        TarefaProducao.objects.bulk_create([
+            TarefaProducao(ordem=ordem, posto=self.posto2, funcionario=funcionario, concluido=True)
+            for funcionario in self.funcionarios
+        ])
+        muitas, _ = self.queries_lista(url)
+        self.assertEqual(muitas, poucas)
+
+
+class RoteamentoTests(OrcamentoQueriesMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.posto1 = Posto.objects.create(nome='Corte', ordem_sequencia=1)
+        cls.posto2 = Posto.objects.create(nome='Pintura', ordem_sequencia=5)
+        cls.acessorio = Acessorio.objects.create(nome='Garfo')
+        cls.operador = Funcionario.objects.create(nome='Rui', codigo='4321')
+
+    def setUp(self):
+        roteamento.invalidar()
+        cache.clear()
+
+    def criar_tarefa(self, posto):
+        ordem = OrdemProducao.objects.create(
+            numero_serie=f'SN-R{OrdemProducao.objects.count()}',
+            acessorio=self.acessorio,
+            posto_atual=posto,
+            status_global='EM_ANDAMENTO',
+        )
+        return TarefaProducao.objects.create(ordem=ordem, posto=posto, funcionario=self.operador)
+
+    def test_tabela_em_memoria(self):
+        self.assertEqual(roteamento.primeiro_posto_id(), self.posto1.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(roteamento.proximo_posto_id(self.posto1.id), self.posto2.id)
+            self.assertIsNone(roteamento.proximo_posto_id(self.posto2.id))
+
+    def test_invalidada_quando_posto_muda(self):
+        roteamento.tabela()
+        posto3 = Posto.objects.create(nome='Embalagem', ordem_sequencia=3)
+        self.assertEqual(roteamento.proximo_posto_id(self.posto1.id), posto3.id)
+        posto3.delete()
+        self.assertEqual(roteamento.proximo_posto_id(self.posto1.id), self.posto2.id)
+
+    def test_finalizar_sem_ler_postos(self):
+        tarefa = self.criar_tarefa(self.posto1)
+        roteamento.tabela()
+        with CaptureQueriesContext(connection) as queries:
+            tarefa.finalizar_tarefa()
+        # tarefa + ordem + evento + totais diários, sem consultar Posto
+        self.assertEqual(len(self.queries_efetivas(queries)), 4)
+
+        ordem = OrdemProducao.objects.get(pk=tarefa.ordem_id)
+        self.assertEqual(ordem.posto_atual, self.posto2)
+        self.assertEqual(ordem.status_global, 'PENDENTE')
+        tarefa.refresh_from_db()
+        self.assertTrue(tarefa.concluido)
+        self.assertIsNotNone(tarefa.fim)
+
+    def test_finalizar_ultimo_posto_conclui_ordem(self):
+        tarefa = self.criar_tarefa(self.posto2)
+        tarefa.finalizar_tarefa()
+        self.assertEqual(tarefa.ordem.status_global, 'CONCLUIDO')
+        self.assertEqual(OrdemProducao.objects.get(pk=tarefa.ordem_id).status_global, 'CONCLUIDO')
+
+
+class RotasTests(OrcamentoQueriesMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.corte = Posto.objects.create(nome='Corte', ordem_sequencia=1)
+        cls.solda = Posto.objects.create(nome='Soldadura', ordem_sequencia=2)
+        cls.pintura = Posto.objects.create(nome='Pintura', ordem_sequencia=3)
+        cls.gravacao = Posto.objects.create(nome='Gravação', ordem_sequencia=4)
+        cls.embalagem = Posto.objects.create(nome='Embalagem', ordem_sequencia=5)
+        cls.acessorio = Acessorio.objects.create(nome='Suporte')
+        cls.ana = Funcionario.objects.create(nome='Ana', codigo='1111')
+        cls.rui = Funcionario.objects.create(nome='Rui', codigo='2222')
+        cls.ana.postos.set([cls.corte, cls.solda, cls.embalagem])
+        cls.rui.postos.set([cls.pintura, cls.gravacao])
+
+    def setUp(self):
+        roteamento.invalidar()
+        cache.clear()
+
+    def definir_rota(self, *etapas):
+        for numero, etapa in enumerate(etapas, start=1):
+            for posto, opcional in etapa:
+                PassoRota.objects.create(acessorio=self.acessorio, etapa=numero, posto=posto, opcional=opcional)
+
+    def criar_ordem(self):
+        primeira = roteamento.rota(self.acessorio.id).primeira_etapa
+        ordem = OrdemProducao.objects.create(
+            numero_serie=f'SN-P{OrdemProducao.objects.count()}',
+            acessorio=self.acessorio,
+            posto_atual_id=roteamento.posto_inicial(self.acessorio.id),
+        )
+        if len(primeira) > 1:
+            OrdemProducao.objects.filter(pk=ordem.pk).update(**OrdemProducao.entrar_na_etapa(ordem.pk, primeira))
+        return ordem
+
+    def fazer(self, ordem, funcionario):
+        tarefa = TarefaProducao.abrir(ordem.id, funcionario)
+        self.assertIsNotNone(tarefa)
+        tarefa.finalizar_tarefa()
+        ordem.refresh_from_db()
+        return tarefa
+
+    def test_rota_do_produto_salta_postos(self):
+        self.definir_rota([(self.corte, False)], [(self.pintura, False)])
+        ordem = self.criar_ordem()
+        self.assertEqual(ordem.posto_atual, self.corte)
+        self.fazer(ordem, self.ana)
+        self.assertEqual(ordem.posto_atual, self.pintura)
+        self.fazer(ordem, self.rui)
+        self.assertEqual(ordem.status_global, 'CONCLUIDO')
+        # Os outros produtos continuam na linha geral
+        self.assertEqual(roteamento.proximo_posto_id(self.corte.id), self.solda.id)
+
+    def test_etapa_paralela_espera_por_todos_os_ramos(self):
+        self.definir_rota([(self.corte, False)], [(self.solda, False), (self.pintura, False)], [(self.embalagem, False)])
+        ordem = self.criar_ordem()
+        self.fazer(ordem, self.ana)
+        self.assertIsNone(ordem.posto_atual)
+        self.assertEqual(
+            set(ordem.ramos.values_list('posto_id', 'estado')),
+            {(self.solda.id, 'PENDENTE'), (self.pintura.id, 'PENDENTE')},
+        )
+
+        self.fazer(ordem, self.rui)
+        self.assertIsNone(ordem.posto_atual)
+        self.assertEqual(ordem.status_global, 'PENDENTE')
+        self.assertIsNone(TarefaProducao.abrir(ordem.id, self.rui))  # o ramo da pintura já foi feito
+
+        self.fazer(ordem, self.ana)
+        self.assertEqual(ordem.posto_atual, self.embalagem)
+        self.assertFalse(RamoOrdem.objects.filter(ordem=ordem).exists())
+        self.fazer(ordem, self.ana)
+        self.assertEqual(ordem.status_global, 'CONCLUIDO')
+
+    def test_ordem_em_paralelo_conta_no_wip_de_cada_ramo(self):
+        self.definir_rota([(self.corte, False)], [(self.solda, False), (self.pintura, False)], [(self.embalagem, False)])
+        ordem = self.criar_ordem()
+        self.fazer(ordem, self.ana)
+        tarefa = TarefaProducao.abrir(ordem.id, self.rui)  # pintura em curso, soldadura à espera
+        esperado = {
+            self.solda.id: {'pendentes': 1, 'em_andamento': 0},
+            self.pintura.id: {'pendentes': 0, 'em_andamento': 1},
+        }
+        self.assertEqual(analitica.wip_por_posto(), esperado)
+        self.assertEqual(historico.wip_em(timezone.now()), esperado)
+
+        # A pintura acaba: a ordem fica só na soldadura (também depois de um snapshot)
+        tarefa.finalizar_tarefa()
+        historico.criar_snapshot(timezone.now())
+        esperado = {self.solda.id: {'pendentes': 1, 'em_andamento': 0}}
+        self.assertEqual(analitica.wip_por_posto(), esperado)
+        self.assertEqual(historico.wip_em(timezone.now()), esperado)
+
+        self.fazer(ordem, self.ana)
+        esperado = {self.embalagem.id: {'pendentes': 1, 'em_andamento': 0}}
+        self.assertEqual(analitica.wip_por_posto(), esperado)
+        self.assertEqual(historico.wip_em(timezone.now()), esperado)
+
+    def test_ramo_opcional_nao_atrasa_a_ordem(self):
+        self.definir_rota([(self.corte, False)], [(self.pintura, False), (self.gravacao, True)], [(self.embalagem, False)])
+        ordem = self.criar_ordem()
+        self.fazer(ordem, self.ana)
+        self.fazer(ordem, self.rui)  # pintura (o primeiro ramo pela sequência dos postos)
+        self.assertEqual(ordem.posto_atual, self.embalagem)
+
+    def test_rota_pode_comecar_em_paralelo(self):
+        self.definir_rota([(self.corte, False), (self.pintura, False)], [(self.embalagem, False)])
+        self.assertTrue(roteamento.comeca_em(self.acessorio.id, {self.pintura.id}))
+        ordem = self.criar_ordem()
+        self.assertIsNone(ordem.posto_atual)
+        self.assertEqual(set(ordem.ramos.values_list('posto_id', flat=True)), {self.corte.id, self.pintura.id})
+
+    def test_fila_mostra_a_ordem_em_cada_ramo(self):
+        self.definir_rota([(self.corte, False)], [(self.solda, False), (self.pintura, False)])
+        ordem = self.criar_ordem()
+        self.fazer(ordem, self.ana)
+        for funcionario, posto in ((self.ana, self.solda), (self.rui, self.pintura)):
+            with self.subTest(posto=posto.nome):
+                self.entrar_como(funcionario)
+                resposta = self.client.get(reverse('dashboard_funcionario'))
+                self.assertEqual([o.id for o in resposta.context['ordens_gerais']], [ordem.id])
+                self.assertContains(resposta, posto.nome)
+
+    def test_posto_fora_da_rota_retoma_a_rota(self):
+        # Ordens a meio quando o produto passa a ter rota própria (sem o posto onde estão)
+        no_corte = self.criar_ordem()
+        na_solda = self.criar_ordem()
+        OrdemProducao.objects.filter(pk=na_solda.pk).update(posto_atual=self.solda)
+        self.definir_rota([(self.pintura, False)], [(self.embalagem, False)])
+
+        with self.assertLogs('producao.roteamento', 'WARNING'):
+            self.fazer(no_corte, self.ana)
+        self.assertEqual((no_corte.posto_atual, no_corte.status_global), (self.pintura, 'PENDENTE'))
+
+        PassoRota.objects.all().delete()
+        self.definir_rota([(self.corte, False)])
+        with self.assertLogs('producao.roteamento', 'WARNING'):
+            self.fazer(na_solda, self.ana)
+        # Posto depois de todos os da rota (ex: inspeção final escolhida no admin): a ordem fica concluída
+        self.assertEqual(na_solda.status_global, 'CONCLUIDO')
+        self.assertFalse(TarefaProducao.objects.filter(ordem=na_solda, concluido=False).exists())
+
+    def test_posto_fora_da_rota_so_compara_a_sua_linha(self):
+        linha = LinhaProducao.objects.create(nome='Linha B')
+        inspecao_b = Posto.objects.create(nome='Inspeção B', linha=linha, ordem_sequencia=4)
+        self.ana.postos.add(inspecao_b)
+        self.definir_rota([(self.pintura, False)], [(self.embalagem, False)])
+        ordem = self.criar_ordem()
+        OrdemProducao.objects.filter(pk=ordem.pk).update(posto_atual=inspecao_b)
+        with self.assertLogs('producao.roteamento', 'WARNING'):
+            self.fazer(ordem, self.ana)
+        # A sequência 4 da linha B não diz nada sobre a embalagem (5) da linha geral: começa a rota
+        self.assertEqual((ordem.posto_atual, ordem.status_global), (self.pintura, 'PENDENTE'))
+
+    def test_linhas_de_producao(self):
+        linha = LinhaProducao.objects.create(nome='Linha B')
+        posto_b1 = Posto.objects.create(nome='Corte B', linha=linha, ordem_sequencia=1)
+        posto_b2 = Posto.objects.create(nome='Montagem B', linha=linha, ordem_sequencia=2)
+        outro = Acessorio.objects.create(nome='Grade', linha=linha)
+        self.assertEqual(roteamento.rota(outro.id).postos_ids, [posto_b1.id, posto_b2.id])
+        # A linha geral não inclui os postos da linha B
+        self.assertEqual(roteamento.rota().postos_ids, [
+            self.corte.id, self.solda.id, self.pintura.id, self.gravacao.id, self.embalagem.id,
+        ])
+
+
+class ReservaTarefasTests(OrcamentoQueriesMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.posto1 = Posto.objects.create(nome='Corte', ordem_sequencia=1)
+        cls.posto2 = Posto.objects.create(nome='Soldadura', ordem_sequencia=2)
+        cls.acessorio = Acessorio.objects.create(nome='Balde')
+        cls.ana = Funcionario.objects.create(nome='Ana', codigo='1234')
+        cls.rui = Funcionario.objects.create(nome='Rui', codigo='5678')
+        cls.ana.postos.set([cls.posto1, cls.posto2])
+        cls.rui.postos.set([cls.posto1])
+
+    def setUp(self):
+        roteamento.invalidar()
+        cache.clear()
+        self.ordem = OrdemProducao.objects.create(
+            numero_serie='SN-1', acessorio=self.acessorio, posto_atual=self.posto1
+        )
+
+    def test_get_nao_permitido(self):
+        self.entrar_como(self.ana)
+        resposta = self.client.get(reverse('iniciar_tarefa', args=[self.ordem.id]))
+        self.assertEqual(resposta.status_code, 405)
+        self.assertFalse(TarefaProducao.objects.exists())
+
+    def test_iniciar_idempotente(self):
+        primeira = TarefaProducao.abrir(self.ordem.id, self.ana)
+        segunda = TarefaProducao.abrir(self.ordem.id, self.ana)
+        self.assertEqual(primeira, segunda)
+        self.assertEqual(TarefaProducao.objects.count(), 1)
+        self.ordem.refresh_from_db()
+        self.assertEqual(self.ordem.status_global, 'EM_ANDAMENTO')
+
+    def test_ordem_reservada_nao_pode_ser_iniciada_por_outro(self):
+        self.assertIsNotNone(TarefaProducao.abrir(self.ordem.id, self.ana))
+        self.assertIsNone(TarefaProducao.abrir(self.ordem.id, self.rui))
+        self.assertEqual(TarefaProducao.objects.count(), 1)
+
+    def test_posto_nao_autorizado(self):
+        OrdemProducao.objects.filter(pk=self.ordem.pk).update(posto_atual=self.posto2)
+        self.assertIsNone(TarefaProducao.abrir(self.ordem.id, self.rui))
+
+    def test_indices_unicos_parciais(self):
+        from django.db import IntegrityError, transaction
+
+        TarefaProducao.objects.create(ordem=self.ordem, posto=self.posto1, funcionario=self.ana)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TarefaProducao.objects.create(ordem=self.ordem, posto=self.posto1, funcionario=self.rui)
+        outra = OrdemProducao.objects.create(numero_serie='SN-2', acessorio=self.acessorio)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TarefaProducao.objects.create(ordem=outra, posto=self.posto1, funcionario=self.ana)
+
+    def test_finalizar_duas_vezes_avanca_uma_so_vez(self):
+        tarefa = TarefaProducao.abrir(self.ordem.id, self.ana)
+        self.entrar_como(self.ana)
+        url = reverse('finalizar_tarefa', args=[tarefa.id])
+        self.client.post(url)
+        self.client.post(url)
+
+        self.ordem.refresh_from_db()
+        self.assertEqual(self.ordem.posto_atual, self.posto2)
+        self.assertEqual(self.ordem.status_global, 'PENDENTE')
+        self.assertFalse(TarefaProducao.objects.get(pk=tarefa.pk).finalizar_tarefa())
+
+    def test_criar_ordem_abre_tarefa(self):
+        self.entrar_como(self.rui)
+        dados = {'criar_ordem': '1', 'numero_serie': 'SN-NOVA', 'acessorio': self.acessorio.id}
+        self.client.post(reverse('dashboard_funcionario'), dados)
+        self.client.post(reverse('dashboard_funcionario'), dados)
+        self.assertEqual(OrdemProducao.objects.filter(numero_serie='SN-NOVA').count(), 1)
+        tarefa = TarefaProducao.objects.get(funcionario=self.rui, concluido=False)
+        self.assertEqual(tarefa.ordem.numero_serie, 'SN-NOVA')
+
+
+class ProducaoDiariaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.posto1 = Posto.objects.create(nome='Corte', ordem_sequencia=1)
+        cls.posto2 = Posto.objects.create(nome='Pintura', ordem_sequencia=2)
+        cls.acessorio = Acessorio.objects.create(nome='Garfo')
+        cls.ana = Funcionario.objects.create(nome='Ana', codigo='1234')
+        cls.ana.postos.set([cls.posto1, cls.posto2])
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'senha')
+
+    def setUp(self):
+        roteamento.invalidar()
+        cache.clear()
+
+    def produzir(self, numero_serie, minutos=10):
+        ordem = OrdemProducao.objects.create(
+            numero_serie=numero_serie, acessorio=self.acessorio, posto_atual=self.posto1
+        )
+        for _ in range(2):
+            tarefa = TarefaProducao.abrir(ordem.id, self.ana)
+            TarefaProducao.objects.filter(pk=tarefa.pk).update(
+                inicio=timezone.now() - datetime.timedelta(minutes=minutos)
+            )
+            tarefa.refresh_from_db()
+            tarefa.finalizar_tarefa()
+        return ordem
+
+    def totais(self):
+        return sorted(
+            ProducaoDiaria.objects.values_list('posto_id', 'tarefas', 'ordens_concluidas'),
+        )
+
+    def test_totais_incrementais(self):
+        self.produzir('SN-1', minutos=10)
+        self.produzir('SN-2', minutos=20)
+        self.assertEqual(self.totais(), [(self.posto1.id, 2, 0), (self.posto2.id, 2, 2)])
+        linha = ProducaoDiaria.objects.get(posto=self.posto1)
+        self.assertAlmostEqual(linha.segundos_medio, 15 * 60, delta=5)
+
+    def test_reconstruir_igual_aos_incrementais(self):
+        self.produzir('SN-1')
+        self.produzir('SN-2')
+        incrementais = self.totais()
+        ProducaoDiaria.objects.all().delete()
+
+        self.assertEqual(estatisticas.reconstruir(dias_por_lote=1), 2)
+        self.assertEqual(self.totais(), incrementais)
+
+    def test_estatisticas_le_totais_com_filtro_de_datas(self):
+        self.produzir('SN-1')
+        self.client.force_login(self.admin)
+        resposta = self.client.get(reverse('dashboard_estatisticas'))
+        self.assertEqual(resposta.context['total_concluido'], 1)
+
+        amanha = timezone.localdate() + datetime.timedelta(days=1)
+        resposta = self.client.get(reverse('dashboard_estatisticas'), {'de': amanha.isoformat()})
+        self.assertEqual(resposta.context['total_concluido'], 0)
+
+
+class ArquivoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.posto1 = Posto.objects.create(nome='Corte', ordem_sequencia=1)
+        cls.posto2 = Posto.objects.create(nome='Pintura', ordem_sequencia=2)
+        cls.acessorio = Acessorio.objects.create(nome='Garfo')
+        cls.ana = Funcionario.objects.create(nome='Ana', codigo='1234')
+        cls.ana.postos.set([cls.posto1, cls.posto2])
+
+    def setUp(self):
+        roteamento.invalidar()
+        cache.clear()
+        self.daqui_a_40_dias = timezone.now() + datetime.timedelta(days=40)
+
+    def produzir(self, numero_serie, postos=2):
+        ordem = OrdemProducao.objects.create(
+            numero_serie=numero_serie, acessorio=self.acessorio, posto_atual=self.posto1,
+            data_prevista=timezone.localdate(),
+        )
+        for _ in range(postos):
+            tarefa = TarefaProducao.abrir(ordem.id, self.ana)
+            TarefaProducao.objects.filter(pk=tarefa.pk).update(inicio=timezone.now() - datetime.timedelta(minutes=10))
+            tarefa.refresh_from_db()
+            tarefa.finalizar_tarefa()
+        return ordem
+
+    def test_finalizar_regista_data_de_conclusao(self):
+        ordem = self.produzir('SN-1', postos=1)
+        self.assertIsNone(OrdemProducao.objects.get(pk=ordem.pk).data_conclusao)
+        TarefaProducao.abrir(ordem.id, self.ana).finalizar_tarefa()
+        self.assertIsNotNone(OrdemProducao.objects.get(pk=ordem.pk).data_conclusao)
+
+    def test_arquiva_so_concluidas_antigas_e_retoma(self):
+        concluidas = [self.produzir(f'SN-{i}') for i in range(3)]
+        em_curso = self.produzir('SN-X', postos=1)
+
+        self.assertEqual(arquivo.arquivar(dias=30), (0, 0))
+        # Interrompido ao fim de um lote: a segunda corrida continua onde ficou
+        self.assertEqual(arquivo.arquivar(dias=30, tamanho_lote=2, max_lotes=1, agora=self.daqui_a_40_dias), (2, 4))
+        self.assertEqual(arquivo.arquivar(dias=30, tamanho_lote=2, agora=self.daqui_a_40_dias), (1, 2))
+        self.assertEqual(arquivo.arquivar(dias=30, agora=self.daqui_a_40_dias), (0, 0))
+
+        self.assertEqual(list(OrdemProducao.objects.values_list('id', flat=True)), [em_curso.id])
+        self.assertEqual(TarefaProducao.objects.count(), 1)
+        arquivada = OrdemArquivada.objects.get(pk=concluidas[0].pk)
+        self.assertEqual(arquivada.numero_serie, 'SN-0')
+        self.assertEqual(arquivada.tarefas.count(), 2)
+
+    def test_numero_de_serie_arquivado_nao_se_reutiliza(self):
+        self.produzir('SN-1')
+        arquivo.arquivar(dias=30, agora=self.daqui_a_40_dias)
+
+        self.client.post(reverse('login_funcionario'), {'codigo': '1234'})
+        resposta = self.client.post(
+            reverse('dashboard_funcionario'), {'criar_ordem': '1', 'numero_serie': 'SN-1', 'acessorio': self.acessorio.id},
+            follow=True,
+        )
+        self.assertFalse(OrdemProducao.objects.exists())
+        self.assertIn('já foi usado por uma ordem arquivada', ' '.join(str(m) for m in resposta.context['messages']))
+        # Formulários do admin (full_clean): o erro fica no campo
+        with self.assertRaises(ValidationError) as contexto:
+            OrdemProducao(numero_serie='SN-1', acessorio=self.acessorio).full_clean()
+        self.assertIn('numero_serie', contexto.exception.message_dict)
+
+    def test_historico_le_as_duas_tabelas(self):
+        self.produzir('SN-1')
+        self.produzir('SN-2')
+        totais = sorted(ProducaoDiaria.objects.values_list('posto_id', 'tarefas', 'ordens_concluidas'))
+        analise = analitica.analise_linha(horas=1)
+        calendario = contagens_por_dia(timezone.localdate(), timezone.localdate())
+
+        arquivo.arquivar(dias=30, agora=self.daqui_a_40_dias)
+        self.assertFalse(OrdemProducao.objects.exists())
+
+        ProducaoDiaria.objects.all().delete()
+        estatisticas.reconstruir()
+        self.assertEqual(sorted(ProducaoDiaria.objects.values_list('posto_id', 'tarefas', 'ordens_concluidas')), totais)
+        self.assertEqual(
+            [linha['tempo_ciclo']['n'] for linha in analitica.analise_linha(horas=1)['postos']],
+            [linha['tempo_ciclo']['n'] for linha in analise['postos']],
+        )
+        resumo = contagens_por_dia(timezone.localdate(), timezone.localdate())[timezone.localdate()]
+        self.assertEqual(resumo.por_status, calendario[timezone.localdate()].por_status)
+
+    def test_comando(self):
+        self.produzir('SN-1')
+        saida = io.StringIO()
+        call_command('arquivar_ordens', '--dias', '0', '--dry-run', stdout=saida)
+        self.assertIn('1 ordens seriam arquivadas', saida.getvalue())
+        self.assertTrue(OrdemProducao.objects.exists())
+
+
+class RastreabilidadeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.posto1 = Posto.objects.create(nome='Corte', ordem_sequencia=1)
+        cls.posto2 = Posto.objects.create(nome='Pintura', ordem_sequencia=2)
+        cls.garfo = Acessorio.objects.create(nome='Garfo')
+        cls.balde = Acessorio.objects.create(nome='Balde')
+        cls.ana = Funcionario.objects.create(nome='Ana', codigo='1234')
+        cls.ana.postos.set([cls.posto1, cls.posto2])
+
+    def setUp(self):
+        roteamento.invalidar()
+        cache.clear()
+        inicio = timezone.make_aware(datetime.datetime(2026, 10, 5, 8))
+        self.produzir('SN-3', self.garfo, inicio)
+        self.produzir('SN-1', self.balde, inicio)
+        self.produzir('SN-2', self.garfo, inicio + datetime.timedelta(days=3))
+        # SN-1 vai para o arquivo; a exportação intercala-o com as ordens vivas
+        OrdemProducao.objects.filter(numero_serie='SN-1').update(data_conclusao=timezone.now() - datetime.timedelta(days=100))
+        arquivo.arquivar(dias=30)
+
+    def produzir(self, numero_serie, acessorio, inicio):
+        ordem = OrdemProducao.objects.create(numero_serie=numero_serie, acessorio=acessorio, posto_atual=self.posto1)
+        for passo in range(2):
+            tarefa = TarefaProducao.abrir(ordem.id, self.ana)
+            tarefa.finalizar_tarefa()
+            TarefaProducao.objects.filter(pk=tarefa.pk).update(
+                inicio=inicio + datetime.timedelta(hours=passo), fim=inicio + datetime.timedelta(hours=passo, minutes=30),
+            )
+
+    def test_linhas_ordenadas_com_arquivo(self):
+        linhas = list(rastreabilidade.linhas(tamanho_chunk=2))
+        self.assertEqual([(linha[0], linha[3], linha[10]) for linha in linhas], [
+            ('SN-1', 'Corte', True), ('SN-1', 'Pintura', True),
+            ('SN-2', 'Corte', False), ('SN-2', 'Pintura', False),
+            ('SN-3', 'Corte', False), ('SN-3', 'Pintura', False),
+        ])
+        self.assertEqual(linhas[0][8], 1800.0)
+        self.assertEqual(linhas[0][4:6], ('1234', 'Ana'))
+
+    def test_filtros(self):
+        def series(**filtros):
+            return sorted({linha[0] for linha in rastreabilidade.linhas(**filtros)})
+        self.assertEqual(series(serie_de='SN-2', serie_ate='SN-3'), ['SN-2', 'SN-3'])
+        self.assertEqual(series(acessorio_id=self.garfo.id), ['SN-2', 'SN-3'])
+        self.assertEqual(series(desde=datetime.date(2026, 10, 6)), ['SN-2'])
+        self.assertEqual(series(ate=datetime.date(2026, 10, 5)), ['SN-1', 'SN-3'])
+        self.assertEqual(len(list(rastreabilidade.linhas(posto_id=self.posto2.id))), 3)
+
+    def test_comando_jsonl(self):
+        saida = io.StringIO()
+        call_command('exportar_rastreabilidade', '--formato', 'jsonl', '--serie-de', 'SN-3', stdout=saida)
+        registos = [json.loads(linha) for linha in saida.getvalue().splitlines()]
+        self.assertEqual([registo['posto'] for registo in registos], ['Corte', 'Pintura'])
+        self.assertEqual(registos[0]['inicio'], '2026-10-05T08:00:00+00:00')
+
+    def test_admin_em_streaming(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'senha'))
+        url = reverse('admin:producao_ordemproducao_rastreabilidade')
+        self.assertContains(self.client.get(url), 'name="serie_de"')
+        resposta = self.client.get(url, {'formato': 'csv', 'produto': self.garfo.id})
+        self.assertTrue(resposta.streaming)
+        linhas = b''.join(resposta.streaming_content).decode().splitlines()
+        self.assertEqual(linhas[0].split(',')[:2], ['numero_serie', 'produto'])
+        self.assertEqual(len(linhas), 5)
+
+
+class PlaneamentoTests(TestCase):
+    SEGUNDA = datetime.date(2026, 10, 19)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.posto1 = Posto.objects.create(nome='Corte', ordem_sequencia=1)
+        cls.posto2 = Posto.objects.create(nome='Pintura', ordem_sequencia=2)
+        cls.acessorio = Acessorio.objects.create(nome='Garfo')
+        cls.ana = Funcionario.objects.create(nome='Ana', codigo='1')
+        cls.rui = Funcionario.objects.create(nome='Rui', codigo='2')
+        cls.eva = Funcionario.objects.create(nome='Eva', codigo='3')
+        cls.ana.postos.set([cls.posto1])
+        cls.rui.postos.set([cls.posto1, cls.posto2])
+        cls.eva.postos.set([cls.posto2])
+        # Histórico: 2 h por peça no corte, 1 h na pintura
+        ProducaoDiaria.objects.create(dia=cls.SEGUNDA - datetime.timedelta(days=3), funcionario=cls.ana, posto=cls.posto1,
+                                      acessorio=cls.acessorio, tarefas=4, segundos_total=4 * 7200)
+        ProducaoDiaria.objects.create(dia=cls.SEGUNDA - datetime.timedelta(days=3), funcionario=cls.eva, posto=cls.posto2,
+                                      acessorio=cls.acessorio, tarefas=4, segundos_total=4 * 3600)
+
+    def setUp(self):
+        roteamento.invalidar()
+
+    def criar_ordens(self, n, **kwargs):
+        kwargs.setdefault('posto_atual', self.posto1)
+        inicio = OrdemProducao.objects.count()
+        OrdemProducao.objects.bulk_create([
+            OrdemProducao(numero_serie=f'SN-{inicio + i}', acessorio=self.acessorio, **kwargs) for i in range(n)
+        ])
+
+    def test_respeita_capacidade_e_postos(self):
+        self.criar_ordens(12)
+        plano = planeamento.planear(inicio=self.SEGUNDA)
+        self.assertEqual(plano.planeadas, 12)
+        self.assertEqual(planeamento.aplicar(plano), 12)
+
+        ordens = list(OrdemProducao.objects.values_list('funcionario_designado_id', 'data_prevista'))
+        # Só quem trabalha no corte pode ser designado, e a carga fica repartida
+        self.assertEqual({f for f, _ in ordens}, {self.ana.id, self.rui.id})
+        # 36 h de trabalho (24 h corte + 12 h pintura) para 3 operadores de 8 h: não cabe num dia
+        datas = sorted(dia for _, dia in ordens)
+        self.assertEqual(datas[0], self.SEGUNDA)
+        self.assertGreater(datas[-1], self.SEGUNDA)
+        self.assertLessEqual(datas[-1], self.SEGUNDA + datetime.timedelta(days=2))
+
+    def test_mantem_ordens_ja_planeadas_e_conta_a_sua_carga(self):
+        self.criar_ordens(4, funcionario_designado=self.ana, data_prevista=self.SEGUNDA)
+        self.criar_ordens(1)
+        plano = planeamento.planear(inicio=self.SEGUNDA)
+        self.assertEqual(plano.planeadas, 1)
+        [alteracao] = plano.alteracoes
+        # A Ana já tem o dia cheio
+        self.assertEqual(alteracao.funcionario_id, self.rui.id)
+
+        plano = planeamento.planear(inicio=self.SEGUNDA, replanear=True)
+        self.assertEqual(plano.planeadas, 5)
+
+    def test_ordem_sem_operador_no_posto(self):
+        posto3 = Posto.objects.create(nome='Embalagem', ordem_sequencia=3)
+        self.criar_ordens(1, posto_atual=posto3)
+        plano = planeamento.planear(inicio=self.SEGUNDA)
+        self.assertEqual(plano.sem_operador, ['SN-0'])
+        self.assertEqual(plano.alteracoes, [])
+
+    def test_milhares_de_ordens_em_poucas_queries(self):
+        self.criar_ordens(3000)
+        roteamento.tabela()
+        with self.assertNumQueries(4):
+            plano = planeamento.planear(inicio=self.SEGUNDA)
+        self.assertEqual(plano.planeadas, 3000)
+
+    def test_comando_dry_run_nao_grava(self):
+        self.criar_ordens(2)
+        saida = io.StringIO()
+        call_command('planear', '--inicio', self.SEGUNDA.isoformat(), '--dry-run', stdout=saida)
+        self.assertIn('SN-0: - -> Ana, - -> 2026-10-19', saida.getvalue())
+        self.assertFalse(OrdemProducao.objects.filter(funcionario_designado__isnull=False).exists())
+        call_command('planear', '--inicio', self.SEGUNDA.isoformat(), stdout=io.StringIO())
+        self.assertFalse(OrdemProducao.objects.filter(funcionario_designado__isnull=True).exists())
+
+    def test_acao_do_admin(self):
+        self.criar_ordens(3)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'senha'))
+        ids = list(OrdemProducao.objects.values_list('id', flat=True)[:2])
+        self.client.post(reverse('admin:producao_agendamento_changelist'), {
+            'action': 'planear_automaticamente', '_selected_action': ids,
+        })
+        # A ação só enfileira; o planeamento corre no trabalhador
+        self.assertFalse(OrdemProducao.objects.filter(funcionario_designado__isnull=False).exists())
+        self.assertEqual(trabalhos.executar_pendentes(), 1)
+        self.assertEqual(
+            sorted(OrdemProducao.objects.filter(funcionario_designado__isnull=False).values_list('id', flat=True)), sorted(ids)
+        )
+
+
+class AnaliticaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.posto1 = Posto.objects.create(nome='Corte', ordem_sequencia=1)
+        cls.posto2 = Posto.objects.create(nome='Pintura', ordem_sequencia=2)
+        cls.acessorio = Acessorio.objects.create(nome='Garfo')
+        cls.ana = Funcionario.objects.create(nome='Ana', codigo='1234')
+        cls.ana.postos.set([cls.posto1, cls.posto2])
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'senha')
+
+        agora = timezone.now()
+        ordem = OrdemProducao.objects.create(numero_serie='SN-A', acessorio=cls.acessorio, posto_atual=cls.posto2)
+        OrdemProducao.objects.create(numero_serie='SN-B', acessorio=cls.acessorio, posto_atual=cls.posto2)
+        tarefas = []
+        for minutos in range(1, 11):
+            tarefas.append(TarefaProducao(
+                ordem=ordem, posto=cls.posto1, funcionario=cls.ana, concluido=True,
+                inicio=agora - datetime.timedelta(minutes=minutos), fim=agora,
+            ))
+            tarefas.append(TarefaProducao(
+                ordem=ordem, posto=cls.posto2, funcionario=cls.ana, concluido=True,
+                inicio=agora - datetime.timedelta(minutes=3 * minutos), fim=agora,
+            ))
+        TarefaProducao.objects.bulk_create(tarefas)
+
+    def test_percentil_interpolado(self):
+        self.assertEqual(analitica._percentil([1, 2, 3, 4], 50), 2.5)
+        self.assertEqual(analitica._percentil([10], 99), 10)
+        self.assertIsNone(analitica._percentil([], 50))
+
+    def test_analise_linha(self):
+        analise = analitica.analise_linha(horas=1)
+        por_posto = {linha['posto_id']: linha for linha in analise['postos']}
+
+        ciclo = por_posto[self.posto1.id]['tempo_ciclo']
+        self.assertEqual(ciclo['n'], 10)
+        self.assertAlmostEqual(ciclo['p50'], 5.5 * 60, delta=1)
+        self.assertAlmostEqual(ciclo['p90'], 9.1 * 60, delta=1)
+        self.assertEqual(por_posto[self.posto2.id]['wip']['pendentes'], 2)
+        # O posto 2 é três vezes mais lento: é o estrangulamento
+        self.assertEqual(analise['estrangulamentos'], [self.posto2.id, self.posto1.id])
+        self.assertEqual(analise['produtos'][0]['tempo_ciclo']['n'], 20)
+
+    def test_vistas(self):
+        self.assertEqual(self.client.get(reverse('analitica_json')).status_code, 302)
+        self.client.force_login(self.admin)
+        resposta = self.client.get(reverse('analitica_json'), {'horas': 2})
+        self.assertEqual(resposta.json()['estrangulamentos'][0], self.posto2.id)
+        resposta = self.client.get(reverse('dashboard_analitica'))
+        self.assertContains(resposta, 'Pintura')
+
+
+class EventosTests(OrcamentoQueriesMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.posto1 = Posto.objects.create(nome='Corte', ordem_sequencia=1)
+        cls.posto2 = Posto.objects.create(nome='Pintura', ordem_sequencia=2)
+        cls.posto3 = Posto.objects.create(nome='Embalagem', ordem_sequencia=3)
+        cls.acessorio = Acessorio.objects.create(nome='Garfo')
+        cls.ana = Funcionario.objects.create(nome='Ana', codigo='1234')
+        cls.ana.postos.set([cls.posto1])
+
+    def setUp(self):
+        roteamento.invalidar()
+        cache.clear()
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def subscrever(self, postos_ids):
+        async def criar():
+            return eventos.difusor.subscrever(postos_ids, None)
+
+        subscricao = self.loop.run_until_complete(criar())
+        self.addCleanup(eventos.difusor.cancelar, subscricao)
+        return subscricao
+
+    def recebidos(self, subscricao):
+        self.loop.run_until_complete(asyncio.sleep(0))
+        return [subscricao.fila.get_nowait() for _ in range(subscricao.fila.qsize())]
+
+    def test_sem_subscritores_nao_faz_queries(self):
+        with self.assertNumQueries(0), self.captureOnCommitCallbacks() as callbacks:
+            eventos.ordem_alterada(123)
+        self.assertEqual(callbacks, [])
+
+    def test_finalizar_publica_para_postos_de_origem_e_destino(self):
+        ordem = OrdemProducao.objects.create(numero_serie='SN-1', acessorio=self.acessorio, posto_atual=self.posto1)
+        tarefa = TarefaProducao.abrir(ordem.id, self.ana)
+        no_destino = self.subscrever({self.posto2.id})
+        noutro_posto = self.subscrever({self.posto3.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tarefa.finalizar_tarefa()
+
+        [evento] = self.recebidos(no_destino)
+        self.assertEqual(evento['ordem_id'], ordem.id)
+        self.assertEqual(evento['posto_id'], self.posto2.id)
+        self.assertEqual(evento['posto_anterior_id'], self.posto1.id)
+        self.assertEqual(evento['status'], 'PENDENTE')
+        self.assertEqual(evento['numero_serie'], 'SN-1')
+        self.assertEqual(self.recebidos(noutro_posto), [])
+
+    @override_settings(SSE_ATIVO=True)
+    def test_stream_exige_sessao(self):
+        resposta = self.loop.run_until_complete(AsyncClient().get(reverse('stream_funcionario')))
+        self.assertEqual(resposta.status_code, 403)
+
+    def test_stream_desligado_responde_204(self):
+        resposta = self.loop.run_until_complete(AsyncClient().get(reverse('stream_funcionario')))
+        self.assertEqual(resposta.status_code, 204)
+
+    @override_settings(SSE_ATIVO=True)
+    def test_stream_recusado_sob_wsgi(self):
+        self.entrar_como(self.ana)
+        resposta = self.client.get(reverse('stream_funcionario'))
+        self.assertEqual(resposta.status_code, 204)
+        self.assertFalse(resposta.streaming)
+
+    def test_dashboard_so_abre_stream_com_sse_ativo(self):
+        self.entrar_como(self.ana)
+        self.assertNotContains(self.client.get(reverse('dashboard_funcionario')), 'EventSource(')
+        with self.settings(SSE_ATIVO=True):
+            self.assertContains(self.client.get(reverse('dashboard_funcionario')), 'EventSource(')
+
+
+class FragmentosTests(OrcamentoQueriesMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.posto1 = Posto.objects.create(nome='Corte', ordem_sequencia=1)
+        cls.posto2 = Posto.objects.create(nome='Pintura', ordem_sequencia=2)
+        cls.acessorio = Acessorio.objects.create(nome='Garfo')
+        cls.ana = Funcionario.objects.create(nome='Ana', codigo='1234')
+        cls.ana.postos.set([cls.posto2])
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'senha')
+
+    def setUp(self):
+        roteamento.invalidar()
+        cache.clear()
+
+    def dashboard(self):
+        # O primeiro pedido deixa o cookie CSRF no cliente (sem ele o fragmento não é guardado)
+        return self.client.get(reverse('dashboard_funcionario'))
+
+    def test_versao_muda_ao_incrementar(self):
+        antes = fragmentos.versao('ordens', 'stock')
+        self.assertEqual(fragmentos.versao('ordens', 'stock'), antes)
+        fragmentos.incrementar('stock')
+        depois = fragmentos.versao('ordens', 'stock')
+        self.assertNotEqual(depois, antes)
+        self.assertEqual(depois.split('.')[0], antes.split('.')[0])
+
+    def test_versao_nao_se_repete_depois_de_sair_da_cache(self):
+        fragmentos.incrementar('ordens')
+        antes = fragmentos.versao('ordens')
+        cache.clear()
+        self.assertNotEqual(fragmentos.versao('ordens'), antes)
+
+    def test_fragmentos_duram_segundos_sem_cache_partilhada(self):
+        self.assertFalse(fragmentos.cache_partilhada())
+        self.assertEqual(fragmentos.ttl(), fragmentos.TTL_LOCAL)
+        with tempfile.TemporaryDirectory() as pasta, self.settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': pasta,
+        }}):
+            self.assertTrue(fragmentos.cache_partilhada())
+            self.assertEqual(fragmentos.ttl(), fragmentos.TTL)
+
+    def test_dashboard_em_cache_ate_a_fila_mudar(self):
+        OrdemProducao.objects.create(numero_serie='SN-1', acessorio=self.acessorio, posto_atual=self.posto2)
+        self.entrar_como(self.ana)
+        self.dashboard()
+        self.dashboard()
+        # Só a tarefa aberta (sempre lida da base de dados); a fila vem do fragmento
+        with self.assertMaxQueries(1):
+            resposta = self.dashboard()
+        self.assertContains(resposta, 'SN-1')
+
+        # Ordem que chega ao posto da Ana vinda do posto anterior
+        ordem = OrdemProducao.objects.create(numero_serie='SN-2', acessorio=self.acessorio, posto_atual=self.posto1)
+        bruno = Funcionario.objects.create(nome='Bruno', codigo='5678')
+        bruno.postos.set([self.posto1])
+        with self.captureOnCommitCallbacks(execute=True):
+            TarefaProducao.abrir(ordem.id, bruno).finalizar_tarefa()
+        self.assertContains(self.dashboard(), 'SN-2')
+
+    def test_fragmento_nao_e_partilhado_sem_cookie_csrf(self):
+        OrdemProducao.objects.create(numero_serie='SN-1', acessorio=self.acessorio, posto_atual=self.posto2)
+        self.entrar_como(self.ana)
+        self.dashboard()
+        self.dashboard()
+        # Outro tablet da Ana, ainda sem cookie CSRF: os tokens dos formulários têm de ser do seu segredo
+        del self.client.cookies[settings.CSRF_COOKIE_NAME]
+        resposta = self.dashboard()
+        segredo = resposta.cookies[settings.CSRF_COOKIE_NAME].value
+        tokens = re.findall(r'name="csrfmiddlewaretoken" value="([^"]+)"', resposta.content.decode())
+        self.assertGreater(len(tokens), 1)
+        for token in tokens:
+            self.assertEqual(_unmask_cipher_token(token), segredo)
+
+    def test_estatisticas_em_cache_ate_a_producao_mudar(self):
+        self.client.force_login(self.admin)
+        self.client.get(reverse('dashboard_estatisticas'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('dashboard_estatisticas'))
+        # Só os alertas do monitor são lidos sempre (não ficam em cache)
+        self.assertEqual(
+            [q['sql'] for q in queries if 'producao_' in q['sql'] and 'producao_alertalinha' not in q['sql']], [],
+        )
+
+        ordem = OrdemProducao.objects.create(numero_serie='SN-9', acessorio=self.acessorio, posto_atual=self.posto2)
+        with self.captureOnCommitCallbacks(execute=True):
+            TarefaProducao.abrir(ordem.id, self.ana).finalizar_tarefa()
+        resposta = self.client.get(reverse('dashboard_estatisticas'))
+        self.assertEqual(str(resposta.context['total_concluido']), '1')
+        self.assertContains(resposta, '<p class="valor">1</p>', html=True)
+
+    def test_calendario_em_cache_ate_as_ordens_mudarem(self):
+        self.client.force_login(self.admin)
+        hoje = datetime.date.today()
+        url = reverse('admin:producao_agendamento_changelist')
+        self.client.get(url)
+        OrdemProducao.objects.bulk_create([
+            OrdemProducao(numero_serie='SN-1', acessorio=self.acessorio, posto_atual=self.posto1, data_prevista=hoje),
+        ])
+        # Sem sinais (bulk_create) a versão não muda: o calendário guardado continua a servir
+        self.assertNotContains(self.client.get(url), '1 tarefas')
+        fragmentos.ordens_alteradas()
+        self.assertContains(self.client.get(url), '1 tarefas')
+
+    def test_paginas_usam_css_estatico(self):
+        self.entrar_como(self.ana)
+        self.assertContains(self.dashboard(), 'producao/css/tablet.css')
+        self.client.force_login(self.admin)
+        self.assertContains(self.client.get(reverse('dashboard_estatisticas')), 'producao/css/gestao.css')
+        self.assertContains(
+            self.client.get(reverse('admin:producao_agendamento_changelist')), 'producao/css/calendario.css',
+        )
+
+
+class SincronizacaoTests(OrcamentoQueriesMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.posto1 = Posto.objects.create(nome='Corte', ordem_sequencia=1)
+        cls.posto2 = Posto.objects.create(nome='Pintura', ordem_sequencia=2)
+        cls.acessorio = Acessorio.objects.create(nome='Garfo')
+        cls.ana = Funcionario.objects.create(nome='Ana', codigo='1234')
+        cls.ana.postos.set([cls.posto1])
+        cls.bruno = Funcionario.objects.create(nome='Bruno', codigo='5678')
+        cls.bruno.postos.set([cls.posto1])
+
+    def setUp(self):
+        roteamento.invalidar()
+        cache.clear()
+        self.agora = timezone.now()
+        self.ordens = [
+            OrdemProducao.objects.create(numero_serie=f'SN-{i}', acessorio=self.acessorio, posto_atual=self.posto1)
+            for i in range(3)
+        ]
+
+    def evento(self, tipo, ordem, minutos_atras, identificador=None):
+        return {
+            'id': identificador or str(uuid.uuid4()), 'tipo': tipo, 'ordem_id': ordem.id,
+            'momento': (self.agora - datetime.timedelta(minutes=minutos_atras)).isoformat(),
+        }
+
+    def aplicar(self, eventos, funcionario=None):
+        return sincronizacao.aplicar_lote(operador.contexto((funcionario or self.ana).id), eventos, agora=self.agora)
+
+    def test_aplica_por_ordem_de_momento_com_as_horas_do_tablet(self):
+        eventos = [
+            self.evento('finalizar', self.ordens[0], 20),
+            self.evento('iniciar', self.ordens[1], 10),
+            self.evento('iniciar', self.ordens[0], 30),
+        ]
+        resultados = self.aplicar(eventos)
+        self.assertEqual([r['estado'] for r in resultados], ['aplicado'] * 3)
+        self.assertEqual([r['id'] for r in resultados], [eventos[2]['id'], eventos[0]['id'], eventos[1]['id']])
+
+        feita = TarefaProducao.objects.get(ordem=self.ordens[0])
+        self.assertEqual(feita.inicio, self.agora - datetime.timedelta(minutes=30))
+        self.assertEqual(feita.fim, self.agora - datetime.timedelta(minutes=20))
+        self.ordens[0].refresh_from_db()
+        self.assertEqual(self.ordens[0].posto_atual, self.posto2)
+        aberta = TarefaProducao.objects.get(ordem=self.ordens[1])
+        self.assertFalse(aberta.concluido)
+        self.assertEqual(aberta.inicio, self.agora - datetime.timedelta(minutes=10))
+
+    def test_reenviar_o_lote_nao_aplica_duas_vezes(self):
+        eventos = [self.evento('iniciar', self.ordens[0], 30), self.evento('finalizar', self.ordens[0], 20)]
+        self.aplicar(eventos)
+        resultados = self.aplicar(eventos)
+        self.assertTrue(all(r['repetido'] and r['estado'] == 'aplicado' for r in resultados))
+        self.assertEqual(TarefaProducao.objects.filter(ordem=self.ordens[0]).count(), 1)
+        self.assertEqual(EventoTablet.objects.count(), 2)
+
+    def test_conflito_nao_desfaz_o_resto_do_lote(self):
+        # Enquanto a Ana estava sem rede o Bruno pegou na ordem 0
+        TarefaProducao.abrir(self.ordens[0].id, self.bruno)
+        resultados = self.aplicar([
+            self.evento('iniciar', self.ordens[0], 30),
+            self.evento('finalizar', self.ordens[0], 25),
+            self.evento('iniciar', self.ordens[1], 20),
+        ])
+        self.assertEqual([r['estado'] for r in resultados], ['conflito', 'conflito', 'aplicado'])
+        self.assertTrue(TarefaProducao.objects.filter(ordem=self.ordens[1], funcionario=self.ana, concluido=False).exists())
+        self.assertEqual(
+            list(EventoTablet.objects.order_by('momento').values_list('estado', flat=True)),
+            ['CONFLITO', 'CONFLITO', 'APLICADO'],
+        )
+
+    def test_eventos_invalidos_e_relogio_adiantado(self):
+        no_futuro = self.evento('iniciar', self.ordens[0], -60)
+        resultados = self.aplicar([{'id': 'x', 'tipo': 'iniciar'}, {**no_futuro, 'tipo': 'pausar'}, no_futuro])
+        self.assertEqual([r['estado'] for r in resultados], ['invalido', 'invalido', 'aplicado'])
+        self.assertEqual(TarefaProducao.objects.get(ordem=self.ordens[0]).inicio, self.agora)
+        with self.assertRaises(sincronizacao.LoteInvalido):
+            self.aplicar({'eventos': []})
+
+    def test_vista_sincronizar(self):
+        url = reverse('sincronizar_eventos')
+        corpo = json.dumps({'eventos': [self.evento('iniciar', self.ordens[0], 5)]})
+        self.assertEqual(self.client.post(url, corpo, content_type='application/json').status_code, 403)
+
+        self.entrar_como(self.ana)
+        self.assertEqual(self.client.post(url, 'não é json', content_type='application/json').status_code, 400)
+        resposta = self.client.post(url, corpo, content_type='application/json')
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()['resultados'][0]['estado'], 'aplicado')
+        self.assertContains(self.client.get(reverse('dashboard_funcionario')), 'SN-0')
+
+
+class HistoricoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.posto1 = Posto.objects.create(nome='Corte', ordem_sequencia=1)
+        cls.posto2 = Posto.objects.create(nome='Pintura', ordem_sequencia=2)
+        cls.acessorio = Acessorio.objects.create(nome='Garfo')
+        cls.ana = Funcionario.objects.create(nome='Ana', codigo='1234')
+        cls.ana.postos.set([cls.posto1, cls.posto2])
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'senha')
+
+    def setUp(self):
+        roteamento.invalidar()
+        cache.clear()
+        self.agora = timezone.now()
+
+    def minutos(self, n):
+        return self.agora + datetime.timedelta(minutes=n)
+
+    def produzir(self, ordem, inicio, fim=None):
+        """Abre e (se `fim`) fecha a tarefa da ordem no posto atual, nos minutos indicados."""
+        tarefa = TarefaProducao.abrir(ordem.id, self.ana, inicio=self.minutos(inicio))
+        if fim is not None:
+            tarefa.finalizar_tarefa(fim=self.minutos(fim))
+        return tarefa
+
+    def test_eventos_escritos_com_as_transicoes(self):
+        ordem = OrdemProducao.objects.create(numero_serie='SN-1', acessorio=self.acessorio, posto_atual=self.posto1)
+        self.produzir(ordem, 10, 20)
+        self.produzir(ordem, 30, 40)
+        self.assertEqual(
+            list(EventoProducao.objects.order_by('momento', 'id').values_list('tipo', 'posto_id', 'status')),
+            [
+                ('CRIADA', self.posto1.id, 'PENDENTE'),
+                ('INICIADA', self.posto1.id, 'EM_ANDAMENTO'),
+                ('FINALIZADA', self.posto2.id, 'PENDENTE'),
+                ('INICIADA', self.posto2.id, 'EM_ANDAMENTO'),
+                ('FINALIZADA', self.posto2.id, 'CONCLUIDO'),
+            ],
+        )
+
+        self.assertEqual(historico.wip_em(self.minutos(-1)), {})
+        self.assertEqual(historico.wip_em(self.minutos(5)), {self.posto1.id: {'pendentes': 1, 'em_andamento': 0}})
+        self.assertEqual(historico.wip_em(self.minutos(15)), {self.posto1.id: {'pendentes': 0, 'em_andamento': 1}})
+        self.assertEqual(historico.wip_em(self.minutos(25)), {self.posto2.id: {'pendentes': 1, 'em_andamento': 0}})
+        self.assertEqual(historico.wip_em(self.minutos(45)), {})
+
+    def test_admin_regista_so_mudancas_de_estado(self):
+        ordem = OrdemProducao.objects.create(numero_serie='SN-1', acessorio=self.acessorio, posto_atual=self.posto1)
+        ordem.data_prevista = datetime.date(2026, 11, 3)
+        ordem.save()
+        self.assertEqual(EventoProducao.objects.count(), 1)
+
+        ordem.posto_atual = self.posto2
+        ordem.save()
+        ordem.delete()
+        self.assertEqual(
+            list(EventoProducao.objects.order_by('id').values_list('tipo', 'posto_id')),
+            [('CRIADA', self.posto1.id), ('MOVIDA', self.posto2.id), ('REMOVIDA', self.posto2.id)],
+        )
+        self.assertEqual(historico.wip_em(timezone.now()), {})
+
+    def test_snapshot_e_repeticao_dao_o_mesmo_estado(self):
+        ordens = [
+            OrdemProducao.objects.create(numero_serie=f'SN-{i}', acessorio=self.acessorio, posto_atual=self.posto1)
+            for i in range(3)
+        ]
+        self.produzir(ordens[0], 10, 20)
+        self.produzir(ordens[1], 30)
+        sem_snapshot = [historico.estado_em(self.minutos(m))[0] for m in (15, 25, 35)]
+
+        snapshot = historico.criar_snapshot(self.minutos(25))
+        self.assertEqual(len(snapshot.ordens), 3)
+        estado, repetidos = historico.estado_em(self.minutos(35))
+        self.assertEqual(repetidos, 1)  # só o início da ordem 1, depois do snapshot
+        self.assertEqual([historico.estado_em(self.minutos(m))[0] for m in (15, 25, 35)], sem_snapshot)
+
+        serie = historico.serie_wip(self.minutos(15), self.minutos(35), datetime.timedelta(minutes=10))
+        self.assertEqual([wip for _, wip in serie], [historico.wip_em(self.minutos(m)) for m in (15, 25, 35)])
+
+    def test_evento_atrasado_invalida_snapshots_seguintes(self):
+        ordem = OrdemProducao.objects.create(numero_serie='SN-1', acessorio=self.acessorio, posto_atual=self.posto1)
+        antes, depois = self.minutos(-120), self.minutos(-60)
+        EventoProducao.objects.update(momento=self.minutos(-180))
+        historico.criar_snapshot(antes)
+        historico.criar_snapshot(depois)
+
+        # Tablet sem rede: a ordem foi iniciada há 90 minutos mas o evento só chega agora
+        historico.registar(ordem.id, 'INICIADA', self.posto1.id, 'EM_ANDAMENTO', momento=self.minutos(-90))
+        self.assertEqual(list(SnapshotWIP.objects.values_list('momento', flat=True)), [antes])
+        self.assertEqual(historico.wip_em(depois), {self.posto1.id: {'pendentes': 0, 'em_andamento': 1}})
+
+    def test_criar_snapshots_em_falta(self):
+        OrdemProducao.objects.create(numero_serie='SN-1', acessorio=self.acessorio, posto_atual=self.posto1)
+        # Três horas certas entre o evento e `ate`, seja qual for o minuto atual
+        EventoProducao.objects.update(momento=self.agora - datetime.timedelta(hours=4))
+        ate = self.agora - datetime.timedelta(hours=1)
+        self.assertEqual(historico.criar_snapshots(ate), 3)
+        self.assertEqual(historico.criar_snapshots(ate), 0)
+        momentos = list(SnapshotWIP.objects.order_by('momento').values_list('momento', flat=True))
+        self.assertTrue(all(momento.minute == momento.second == 0 for momento in momentos))
+        self.assertLessEqual(momentos[-1], ate)
+        # Sem `ate` vai até agora - MARGEM
+        historico.criar_snapshots()
+        self.assertLessEqual(SnapshotWIP.objects.order_by('momento').last().momento, timezone.now() - historico.MARGEM)
+
+    def test_reconstruir_a_partir_das_tarefas(self):
+        ordens = [
+            OrdemProducao.objects.create(numero_serie=f'SN-{i}', acessorio=self.acessorio, posto_atual=self.posto1)
+            for i in range(3)
+        ]
+        self.produzir(ordens[0], 10, 20)
+        self.produzir(ordens[0], 30, 40)
+        self.produzir(ordens[1], 50)
+        esperado = [historico.estado_em(self.minutos(m))[0] for m in (5, 15, 25, 35, 45, 55)]
+
+        self.assertEqual(historico.reconstruir(tamanho_lote=2), EventoProducao.objects.count())
+        self.assertEqual([historico.estado_em(self.minutos(m))[0] for m in (5, 15, 25, 35, 45, 55)], esperado)
+
+    def test_wip_json(self):
+        OrdemProducao.objects.create(numero_serie='SN-1', acessorio=self.acessorio, posto_atual=self.posto1)
+        url = reverse('wip_json')
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(self.admin)
+        dados = self.client.get(url).json()
+        self.assertEqual(dados['postos'], [{'posto_id': self.posto1.id, 'posto': 'Corte', 'pendentes': 1, 'em_andamento': 0}])
+        self.assertEqual(self.client.get(url, {'momento': 'ontem'}).status_code, 400)
+
+        serie = self.client.get(url, {
+            'desde': self.minutos(-59).isoformat(), 'ate': self.minutos(61).isoformat(), 'passo': 60,
+        }).json()['serie']
+        self.assertEqual([len(ponto['postos']) for ponto in serie], [0, 1, 1])
+        self.assertEqual(self.client.get(url, {'desde': self.minutos(-60).isoformat(), 'passo': 0}).status_code, 400)
+
+
+class AgendaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.posto1 = Posto.objects.create(nome='Corte', ordem_sequencia=1)
+        cls.posto2 = Posto.objects.create(nome='Pintura', ordem_sequencia=2)
+        cls.acessorio = Acessorio.objects.create(nome='Garfo')
+        cls.ana = Funcionario.objects.create(nome='Ana', codigo='1234')
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'senha')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+        self.dia = datetime.date(2026, 11, 3)
+        self.ordens = [
+            OrdemProducao.objects.create(
+                numero_serie=f'SN-{i}', acessorio=self.acessorio, posto_atual=self.posto1, data_prevista=self.dia,
+                funcionario_designado=self.ana if i == 0 else None,
+            )
+            for i in range(3)
+        ]
+        self.url = reverse('agenda_json')
+        self.parametros = {'desde': '2026-11-01', 'ate': '2026-11-30'}
+
+    def pedir(self, **cabecalhos):
+        return self.client.get(self.url, self.parametros, headers=cabecalhos)
+
+    def test_json_compacto_com_nomes(self):
+        resposta = self.pedir()
+        self.assertEqual(resposta.status_code, 200)
+        dados = resposta.json()
+        self.assertEqual(len(dados['ordens']), 3)
+        linha = dict(zip(dados['colunas'], dados['ordens'][0]))
+        self.assertEqual(linha['numero_serie'], 'SN-0')
+        self.assertEqual(linha['data_prevista'], '2026-11-03')
+        self.assertEqual(dados['postos'], {str(self.posto1.id): 'Corte'})
+        self.assertEqual(dados['funcionarios'], {str(self.ana.id): 'Ana'})
+        self.assertIn('ETag', resposta)
+        self.assertIn('Last-Modified', resposta)
+        self.assertIn('no-cache', resposta['Cache-Control'])
+
+        self.parametros['funcionario'] = str(self.ana.id)
+        self.assertEqual(len(self.pedir().json()['ordens']), 1)
+        self.parametros['posto'] = str(self.posto2.id)
+        self.assertEqual(self.pedir().json()['ordens'], [])
+
+    def test_pedido_invalido(self):
+        for parametros in ({'desde': 'amanhã'}, {'desde': '2026-11-30', 'ate': '2026-11-01'},
+                           {'desde': '2026-01-01', 'ate': '2027-12-31'}, {'posto': 'x'}):
+            with self.subTest(parametros):
+                self.assertEqual(self.client.get(self.url, parametros).status_code, 400)
+
+    def test_sem_alteracoes_responde_304_sem_ler_as_ordens(self):
+        primeira = self.pedir()
+        with CaptureQueriesContext(connection) as queries:
+            resposta = self.pedir(if_none_match=primeira['ETag'])
+        self.assertEqual(resposta.status_code, 304)
+        self.assertEqual(resposta['ETag'], primeira['ETag'])
+        self.assertFalse([q for q in queries.captured_queries if 'numero_serie' in q['sql']])
+        self.assertEqual(self.pedir(if_modified_since=primeira['Last-Modified']).status_code, 304)
+
+    def test_etag_igual_em_todos_os_workers(self):
+        # Outro worker tem a sua própria cache: o ETag só depende da base de dados
+        primeira = self.pedir()
+        cache.clear()
+        self.assertEqual(self.pedir(if_none_match=primeira['ETag']).status_code, 304)
+
+    def test_etag_muda_com_as_ordens_e_os_nomes(self):
+        etags = [self.pedir()['ETag']]
+
+        self.ana.postos.add(self.posto1)
+        TarefaProducao.abrir(self.ordens[1].id, self.ana)
+        etags.append(self.pedir(if_none_match=etags[-1])['ETag'])
+        self.ordens[2].delete()
+        etags.append(self.pedir(if_none_match=etags[-1])['ETag'])
+        self.posto1.nome = 'Corte laser'
+        self.posto1.save()
+        resposta = self.pedir(if_none_match=etags[-1])
+        etags.append(resposta['ETag'])
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.json()['postos'], {str(self.posto1.id): 'Corte laser'})
+        self.assertEqual(len(set(etags)), 4)
+
+        # Ordens fora do intervalo não mudam a versão
+        OrdemProducao.objects.create(numero_serie='SN-9', acessorio=self.acessorio, data_prevista=datetime.date(2026, 12, 1))
+        self.assertEqual(self.pedir(if_none_match=etags[-1]).status_code, 304)
+
+
+class MonitorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.posto1 = Posto.objects.create(nome='Corte', ordem_sequencia=1)
+        cls.posto2 = Posto.objects.create(nome='Pintura', ordem_sequencia=2)
+        cls.acessorio = Acessorio.objects.create(nome='Garfo')
+        cls.ana = Funcionario.objects.create(nome='Ana', codigo='1234')
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'senha')
+
+    def setUp(self):
+        roteamento.invalidar()
+        cache.clear()
+
+    def historico_de_ciclo(self, posto, segundos, dia=None):
+        ProducaoDiaria.objects.create(
+            dia=dia or timezone.localdate() - datetime.timedelta(days=1), funcionario=self.ana, posto=posto,
+            acessorio=self.acessorio, tarefas=1, segundos_total=segundos,
+        )
+
+    def criar_ordens(self, n, posto, **campos):
+        return [
+            OrdemProducao.objects.create(
+                numero_serie=f'SN-M{OrdemProducao.objects.count()}', acessorio=self.acessorio, posto_atual=posto, **campos,
+            )
+            for _ in range(n)
+        ]
+
+    def test_fila_a_acumular(self):
+        self.historico_de_ciclo(self.posto1, 3600)
+        vigia = monitor.Monitor()
+        vigia.arrancar()
+        ordens = self.criar_ordens(5, self.posto1)
+        self.assertEqual(vigia.executar(), (1, 0))
+        alerta = AlertaLinha.objects.get(resolvido_em__isnull=True)
+        self.assertEqual((alerta.tipo, alerta.posto, alerta.valor), ('FILA', self.posto1, 5.0))
+
+        OrdemProducao.objects.filter(pk__in=[ordem.pk for ordem in ordens[:2]]).update(
+            posto_atual=self.posto2, atualizado_em=timezone.now(),
+        )
+        self.assertEqual(vigia.executar(), (0, 1))
+        alerta.refresh_from_db()
+        self.assertIsNotNone(alerta.resolvido_em)
+
+    def test_posto_lento_pelas_tarefas_da_janela(self):
+        self.historico_de_ciclo(self.posto1, 600)
+        self.ana.postos.add(self.posto1)
+        vigia = monitor.Monitor()
+        vigia.arrancar()
+        agora = timezone.now()
+        for ordem in self.criar_ordens(3, self.posto1):
+            tarefa = TarefaProducao.abrir(ordem.id, self.ana, inicio=agora - datetime.timedelta(minutes=40))
+            tarefa.finalizar_tarefa(fim=agora - datetime.timedelta(minutes=10))
+        vigia.executar()
+        alerta = AlertaLinha.objects.get(tipo='LENTO')
+        self.assertEqual((alerta.posto, alerta.valor), (self.posto1, 3.0))
+
+        # Sem nada de novo, só se leem as ordens alteradas e os eventos novos
+        with self.assertNumQueries(2):
+            self.assertEqual(vigia.executar(), (0, 0))
+
+    def test_ordem_em_risco_de_atraso(self):
+        agora = timezone.make_aware(datetime.datetime(2026, 10, 19, 10, 0))  # segunda-feira
+        hoje = agora.date()
+        for posto in (self.posto1, self.posto2):
+            self.historico_de_ciclo(posto, 6 * 3600, dia=hoje - datetime.timedelta(days=1))
+        em_risco, folgada = self.criar_ordens(2, self.posto1)
+        em_risco.data_prevista = hoje
+        folgada.data_prevista = hoje + datetime.timedelta(days=7)
+        atrasada = self.criar_ordens(1, self.posto2, data_prevista=hoje - datetime.timedelta(days=1))[0]
+        OrdemProducao.objects.bulk_update([em_risco, folgada], ['data_prevista'])
+
+        vigia = monitor.Monitor(limite_fila_horas=24)
+        vigia.arrancar(agora)
+        condicoes = vigia.condicoes(agora)
+        # Corte (6 h) + Pintura (6 h), 8 h por dia: só acaba na terça
+        self.assertEqual(condicoes[f'prazo:{em_risco.id}'][3], 1)
+        self.assertNotIn(f'prazo:{folgada.id}', condicoes)
+        self.assertNotIn(f'prazo:{atrasada.id}', condicoes)
+
+    def test_alertas_nas_estatisticas(self):
+        self.client.force_login(self.admin)
+        agora = timezone.now()
+        AlertaLinha.objects.create(
+            tipo='FILA', chave=f'fila:{self.posto1.id}', posto=self.posto1, mensagem='9 ordens à espera', valor=9,
+            inicio=agora, atualizado_em=agora,
+        )
+        self.assertContains(self.client.get(reverse('dashboard_estatisticas')), '9 ordens à espera')
+
+        # Resolvido por outro processo (sem passar pela cache deste): a página já não o mostra
+        AlertaLinha.objects.update(resolvido_em=agora)
+        self.assertNotContains(self.client.get(reverse('dashboard_estatisticas')), '9 ordens à espera')
+
+        AlertaLinha.objects.create(
+            tipo='FILA', chave=f'fila:{self.posto1.id}', posto=self.posto1, mensagem='9 ordens à espera', valor=9,
+            inicio=agora, atualizado_em=agora,
+        )
+        self.assertContains(self.client.get(reverse('dashboard_estatisticas')), '9 ordens à espera')
+
+        # O monitor resolve-o (a fila está vazia) e a página deixa de o mostrar
+        monitor.Monitor().executar()
+        self.assertNotContains(self.client.get(reverse('dashboard_estatisticas')), '9 ordens à espera')
+
+    def test_comando(self):
+        self.historico_de_ciclo(self.posto1, 3600)
+        self.criar_ordens(5, self.posto1)
+        saida = io.StringIO()
+        call_command('monitor_linha', '--uma-vez', stdout=saida)
+        self.assertIn('1 novos', saida.getvalue())
+        self.assertTrue(AlertaLinha.objects.filter(tipo='FILA', resolvido_em__isnull=True).exists())
+
+
+@override_settings(REPLICA_ATIVA=True)
+class ReplicasTests(TransactionTestCase):
+    # A réplica é outra ligação à mesma base de dados: só vê dados já gravados (sem a transação do TestCase)
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.posto = Posto.objects.create(nome='Corte', ordem_sequencia=1)
+        self.acessorio = Acessorio.objects.create(nome='Garfo')
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'senha')
+        self.client.force_login(self.admin)
+
+    def queries_por_alias(self, pedido):
+        with CaptureQueriesContext(connections['default']) as primaria, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            resposta = pedido()
+            if resposta.streaming:
+                b''.join(resposta.streaming_content)
+        self.assertLess(resposta.status_code, 400)
+        # Na primária só a autenticação (auth_user); os dados da produção vêm todos de um lado
+        da_producao = [q for q in primaria.captured_queries if '"producao_' in q['sql']]
+        return len(da_producao), len(replica)
+
+    def test_router(self):
+        self.assertEqual(OrdemProducao.objects.all().db, 'default')
+        with replicas.ler_da_replica():
+            self.assertEqual(OrdemProducao.objects.all().db, 'replica')
+            self.assertEqual(OrdemProducao.objects.all().using('default').db, 'default')
+            self.assertEqual(replicas.RouterReplica().db_for_write(OrdemProducao), 'default')
+        self.assertFalse(replicas.RouterReplica().allow_migrate('replica', 'producao'))
+
+    def test_vistas_de_leitura_usam_a_replica(self):
+        for url in (
+            reverse('dashboard_estatisticas'),
+            reverse('analitica_json'),
+            reverse('admin:producao_agendamento_changelist'),  # TemplateResponse, desenhada na réplica
+            reverse('admin:producao_ordemproducao_rastreabilidade') + '?formato=csv',
+        ):
+            with self.subTest(url):
+                cache.clear()
+                na_primaria, na_replica = self.queries_por_alias(lambda: self.client.get(url))
+                self.assertEqual(na_primaria, 0)
+                self.assertGreater(na_replica, 0)
+
+    def test_tablet_fica_na_primaria(self):
+        funcionario = Funcionario.objects.create(nome='Ana', codigo='1234')
+        self.client.post(reverse('login_funcionario'), {'codigo': '1234'})
+        _, na_replica = self.queries_por_alias(lambda: self.client.get(reverse('dashboard_funcionario')))
+        self.assertEqual(na_replica, 0)
+        self.assertTrue(funcionario.pk)
+
+    def test_depois_de_gravar_le_da_primaria(self):
+        resposta = self.client.post(reverse('admin:producao_ordemproducao_add'), {
+            'numero_serie': 'SN-1', 'acessorio': self.acessorio.id, 'posto_atual': self.posto.id,
+            'status_global': 'PENDENTE', 'estado_stock': 'NAO_RESERVADO',
+            'tarefas-TOTAL_FORMS': 0, 'tarefas-INITIAL_FORMS': 0, 'ramos-TOTAL_FORMS': 0, 'ramos-INITIAL_FORMS': 0,
+        })
+        self.assertEqual(resposta.status_code, 302)
+        self.assertIn(replicas.COOKIE_PRIMARIA, resposta.cookies)
+        na_primaria, na_replica = self.queries_por_alias(lambda: self.client.get(reverse('dashboard_estatisticas')))
+        self.assertGreater(na_primaria, 0)
+        self.assertEqual(na_replica, 0)
+
+
+class InstrumentacaoTests(TestCase):
+    def setUp(self):
+        instrumentacao.limpar()
+        self.addCleanup(instrumentacao.limpar)
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'senha')
+
+    @override_settings(INSTRUMENTACAO_AMOSTRAGEM=0)
+    def test_desligado_nao_mede(self):
+        self.client.force_login(self.admin)
+        resposta = self.client.get(reverse('dashboard_analitica'))
+        self.assertNotIn('Server-Timing', resposta)
+        self.assertEqual(instrumentacao.amostras(), [])
+
+    @override_settings(INSTRUMENTACAO_AMOSTRAGEM=1)
+    def test_amostra_com_queries(self):
+        self.client.force_login(self.admin)
+        with CaptureQueriesContext(connection) as queries:
+            resposta = self.client.get(reverse('dashboard_analitica'))
+        self.assertIn('total;dur=', resposta['Server-Timing'])
+        amostra, = instrumentacao.amostras()
+        self.assertEqual((amostra['vista'], amostra['estado']), ('dashboard_analitica', 200))
+        self.assertEqual(amostra['queries'], len(queries))
+
+    @override_settings(INSTRUMENTACAO_AMOSTRAGEM=1)
+    def test_pedido_assincrono(self):
+        # Sob ASGI o middleware corre em modo assíncrono
+        resposta = asyncio.run(AsyncClient().get(reverse('login_funcionario')))
+        self.assertIn('Server-Timing', resposta)
+        amostra, = instrumentacao.amostras()
+        self.assertEqual((amostra['vista'], amostra['estado']), ('login_funcionario', 200))
+
+    def test_resumo_deteta_n_mais_1(self):
+        amostra = {'vista': 'v', 'ms': 30.0, 'queries': 40, 'bd_ms': 12.0, 'repetidas': [('SELECT x WHERE id = %s', 38)]}
+        resumo = instrumentacao.resumo([amostra, dict(amostra, ms=700.0, repetidas=[])])
+        linha, = resumo['vistas']
+        self.assertEqual((linha['pedidos'], linha['p50_ms'], linha['max_ms']), (2, 700.0, 700.0))
+        self.assertEqual(linha['histograma'][2], 1)  # 25 < 30 <= 50
+        self.assertEqual(linha['histograma'][6], 1)  # 500 < 700 <= 1000
+        self.assertEqual(linha['n_mais_1'], [{'sql': 'SELECT x WHERE id = %s', 'repeticoes': 38}])
+
+    @override_settings(INSTRUMENTACAO_AMOSTRAGEM=1)
+    def test_pagina_e_json_so_para_staff(self):
+        self.assertEqual(self.client.get(reverse('desempenho_json')).status_code, 302)
+        self.client.force_login(self.admin)
+        self.client.get(reverse('dashboard_analitica'))
+        dados = self.client.get(reverse('desempenho_json')).json()
+        self.assertIn('dashboard_analitica', [linha['vista'] for linha in dados['vistas']])
+        self.assertContains(self.client.get(reverse('dashboard_desempenho')), 'dashboard_analitica')
+
+
+class DadosSinteticosTests(TestCase):
+    def setUp(self):
+        roteamento.invalidar()
+        cache.clear()
+
+    def test_gerar_e_remover(self):
+        gerados = dados_sinteticos.gerar(**dados_sinteticos.ESCALAS['minima'], tamanho_lote=25)
+        self.assertEqual(gerados['ordens'], 60)
+        self.assertEqual(TarefaProducao.objects.count(), gerados['tarefas'])
+        concluidas = OrdemProducao.objects.filter(status_global='CONCLUIDO')
+        self.assertTrue(concluidas.exists())
+        # Uma tarefa concluída por posto da rota em cada ordem concluída
+        self.assertEqual(TarefaProducao.objects.filter(ordem__in=concluidas).count(), 3 * concluidas.count())
+        self.assertFalse(concluidas.filter(data_conclusao__isnull=True).exists())
+        self.assertTrue(ProducaoDiaria.objects.exists())
+        self.assertLessEqual(TarefaProducao.objects.filter(concluido=False).count(), 3)
+        # O histórico de eventos termina no estado atual de cada ordem (há tarefas geradas para dias futuros)
+        por_concluir = OrdemProducao.objects.exclude(status_global='CONCLUIDO')
+        self.assertEqual(
+            historico.estado_em(timezone.now() + datetime.timedelta(days=30))[0],
+            {ordem.id: {ordem.posto_atual_id: ordem.status_global} for ordem in por_concluir},
+        )
+
+        self.assertEqual(dados_sinteticos.remover(), 60)
+        self.assertFalse(OrdemProducao.objects.exists())
+        self.assertFalse(EventoProducao.objects.exists())
+        self.assertFalse(Posto.objects.exists())
+
+    def test_mesma_semente_mesmos_dados(self):
+        def gerar():
+            dados_sinteticos.gerar(**dados_sinteticos.ESCALAS['minima'], semente=7, reconstruir_totais=False)
+            return list(OrdemProducao.objects.order_by('numero_serie').values_list('numero_serie', 'status_global', 'data_prevista'))
+        primeira = gerar()
+        dados_sinteticos.remover()
+        self.assertEqual(gerar(), primeira)
+
+    def test_benchmark_guarda_e_compara(self):
+        with tempfile.TemporaryDirectory() as pasta:
+            base = os.path.join(pasta, 'base.json')
+            saida = io.StringIO()
+            call_command('benchmark', '--escala', 'minima', '--repeticoes', '1', '--guardar', base, stdout=saida)
+            self.assertIn('iniciar_tarefa', saida.getvalue())
+            # Nada do benchmark fica gravado (tarefas abertas/fechadas, utilizador de staff)
+            self.assertFalse(User.objects.exists())
+            with open(base, encoding='utf-8') as ficheiro:
+                resultados = json.load(ficheiro)
+            self.assertEqual(set(resultados['minima']['cenarios']), set(benchmark.CENARIOS))
+
+            saida = io.StringIO()
+            call_command('benchmark', '--repeticoes', '1', '--comparar', base, '--tolerancia', '100', stdout=saida)
+            self.assertIn('Sem regressões', saida.getvalue())
+
+    def test_comparar_deteta_regressao(self):
+        base = {'cenarios': {'x': {'queries': 3, 'ms_mediana': 10.0}}}
+        atual = {'cenarios': {'x': {'queries': 4, 'ms_mediana': 11.0}}}
+        self.assertEqual(benchmark.comparar(atual, base, tolerancia=0.25), [
+            ('x', 'queries', 3, 4, True), ('x', 'ms_mediana', 10.0, 11.0, False),
+        ])
+
+
+class IndicesTests(TestCase):
+    def test_queries_quentes_usam_indices(self):
+        for descricao, ok, plano in indices.verificar():
+            with self.subTest(descricao):
+                self.assertTrue(ok, plano)
+
+
+class ImportacaoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.posto = Posto.objects.create(nome='Corte', ordem_sequencia=1)
+        cls.balde = Acessorio.objects.create(nome='Balde Médio')
+        cls.garfo = Acessorio.objects.create(nome='Garfo')
+        cls.ana = Funcionario.objects.create(nome='Ana', codigo='1234')
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'senha')
+        OrdemProducao.objects.create(numero_serie='SN-EXISTE', acessorio=cls.garfo)
+
+    def setUp(self):
+        roteamento.invalidar()
+        cache.clear()
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.media = pasta.name
+        configuracao = self.settings(MEDIA_ROOT=self.media)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    CSV = (
+        "Nº Série;Tipo de Produto;Data Prevista;Funcionário\n"
+        "SN-1;balde medio;2026-11-02;ANA\n"
+        "SN-2;{garfo_id};03/11/2026;\n"
+        "SN-EXISTE;Garfo;;\n"
+        "SN-1;Garfo;;\n"
+        "SN-3;Pá;;\n"
+        "SN-4;Garfo;31/02/2026;\n"
+        "SN-5;Garfo;;9999\n"
+        ";;;\n"
+        "SN-6;Garfo;;\n"
+    )
+
+    def test_importar_em_lotes_com_erros_por_linha(self):
+        ficheiro = io.StringIO(self.CSV.format(garfo_id=self.garfo.id))
+        with CaptureQueriesContext(connection) as queries:
+            relatorio = importacao.importar_csv(ficheiro, tamanho_lote=3)
+
+        self.assertEqual(relatorio.lidas, 8)
+        self.assertEqual(relatorio.criadas, 3)
+        self.assertEqual(
+            sorted((linha, mensagem.split(':')[0]) for linha, _, mensagem in relatorio.erros),
+            [
+                (4, 'Número de série já existe'),
+                (5, 'Número de série já existe'),
+                (6, 'Tipo de produto desconhecido'),
+                (7, 'Data inválida'),
+                (8, 'Funcionário desconhecido'),
+            ],
+        )
+        sn1 = OrdemProducao.objects.get(numero_serie='SN-1')
+        self.assertEqual(sn1.acessorio, self.balde)
+        self.assertEqual(sn1.funcionario_designado, self.ana)
+        self.assertEqual(sn1.posto_atual, self.posto)
+        self.assertEqual(
+            OrdemProducao.objects.get(numero_serie='SN-2').data_prevista, datetime.date(2026, 11, 3)
+        )
+        # Cargas iniciais + (verificação + inserção das ordens e dos eventos) por lote, nunca por linha
+        self.assertLessEqual(len(self.queries_sem_savepoints(queries)), 3 + 3 * 3)
+
+    def queries_sem_savepoints(self, queries):
+        return [q for q in queries if 'SAVEPOINT' not in q['sql']]
+
+    def test_dry_run_nao_grava(self):
+        relatorio = importacao.importar_csv(io.StringIO("numero_serie,tipo_produto\nSN-9,Garfo\n"), gravar=False)
+        self.assertEqual(relatorio.criadas, 1)
+        self.assertFalse(OrdemProducao.objects.filter(numero_serie='SN-9').exists())
+
+    def test_falta_coluna_obrigatoria(self):
+        relatorio = importacao.importar_csv(io.StringIO("numero_serie\nSN-9\n"))
+        self.assertEqual(relatorio.erros, [(1, None, "Falta a coluna obrigatória 'tipo_produto'")])
+
+    def test_comando(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as ficheiro:
+            ficheiro.write("numero_serie,tipo_produto\nSN-10,Garfo\nSN-11,Garfo\n")
+        self.addCleanup(os.remove, ficheiro.name)
+        saida = io.StringIO()
+        call_command('importar_ordens', ficheiro.name, stdout=saida)
+        self.assertIn('2 ordens criadas', saida.getvalue())
+
+    def test_funcionario_por_id_ou_nome_e_nunca_pelo_codigo(self):
+        Funcionario.objects.create(nome='Rui', codigo='1111')
+        Funcionario.objects.create(nome='Rui', codigo='2222')
+        relatorio = importacao.importar_csv(io.StringIO(
+            "numero_serie;tipo_produto;funcionario\n"
+            f"SN-10;Garfo;{self.ana.id}\n"
+            "SN-11;Garfo;1234\n"
+            "SN-12;Garfo;rui\n"
+        ))
+        self.assertEqual(OrdemProducao.objects.get(numero_serie='SN-10').funcionario_designado, self.ana)
+        self.assertEqual(
+            [(linha, mensagem) for linha, _, mensagem in relatorio.erros],
+            [(3, 'Funcionário desconhecido: 1234'), (4, 'Há mais de um funcionário com o nome rui: use o id')],
+        )
+
+    def test_comando_com_codificacao_desconhecida(self):
+        with self.assertRaisesMessage(CommandError, 'Codificação desconhecida: utf-88'):
+            call_command('importar_ordens', 'ordens.csv', encoding='utf-88')
+
+    def test_admin_upload(self):
+        self.client.force_login(self.admin)
+        ficheiro = SimpleUploadedFile('ordens.csv', "numero_serie;tipo_produto\nSN-20;Garfo\n".encode('utf-8'))
+        resposta = self.client.post(reverse('admin:producao_ordemproducao_importar'), {'ficheiro': ficheiro})
+        trabalho = Trabalho.objects.get()
+        self.assertRedirects(resposta, reverse('admin:producao_trabalho_change', args=[trabalho.pk]))
+        self.assertFalse(OrdemProducao.objects.filter(numero_serie='SN-20').exists())
+        # O ficheiro fica no storage e o trabalho só guarda o caminho
+        caminho = os.path.join(self.media, trabalho.parametros['ficheiro'])
+        self.assertTrue(os.path.exists(caminho))
+
+        trabalhos.executar_pendentes()
+        trabalho.refresh_from_db()
+        self.assertEqual(trabalho.estado, 'CONCLUIDO')
+        self.assertEqual(trabalho.resultado['criadas'], 1)
+        self.assertFalse(os.path.exists(caminho))
+        self.assertTrue(OrdemProducao.objects.filter(numero_serie='SN-20').exists())
+        self.assertContains(self.client.get(reverse('admin:producao_trabalho_change', args=[trabalho.pk])), '1 ordens criadas')
+
+    def test_admin_upload_com_codificacao_desconhecida(self):
+        self.client.force_login(self.admin)
+        ficheiro = SimpleUploadedFile('ordens.csv', "numero_serie;tipo_produto\nSN-20;Garfo\n".encode('utf-8'))
+        resposta = self.client.post(
+            reverse('admin:producao_ordemproducao_importar'), {'ficheiro': ficheiro, 'encoding': 'utf-88'},
+        )
+        self.assertContains(resposta, 'Codificação desconhecida: utf-88')
+        self.assertFalse(Trabalho.objects.exists())
+        self.assertEqual(os.listdir(self.media), [])
+
+
+class TrabalhoTests(TestCase):
+    def setUp(self):
+        self.chamadas = []
+        trabalhos.tipo('teste')(self.tarefa_de_teste)
+        self.addCleanup(trabalhos._TIPOS.pop, 'teste')
+
+    def tarefa_de_teste(self, trabalho, falhar=0):
+        self.chamadas.append(trabalho.pk)
+        trabalhos.reportar(trabalho, 50, 'a meio')
+        if len(self.chamadas) <= falhar:
+            raise RuntimeError('falhou')
+        return {'resumo': 'feito'}
+
+    def test_reclamar_por_ordem_e_uma_so_vez(self):
+        primeiro = trabalhos.enfileirar('teste')
+        segundo = trabalhos.enfileirar('teste')
+        reclamado = trabalhos.reclamar('t1')
+        self.assertEqual((reclamado.pk, reclamado.estado, reclamado.tentativas), (primeiro.pk, 'EM_CURSO', 1))
+        self.assertEqual(trabalhos.reclamar('t2').pk, segundo.pk)
+        self.assertIsNone(trabalhos.reclamar('t3'))
+
+    def test_concluido_com_progresso_e_resultado(self):
+        trabalho = trabalhos.enfileirar('teste')
+        self.assertEqual(trabalhos.executar_pendentes(), 1)
+        trabalho.refresh_from_db()
+        self.assertEqual((trabalho.estado, trabalho.progresso, trabalho.mensagem), ('CONCLUIDO', 100, 'a meio'))
+        self.assertEqual(trabalho.resultado, {'resumo': 'feito'})
+
+    def test_falha_volta_a_fila_com_espera(self):
+        trabalho = trabalhos.enfileirar('teste', {'falhar': 1})
+        trabalhos.executar_pendentes()
+        trabalho.refresh_from_db()
+        self.assertEqual(trabalho.estado, 'PENDENTE')
+        self.assertIn('RuntimeError', trabalho.erro)
+        self.assertGreater(trabalho.disponivel_em, timezone.now())
+        # Ainda à espera: não é reclamado até passar o tempo
+        self.assertIsNone(trabalhos.reclamar('t1'))
+
+        self.assertIsNotNone(trabalhos.reclamar('t1', agora=trabalho.disponivel_em))
+        trabalho.refresh_from_db()
+        self.assertTrue(trabalhos.executar(trabalho))
+        trabalho.refresh_from_db()
+        self.assertEqual((trabalho.estado, trabalho.tentativas, trabalho.erro), ('CONCLUIDO', 2, ''))
+
+    def test_falha_definitiva_ao_fim_das_tentativas(self):
+        trabalho = trabalhos.enfileirar('teste', {'falhar': 5}, max_tentativas=1)
+        trabalhos.executar_pendentes()
+        trabalho.refresh_from_db()
+        self.assertEqual(trabalho.estado, 'FALHOU')
+        self.assertIsNotNone(trabalho.terminado_em)
+
+    def test_tipo_desconhecido(self):
+        with self.assertRaises(ValueError):
+            trabalhos.enfileirar('nao_existe')
+
+    def test_recuperar_abandonados(self):
+        trabalho = trabalhos.enfileirar('teste')
+        trabalhos.reclamar('morto')
+        depois = timezone.now() + datetime.timedelta(seconds=trabalhos.TEMPO_LIMITE + 1)
+        self.assertEqual(trabalhos.recuperar_abandonados(agora=depois), 1)
+        trabalho.refresh_from_db()
+        self.assertEqual((trabalho.estado, trabalho.trabalhador), ('PENDENTE', ''))
+
+    def test_comando_uma_vez(self):
+        trabalhos.enfileirar('teste')
+        trabalhos.enfileirar('teste')
+        saida = io.StringIO()
+        call_command('trabalhador', '--uma-vez', '--nome', 'teste', stdout=saida)
+        self.assertIn('2 trabalhos', saida.getvalue())
+        self.assertEqual(Trabalho.objects.filter(estado='CONCLUIDO').count(), 2)
+
+    def test_reconstruir_pelo_admin(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'senha'))
+        self.assertEqual(self.client.get(reverse('admin:producao_producaodiaria_reconstruir')).status_code, 403)
+        self.client.post(reverse('admin:producao_producaodiaria_reconstruir'))
+        trabalho = Trabalho.objects.get()
+        self.assertEqual(trabalho.tipo, 'reconstruir_estatisticas')
+        trabalhos.executar_pendentes()
+        trabalho.refresh_from_db()
+        self.assertEqual(trabalho.estado, 'CONCLUIDO')
+        self.assertContains(self.client.get(reverse('admin:producao_trabalho_changelist')), 'reconstruir_estatisticas')
+
+
+class StockTests(OrcamentoQueriesMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.posto1 = Posto.objects.create(nome='Corte', ordem_sequencia=1)
+        cls.posto2 = Posto.objects.create(nome='Pintura', ordem_sequencia=2)
+        cls.balde = Acessorio.objects.create(nome='Balde')
+        cls.chapa = Peca.objects.create(nome='Chapa', referencia='CH-1', stock_atual=10)
+        cls.dente = Peca.objects.create(nome='Dente', referencia='DT-1', stock_atual=8)
+        ComponenteAcessorio.objects.create(acessorio=cls.balde, peca=cls.chapa, quantidade=2)
+        ComponenteAcessorio.objects.create(acessorio=cls.balde, peca=cls.dente, quantidade=4)
+        cls.ana = Funcionario.objects.create(nome='Ana', codigo='1234')
+        cls.ana.postos.set([cls.posto1, cls.posto2])
+
+    def setUp(self):
+        roteamento.invalidar()
+        cache.clear()
+
+    def nova_ordem(self, numero_serie):
+        return OrdemProducao.objects.create(numero_serie=numero_serie, acessorio=self.balde, posto_atual=self.posto1)
+
+    def stock(self):
+        return sorted(Peca.objects.values_list('referencia', 'stock_atual', 'stock_reservado'))
+
+    def test_reservar_e_consumir(self):
+        ordem = self.nova_ordem('SN-1')
+        self.assertTrue(stock.reservar(ordem))
+        self.assertFalse(stock.reservar(ordem))
+        self.assertEqual(self.stock(), [('CH-1', 10, 2), ('DT-1', 8, 4)])
+
+        tarefa = TarefaProducao.abrir(ordem.id, self.ana)
+        self.assertEqual(self.stock(), [('CH-1', 8, 0), ('DT-1', 4, 0)])
+        self.assertEqual(OrdemProducao.objects.get(pk=ordem.pk).estado_stock, 'CONSUMIDO')
+
+        # No posto seguinte a ordem não volta a consumir peças
+        tarefa.finalizar_tarefa()
+        TarefaProducao.abrir(ordem.id, self.ana)
+        self.assertEqual(self.stock(), [('CH-1', 8, 0), ('DT-1', 4, 0)])
+
+    def test_consumir_sem_reserva(self):
+        ordem = self.nova_ordem('SN-1')
+        TarefaProducao.abrir(ordem.id, self.ana)
+        self.assertEqual(self.stock(), [('CH-1', 8, 0), ('DT-1', 4, 0)])
+
+    def test_stock_insuficiente_nao_altera_nada(self):
+        stock.reservar(self.nova_ordem('SN-1'))
+        stock.reservar(self.nova_ordem('SN-2'))
+        terceira = self.nova_ordem('SN-3')
+        with self.assertRaises(stock.StockInsuficiente) as erro:
+            stock.reservar(terceira)
+        self.assertEqual([peca.referencia for peca, _, _ in erro.exception.faltas], ['DT-1'])
+        self.assertEqual(self.stock(), [('CH-1', 10, 4), ('DT-1', 8, 8)])
+
+        # A ordem sem reserva não pode consumir o que está reservado para as outras
+        with self.assertRaises(stock.StockInsuficiente):
+            TarefaProducao.abrir(terceira.id, self.ana)
+        self.assertFalse(TarefaProducao.objects.exists())
+        self.assertEqual(OrdemProducao.objects.get(pk=terceira.pk).status_global, 'PENDENTE')
+
+    def test_apagar_ordem_liberta_reserva(self):
+        ordem = self.nova_ordem('SN-1')
+        stock.reservar(ordem)
+        stock.reservar(self.nova_ordem('SN-2'))
+        ordem.delete()
+        self.assertEqual(self.stock(), [('CH-1', 10, 2), ('DT-1', 8, 4)])
+
+        # Apagadas pelo admin (queryset): também libertam, uma vez só
+        OrdemProducao.objects.all().delete()
+        self.assertEqual(self.stock(), [('CH-1', 10, 0), ('DT-1', 8, 0)])
+
+    def test_mudar_produto_no_admin_liberta_reserva(self):
+        garfo = Acessorio.objects.create(nome='Garfo')
+        ordem = self.nova_ordem('SN-1')
+        stock.reservar(ordem)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'senha'))
+        resposta = self.client.post(reverse('admin:producao_ordemproducao_change', args=[ordem.pk]), {
+            'numero_serie': 'SN-1', 'acessorio': garfo.id, 'posto_atual': self.posto1.id,
+            'status_global': 'PENDENTE', 'estado_stock': 'RESERVADO',
+            'tarefas-TOTAL_FORMS': 0, 'tarefas-INITIAL_FORMS': 0, 'ramos-TOTAL_FORMS': 0, 'ramos-INITIAL_FORMS': 0,
+        })
+        self.assertEqual(resposta.status_code, 302)
+        self.assertEqual(self.stock(), [('CH-1', 10, 0), ('DT-1', 8, 0)])
+        ordem.refresh_from_db()
+        self.assertEqual((ordem.acessorio_id, ordem.estado_stock), (garfo.id, 'NAO_RESERVADO'))
+
+    def test_criar_ordem_sem_stock_mostra_erro(self):
+        Peca.objects.filter(pk=self.dente.pk).update(stock_atual=1)
+        self.entrar_como(self.ana)
+        resposta = self.client.post(
+            reverse('dashboard_funcionario'),
+            {'criar_ordem': '1', 'numero_serie': 'SN-1', 'acessorio': self.balde.id},
+            follow=True,
+        )
+        self.assertContains(resposta, 'Stock insuficiente')
+        self.assertFalse(OrdemProducao.objects.exists())
+
+    def test_criar_ordem_sem_stock_para_comecar_mostra_erro(self):
+        # O stock mudou entre a reserva e o consumo (ex: acerto de inventário noutro pedido)
+        self.entrar_como(self.ana)
+        with mock.patch.object(stock, 'consumir', side_effect=stock.StockInsuficiente([(self.dente, 4, 1)])):
+            resposta = self.client.post(
+                reverse('dashboard_funcionario'),
+                {'criar_ordem': '1', 'numero_serie': 'SN-1', 'acessorio': self.balde.id},
+                follow=True,
+            )
+        self.assertContains(resposta, 'Stock insuficiente: DT-1: precisa 4, disponível 1')
+        ordem = OrdemProducao.objects.get()
+        self.assertEqual((ordem.status_global, ordem.estado_stock), ('PENDENTE', 'RESERVADO'))
+        self.assertFalse(TarefaProducao.objects.exists())
+
+    def test_faltas_numa_query(self):
+        for i in range(3):
+            self.nova_ordem(f'SN-{i}')
+        concluida = self.nova_ordem('SN-C')
+        OrdemProducao.objects.filter(pk=concluida.pk).update(status_global='CONCLUIDO')
+
+        with self.assertNumQueries(1):
+            faltas = stock.faltas()
+        self.assertEqual(
+            [(peca['referencia'], peca['necessario'], peca['falta']) for peca in faltas],
+            [('DT-1', 12, 4)],
+        )
+
+
+class ReconstrucaoHistoricoTests(TransactionTestCase):
+    def test_cada_lote_fica_gravado_antes_do_progresso(self):
+        posto = Posto.objects.create(nome='Corte', ordem_sequencia=1)
+        acessorio = Acessorio.objects.create(nome='Garfo')
+        for i in range(3):
+            OrdemProducao.objects.create(numero_serie=f'SN-{i}', acessorio=acessorio, posto_atual=posto)
+        lotes = []
+
+        def progresso(ordens, eventos):
+            # Fora de transação: o sinal de vida do trabalho (trabalhos.reportar) é gravado logo
+            lotes.append((ordens, connection.in_atomic_block, EventoProducao.objects.count() == eventos))
+
+        historico.reconstruir(tamanho_lote=2, progresso=progresso)
+        self.assertEqual(lotes, [(2, False, True), (3, False, True)])
+
+
+class MigracoesTests(TransactionTestCase):
+    def migrar(self, destino):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(destino)
+        return executor.loader.project_state(destino).apps
+
+    def tearDown(self):
+        self.migrar(MigrationExecutor(connection).loader.graph.leaf_nodes('producao'))
+
+    def test_tarefas_abertas_duplicadas_fecham_antes_das_restricoes(self):
+        apps = self.migrar([('producao', '0001_initial')])
+        Posto = apps.get_model('producao', 'Posto')
+        Acessorio = apps.get_model('producao', 'Acessorio')
+        Funcionario = apps.get_model('producao', 'Funcionario')
+        OrdemProducao = apps.get_model('producao', 'OrdemProducao')
+        TarefaProducao = apps.get_model('producao', 'TarefaProducao')
+        posto = Posto.objects.create(nome='Corte', ordem_sequencia=1)
+        acessorio = Acessorio.objects.create(nome='Garfo')
+        ana = Funcionario.objects.create(nome='Ana', codigo='1234')
+        rui = Funcionario.objects.create(nome='Rui', codigo='5678')
+        ordem1 = OrdemProducao.objects.create(numero_serie='SN-1', acessorio=acessorio, posto_atual=posto)
+        ordem2 = OrdemProducao.objects.create(numero_serie='SN-2', acessorio=acessorio, posto_atual=posto)
+        agora = timezone.now()
+        antiga = TarefaProducao.objects.create(ordem=ordem1, funcionario=ana, posto=posto, inicio=agora - datetime.timedelta(hours=1))
+        mesma_ordem = TarefaProducao.objects.create(ordem=ordem1, funcionario=rui, posto=posto, inicio=agora)
+        mesmo_funcionario = TarefaProducao.objects.create(ordem=ordem2, funcionario=ana, posto=posto, inicio=agora)
+
+        apps = self.migrar([('producao', '0002_tarefa_aberta_unica')])
+        TarefaProducao = apps.get_model('producao', 'TarefaProducao')
+        self.assertEqual(list(TarefaProducao.objects.filter(concluido=False).values_list('id', flat=True)), [antiga.id])
+        for tarefa in TarefaProducao.objects.filter(pk__in=[mesma_ordem.id, mesmo_funcionario.id]):
+            self.assertEqual(tarefa.fim, tarefa.inicio)
@@ -0,0 +1,234 @@
+"""Fila de trabalhos em segundo plano guardada na base de dados (tabela Trabalho).
+
+O admin só enfileira (enfileirar) e responde logo; o comando `trabalhador`
+corre noutro processo (no Render, um Background Worker com
+`python manage.py trabalhador`) e executa os trabalhos um a um. Não precisa
+de nenhum broker: funciona com o SQLite e com o PostgreSQL.
+
+Cada trabalhador reclama o próximo trabalho com select_for_update(skip_locked)
+(PostgreSQL) seguido de um UPDATE condicional ao estado, que garante que só
+um o leva mesmo em SQLite. Se falhar, volta à fila com espera crescente até
+max_tentativas. Um trabalho EM_CURSO sem sinal de vida há TEMPO_LIMITE
+segundos (trabalhador morto) é devolvido à fila.
+
+Os tipos de trabalho são funções registadas com @tipo('nome'), chamadas com
+(trabalho, **parametros); o que devolvem fica em Trabalho.resultado.
+
+Um ficheiro carregado (ex: CSV a importar) não vai para a base de dados: é
+gravado aos bocados no default_storage e o trabalho recebe o caminho no
+parâmetro `ficheiro`. O trabalhador lê-o em streaming do mesmo storage (tem de
+ver a mesma pasta, ver MEDIA_ROOT) e apaga-o quando o trabalho é concluído.
+"""
+import datetime
+import io
+import traceback
+import uuid
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Trabalho
+
+TEMPO_LIMITE = 60 * 60
+ESPERA_BASE = 30  # segundos antes da 2.ª tentativa; duplica a cada falha
+MAX_ERROS_GUARDADOS = 500
+PASTA_FICHEIROS = 'trabalhos'
+
+_TIPOS = {}
+
+
+def tipo(nome):
+    def registar(funcao):
+        _TIPOS[nome] = funcao
+        return funcao
+    return registar
+
+
+def enfileirar(nome, parametros=None, ficheiro=None, criado_por=None, max_tentativas=3):
+    if nome not in _TIPOS:
+        raise ValueError(f"Tipo de trabalho desconhecido: {nome}")
+    parametros = dict(parametros or {})
+    if ficheiro is not None:
+        parametros['ficheiro'] = default_storage.save(f'{PASTA_FICHEIROS}/{uuid.uuid4().hex}', ficheiro)
+    return Trabalho.objects.create(
+        tipo=nome,
+        parametros=parametros,
+        criado_por=criado_por,
+        max_tentativas=max_tentativas,
+    )
+
+
+def reportar(trabalho, progresso=None, mensagem=None):
+    """Atualiza o progresso (0-100) e a mensagem do trabalho; serve também de sinal de vida."""
+    alteracoes = {'atualizado_em': timezone.now()}
+    if progresso is not None:
+        alteracoes['progresso'] = trabalho.progresso = max(0, min(int(progresso), 100))
+    if mensagem is not None:
+        alteracoes['mensagem'] = trabalho.mensagem = mensagem[:255]
+    Trabalho.objects.filter(pk=trabalho.pk).update(**alteracoes)
+
+
+def recuperar_abandonados(agora=None):
+    """Devolve à fila os trabalhos EM_CURSO de trabalhadores que deixaram de dar sinal de vida."""
+    agora = agora or timezone.now()
+    abandonados = Trabalho.objects.filter(estado='EM_CURSO', atualizado_em__lt=agora - datetime.timedelta(seconds=TEMPO_LIMITE))
+    falhados = abandonados.filter(tentativas__gte=F('max_tentativas')).update(
+        estado='FALHOU', terminado_em=agora, erro='Trabalhador deixou de responder',
+    )
+    devolvidos = abandonados.update(estado='PENDENTE', disponivel_em=agora, trabalhador='')
+    return devolvidos + falhados
+
+
+def reclamar(trabalhador, agora=None):
+    """Reserva o próximo trabalho disponível para `trabalhador`. Devolve o Trabalho ou None."""
+    agora = agora or timezone.now()
+    with transaction.atomic():
+        candidato = (
+            Trabalho.objects.select_for_update(skip_locked=True)
+            .filter(estado='PENDENTE', disponivel_em__lte=agora)
+            .order_by('disponivel_em', 'id')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if candidato is None:
+            return None
+        reclamado = Trabalho.objects.filter(pk=candidato, estado='PENDENTE').update(
+            estado='EM_CURSO',
+            trabalhador=trabalhador[:100],
+            tentativas=F('tentativas') + 1,
+            iniciado_em=agora,
+            atualizado_em=agora,
+            progresso=0,
+        )
+        if not reclamado:
+            return None
+    return Trabalho.objects.get(pk=candidato)
+
+
+def executar(trabalho):
+    """Executa um trabalho já reclamado e grava o desfecho. Devolve True se concluiu."""
+    funcao = _TIPOS.get(trabalho.tipo)
+    try:
+        if funcao is None:
+            raise LookupError(f"Tipo de trabalho desconhecido: {trabalho.tipo}")
+        resultado = funcao(trabalho, **trabalho.parametros)
+    except Exception as erro:
+        agora = timezone.now()
+        definitivo = isinstance(erro, LookupError) or trabalho.tentativas >= trabalho.max_tentativas
+        if definitivo:
+            alteracoes = {'estado': 'FALHOU', 'terminado_em': agora}
+        else:
+            espera = ESPERA_BASE * 2 ** (trabalho.tentativas - 1)
+            alteracoes = {'estado': 'PENDENTE', 'disponivel_em': agora + datetime.timedelta(seconds=espera)}
+        Trabalho.objects.filter(pk=trabalho.pk).update(erro=traceback.format_exc(), atualizado_em=agora, **alteracoes)
+        return False
+
+    agora = timezone.now()
+    Trabalho.objects.filter(pk=trabalho.pk).update(
+        estado='CONCLUIDO', progresso=100, resultado=resultado, erro='', terminado_em=agora, atualizado_em=agora,
+    )
+    # Se falhar fica no storage, para o trabalho poder ser repetido no admin
+    if trabalho.parametros.get('ficheiro'):
+        default_storage.delete(trabalho.parametros['ficheiro'])
+    return True
+
+
+def executar_pendentes(trabalhador='local', limite=None):
+    """Executa trabalhos disponíveis até a fila esvaziar (ou até `limite`). Devolve quantos executou."""
+    executados = 0
+    while limite is None or executados < limite:
+        trabalho = reclamar(trabalhador)
+        if trabalho is None:
+            break
+        executar(trabalho)
+        executados += 1
+    return executados
+
+
+# --- Tipos de trabalho ---
+def _data(valor):
+    return datetime.date.fromisoformat(valor) if valor else None
+
+
+@tipo('importar_ordens')
+def importar_ordens(trabalho, ficheiro, encoding='utf-8-sig', dry_run=False, tamanho_lote=None):
+    from . import importacao
+
+    tamanho = max(default_storage.size(ficheiro), 1)
+    with default_storage.open(ficheiro, 'rb') as bruto:
+        texto = io.TextIOWrapper(bruto, encoding=encoding, errors='replace', newline='')
+
+        def progresso(relatorio):
+            reportar(trabalho, 100 * bruto.tell() / tamanho, str(relatorio))
+
+        relatorio = importacao.importar_csv(
+            texto, tamanho_lote or importacao.TAMANHO_LOTE, gravar=not dry_run, progresso=progresso,
+        )
+    return {
+        'resumo': str(relatorio),
+        'lidas': relatorio.lidas,
+        'criadas': relatorio.criadas,
+        'total_erros': len(relatorio.erros),
+        'erros': relatorio.erros[:MAX_ERROS_GUARDADOS],
+    }
+
+
+@tipo('reconstruir_estatisticas')
+def reconstruir_estatisticas(trabalho, desde=None, ate=None, dias_por_lote=31):
+    from . import estatisticas
+
+    desde, ate = _data(desde), _data(ate)
+
+    def progresso(inicio, fim, linhas):
+        if desde and ate:
+            feito = (fim - desde).days + 1
+            reportar(trabalho, 100 * feito / ((ate - desde).days + 1), f"{fim}: {linhas} linhas")
+        else:
+            reportar(trabalho, mensagem=f"{fim}: {linhas} linhas")
+
+    criadas = estatisticas.reconstruir(desde, ate, dias_por_lote, progresso=progresso)
+    return {'resumo': f"Totais reconstruídos: {criadas} linhas"}
+
+
+@tipo('planear')
+def planear(trabalho, ids=None, replanear=False, inicio=None):
+    from . import planeamento
+    from .models import OrdemProducao
+
+    selecao = OrdemProducao.objects.filter(id__in=ids, status_global='PENDENTE') if ids is not None else None
+    plano = planeamento.planear(selecao=selecao, replanear=replanear, inicio=_data(inicio))
+    reportar(trabalho, 50, str(plano))
+    planeamento.aplicar(plano)
+    return {'resumo': f"Planeamento: {plano}", 'sem_operador': plano.sem_operador}
+
+
+@tipo('arquivar_ordens')
+def arquivar_ordens(trabalho, dias=None, tamanho_lote=None):
+    from . import arquivo
+
+    def progresso(ordens, tarefas):
+        reportar(trabalho, mensagem=f"{ordens} ordens e {tarefas} tarefas arquivadas")
+
+    ordens, tarefas = arquivo.arquivar(
+        dias if dias is not None else arquivo.DIAS_PADRAO, tamanho_lote or arquivo.TAMANHO_LOTE, progresso=progresso,
+    )
+    return {'resumo': f"Arquivo concluído: {ordens} ordens, {tarefas} tarefas"}
+
+
+@tipo('snapshot_wip')
+def snapshot_wip(trabalho, reconstruir=False, intervalo_minutos=60):
+    from . import historico
+
+    if reconstruir:
+        def progresso_eventos(ordens, eventos):
+            reportar(trabalho, mensagem=f"{ordens} ordens: {eventos} eventos")
+
+        historico.reconstruir(progresso=progresso_eventos)
+
+    def progresso(momento, criados):
+        reportar(trabalho, mensagem=f"{criados} snapshots (até {momento:%Y-%m-%d %H:%M})")
+
+    criados = historico.criar_snapshots(intervalo=datetime.timedelta(minutes=intervalo_minutos), progresso=progresso)
+    return {'resumo': f"Snapshots de WIP criados: {criados}"}
@@ -5,7 +5,15 @@ urlpatterns = [
     path('login/', views.login_funcionario, name='login_funcionario'),
     path('logout/', views.logout_funcionario, name='logout_funcionario'),
     path('estatisticas/', views.dashboard_estatisticas, name='dashboard_estatisticas'),
+    path('estatisticas/analitica/', views.dashboard_analitica, name='dashboard_analitica'),
+    path('estatisticas/analitica.json', views.analitica_json, name='analitica_json'),
+    path('estatisticas/wip.json', views.wip_json, name='wip_json'),
+    path('agenda.json', views.agenda_json, name='agenda_json'),
+    path('estatisticas/desempenho/', views.dashboard_desempenho, name='dashboard_desempenho'),
+    path('estatisticas/desempenho.json', views.desempenho_json, name='desempenho_json'),
     path('', views.dashboard_funcionario, name='dashboard_funcionario'),
+    path('stream/', views.stream_funcionario, name='stream_funcionario'),
     path('iniciar/<int:ordem_id>/', views.iniciar_tarefa, name='iniciar_tarefa'),
     path('finalizar/<int:tarefa_id>/', views.finalizar_tarefa, name='finalizar_tarefa'),
+    path('sincronizar/', views.sincronizar_eventos, name='sincronizar_eventos'),
 ]
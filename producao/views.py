@@ -1,18 +1,49 @@
+import asyncio
+import datetime
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.utils import timezone
-from django.db.models import Q, Count
+from django.utils.functional import SimpleLazyObject
+from django.db.models import ExpressionWrapper, FloatField, OuterRef, Q, Subquery, Sum
+from django.utils.dateparse import parse_date, parse_datetime
+from django.contrib import messages
 from django.contrib.admin.views.decorators import staff_member_required
-from .models import OrdemProducao, TarefaProducao, Funcionario, Posto, Acessorio
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import IntegrityError, transaction
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import require_POST
+from . import agenda, analitica, eventos, fragmentos, historico, instrumentacao, operador, replicas, roteamento, sincronizacao, stock
+from .models import AlertaLinha, OrdemProducao, TarefaProducao, Acessorio, Posto, ProducaoDiaria, RamoOrdem
+
+# Máximo de cartões da pool geral mostrados de cada vez no tablet
+ORDENS_GERAIS_POR_PAGINA = 20
+
+# Alertas do monitor da linha mostrados nas estatísticas (os mais graves de cada tipo primeiro)
+MAX_ALERTAS = 50
+
+# Segundos sem eventos até enviar um comentário SSE para manter a ligação aberta
+SSE_KEEPALIVE = 25
 
 def login_funcionario(request):
     if request.method == 'POST':
-        codigo = request.POST.get('codigo')
-        try:
-            funcionario = Funcionario.objects.get(codigo=codigo)
-            request.session['funcionario_id'] = funcionario.id
-            return redirect('dashboard_funcionario')
-        except Funcionario.DoesNotExist:
+        # Demasiados PINs errados deste IP: recusa sem ir à base de dados
+        if operador.bloqueado(request):
+            return render(request, 'producao/login_funcionario.html', {
+                'erro': 'Demasiadas tentativas. Aguarde alguns minutos.'
+            }, status=429)
+        contexto = operador.autenticar(request.POST.get('codigo'))
+        if contexto is None:
+            operador.registar_falha(request)
             return render(request, 'producao/login_funcionario.html', {'erro': 'Código inválido'})
+        request.session['funcionario_id'] = contexto.funcionario_id
+        return redirect('dashboard_funcionario')
     return render(request, 'producao/login_funcionario.html')
 
 def logout_funcionario(request):
@@ -20,131 +51,395 @@ def logout_funcionario(request):
         del request.session['funcionario_id']
     return redirect('login_funcionario')
 
+def _contexto_operador(request):
+    """Contexto em cache do operador com sessão iniciada, ou None."""
+    funcionario_id = request.session.get('funcionario_id')
+    if funcionario_id is None:
+        return None
+    return operador.contexto(funcionario_id)
+
 def dashboard_funcionario(request):
     # Verificação de Sessão Manual (Substitui o @login_required)
     if 'funcionario_id' not in request.session:
         return redirect('login_funcionario')
 
-    try:
-        funcionario = Funcionario.objects.get(id=request.session['funcionario_id'])
-    except Funcionario.DoesNotExist:
+    # Funcionário e postos vêm da cache (sem queries na maioria dos pedidos); só servem para mostrar
+    contexto = _contexto_operador(request)
+    if contexto is None:
         return redirect('logout_funcionario')
+    funcionario = contexto.funcionario
+
+    postos_ids = contexto.postos_ids
 
-    # Obtém todos os postos onde este funcionário pode trabalhar
-    postos_autorizados = funcionario.postos.all()
-    
     # --- LÓGICA PARA O POSTO 1 (INÍCIO DE PRODUÇÃO) ---
-    # Verifica se o funcionário tem acesso ao primeiro posto da linha
-    primeiro_posto = Posto.objects.order_by('ordem_sequencia').first()
+    # Verifica se o funcionário tem acesso ao primeiro posto de alguma rota (cada produto tem a sua)
     e_posto_inicial = False
     acessorios_disponiveis = []
 
-    if primeiro_posto and primeiro_posto in postos_autorizados:
+    if roteamento.postos_iniciais() & set(postos_ids):
         e_posto_inicial = True
-        acessorios_disponiveis = Acessorio.objects.all()
+        acessorios_disponiveis = [
+            acessorio for acessorio in Acessorio.objects.all() if roteamento.comeca_em(acessorio.id, postos_ids)
+        ]
 
         # Se for um pedido para CRIAR uma nova ordem (Botão Iniciar Produção)
         if request.method == 'POST' and 'criar_ordem' in request.POST:
             numero_serie = request.POST.get('numero_serie')
-            acessorio_id = request.POST.get('acessorio')
+            acessorio_id = int(request.POST.get('acessorio') or 0) if (request.POST.get('acessorio') or '').isdigit() else None
             
-            if numero_serie and acessorio_id:
-                # 1. Cria a Ordem
-                nova_ordem = OrdemProducao.objects.create(
-                    numero_serie=numero_serie,
-                    acessorio_id=acessorio_id,
-                    posto_atual=primeiro_posto,
-                    status_global='PENDENTE'
-                )
-                # 2. Redireciona para "iniciar_tarefa" para começar o cronómetro logo
-                return redirect('iniciar_tarefa', ordem_id=nova_ordem.id)
+            # Os postos em cache podem estar desatualizados noutro processo: para gravar confirma-se na base de dados
+            if numero_serie and acessorio_id and roteamento.comeca_em(
+                acessorio_id, set(funcionario.postos.values_list('id', flat=True)),
+            ):
+                try:
+                    # 1. Cria a Ordem na primeira etapa da rota do produto e reserva as peças (tudo ou nada)
+                    with transaction.atomic():
+                        primeira = roteamento.rota(acessorio_id).primeira_etapa
+                        nova_ordem = OrdemProducao.objects.create(
+                            numero_serie=numero_serie,
+                            acessorio_id=acessorio_id,
+                            posto_atual_id=roteamento.posto_inicial(acessorio_id),
+                            status_global='PENDENTE'
+                        )
+                        if len(primeira) > 1:
+                            OrdemProducao.entrar_na_etapa(nova_ordem.id, primeira)
+                            historico.registar_etapa(
+                                nova_ordem.id, 'CRIADA', [passo.posto_id for passo in primeira], 'PENDENTE',
+                                momento=nova_ordem.data_criacao,
+                            )
+                        stock.reservar(nova_ordem)
+                except IntegrityError:
+                    # Número de série repetido (ex: duplo toque no botão): a ordem já existe
+                    return redirect('dashboard_funcionario')
+                except ValidationError as erro:
+                    # Número de série de uma ordem já arquivada
+                    messages.error(request, ' '.join(erro.messages))
+                    return redirect('dashboard_funcionario')
+                except stock.StockInsuficiente as erro:
+                    messages.error(request, f"Stock insuficiente: {erro}")
+                    return redirect('dashboard_funcionario')
+                # 2. Abre logo a tarefa para começar o cronómetro. O stock pode ter mudado desde a
+                #    reserva (ex: acerto de inventário): a ordem fica criada e pendente no posto
+                try:
+                    TarefaProducao.abrir(nova_ordem.id, funcionario)
+                except stock.StockInsuficiente as erro:
+                    messages.error(request, f"Ordem criada, mas não pôde começar. Stock insuficiente: {erro}")
+                return redirect('dashboard_funcionario')
 
     # 2. Verifica se o funcionário já tem alguma tarefa "aberta" (cronómetro a contar)
+    # Lida sempre da base de dados (índice parcial por funcionário): pode ter sido aberta noutro processo
     tarefa_em_curso = TarefaProducao.objects.filter(
-        funcionario=funcionario,
+        funcionario_id=contexto.funcionario_id,
         concluido=False
-    ).first()
-
-    # 3. Base de procura: Ordens pendentes NOS POSTOS AUTORIZADOS
-    base_ordens = OrdemProducao.objects.filter(
-        posto_atual__in=postos_autorizados
-    ).exclude(status_global='CONCLUIDO')
+    ).select_related('ordem__acessorio').first()
 
-    # Se já estiver a trabalhar numa, não mostramos essa na lista de "pendentes" para não confundir
-    if tarefa_em_curso:
-        base_ordens = base_ordens.exclude(id=tarefa_em_curso.ordem.id)
+    # 3. Base de procura: Ordens pendentes NOS POSTOS AUTORIZADOS (as EM_ANDAMENTO já estão reservadas)
+    # select_related evita uma query por cartão (posto_atual.nome / acessorio.nome)
+    # Lida só quando uma das listas é desenhada (com o fragmento em cache não custa queries)
+    base_ordens = SimpleLazyObject(lambda: _fila(postos_ids, tarefa_em_curso))
 
     # SISTEMA DE AGENDAMENTO: Separar o que é "Meu" do que é "Geral"
     # Lista 1: Agendadas especificamente para este funcionário (Prioridade Alta)
-    ordens_agendadas = base_ordens.filter(funcionario_designado=funcionario).order_by('data_prevista', 'id')
+    ordens_agendadas = SimpleLazyObject(
+        lambda: base_ordens.filter(funcionario_designado=funcionario).order_by('data_prevista', 'id')
+    )
 
     # Lista 2: Livres (Ninguém designado) - Qualquer um no posto pode pegar
-    ordens_gerais = base_ordens.filter(funcionario_designado__isnull=True)
+    # Paginada para o número de queries e o tamanho da página não crescerem com a fila.
+    # Preguiçosa (como a lista 1): com o fragmento das listas em cache não chega a ser lida
+    pagina = request.GET.get('pagina')
+    ordens_gerais = SimpleLazyObject(lambda: Paginator(
+        base_ordens.filter(funcionario_designado__isnull=True).order_by('data_prevista', 'id'),
+        ORDENS_GERAIS_POR_PAGINA,
+    ).get_page(pagina))
+
+    # Chave do fragmento das listas: versão das filas dos postos e o token CSRF dos formulários
+    # (sem cookie CSRF o token é novo neste pedido e o fragmento não pode ser reutilizado)
+    csrf = request.META.get('CSRF_COOKIE')
+    cache_filas = {
+        'versao': fragmentos.filas(postos_ids),
+        'pagina': pagina or '1',
+        'csrf': csrf,
+        'ttl': fragmentos.ttl() if csrf else 0,
+    }
 
     return render(request, 'producao/dashboard.html', {
         'funcionario': funcionario,
-        'postos': postos_autorizados,
+        'postos': contexto.postos,
         'e_posto_inicial': e_posto_inicial,
         'acessorios': acessorios_disponiveis,
         'tarefa_em_curso': tarefa_em_curso,
         'ordens_agendadas': ordens_agendadas,
         'ordens_gerais': ordens_gerais,
+        'cache_filas': cache_filas,
+        'sse_ativo': settings.SSE_ATIVO,
     })
 
-def iniciar_tarefa(request, ordem_id):
-    if 'funcionario_id' not in request.session:
-        return redirect('login_funcionario')
-        
-    ordem = get_object_or_404(OrdemProducao, id=ordem_id)
-    funcionario = Funcionario.objects.get(id=request.session['funcionario_id'])
+def _fila(postos_ids, tarefa_em_curso=None):
+    """
+    Ordens pendentes nos postos autorizados: as que estão num deles e as que, numa etapa
+    paralela, têm lá um ramo por começar (`posto_ramo` é o nome desse posto).
+    """
+    filtro = Q(posto_atual__in=postos_ids, status_global='PENDENTE')
+    ramos = RamoOrdem.objects.filter(posto_id__in=postos_ids, estado='PENDENTE')
+    # Os ids vêm à parte: um OR com subquery impedia o uso do índice da fila
+    ids_em_ramos = list(ramos.values_list('ordem_id', flat=True).distinct())
+    if ids_em_ramos:
+        filtro |= Q(id__in=ids_em_ramos)
+    ordens = OrdemProducao.objects.filter(filtro).select_related('posto_atual', 'acessorio')
+    if ids_em_ramos:
+        ordens = ordens.annotate(posto_ramo=Subquery(
+            ramos.filter(ordem_id=OuterRef('id')).order_by('posto__ordem_sequencia').values('posto__nome')[:1]
+        ))
 
-    # Impede iniciar duas tarefas ao mesmo tempo
-    if TarefaProducao.objects.filter(funcionario=funcionario, concluido=False).exists():
-        return redirect('dashboard_funcionario')
+    # Se já estiver a trabalhar numa, não mostramos essa na lista de "pendentes" para não confundir
+    if tarefa_em_curso:
+        ordens = ordens.exclude(id=tarefa_em_curso.ordem_id)
+    return ordens
 
-    # Verifica se o funcionário tem acesso ao posto atual da ordem
-    if ordem.posto_atual not in funcionario.postos.all():
-        return redirect('dashboard_funcionario') # Ou mostrar erro de permissão
 
-    # Cria o registo de início de trabalho
-    TarefaProducao.objects.create(
-        ordem=ordem,
-        posto=ordem.posto_atual,
-        funcionario=funcionario,
-        inicio=timezone.now()
-    )
+@require_POST
+def iniciar_tarefa(request, ordem_id):
+    contexto = _contexto_operador(request)
+    if contexto is None:
+        return redirect('login_funcionario')
 
-    # Atualiza o estado da ordem para "Em Andamento"
-    ordem.status_global = 'EM_ANDAMENTO'
-    ordem.save()
+    # Reserva atómica: valida o posto, impede duas tarefas ao mesmo tempo e é idempotente
+    try:
+        TarefaProducao.abrir(ordem_id, contexto.funcionario)
+    except stock.StockInsuficiente as erro:
+        messages.error(request, f"Stock insuficiente: {erro}")
 
     return redirect('dashboard_funcionario')
 
+@require_POST
 def finalizar_tarefa(request, tarefa_id):
-    if 'funcionario_id' not in request.session:
+    funcionario_id = request.session.get('funcionario_id')
+    if funcionario_id is None:
         return redirect('login_funcionario')
-        
-    funcionario = Funcionario.objects.get(id=request.session['funcionario_id'])
-    tarefa = get_object_or_404(TarefaProducao, id=tarefa_id, funcionario=funcionario)
-    # Chama a função que criámos no models.py (fecha tempo e muda posto)
+
+    tarefa = get_object_or_404(TarefaProducao.objects.select_related('ordem'), id=tarefa_id, funcionario_id=funcionario_id)
+    # Chama a função que criámos no models.py (fecha tempo e muda posto). Repetir o pedido não faz nada.
     tarefa.finalizar_tarefa() 
     return redirect('dashboard_funcionario')
 
+@require_POST
+def sincronizar_eventos(request):
+    """Recebe em lote os inícios e fins de tarefa registados no tablet (ver sincronizacao.py)."""
+    contexto = _contexto_operador(request)
+    if contexto is None:
+        return JsonResponse({'erro': 'Sessão terminada'}, status=403)
+    try:
+        eventos_tablet = json.loads(request.body).get('eventos')
+        resultados = sincronizacao.aplicar_lote(contexto, eventos_tablet)
+    except (ValueError, AttributeError):
+        return JsonResponse({'erro': 'Pedido inválido: esperado {"eventos": [...]}'}, status=400)
+    except sincronizacao.LoteInvalido as erro:
+        return JsonResponse({'erro': str(erro)}, status=400)
+    return JsonResponse({'resultados': resultados})
+
 # --- DASHBOARD DE ESTATÍSTICAS (ADMIN) ---
+def _data_do_pedido(request, chave):
+    try:
+        return parse_date(request.GET.get(chave) or '')
+    except ValueError:
+        return None
+
 @staff_member_required
+@replicas.usar_replica
 def dashboard_estatisticas(request):
-    # 1. Total Produzido
-    total_concluido = OrdemProducao.objects.filter(status_global='CONCLUIDO').count()
+    # Lê apenas os totais diários (ProducaoDiaria), nunca o histórico de tarefas
+    de = _data_do_pedido(request, 'de')
+    ate = _data_do_pedido(request, 'ate')
+    totais = ProducaoDiaria.objects.all()
+    if de:
+        totais = totais.filter(dia__gte=de)
+    if ate:
+        totais = totais.filter(dia__lte=ate)
+    minutos_medio = ExpressionWrapper(Sum('segundos_total') / Sum('tarefas') / 60.0, output_field=FloatField())
+
+    # 1. Total Produzido (preguiçoso, como as restantes consultas: com o fragmento em cache não é lido)
+    total_concluido = SimpleLazyObject(lambda: totais.aggregate(total=Sum('ordens_concluidas'))['total'] or 0)
     
     # 2. Peças por Funcionário
-    pecas_por_func = TarefaProducao.objects.filter(concluido=True).values('funcionario__nome').annotate(total=Count('id'))
+    pecas_por_func = totais.values('funcionario__nome').annotate(
+        total=Sum('tarefas'), minutos_medio=minutos_medio
+    ).order_by('-total')
+
+    # 3. Tempo de ciclo por Posto
+    por_posto = totais.values('posto__nome', 'posto__ordem_sequencia').annotate(
+        total=Sum('tarefas'), minutos_medio=minutos_medio
+    ).order_by('posto__ordem_sequencia')
     
-    # 3. Ordens Atrasadas (Agendadas para o passado e não concluídas)
+    # 4. Ordens Atrasadas (Agendadas para o passado e não concluídas)
     hoje = timezone.now().date()
-    atrasadas = OrdemProducao.objects.filter(data_prevista__lt=hoje).exclude(status_global='CONCLUIDO')
+    atrasadas = OrdemProducao.objects.filter(data_prevista__lt=hoje).exclude(
+        status_global='CONCLUIDO'
+    ).select_related('acessorio', 'posto_atual')
+
+    # 5. Peças em falta para as ordens por iniciar (uma query agregada)
+    faltas_stock = SimpleLazyObject(lambda: stock.faltas(ate))
+
+    # 6. Alertas ativos do monitor da linha. Sem cache: o monitor corre noutro processo e a versão de um
+    #    fragmento não lhe chegaria; é uma query pelo índice dos alertas ativos, limitada a MAX_ALERTAS
+    alertas = AlertaLinha.objects.filter(resolvido_em__isnull=True).select_related('posto').order_by('tipo', '-valor')[:MAX_ALERTAS]
 
     return render(request, 'producao/estatisticas.html', {
         'total_concluido': total_concluido,
+        'faltas_stock': faltas_stock,
         'pecas_por_func': pecas_por_func,
+        'por_posto': por_posto,
         'atrasadas': atrasadas,
+        'alertas': alertas,
+        'de': de,
+        'ate': ate,
+        'hoje': hoje,
+        'versao': fragmentos.versao('ordens', 'producao', 'stock'),
+        'ttl': fragmentos.ttl(),
+    })
+
+# --- ANÁLISE DE TEMPOS DE CICLO E ESTRANGULAMENTOS (ADMIN) ---
+def _analise_do_pedido(request):
+    try:
+        horas = min(max(int(request.GET.get('horas') or 168), 1), 24 * 365)
+    except ValueError:
+        horas = 168
+    return analitica.analise_linha(horas=horas)
+
+@staff_member_required
+@replicas.usar_replica
+def dashboard_analitica(request):
+    analise = _analise_do_pedido(request)
+    por_id = {linha['posto_id']: linha for linha in analise['postos']}
+    return render(request, 'producao/analitica.html', {
+        'analise': analise,
+        'estrangulamentos': [por_id[posto_id] for posto_id in analise['estrangulamentos']],
+        'horas': int((analise['ate'] - analise['desde']).total_seconds() // 3600),
+    })
+
+@staff_member_required
+@replicas.usar_replica
+def analitica_json(request):
+    return JsonResponse(_analise_do_pedido(request))
+
+def _momento(valor, padrao):
+    try:
+        momento = parse_datetime(valor) if valor else padrao
+    except ValueError:
+        return None
+    if momento is not None and timezone.is_naive(momento):
+        momento = timezone.make_aware(momento)
+    return momento
+
+@staff_member_required
+@replicas.usar_replica
+def wip_json(request):
+    """
+    WIP por posto no passado (historico.py): ?momento=ISO para um instante, ou
+    ?desde=ISO&ate=ISO&passo=minutos para uma série.
+    """
+    agora = timezone.now()
+    postos = dict(Posto.objects.values_list('id', 'nome'))
+
+    def por_posto(wip):
+        return [
+            {'posto_id': posto_id, 'posto': postos.get(posto_id), **contagens}
+            for posto_id, contagens in sorted(wip.items(), key=lambda item: (item[0] is None, item[0] or 0))
+        ]
+
+    if 'desde' not in request.GET:
+        momento = _momento(request.GET.get('momento'), agora)
+        if momento is None:
+            return JsonResponse({'erro': "momento inválido"}, status=400)
+        return JsonResponse({'momento': momento, 'postos': por_posto(historico.wip_em(momento))})
+
+    desde = _momento(request.GET.get('desde'), None)
+    ate = _momento(request.GET.get('ate'), agora)
+    try:
+        passo = datetime.timedelta(minutes=int(request.GET.get('passo') or 60))
+    except ValueError:
+        passo = None
+    if desde is None or ate is None or passo is None:
+        return JsonResponse({'erro': "desde, ate ou passo inválidos"}, status=400)
+    try:
+        serie = historico.serie_wip(desde, ate, passo)
+    except ValueError as erro:
+        return JsonResponse({'erro': str(erro)}, status=400)
+    return JsonResponse({'serie': [{'momento': momento, 'postos': por_posto(wip)} for momento, wip in serie]})
+
+# --- AGENDA EM JSON (ecrãs de planeamento e painéis, com pedidos condicionais) ---
+@staff_member_required
+@replicas.usar_replica
+def agenda_json(request):
+    try:
+        filtros = agenda.filtros_do_pedido(request.GET)
+    except ValueError as erro:
+        return JsonResponse({'erro': str(erro)}, status=400)
+    consulta = agenda.ordens(**filtros)
+    ultima, total = agenda.versao(consulta)
+    etag = agenda.etag(filtros, ultima, total)
+    ultima_epoch = int(ultima.timestamp()) if ultima else None
+
+    # Mesma versão que o cliente já tem: 304 sem ler as ordens
+    resposta = get_conditional_response(request, etag=etag, last_modified=ultima_epoch)
+    if resposta is None:
+        resposta = JsonResponse(agenda.serializar(consulta))
+    resposta['ETag'] = etag
+    if ultima_epoch is not None:
+        resposta['Last-Modified'] = http_date(ultima_epoch)
+    patch_cache_control(resposta, private=True, no_cache=True)
+    return resposta
+
+# --- DESEMPENHO DAS PÁGINAS (amostras do InstrumentacaoMiddleware) ---
+@staff_member_required
+def dashboard_desempenho(request):
+    if request.method == 'POST':
+        instrumentacao.limpar()
+        return redirect('dashboard_desempenho')
+    resumo = instrumentacao.resumo()
+    limites = resumo['limites_histograma_ms']
+    return render(request, 'producao/desempenho.html', {
+        'resumo': resumo,
+        'colunas_histograma': [f"≤{limite}" for limite in limites] + [f">{limites[-1]}"],
     })
+
+@staff_member_required
+def desempenho_json(request):
+    dados = instrumentacao.resumo()
+    if request.GET.get('amostras'):
+        dados['amostras'] = instrumentacao.amostras()
+    return JsonResponse(dados)
+
+# --- ATUALIZAÇÕES EM TEMPO REAL PARA O TABLET (SSE, requer servidor ASGI) ---
+async def stream_funcionario(request):
+    # Sob WSGI o stream prenderia um worker para sempre; com 204 o browser deixa de voltar a ligar-se
+    if not settings.SSE_ATIVO or not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    funcionario_id = await request.session.aget('funcionario_id')
+    if funcionario_id is None:
+        return HttpResponseForbidden()
+    contexto = await sync_to_async(operador.contexto)(funcionario_id)
+    if contexto is None:
+        return HttpResponseForbidden()
+    postos_ids = contexto.postos_ids
+
+    async def gerar():
+        subscricao = eventos.difusor.subscrever(postos_ids, funcionario_id)
+        try:
+            # Se a ligação cair, o browser volta a ligar-se ao fim de 3 segundos
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    evento = await asyncio.wait_for(subscricao.fila.get(), timeout=SSE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    # Mantém a ligação viva através de proxies (ex: Render)
+                    yield ': keepalive\n\n'
+                    continue
+                yield f'event: ordem\ndata: {json.dumps(evento)}\n\n'
+        finally:
+            eventos.difusor.cancelar(subscricao)
+
+    resposta = StreamingHttpResponse(gerar(), content_type='text/event-stream')
+    resposta['Cache-Control'] = 'no-cache'
+    resposta['X-Accel-Buffering'] = 'no'
+    return resposta